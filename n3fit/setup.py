@@ -15,6 +15,7 @@ setup(
             ['n3fit = n3fit.scripts.n3fit_exec:main',
              'vp-setupfit = n3fit.scripts.vp_setupfit:main',
              'varflavors = n3fit.scripts.varflavors:main',
+             'n3fit-dy-benchmark = n3fit.scripts.dy_benchmark:main',
              ]
             },
 )
@@ -1,10 +1,17 @@
 from n3fit.backends.keras_backend.internal_state import (
     set_initial_state,
     clear_backend_state,
-    set_eager
+    set_eager,
+    get_rng_state,
+    set_rng_state,
+    backend_initialized,
 )
 from n3fit.backends.keras_backend.MetaLayer import MetaLayer
-from n3fit.backends.keras_backend.MetaModel import MetaModel
+from n3fit.backends.keras_backend.MetaModel import (
+    MetaModel,
+    compile_predict_many,
+    predict_many,
+)
 from n3fit.backends.keras_backend.base_layers import (
     Input,
     concatenate,
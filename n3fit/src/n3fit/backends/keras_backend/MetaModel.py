@@ -262,6 +262,38 @@ class MetaModel(Model):
 
         super().compile(optimizer=opt, loss=loss)
 
+    def _optimizer_variables(self, build=False):
+        """Return the variables of the optimizer (iterations, slots...).
+        If ``build`` is True, the variables are created first if the
+        optimizer has not been applied to any gradient yet"""
+        optimizer = self.optimizer
+        if build:
+            if hasattr(optimizer, "build"):
+                if not optimizer.built:
+                    optimizer.build(self.trainable_variables)
+            else:
+                # Optimizers of keras < 2.11 create their variables lazily
+                optimizer._create_all_weights(self.trainable_variables)
+        variables = optimizer.variables
+        if callable(variables):
+            variables = variables()
+        return variables
+
+    def get_optimizer_state(self):
+        """Return the values of all the variables of the optimizer"""
+        return [np.array(var) for var in self._optimizer_variables()]
+
+    def set_optimizer_state(self, values):
+        """Set the variables of the optimizer to the values
+        returned by :py:meth:`get_optimizer_state`"""
+        variables = self._optimizer_variables(build=True)
+        if len(variables) != len(values):
+            raise ValueError(
+                f"The optimizer has {len(variables)} variables, received {len(values)} values"
+            )
+        for var, value in zip(variables, values):
+            var.assign(value)
+
     def set_masks_to(self, names, val=0.0):
         """Set all mask value to the selected value
         Masks in MetaModel should be named {name}_mask
@@ -313,3 +345,44 @@ class MetaModel(Model):
         """ Get all layers matching the given regular expression """
         check = lambda x: re.match(regex, x.name)
         return list(filter(check, self.layers))
+
+
+
+def compile_predict_many(models):
+    """Compile a function evaluating several models on the same input with one
+    single call, instead of going through the ``predict`` machinery of every model.
+    The input is parsed (and scaled) by each model as in :py:meth:`MetaModel.predict`.
+
+    The function is traced once for every input shape, so whoever evaluates the
+    same models several times (e.g. :py:class:`n3fit.vpinterface.ReplicaEvaluator`)
+    should keep it rather than calling this function again. Nothing is kept at
+    module level, so the models and the traced graphs are released with it.
+
+    Parameters
+    ----------
+        models: list(:py:class:`MetaModel`)
+            models with the same input and output shapes
+
+    Returns
+    -------
+        callable
+            function taking the input of the models (e.g. ``{"pdf_input": xgrid}``)
+            and returning as a numpy array the outputs of all models concatenated
+            along the first (batch) axis
+    """
+    models = tuple(models)
+
+    @tf.function(reduce_retracing=True)
+    def predict_all(inputs):
+        return tf.concat([model(i) for model, i in zip(models, inputs)], axis=0)
+
+    def predict(x=None):
+        return predict_all([model._parse_input(x) for model in models]).numpy()
+
+    return predict
+
+
+def predict_many(models, x=None):
+    """Evaluate several models on the same input ``x`` with one compiled call,
+    see :py:func:`compile_predict_many`"""
+    return compile_predict_many(models)(x)
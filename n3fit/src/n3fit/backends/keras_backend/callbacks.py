@@ -8,11 +8,13 @@
     they must take as input an epoch number and a log of the partial losses.
 """
 
+import contextlib
 import logging
-from time import time
+from time import time, process_time
 import numpy as np
 import tensorflow as tf
 from tensorflow.keras.callbacks import TensorBoard, Callback
+from n3fit.backends.keras_backend.internal_state import get_rng_state, set_rng_state
 
 log = logging.getLogger(__name__)
 
@@ -32,8 +34,8 @@ class TimerCallback(Callback):
     def on_epoch_end(self, epoch, logs=None):
         """ At the end of every epoch it checks the time """
         new_time = time()
-        if epoch == 0:
-            # The first epoch is only useful for starting
+        if self.starting_time is None:
+            # The first epoch (which is not 0 for resumed fits) is only useful for starting
             self.starting_time = new_time
         else:
             cur_dif = new_time - self.last_time
@@ -56,6 +58,41 @@ class TimerCallback(Callback):
         log.info(f"> > > Total time: {total_time/60:.5} min")
 
 
+def _phase(stopwatch, name):
+    """Profile the block as the phase ``name`` of ``stopwatch``, if given"""
+    if stopwatch is None:
+        return contextlib.nullcontext()
+    return stopwatch.phase(name, category="epoch")
+
+
+class ProfilingCallback(Callback):
+    """Callback recording every training step as a ``train_step`` phase of
+    ``stopwatch`` (see :py:class:`n3fit.stopwatch.StopWatch`).
+    It should be the first callback of the list so that the time spent in
+    the other callbacks is not counted as part of the training step.
+
+    Parameters
+    ----------
+        stopwatch: StopWatch
+            stopwatch where the phases are recorded
+    """
+
+    def __init__(self, stopwatch):
+        super().__init__()
+        self.stopwatch = stopwatch
+        self._start = None
+        self._start_cpu = None
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self._start_cpu = process_time()
+        self._start = time()
+
+    def on_epoch_end(self, epoch, logs=None):
+        end = time()
+        cputime = process_time() - self._start_cpu
+        self.stopwatch.record_phase("train_step", self._start, end, cputime=cputime, category="epoch")
+
+
 class StoppingCallback(Callback):
     """
     Given a ``stopping_object``, the callback will monitor the validation chi2
@@ -69,18 +106,22 @@ class StoppingCallback(Callback):
         log_freq: int
             each how many epochs the ``print_stats`` argument of ``stopping_object``
             will be set to true
+        stopwatch: StopWatch
+            if given, the validation is recorded as a ``validation`` phase
     """
 
-    def __init__(self, stopping_object, log_freq=100):
+    def __init__(self, stopping_object, log_freq=100, stopwatch=None):
         super().__init__()
         self.log_freq = log_freq
         self.stopping_object = stopping_object
+        self.stopwatch = stopwatch
 
     def on_epoch_end(self, epoch, logs=None):
         """ Function to be called at the end of every epoch """
         print_stats = ((epoch + 1) % self.log_freq) == 0
         # Note that the input logs correspond to the fit before the weights are updated
-        self.stopping_object.monitor_chi2(logs, epoch, print_stats=print_stats)
+        with _phase(self.stopwatch, "validation"):
+            self.stopping_object.monitor_chi2(logs, epoch, print_stats=print_stats)
         if self.stopping_object.stop_here():
             self.model.stop_training = True
 
@@ -105,9 +146,15 @@ class LagrangeCallback(Callback):
             List of multipliers to be applied
         update_freq: int
             each how many epochs the positivity lambda is updated
+        stopwatch: StopWatch
+            if given, the updates are recorded as phases of name ``phase_name``
+        phase_name: str
+            name of the phase recorded in ``stopwatch``
     """
 
-    def __init__(self, datasets, multipliers, update_freq=100):
+    def __init__(
+        self, datasets, multipliers, update_freq=100, stopwatch=None, phase_name="lagrange_update"
+    ):
         super().__init__()
         if len(multipliers) != len(datasets):
             raise ValueError("The number of datasets and multipliers do not match")
@@ -115,6 +162,8 @@ class LagrangeCallback(Callback):
         self.datasets = datasets
         self.multipliers = multipliers
         self.updateable_weights = []
+        self.stopwatch = stopwatch
+        self.phase_name = phase_name
 
     def on_train_begin(self, logs=None):
         """ Save an instance of all relevant layers """
@@ -135,7 +184,88 @@ class LagrangeCallback(Callback):
     def on_epoch_end(self, epoch, logs=None):
         """ Function to be called at the end of every epoch """
         if (epoch + 1) % self.update_freq == 0:
-            self._update_weights()
+            with _phase(self.stopwatch, self.phase_name):
+                self._update_weights()
+
+
+def get_checkpoint(training_model, stopping_object, epoch):
+    """Return a checkpoint with the state of the fit after ``epoch`` epochs,
+    see :py:mod:`n3fit.io.checkpoint`.
+    All the elements of the checkpoint are copies of the state of the fit
+
+    Parameters
+    ----------
+        training_model: n3fit.backends.MetaModel
+            the model being trained, its weights include the Lagrange multipliers
+        stopping_object: n3fit.stopping.Stopping
+            the stopping object monitoring the fit
+        epoch: int
+            number of epochs already run, i.e., the epoch at which the fit will be resumed
+    """
+    return {
+        "epoch": epoch,
+        "weights": training_model.get_weights(),
+        "optimizer": training_model.get_optimizer_state(),
+        "stopping": stopping_object.get_checkpoint(),
+        "rng": get_rng_state(),
+    }
+
+
+def load_checkpoint(training_model, stopping_object, checkpoint):
+    """Restore the state of the fit saved in ``checkpoint`` by :py:func:`get_checkpoint`
+    and return the epoch at which the fit is to be resumed"""
+    training_model.set_weights(checkpoint["weights"])
+    training_model.set_optimizer_state(checkpoint["optimizer"])
+    # The replicas which had already stopped are frozen only after the optimizer
+    # has been built, so that it holds the variables of every replica as in the original fit
+    stopping_object.load_checkpoint(checkpoint["stopping"])
+    set_rng_state(checkpoint["rng"])
+    return checkpoint["epoch"]
+
+
+class CheckpointCallback(Callback):
+    """
+    Saves a checkpoint of the fit (see :py:func:`get_checkpoint`) every ``each`` epochs.
+    The checkpoint is handed over to ``writer``, which writes it to disk asynchronously.
+
+    It must come after the stopping and Lagrange multipliers callbacks in the list of callbacks
+    so that the checkpoint contains the state of the fit at the end of the epoch.
+
+    Parameters
+    ----------
+        writer: n3fit.io.checkpoint.CheckpointWriter
+            writer of the checkpoints
+        stopping_object: Stopping
+            instance of Stopping which controls when the fit should stop
+        each: int
+            each how many epochs a checkpoint is saved
+        extra_info: dict
+            information to be saved together with every checkpoint
+        stopwatch: StopWatch
+            if given, the copy of the state is recorded as a ``checkpoint`` phase
+    """
+
+    def __init__(self, writer, stopping_object, each, extra_info=None, stopwatch=None):
+        super().__init__()
+        self.writer = writer
+        self.stopping_object = stopping_object
+        self.each = each
+        self.extra_info = extra_info or {}
+        self.stopwatch = stopwatch
+
+    def on_epoch_end(self, epoch, logs=None):
+        """ Function to be called at the end of every epoch """
+        # Once the fit has stopped the models have been reset to the best state
+        if (epoch + 1) % self.each != 0 or self.stopping_object.stop_now:
+            return
+        with _phase(self.stopwatch, "checkpoint"):
+            checkpoint = get_checkpoint(self.model, self.stopping_object, epoch + 1)
+            checkpoint.update(self.extra_info)
+            self.writer.write(checkpoint)
+
+    def on_train_end(self, logs=None):
+        """ Wait for the last checkpoint to be written """
+        self.writer.wait()
 
 
 def gen_tensorboard_callback(log_dir, profiling=False, histogram_freq=0):
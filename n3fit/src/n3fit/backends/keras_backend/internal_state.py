@@ -27,6 +27,28 @@ def set_eager(flag=True):
     tf.config.run_functions_eagerly(flag)
 
 
+def backend_initialized():
+    """Return whether the tensorflow runtime has already been initialised in this process,
+    i.e., whether any tensorflow operation has been run.
+    Once initialised, the number of threads can no longer be modified and the process
+    can no longer be safely forked"""
+    from tensorflow.python.eager import context
+
+    return context.context()._context_handle is not None
+
+
+def _set_threads(inter_op, intra_op):
+    """Set the number of threads used by tensorflow, unless the runtime has already
+    been initialised, in which case the current ones are kept"""
+    if backend_initialized():
+        log.warning(
+            "Tensorflow has already been initialised, the number of threads cannot be modified"
+        )
+        return
+    tf.config.threading.set_inter_op_parallelism_threads(inter_op)
+    tf.config.threading.set_intra_op_parallelism_threads(intra_op)
+
+
 def set_number_of_cores(max_cores=None):
     """
     Set the maximum number of cores and threads per core to be used by TF.
@@ -56,8 +78,7 @@ def set_number_of_cores(max_cores=None):
     if max_cores is not None:
         cores = min(cores, max_cores)
     log.info("Setting the number of cores to: %d", cores)
-    tf.config.threading.set_inter_op_parallelism_threads(tpc * 2)
-    tf.config.threading.set_intra_op_parallelism_threads(cores)
+    _set_threads(tpc * 2, cores)
 
 
 def clear_backend_state():
@@ -70,6 +91,23 @@ def clear_backend_state():
     K.clear_session()
 
 
+def get_rng_state():
+    """Return the state of the random number generators of numpy, python and tensorflow,
+    so that it can be restored with :py:func:`set_rng_state`"""
+    return {
+        "numpy": np.random.get_state(),
+        "python": rn.getstate(),
+        "tensorflow": tf.random.get_global_generator().state.numpy(),
+    }
+
+
+def set_rng_state(state):
+    """Restore the state of the random number generators saved with :py:func:`get_rng_state`"""
+    np.random.set_state(state["numpy"])
+    rn.setstate(state["python"])
+    tf.random.get_global_generator().state.assign(state["tensorflow"])
+
+
 def set_initial_state(debug=False, external_seed=None, max_cores=None):
     """
     This function sets the initial internal state for the different components of n3fit.
@@ -115,8 +153,7 @@ def set_initial_state(debug=False, external_seed=None, max_cores=None):
     # Set the number of cores depending on the user choice of max_cores
     # if debug mode and no number of cores set by the user, set to 1
     if debug and max_cores is None:
-        tf.config.threading.set_inter_op_parallelism_threads(1)
-        tf.config.threading.set_intra_op_parallelism_threads(1)
+        _set_threads(1, 1)
     else:
         set_number_of_cores(max_cores=max_cores)
 
@@ -246,6 +246,14 @@ def stack(tensor_list, axis=0, **kwargs):
     return tf.stack(tensor_list, axis=axis, **kwargs)
 
 
+def gather(*args, **kwargs):
+    """
+    Gather slices of a tensor along an axis
+    see full `docs <https://www.tensorflow.org/api_docs/python/tf/gather>`_
+    """
+    return tf.gather(*args, **kwargs)
+
+
 def concatenate(tensor_list, axis=-1, target_shape=None, name=None):
     """
     Concatenates a list of numbers or tensor into a bigger tensor
@@ -293,6 +301,40 @@ def pdf_masked_convolution(raw_pdf, basis_mask):
     return pdf_x_pdf
 
 
+def pdf_gather_convolution(raw_pdf, left_index, right_index, fk_values, data_index, ndata):
+    """Computes the convolution of two equal pdfs with a sparse fktable
+    given in coordinate form.
+
+    Only the entries of the luminosity needed by the fktable are computed
+    by gathering them from the flattened pdf. The products are then summed
+    per data point.
+
+    Parameters
+    ----------
+        raw_pdf: tf.tensor
+            rank 4 (batchsize, xgrid, flavours, replicas)
+        left_index: tf.tensor
+            rank 1 (nnz,) indices of the first pdf in the flattened (xgrid, flavours)
+        right_index: tf.tensor
+            rank 1 (nnz,) indices of the second pdf in the flattened (xgrid, flavours)
+        fk_values: tf.tensor
+            rank 1 (nnz,) non-zero values of the fktable
+        data_index: tf.tensor
+            rank 1 (nnz,) data point to which each of the entries contribute
+        ndata: int
+            number of data points
+
+    Return
+    ------
+        result: tf.tensor
+            rank 2 (ndata, replicas)
+    """
+    pdf = tf.reshape(raw_pdf, (-1, raw_pdf.shape[-1]))
+    pdf_x_pdf = tf.gather(pdf, left_index) * tf.gather(pdf, right_index)
+    weighted = tf.expand_dims(fk_values, -1) * pdf_x_pdf
+    return tf.math.unsorted_segment_sum(weighted, data_index, ndata)
+
+
 def einsum(equation, *args, **kwargs):
     """
     Computes the tensor product using einsum
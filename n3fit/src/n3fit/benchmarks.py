@@ -0,0 +1,191 @@
+"""
+    Benchmark of a short fit on the CPU, registered in the suite of ``vp-benchmark``
+    (see :py:mod:`validphys.benchmarks`).
+
+    The fit uses synthetic DIS datasets with the structure of the dictionaries
+    returned by :py:func:`validphys.n3fit_data.fitting_data_dict`, so no data
+    or theory needs to be installed.
+
+    The integration of the sum rules is benchmarked for every integration scheme
+    of :py:mod:`n3fit.msr`, with the estimate of its error logged at setup.
+"""
+from collections import defaultdict
+import logging
+
+import numpy as np
+
+from validphys.benchmarks.runner import benchmark
+from validphys.benchmarks.synthetic import synthetic_covmat, synthetic_xgrid
+
+log = logging.getLogger(__name__)
+
+BASIS = [
+    {"fl": "sng", "smallx": [1.05, 1.19], "largex": [1.47, 2.70]},
+    {"fl": "g", "smallx": [0.94, 1.25], "largex": [0.11, 5.87]},
+    {"fl": "v", "smallx": [0.54, 0.75], "largex": [1.15, 2.76]},
+    {"fl": "v3", "smallx": [0.21, 0.57], "largex": [1.35, 3.08]},
+    {"fl": "v8", "smallx": [0.52, 0.76], "largex": [0.77, 3.56]},
+    {"fl": "t3", "smallx": [-0.37, 1.52], "largex": [1.74, 3.39]},
+    {"fl": "t8", "smallx": [0.56, 1.29], "largex": [1.45, 3.03]},
+    {"fl": "cp", "smallx": [0.12, 1.19], "largex": [1.83, 6.70]},
+]
+
+PARAMETERS = {
+    "nodes_per_layer": [15, 10, 8],
+    "activation_per_layer": ["sigmoid", "sigmoid", "linear"],
+    "initializer": "glorot_normal",
+    "optimizer": {"optimizer_name": "RMSprop", "learning_rate": 1e-3, "clipnorm": 1.0},
+    "stopping_patience": 0.3,
+    "layer_type": "dense",
+    "dropout": 0.0,
+    "positivity": {},
+}
+
+# Fraction of the data used for training
+TRAINING_FRACTION = 0.75
+
+
+def _synthetic_dataset(name, ndata, nx, tr_mask, rng):
+    basis = [1, 2, 3, 9, 10]
+    fktable = rng.random((ndata, len(basis), nx))
+    fkdict = {
+        "ndata": ndata,
+        "nbasis": len(basis),
+        "nonzero": len(basis),
+        "basis": basis,
+        "nx": nx,
+        "xgrid": synthetic_xgrid(nx).reshape(1, nx),
+        "fktable": fktable,
+    }
+    return {
+        "fktables": [fkdict],
+        "tr_fktables": [fktable[tr_mask]],
+        "vl_fktables": [fktable[~tr_mask]],
+        "ex_fktables": [fktable],
+        "ds_tr_mask": tr_mask,
+        "hadronic": False,
+        "operation": "NULL",
+        "name": name,
+        "frac": TRAINING_FRACTION,
+        "ndata": ndata,
+        "use_fixed_predictions": False,
+    }
+
+
+def synthetic_experiment(ndatasets, ndata, nx, nreplicas, seed=0):
+    """Return a dictionary with the structure of the output of
+    :py:func:`validphys.n3fit_data.fitting_data_dict` for ``ndatasets`` synthetic
+    DIS datasets, with the pseudodata of ``nreplicas`` replicas"""
+    rng = np.random.default_rng(seed)
+    tr_masks = [rng.random(ndata) < TRAINING_FRACTION for _ in range(ndatasets)]
+    datasets = [
+        _synthetic_dataset(f"SYNTHETIC{i}", ndata, nx, mask, rng)
+        for i, mask in enumerate(tr_masks)
+    ]
+    tr_mask = np.concatenate(tr_masks)
+    ntotal = len(tr_mask)
+    covmat = synthetic_covmat(ntotal, seed=seed)
+    expdata_true = rng.uniform(1.0, 2.0, (1, ntotal))
+    expdata = expdata_true + rng.normal(scale=0.1, size=(nreplicas, ntotal))
+    return {
+        "datasets": datasets,
+        "name": "SYNTHETIC",
+        "expdata_true": expdata_true,
+        "invcovmat_true": np.linalg.inv(covmat),
+        "covmat": covmat,
+        "trmask": tr_mask,
+        "invcovmat": np.linalg.inv(covmat[tr_mask][:, tr_mask]),
+        "ndata": np.count_nonzero(tr_mask),
+        "expdata": expdata[:, tr_mask],
+        "vlmask": ~tr_mask,
+        "invcovmat_vl": np.linalg.inv(covmat[~tr_mask][:, ~tr_mask]),
+        "ndata_vl": np.count_nonzero(~tr_mask),
+        "expdata_vl": expdata[:, ~tr_mask],
+        "positivity": False,
+        "count_chi2": True,
+        "folds": defaultdict(list),
+        "data_transformation_tr": None,
+        "data_transformation_vl": None,
+    }
+
+
+@benchmark("n3fit.ModelTrainer.fit")
+def bench_model_trainer(params, workdir):
+    from n3fit.model_trainer import ModelTrainer
+
+    nreplicas = params["nreplicas"]
+    exp_info = [
+        synthetic_experiment(params["ndatasets"], params["ndata"], params["nx"], nreplicas)
+    ]
+    replicas = list(range(1, nreplicas + 1))
+    fit_parameters = dict(PARAMETERS, epochs=params["epochs"])
+
+    def run():
+        trainer = ModelTrainer(
+            exp_info,
+            [],
+            None,
+            BASIS,
+            "NN31IC",
+            [2 * r for r in replicas],
+            replicas,
+            simu_parameters_names=[],
+            simu_parameters_scales=[],
+            bsm_fac_initialisations=[],
+            max_cores=1,
+            parallel_models=nreplicas,
+        )
+        trainer.hyperparametrizable(fit_parameters)
+
+    return run
+
+
+def _sumrule_integrands(nreplicas, seed=0):
+    """Return a function computing, for ``nreplicas`` synthetic PDFs, the integrands
+    of the sum rules in a grid of x: a dense network with the architecture of PARAMETERS
+    and random weights, times the preprocessing x^{-alpha} (1-x)^beta of BASIS"""
+    rng = np.random.default_rng(seed)
+    nodes = [2] + PARAMETERS["nodes_per_layer"]
+    layers = [
+        (rng.normal(size=(nreplicas, nin, nout)), rng.normal(size=(nreplicas, 1, nout)))
+        for nin, nout in zip(nodes[:-1], nodes[1:])
+    ]
+    alpha = np.array([np.mean(flav["smallx"]) for flav in BASIS])
+    beta = np.array([np.mean(flav["largex"]) for flav in BASIS])
+
+    def integrands(xgrid):
+        nn_input = np.concatenate([xgrid, np.log(xgrid)], axis=-1)
+        output = np.broadcast_to(nn_input, (nreplicas,) + nn_input.shape)
+        for i, (kernel, bias) in enumerate(layers):
+            output = output @ kernel + bias
+            if i < len(layers) - 1:
+                output = 1.0 / (1.0 + np.exp(-output))
+        return output * xgrid ** (-alpha) * (1.0 - xgrid) ** beta
+
+    return integrands
+
+
+def _bench_msr(scheme):
+    def bench(params, workdir):
+        from n3fit.msr import INTEGRATION_SCHEMES, gen_integration_input, integration_error
+
+        nx = INTEGRATION_SCHEMES[scheme]
+        log.info(
+            "%s integration on %d points, estimated relative error: %.1e",
+            scheme,
+            nx,
+            integration_error(nx, scheme),
+        )
+        integrands = _sumrule_integrands(params["nmembers"])
+
+        def run():
+            xgrid, weights = gen_integration_input(nx, scheme)
+            return np.sum(integrands(xgrid) * weights, axis=-2)
+
+        return run
+
+    return bench
+
+
+for _scheme in ("trapezoidal", "gauss_legendre"):
+    benchmark(f"n3fit.msr.{_scheme}")(_bench_msr(_scheme))
@@ -112,6 +112,25 @@ def check_dropout(parameters):
         raise CheckError(f"Dropout must be between 0 and 1, got: {dropout}")
 
 
+def check_msr_integration(parameters):
+    """Checks the integration scheme and number of points used to impose the sum rules"""
+    from n3fit.msr import INTEGRATION_SCHEMES
+
+    msr_integration = parameters.get("msr_integration")
+    if msr_integration is None:
+        return
+    if unknown := set(msr_integration) - {"scheme", "nx"}:
+        raise CheckError(f"Unknown keys in msr_integration: {unknown}")
+    scheme = msr_integration.get("scheme", "trapezoidal")
+    if scheme not in INTEGRATION_SCHEMES:
+        raise CheckError(
+            f"Integration scheme {scheme} not accepted, choose one of {list(INTEGRATION_SCHEMES)}"
+        )
+    nx = msr_integration.get("nx", INTEGRATION_SCHEMES[scheme])
+    if not isinstance(nx, int) or nx < 2:
+        raise CheckError(f"The number of integration points must be an integer above 1, received {nx}")
+
+
 def check_tensorboard(tensorboard):
     """Check that the tensorbard callback can be enabled correctly"""
     if tensorboard is not None:
@@ -122,6 +141,16 @@ def check_tensorboard(tensorboard):
             )
 
 
+def check_checkpoint(checkpoint):
+    """Check that the checkpoints of the fit can be enabled correctly"""
+    if checkpoint is not None:
+        each = checkpoint.get("each")
+        if not isinstance(each, int) or each <= 0:
+            raise CheckError(
+                f"The number of epochs between checkpoints must be a positive integer, received {each}"
+            )
+
+
 def check_lagrange_multipliers(parameters, key):
     """Checks the parameters in a lagrange multiplier dictionary
     are correct, e.g. for positivity and integrability"""
@@ -157,9 +186,10 @@ def check_model_file(save, load):
 
 
 @make_argcheck
-def wrapper_check_NN(basis, tensorboard, save, load, parameters):
+def wrapper_check_NN(basis, tensorboard, save, load, parameters, checkpoint=None):
     """Wrapper function for all NN-related checks"""
     check_tensorboard(tensorboard)
+    check_checkpoint(checkpoint)
     check_model_file(save, load)
     check_existing_parameters(parameters)
     check_consistent_layers(parameters)
@@ -171,6 +201,7 @@ def wrapper_check_NN(basis, tensorboard, save, load, parameters):
     # Checks that need to import the backend (and thus take longer) should be done last
     check_optimizer(parameters["optimizer"])
     check_initializer(parameters["initializer"])
+    check_msr_integration(parameters)
 
 
 def check_hyperopt_architecture(architecture):
@@ -223,7 +254,7 @@ def check_hyperopt_positivity(positivity_dict):
             raise CheckError("The minimum initial value cannot be greater than the maximum")
 
 
-def check_kfold_options(kfold):
+def check_kfold_options(kfold, parallel_models=False, structured_covmat=False):
     """Warns the user about potential bugs on the kfold setup"""
     threshold = kfold.get("threshold")
     if threshold is not None and threshold < 2.0:
@@ -248,6 +279,20 @@ def check_kfold_options(kfold):
             raise CheckError("Cannot use target 'fit_future_tests' with just one partition")
         if partitions[-1]["datasets"]:
             log.warning("Last partition in future test is not empty, some datasets will be ignored")
+        if structured_covmat:
+            raise CheckError(
+                "Cannot use target 'fit_future_tests' with structured_covmat, "
+                "the PDF covmat cannot be added to a structured covmat"
+            )
+    if kfold.get("parallel_folds", False):
+        # The folds take the place of the replicas of a parallel fit
+        if parallel_models:
+            raise CheckError("The folds can't be trained in parallel together with parallel_models")
+        if loss_target == "fit_future_tests":
+            raise CheckError(
+                "Cannot use target 'fit_future_tests' with parallel_folds, "
+                "it needs a different experimental model for every fold"
+            )
 
 
 def check_correct_partitions(kfold, data):
@@ -292,7 +337,9 @@ def check_hyperopt_stopping(stopping_dict):
 
 
 @make_argcheck
-def wrapper_hyperopt(hyperopt, hyperscan_config, kfold, data):
+def wrapper_hyperopt(
+    hyperopt, hyperscan_config, kfold, data, parallel_models=False, structured_covmat=False
+):
     """Wrapper function for all hyperopt-related checks
     No check is performed if hyperopt is not active
     """
@@ -305,7 +352,7 @@ def wrapper_hyperopt(hyperopt, hyperscan_config, kfold, data):
     check_hyperopt_stopping(hyperscan_config.get("stopping"))
     check_hyperopt_architecture(hyperscan_config.get("architecture"))
     check_hyperopt_positivity(hyperscan_config.get("positivity"))
-    check_kfold_options(kfold)
+    check_kfold_options(kfold, parallel_models, structured_covmat)
     check_correct_partitions(kfold, data)
 
 
@@ -353,16 +400,20 @@ def check_consistent_basis(sum_rules, fitbasis, basis, theoryid):
 
 
 @make_argcheck
-def check_consistent_parallel(parameters, parallel_models, same_trvl_per_replica):
+def check_consistent_parallel(
+    parameters, parallel_models, same_trvl_per_replica, diagonal_basis=None
+):
     """Checks whether the multiple-replica fit options are consistent among them
-    i.e., that the trvl seed is fixed and the layer type is correct
+    i.e., that the layer type is correct. Replicas with different training/validation
+    masks (i.e., without ``same_trvl_per_replica``) can be fitted in parallel
+    but they are not compatible with the diagonal basis
     """
     if not parallel_models:
         return
-    if not same_trvl_per_replica:
+    if not same_trvl_per_replica and diagonal_basis:
         raise CheckError(
             "Replicas cannot be run in parallel with different training/validation "
-            " masks, please set `same_trvl_per_replica` to True in the runcard"
+            "masks in the diagonal basis, please set `same_trvl_per_replica` to True in the runcard"
         )
     if parameters.get("layer_type") != "dense":
         raise CheckError("Parallelization has only been tested with layer_type=='dense'")
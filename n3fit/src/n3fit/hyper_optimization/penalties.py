@@ -17,10 +17,52 @@ And return a float to be added to the hyperscan loss.
 
 New penalties can be added directly in this module.
 The name in the runcard must match the name used in this module.
+
+The penalties of a fold are computed together by :py:func:`per_replica_penalties`,
+which evaluates all the pdf models in one single call on the union of the x-grids
+needed by the penalties and returns the value of each penalty per replica.
+The penalties implementing this batched evaluation register the grid they need
+in ``PENALTY_XGRIDS``, a per-replica function in ``PER_REPLICA_PENALTIES`` and
+the reduction of the per-replica values into the hyperscan loss in ``REDUCTIONS``.
+Penalties not registered there are simply called.
 """
 import numpy as np
 from validphys import fitveto
-from n3fit.vpinterface import N3PDF
+from n3fit.vpinterface import EVOL_LIST
+
+# Flavours and x-grid (the same as :py:func:`validphys.arclength.integrability_number`)
+# used to compute the integrability numbers
+INTEGRABILITY_FLAVOURS = ["V", "T3", "V3", "T8", "V8"]
+INTEGRABILITY_XGRID = np.logspace(-9, -6, 3)
+# Overflow of the integrability above which the penalty is saturated
+INTEGRABILITY_MAX_OVERFLOW = 50.0
+
+
+def _saturation_xgrid(n=100, min_x=1e-6, max_x=1e-4, **_kwargs):
+    return np.logspace(np.log10(min_x), np.log10(max_x), n)
+
+
+def _integrability_xgrid(**_kwargs):
+    return INTEGRABILITY_XGRID
+
+
+def evaluate_pdf_models(pdf_models, xgrids):
+    """Evaluate all ``pdf_models`` in one single call on the concatenation of ``xgrids``
+
+    Returns
+    -------
+        list(np.ndarray)
+            for every grid, the pdf of all models with shape ``(replicas, xgrid_size, 14)``
+    """
+    # The backend is imported here so that the checks don't need to load it
+    from n3fit.backends import predict_many
+
+    if not xgrids:
+        return []
+    xin = np.concatenate(xgrids).reshape(1, -1, 1)
+    values = predict_many(pdf_models, {"pdf_input": xin})
+    splits = np.cumsum([len(x) for x in xgrids])[:-1]
+    return np.split(values, splits, axis=1)
 
 
 def saturation(pdf_models=None, n=100, min_x=1e-6, max_x=1e-4, flavors=None, **_kwargs):
@@ -49,19 +91,21 @@ def saturation(pdf_models=None, n=100, min_x=1e-6, max_x=1e-4, flavors=None, **_
     True
 
     """
+    x = _saturation_xgrid(n, min_x, max_x)
+    [pdf_values] = evaluate_pdf_models(pdf_models, [x])
+    return float(np.sum(saturation_per_replica(pdf_values, x, flavors)))
+
+
+def saturation_per_replica(pdf_values, x, flavors=None, **_kwargs):
+    """Saturation penalty of each replica, given the pdf of all replicas
+    with shape ``(replicas, xgrid_size, 14)`` evaluated in ``x``"""
     if flavors is None:
         flavors = [1, 2]
-    x = np.logspace(np.log10(min_x), np.log10(max_x), n)
-    xin = np.expand_dims(x, axis=[0, -1])
-    extra_loss = 0.0
-    for pdf_model in pdf_models:
-        y = pdf_model.predict([xin])
-        xpdf = y[0, :, flavors]
-        slope = np.diff(xpdf) / np.diff(np.log10(x))
-        pen = abs(np.mean(slope, axis=1)) + np.std(slope, axis=1)
-        # Add a small offset to avoid ZeroDivisionError
-        extra_loss += np.sum(1.0 / (1e-7 + pen))
-    return extra_loss
+    xpdf = pdf_values[:, :, flavors]
+    slope = np.diff(xpdf, axis=1) / np.diff(np.log10(x))[:, np.newaxis]
+    pen = abs(np.mean(slope, axis=1)) + np.std(slope, axis=1)
+    # Add a small offset to avoid ZeroDivisionError
+    return np.sum(1.0 / (1e-7 + pen), axis=1)
 
 
 def patience(stopping_object=None, alpha=1e-4, **_kwargs):
@@ -86,11 +130,16 @@ def patience(stopping_object=None, alpha=1e-4, **_kwargs):
     3.434143467595683
 
     """
-    epoch_best = np.take(stopping_object.e_best_chi2, 0)
+    return np.take(patience_per_replica(stopping_object, alpha), 0)
+
+
+def patience_per_replica(stopping_object=None, alpha=1e-4, **_kwargs):
+    """Patience penalty of each replica, see :py:func:`patience`"""
+    epoch_best = np.atleast_1d(stopping_object.e_best_chi2)
     patience = stopping_object.stopping_patience
     max_epochs = stopping_object.total_epochs
     diff = abs(max_epochs - patience - epoch_best)
-    vl_loss = np.take(stopping_object.vl_chi2, 0)
+    vl_loss = np.atleast_1d(stopping_object.vl_chi2)
     return vl_loss * np.exp(alpha * diff)
 
 
@@ -111,10 +160,95 @@ def integrability(pdf_models=None, **_kwargs):
     True
 
     """
-    pdf_instance = N3PDF(pdf_models)
-    integ_values = pdf_instance.integrability_numbers()
-    integ_overflow = np.sum(integ_values[integ_values > fitveto.INTEG_THRESHOLD])
-    if integ_overflow > 50.0:
-        # before reaching an overflow, just give a stupidly big number
-        return np.exp(50.0)
-    return np.exp(integ_overflow) - 1.0
+    [pdf_values] = evaluate_pdf_models(pdf_models, [INTEGRABILITY_XGRID])
+    return _reduce_integrability(integrability_per_replica(pdf_values))
+
+
+def integrability_per_replica(pdf_values, *_args, **_kwargs):
+    """Integrability penalty of each replica, given the pdf of all replicas
+    with shape ``(replicas, xgrid_size, 14)`` evaluated in ``INTEGRABILITY_XGRID``"""
+    flavours = [EVOL_LIST.index(fl) for fl in INTEGRABILITY_FLAVOURS]
+    integ_values = np.sum(np.abs(pdf_values[:, :, flavours]), axis=1)
+    overflow = np.sum(np.where(integ_values > fitveto.INTEG_THRESHOLD, integ_values, 0.0), axis=1)
+    # before reaching an overflow, just give a stupidly big number
+    return np.expm1(np.minimum(overflow, INTEGRABILITY_MAX_OVERFLOW))
+
+
+def _reduce_integrability(values):
+    """The penalty for all replicas together is computed from the sum of their
+    overflows, i.e., the product of their ``1 + penalty``"""
+    overflow = np.sum(np.log1p(values))
+    if overflow >= INTEGRABILITY_MAX_OVERFLOW:
+        return np.exp(INTEGRABILITY_MAX_OVERFLOW)
+    return np.expm1(overflow)
+
+
+# Batched version of the penalties, see the module docstring
+PENALTY_XGRIDS = {"saturation": _saturation_xgrid, "integrability": _integrability_xgrid}
+PER_REPLICA_PENALTIES = {
+    "saturation": saturation_per_replica,
+    "patience": patience_per_replica,
+    "integrability": integrability_per_replica,
+}
+REDUCTIONS = {
+    "saturation": np.sum,
+    "patience": lambda values: np.take(values, 0),
+    "integrability": _reduce_integrability,
+}
+
+
+def per_replica_penalties(penalties, pdf_models=None, stopping_object=None, **kwargs):
+    """Compute all ``penalties`` (given by name) evaluating the pdf models only once
+
+    Parameters
+    ----------
+        penalties: list(str)
+            names of the penalties in this module
+        pdf_models: list(:py:class:`n3fit.backends.MetaModel`)
+            pdf models of all replicas
+        stopping_object: :py:class:`n3fit.stopping.Stopping`
+            stopping object of the fit
+        **kwargs:
+            options passed down to all penalties
+
+    Returns
+    -------
+        dict
+            for each penalty, the array with its value per replica
+            (or with a single value for penalties without a batched version)
+
+    Example
+    -------
+    >>> from types import SimpleNamespace
+    >>> from n3fit.hyper_optimization.penalties import per_replica_penalties
+    >>> from n3fit.model_gen import pdfNN_layer_generator
+    >>> fake_fl = [{'fl' : i, 'largex' : [0,1], 'smallx': [1,2]} for i in ['u', 'ubar', 'd', 'dbar', 'c', 'cbar', 's', 'sbar']]
+    >>> pdf_models = pdfNN_layer_generator(nodes=[8], activations=['linear'], seed=[0, 1], flav_info=fake_fl, parallel_models=2)
+    >>> fake_stopping = SimpleNamespace(e_best_chi2=[1000, 2000], stopping_patience=500, total_epochs=5000, vl_chi2=[2.42, 2.5])
+    >>> res = per_replica_penalties(["saturation", "patience"], pdf_models, fake_stopping)
+    >>> res["saturation"].shape
+    (2,)
+    """
+    batched = [name for name in penalties if name in PER_REPLICA_PENALTIES]
+    xgrids = {
+        name: PENALTY_XGRIDS[name](**kwargs) for name in batched if name in PENALTY_XGRIDS
+    }
+    pdf_values = dict(zip(xgrids, evaluate_pdf_models(pdf_models, list(xgrids.values()))))
+
+    result = {}
+    for name in penalties:
+        if name in xgrids:
+            result[name] = PER_REPLICA_PENALTIES[name](pdf_values[name], xgrids[name], **kwargs)
+        elif name in PER_REPLICA_PENALTIES:
+            result[name] = PER_REPLICA_PENALTIES[name](stopping_object=stopping_object, **kwargs)
+        else:
+            penalty = globals()[name]
+            value = penalty(pdf_models=pdf_models, stopping_object=stopping_object, **kwargs)
+            result[name] = np.atleast_1d(value)
+    return result
+
+
+def reduce_penalties(per_replica):
+    """Reduce the output of :py:func:`per_replica_penalties` to the value of every penalty
+    to be added to the hyperscan loss, as returned by the individual penalty functions"""
+    return {name: float(REDUCTIONS.get(name, np.sum)(values)) for name, values in per_replica.items()}
@@ -0,0 +1,133 @@
+"""
+    Checkpoints of a fit, written periodically to the replica folder so that a fit
+    which has been killed can be continued with ``n3fit --resume``.
+
+    A checkpoint is a dictionary (see :py:class:`n3fit.backends.callbacks.CheckpointCallback`)
+    with the state of the fit at the end of a given epoch: the weights of the training model
+    (which include the Lagrange multipliers), the state of the optimizer, the state of the
+    stopping algorithm (history of the fit and best weights of every replica) and the state
+    of the random number generators.
+    The checkpoints are written in a separate thread, so that the training only waits for
+    the copy of the state and not for the disk.
+
+    Every checkpoint records the replicas it belongs to and a digest of the parameters,
+    seeds and data of the fit (see :py:func:`fit_digest`), so that a fit is never resumed
+    from the checkpoint of a different one.
+"""
+import hashlib
+import json
+import logging
+import os
+import pickle
+import threading
+
+import numpy as np
+
+log = logging.getLogger(__name__)
+
+CHECKPOINT_FILE = "checkpoint.pickle"
+
+
+def checkpoint_path(replica_folder):
+    """Return the path of the checkpoint file inside ``replica_folder``"""
+    return replica_folder / CHECKPOINT_FILE
+
+
+def fit_digest(parameters, nnseeds, experiments):
+    """Hash of everything that determines the fit of a set of replicas: the ``parameters``
+    of the runcard, the seeds of the networks and the (pseudo)data of every experiment"""
+    h = hashlib.sha256(json.dumps(parameters, sort_keys=True, default=str).encode())
+    h.update(np.asarray(nnseeds, dtype=np.int64).tobytes())
+    for exp_dict in experiments:
+        h.update(exp_dict["name"].encode())
+        for key in ("expdata", "expdata_vl"):
+            h.update(np.ascontiguousarray(exp_dict[key], dtype=np.float64).tobytes())
+    return h.hexdigest()
+
+
+def fit_completed(replica_path, replicas, fitname):
+    """Whether the fit of the set of ``replicas`` has been completed, i.e., the metadata of
+    every replica (the last file written for it) exists and there is no checkpoint left,
+    which is only removed once all the replicas of the set have been written"""
+    if checkpoint_path(replica_path / f"replica_{replicas[0]}").exists():
+        return False
+    return all((replica_path / f"replica_{r}" / f"{fitname}.json").exists() for r in replicas)
+
+
+def _write(checkpoint, path):
+    """Write ``checkpoint`` to ``path`` through a temporary file, so that
+    a fit killed while writing never leaves a broken checkpoint behind"""
+    tmp_path = path.with_name(f".{path.name}.tmp")
+    with open(tmp_path, "wb") as f:
+        pickle.dump(checkpoint, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, path)
+
+
+class CheckpointWriter:
+    """Writes checkpoints to ``path`` in a background thread.
+    At most one checkpoint is written at any given time, if a new checkpoint
+    arrives while the previous one is still being written, ``write`` waits for it.
+
+    Parameters
+    ----------
+        path: pathlib.Path
+            file where the checkpoints are written
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._thread = None
+        self._error = None
+
+    def _target(self, checkpoint):
+        try:
+            _write(checkpoint, self.path)
+        except OSError as e:
+            self._error = e
+
+    def wait(self):
+        """Wait until the last checkpoint has been written"""
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._error is not None:
+            log.error("The checkpoint could not be written to %s: %s", self.path, self._error)
+            self._error = None
+
+    def write(self, checkpoint):
+        """Write ``checkpoint`` in the background. The checkpoint must not be modified
+        afterwards, i.e., it must contain copies of the state of the fit"""
+        self.wait()
+        self._thread = threading.Thread(target=self._target, args=(checkpoint,), daemon=True)
+        self._thread.start()
+
+
+def load_checkpoint(path):
+    """Load the checkpoint written in ``path``, returns None if there is none"""
+    if not path.exists():
+        return None
+    with open(path, "rb") as f:
+        return pickle.load(f)
+
+
+def check_checkpoint(checkpoint, path, replicas, digest):
+    """Raise a ``ValueError`` if ``checkpoint``, loaded from ``path``, does not belong
+    to the fit of ``replicas`` with the given ``digest`` (see :py:func:`fit_digest`)"""
+    if checkpoint["replicas"] != replicas:
+        raise ValueError(
+            f"The checkpoint {path} belongs to the replicas {checkpoint['replicas']}, "
+            f"it cannot be used to resume the fit of the replicas {replicas}"
+        )
+    if checkpoint.get("digest") != digest:
+        raise ValueError(
+            f"The checkpoint {path} was saved by a fit with different parameters or data, "
+            "remove it to start the fit from scratch"
+        )
+
+
+def remove_checkpoint(path):
+    """Remove the checkpoint written in ``path`` (if any)"""
+    try:
+        path.unlink()
+    except FileNotFoundError:
+        pass
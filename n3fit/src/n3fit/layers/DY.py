@@ -1,21 +1,77 @@
+from dataclasses import dataclass
 import numpy as np
 from .observable import Observable
 from n3fit.backends import operations as op
+from validphys.coredata import SparseFKTable
+
+# Sparse fktables with a density above this threshold are contracted as dense tensors
+SPARSE_DENSITY_THRESHOLD = 0.1
+
+
+@dataclass
+class GatherFKTable:
+    """Coordinate form of a hadronic fktable ready for ``op.pdf_gather_convolution``
+
+    For every non-zero entry of the fktable, ``left_index`` and ``right_index``
+    point to the flattened (xgrid, flavour) entries of the two PDFs
+    and ``data_index`` to the data point the entry contributes to.
+    """
+
+    left_index: object
+    right_index: object
+    data_index: object
+    values: object
+    ndata: int
+
+
+def _basis_mask(basis, nfl):
+    """Boolean (nfl, nfl) mask of the active flavour combinations"""
+    if basis is None:
+        return np.ones((nfl, nfl), dtype=bool)
+    basis_mask = np.zeros((nfl, nfl), dtype=bool)
+    for i, j in basis.reshape(-1, 2):
+        basis_mask[i, j] = True
+    return basis_mask
 
 
 class DY(Observable):
     """
     Computes the convolution of two PDFs (the same one twice) and one fktable
+
+    Fktables given as :py:class:`validphys.coredata.SparseFKTable` with a density
+    below ``sparse_threshold`` are contracted by gathering only the entries of
+    the luminosity that are needed, instead of computing the full luminosity tensor
     """
 
+    def __init__(self, *args, sparse_threshold=SPARSE_DENSITY_THRESHOLD, **kwargs):
+        self.sparse_threshold = sparse_threshold
+        super().__init__(*args, **kwargs)
+
+    def load_fktable(self, fktable, basis):
+        """Sparse fktables below ``sparse_threshold`` are kept in coordinate form,
+        everything else is converted into a dense tensor"""
+        if not isinstance(fktable, SparseFKTable) or fktable.density > self.sparse_threshold:
+            return super().load_fktable(fktable, basis)
+        # Active combinations in the same order used by op.pdf_masked_convolution
+        flavour_pairs = np.argwhere(_basis_mask(basis, self.nfl))
+        data_idx, comb_idx, x1_idx, x2_idx = fktable.coords
+        left_index = x1_idx * self.nfl + flavour_pairs[comb_idx, 0]
+        right_index = x2_idx * self.nfl + flavour_pairs[comb_idx, 1]
+        return GatherFKTable(
+            left_index=op.numpy_to_tensor(left_index, dtype="int32"),
+            right_index=op.numpy_to_tensor(right_index, dtype="int32"),
+            data_index=op.numpy_to_tensor(data_idx, dtype="int32"),
+            values=op.numpy_to_tensor(fktable.values),
+            ndata=fktable.ndata,
+        )
+
     def gen_mask(self, basis):
-        if basis is None:
-            basis_mask = np.ones((self.nfl, self.nfl), dtype=bool)
-        else:
-            basis_mask = np.zeros((self.nfl, self.nfl), dtype=bool)
-            for i, j in basis.reshape(-1, 2):
-                basis_mask[i, j] = True
-        return op.numpy_to_tensor(basis_mask, dtype=bool)
+        return op.numpy_to_tensor(_basis_mask(basis, self.nfl), dtype=bool)
+
+    def _gather_convolution(self, pdf, fk):
+        return op.pdf_gather_convolution(
+            pdf, fk.left_index, fk.right_index, fk.values, fk.data_index, fk.ndata
+        )
 
     def call(self, pdf_raw):
         """
@@ -27,6 +83,9 @@ class DY(Observable):
         The concatenate function returns a rank-3 tensor (combination_index, xgrid, xgrid)
         which can in turn be contracted with the rank-4 fktable.
 
+        Sparse fktables skip the luminosity tensor and are instead contracted
+        with the PDF through ``op.pdf_gather_convolution``.
+
         Parameters
         ----------
             pdf_in: tensor
@@ -44,18 +103,24 @@ class DY(Observable):
         if self.many_masks:
             if self.splitting:
                 splitted_pdf = op.split(pdf_raw, self.splitting, axis=1)
-                for mask, pdf, fk in zip(self.all_masks, splitted_pdf, self.fktables):
-                    pdf_x_pdf = op.pdf_masked_convolution(pdf, mask)
-                    res = op.tensor_product(fk, pdf_x_pdf, axes=3)
-                    results.append(res)
             else:
-                for mask, fk in zip(self.all_masks, self.fktables):
-                    pdf_x_pdf = op.pdf_masked_convolution(pdf_raw, mask)
-                    res = op.tensor_product(fk, pdf_x_pdf, axes=3)
-                    results.append(res)
+                splitted_pdf = [pdf_raw] * len(self.fktables)
+            for mask, pdf, fk in zip(self.all_masks, splitted_pdf, self.fktables):
+                if isinstance(fk, GatherFKTable):
+                    results.append(self._gather_convolution(pdf, fk))
+                    continue
+                pdf_x_pdf = op.pdf_masked_convolution(pdf, mask)
+                res = op.tensor_product(fk, pdf_x_pdf, axes=3)
+                results.append(res)
         else:
-            pdf_x_pdf = op.pdf_masked_convolution(pdf_raw, self.all_masks[0])
+            pdf_x_pdf = None
             for fk in self.fktables:
+                if isinstance(fk, GatherFKTable):
+                    results.append(self._gather_convolution(pdf_raw, fk))
+                    continue
+                # The luminosity is shared by all dense fktables
+                if pdf_x_pdf is None:
+                    pdf_x_pdf = op.pdf_masked_convolution(pdf_raw, self.all_masks[0])
                 res = op.tensor_product(fk, pdf_x_pdf, axes=3)
                 results.append(res)
 
@@ -10,6 +10,7 @@
 import numpy as np
 from n3fit.backends import MetaLayer
 from n3fit.backends import operations as op
+from validphys.covmats_utils import BlockLowRankMatrix
 
 
 class LossInvcovmat(MetaLayer):
@@ -24,6 +25,19 @@ class LossInvcovmat(MetaLayer):
     and can be updated at any points either directly or by using the
     ``update_mask`` and ``add_covmat`` methods.
 
+    When fitting several replicas at once, each with its own training/validation split,
+    the inverse covmat can be given per replica with shape ``(replicas, ndata, ndata)``
+    (with the rows and columns of the masked-out points set to zero)
+    together with a mask of shape ``(replicas, ndata)``.
+    Replicas with the same split can share the inverse covmat: the distinct
+    inverse covmats are given with shape ``(kernels, ndata, ndata)`` together with
+    ``kernel_index``, the index of the inverse covmat of every replica.
+
+    The inverse covmat can also be given as a
+    :py:class:`validphys.covmats_utils.BlockLowRankMatrix`, in which case the loss
+    is computed block by block plus the low rank correction, without building
+    the dense ``(ndata, ndata)`` matrix.
+
     Example
     -------
     >>> import numpy as np
@@ -37,29 +51,45 @@ class LossInvcovmat(MetaLayer):
     True
     """
 
-    def __init__(self, invcovmat, y_true, mask=None, covmat=None, **kwargs):
-        # If we have a diagonal matrix, padd with 0s and hope it's not too heavy on memory
-        if len(invcovmat.shape) == 1:
-            invcovmat = np.diag(invcovmat)
-        self._invcovmat = op.numpy_to_tensor(invcovmat)
+    def __init__(self, invcovmat, y_true, mask=None, covmat=None, kernel_index=None, **kwargs):
+        self._structured = isinstance(invcovmat, BlockLowRankMatrix)
+        if self._structured:
+            self._invcovmat = None
+            self._blocks = [op.numpy_to_tensor(block) for block in invcovmat.blocks]
+            self._block_slices = invcovmat.block_slices
+            self._low_rank = op.numpy_to_tensor(invcovmat.low_rank)
+            self._low_rank_sign = invcovmat.sign
+        else:
+            # If we have a diagonal matrix, padd with 0s and hope it's not too heavy on memory
+            if len(invcovmat.shape) == 1:
+                invcovmat = np.diag(invcovmat)
+            self._invcovmat = op.numpy_to_tensor(invcovmat)
         self._covmat = covmat
         self._y_true = op.numpy_to_tensor(y_true)
         self._ndata = y_true.shape[-1]
-        if mask is None or all(mask):
+        self._per_replica = len(invcovmat.shape) == 3
+        if kernel_index is not None:
+            kernel_index = op.numpy_to_tensor(kernel_index, dtype="int32")
+        self._kernel_index = kernel_index
+        if mask is None or np.all(mask):
             self._mask = None
+            self._mask_replicas = 1
         else:
-            mask = np.array(mask, dtype=np.float32).reshape((1, 1, -1))
+            mask = np.array(mask, dtype=np.float32)
+            self._mask_replicas = mask.shape[0] if mask.ndim == 2 else 1
+            mask = mask.reshape((1, self._mask_replicas, -1))
             self._mask = op.numpy_to_tensor(mask)
         super().__init__(**kwargs)
 
     def build(self, input_shape):
         """Transform the inverse covmat and the mask into
         weights of the layers"""
-        init = MetaLayer.init_constant(self._invcovmat)
-        self.kernel = self.builder_helper(
-            "invcovmat", (self._ndata, self._ndata), init, trainable=False
-        )
-        mask_shape = (1, 1, self._ndata)
+        if not self._structured:
+            init = MetaLayer.init_constant(self._invcovmat)
+            self.kernel = self.builder_helper(
+                "invcovmat", tuple(self._invcovmat.shape), init, trainable=False
+            )
+        mask_shape = (1, self._mask_replicas, self._ndata)
         if self._mask is None:
             init_mask = MetaLayer.init_constant(np.ones(mask_shape))
         else:
@@ -71,19 +101,48 @@ class LossInvcovmat(MetaLayer):
         Note, however, that the _covmat attribute of the layer will
         still refer to the original data covmat
         """
-        new_covmat = np.linalg.inv(self._covmat + covmat)
-        self.kernel.assign(new_covmat)
+        if self._structured:
+            # This combination is rejected by n3fit.checks.check_kfold_options
+            raise ValueError("Covmats cannot be added to a loss built from a structured covmat")
+        if self._covmat is None:
+            raise ValueError("Covmats can only be added to a loss built with its covmat")
+        total_covmat = self._covmat + covmat
+        if not self._per_replica:
+            self.kernel.assign(np.linalg.inv(total_covmat))
+            return
+        # Every per-replica inverse covmat is defined for the points with a non-zero diagonal
+        new_kernels = np.zeros(self.kernel.shape)
+        for new_kernel, kernel in zip(new_kernels, op.evaluate(self.kernel)):
+            idx = np.ix_(np.diag(kernel) != 0, np.diag(kernel) != 0)
+            new_kernel[idx] = np.linalg.inv(total_covmat[idx])
+        self.kernel.assign(new_kernels)
 
     def update_mask(self, new_mask):
         """Update the mask"""
         self.mask.assign(new_mask)
 
+    def _structured_loss(self, tmp):
+        """Loss for a block diagonal plus low rank inverse covmat"""
+        low = op.tensor_product(tmp, self._low_rank, axes=1)
+        res = self._low_rank_sign * op.einsum("brk, brk -> r", low, low)
+        for sl, block in zip(self._block_slices, self._blocks):
+            tmp_block = tmp[:, :, sl]
+            res += op.einsum("bri, ij, brj -> r", tmp_block, block, tmp_block)
+        return res
+
     def call(self, y_pred, **kwargs):
         tmp_raw = self._y_true - y_pred
         # TODO: most of the time this is a y * I multiplication and can be skipped
         # benchmark how much time (if any) is lost in this in actual fits for the benefit of faster kfolds
         tmp = op.op_multiply([tmp_raw, self.mask])
-        if tmp.shape[1] == 1:
+        if self._structured:
+            return self._structured_loss(tmp)
+        if self._per_replica:
+            kernel = self.kernel
+            if self._kernel_index is not None:
+                kernel = op.gather(kernel, self._kernel_index, axis=0)
+            res = op.einsum("bri, rij, brj -> r", tmp, kernel, tmp)
+        elif tmp.shape[1] == 1:
             # einsum is not well suited for CPU, so use tensordot if not multimodel
             right_dot = op.tensor_product(self.kernel, tmp[0, 0, :], axes=1)
             res = op.tensor_product(tmp[0, :, :], right_dot, axes=1)
@@ -2,6 +2,7 @@ from n3fit.backends import MetaLayer
 import numpy as np
 from abc import abstractmethod, ABC
 from n3fit.backends import operations as op
+from validphys.coredata import SparseFKTable
 
 
 def _is_unique(list_of_arrays):
@@ -31,7 +32,8 @@ class Observable(MetaLayer, ABC):
             fktable_dicts: list
                 list of fktable_dicts which define basis and xgrid for the fktables in the list
             fktable_arr: list
-                list of fktables for this observable
+                list of fktables for this observable, either as dense arrays
+                or as :py:class:`validphys.coredata.SparseFKTable`
             operation_name: str
                 string defining the name of the operation to be applied to the fktables
             nfl: int
@@ -49,7 +51,7 @@ class Observable(MetaLayer, ABC):
         for fktable, fk in zip(fktable_dicts, fktable_arr):
             xgrids.append(fktable["xgrid"])
             basis.append(fktable["basis"])
-            self.fktables.append(op.numpy_to_tensor(fk))
+            self.fktables.append(self.load_fktable(fk, fktable["basis"]))
 
         # check how many xgrids this dataset needs
         if _is_unique(xgrids):
@@ -66,12 +68,19 @@ class Observable(MetaLayer, ABC):
             self.all_masks = [self.gen_mask(i) for i in basis]
 
         self.operation = op.c_to_py_fun(operation_name)
-        self.output_dim = self.fktables[0].shape[0]
+        self.output_dim = fktable_arr[0].shape[0]
 
     def compute_output_shape(self, input_shape):
         return (self.output_dim, None)
 
     # Overridables
+    def load_fktable(self, fktable, basis):
+        """Convert the fktable into the object to be used by ``call``.
+        By default sparse fktables are converted to dense tensors"""
+        if isinstance(fktable, SparseFKTable):
+            fktable = fktable.to_dense()
+        return op.numpy_to_tensor(fktable)
+
     @abstractmethod
     def gen_mask(self, basis):
         pass
@@ -24,6 +24,7 @@ from n3fit.backends import operations as op
 from n3fit.backends import MetaLayer, Lambda
 from n3fit.backends import base_layer_selector, regularizer_selector
 from n3fit.layers.CombineCfac import CombineCfacLayer
+from validphys.coredata import SparseFKTable
 
 import logging
 log = logging.getLogger(__name__)
@@ -56,6 +57,9 @@ class ObservableWrapper:
     rotation: ObsRotation = None  # only used for diagonal covmat
     split: str = None
     post_observable: CombineCfacLayer = None
+    data_order: np.array = None  # only used for fused observables
+    replica_masks: np.array = None  # only used for per-replica tr/vl splits
+    kernel_index: np.array = None  # only used for per-replica tr/vl splits
 
     def _all_data(self):
         """Concatenate experimental data from datasets"""
@@ -64,12 +68,19 @@ class ObservableWrapper:
     def _generate_loss(self, mask=None):
         """Generates the corresponding loss function depending on the values the wrapper
         was initialized with"""
+        if self.replica_masks is not None:
+            # Combine the (optional) kfold mask with the mask of every replica
+            if mask is None:
+                mask = self.replica_masks
+            else:
+                mask = self.replica_masks * np.array(mask, dtype=bool)
         if self.invcovmat is not None:
             loss = losses.LossInvcovmat(
                 self.invcovmat,
                 self._all_data(),
                 mask,
                 covmat=self.covmat,
+                kernel_index=self.kernel_index,
                 name=self.name,
             )
         elif self.positivity:
@@ -79,6 +90,37 @@ class ObservableWrapper:
         return loss
 
 
+    def _linear_values(self):
+        """Concatenate the linear BSM factors of all datasets (masked according to
+        the ``split``) into one array per BSM operator. The datasets which are
+        not affected by a given operator get a factor of 0.
+        Returns an empty dictionary if no dataset has BSM factors."""
+        all_coefficients = []
+        for dataset_dict in self.spec_dict["datasets"]:
+            # Use get here to prevent having to worry about POSDATSETS
+            simu_parameters_names_CF = dataset_dict.get("simu_parameters_names_CF")
+            if self.split == "tr":
+                mask = dataset_dict["ds_tr_mask"]
+            elif self.split == "vl":
+                mask = ~dataset_dict["ds_tr_mask"]
+            else:
+                mask = np.ones(dataset_dict["ndata"], dtype=bool)
+            ndata = np.count_nonzero(mask)
+
+            coefficients = {}
+            if simu_parameters_names_CF is not None:
+                coefficients = {
+                    bsmnames.linear_datum_to_op(k): v.central_value[mask]
+                    for k, v in simu_parameters_names_CF.items()
+                }
+            all_coefficients.append((ndata, coefficients))
+
+        names = {k for _, coefficients in all_coefficients for k in coefficients}
+        return {
+            name: np.concatenate([c.get(name, np.zeros(ndata)) for ndata, c in all_coefficients])
+            for name in names
+        }
+
     def _generate_experimental_layer(self, pdf):
         """Generates the experimental layer from the PDF"""
         # First split the layer into the different datasets (if needed!)
@@ -95,48 +137,19 @@ class ObservableWrapper:
         # Every obs gets its share of the split
         output_layers = [obs(p_pdf) for p_pdf, obs in zip(split_pdf, self.observables)]
 
-        for idx, (dataset_dict, output_layer) in enumerate(
-            zip(self.spec_dict['datasets'], output_layers)
-        ):
-            # Use get here to prevent having to worry about POSDATSETS
-            simu_parameters_names_CF = dataset_dict.get('simu_parameters_names_CF')
-            simu_parameters_names = dataset_dict.get('simu_parameters_names')
-            simu_parameters_linear_combinations = dataset_dict.get('simu_parameter_linear_combinations')
-
-            if simu_parameters_names_CF is not None:
-
-                # coefficients = np.array([simu_parameters_names_CF[i].central_value for i in simu_parameters_names])
-                coefficients = {
-                    bsmnames.linear_datum_to_op(k): v.central_value
-                    for k, v in simu_parameters_names_CF.items()
-                }
-
-                if self.split == 'ex':
-                    cfacs = coefficients
-                    
-                elif self.split == 'tr':
-                    cfacs = {
-                        k: v[dataset_dict["ds_tr_mask"]]
-                        for k, v in coefficients.items()
-                    }
-                    
-                elif self.split == 'vl':
-                    # cfacs = coefficients[:, ~dataset_dict['ds_tr_mask']]
-                    cfacs = {
-                        k: v[~dataset_dict["ds_tr_mask"]]
-                        for k, v in coefficients.items()
-                    }
-                    
-                log.info("Applying combination layer")
-
-                output_layers[idx] = self.post_observable(
-                    output_layer,
-                    linear_values=cfacs,
-                )
-
         # Concatenate all datasets (so that experiments are one single entity)
         ret = op.concatenate(output_layers, axis=2)
 
+        # Fused observables output their datasets out of order
+        if self.data_order is not None:
+            ret = op.gather(ret, self.data_order, axis=2)
+
+        # The BSM factors of all datasets are applied at once
+        linear_values = self._linear_values()
+        if linear_values:
+            log.info("Applying combination layer")
+            ret = self.post_observable(ret, linear_values=linear_values)
+
         if self.rotation is not None:
             ret = self.rotation(ret)
         return ret
@@ -147,8 +160,136 @@ class ObservableWrapper:
         return loss_f(experiment_prediction)
 
 
+def _active_combinations(basis, hadronic, nfl=14):
+    """Sorted flat indices of the active flavours (DIS) or flavour pairs (hadronic)
+    in the same order used by the masks of the DIS and DY layers"""
+    if hadronic:
+        mask = np.zeros((nfl, nfl), dtype=bool)
+        for i, j in basis.reshape(-1, 2):
+            mask[i, j] = True
+    else:
+        mask = np.zeros(nfl, dtype=bool)
+        mask[basis] = True
+    return np.flatnonzero(mask)
+
+
+def _block_fktable(fktables, positions, ncombinations):
+    """Concatenate along the data axis the fktables of several datasets after
+    moving their flavour axis to the positions of a common basis of
+    ``ncombinations`` active flavours (combinations)"""
+    if isinstance(fktables[0], SparseFKTable):
+        all_coords = []
+        offset = 0
+        for fk, pos in zip(fktables, positions):
+            coords = fk.coords.copy()
+            coords[0] += offset
+            coords[1] = pos[coords[1]]
+            all_coords.append(coords)
+            offset += fk.ndata
+        return SparseFKTable(
+            shape=(offset, ncombinations) + tuple(fktables[0].shape[2:]),
+            coords=np.concatenate(all_coords, axis=1),
+            values=np.concatenate([fk.values for fk in fktables]),
+        )
+    blocks = []
+    for fk, pos in zip(fktables, positions):
+        block = np.zeros((fk.shape[0], ncombinations) + fk.shape[2:], dtype=fk.dtype)
+        block[:, pos] = fk
+        blocks.append(block)
+    return np.concatenate(blocks, axis=0)
+
+
+def _fuse_datasets(datasets, nfl=14):
+    """Fuse the datasets which can share a single observable layer, i.e., datasets
+    with a single fktable and no operation, which are all DIS or all hadronic and
+    have the same xgrid. The fktables of every group are packed into one
+    block-structured fktable (one block per dataset along the data axis) defined
+    in the union of the active flavours of the group.
+
+    Returns
+    -------
+        fused_datasets: list(dict)
+            list of dataset dictionaries where every group of fusable datasets
+            is substituted by a dictionary with the fused fktables,
+            at the position of the first dataset of the group.
+            The names of the datasets of the group are kept in its ``fused_names``
+        members: list(list(int))
+            for every entry of ``fused_datasets``, the indices of the
+            original datasets it contains
+    """
+    groups = {}
+    members = []
+    for idx, dataset_dict in enumerate(datasets):
+        fktables = dataset_dict["fktables"]
+        if (
+            len(fktables) == 1
+            and dataset_dict["operation"] == "NULL"
+            and not dataset_dict.get("use_fixed_predictions", False)
+        ):
+            key = (dataset_dict["hadronic"], fktables[0]["xgrid"].tobytes())
+            if key in groups:
+                groups[key].append(idx)
+                continue
+            groups[key] = group = [idx]
+            members.append(group)
+        else:
+            members.append([idx])
+
+    fused_datasets = []
+    for group in members:
+        if len(group) == 1:
+            fused_datasets.append(datasets[group[0]])
+            continue
+        group_datasets = [datasets[i] for i in group]
+        hadronic = group_datasets[0]["hadronic"]
+        fktable_dicts = [i["fktables"][0] for i in group_datasets]
+        actives = [_active_combinations(i["basis"], hadronic, nfl) for i in fktable_dicts]
+        union = np.unique(np.concatenate(actives))
+        positions = [np.searchsorted(union, i) for i in actives]
+        if hadronic:
+            basis = np.stack(np.unravel_index(union, (nfl, nfl)), axis=1).ravel()
+        else:
+            basis = union
+
+        names = [i["name"] for i in group_datasets]
+        fused_dict = {
+            # The name is used for the layers, so it can only contain valid scope characters
+            "name": "_".join(names),
+            "fused_names": names,
+            "hadronic": hadronic,
+            "operation": "NULL",
+            "use_fixed_predictions": False,
+            "ndata": sum(i["ndata"] for i in group_datasets),
+            "fktables": [{"xgrid": fktable_dicts[0]["xgrid"], "basis": basis}],
+        }
+        for key in ["tr_fktables", "vl_fktables", "ex_fktables"]:
+            if key in group_datasets[0]:
+                fks = [i[key][0] for i in group_datasets]
+                fused_dict[key] = [_block_fktable(fks, positions, len(union))]
+        fused_datasets.append(fused_dict)
+    return fused_datasets, members
+
+
+def _data_order(members, sizes):
+    """Given the original datasets contained in each observable (``members``) and
+    the number of points of every original dataset (``sizes``), return the indices
+    which take the concatenated output of the observables back to the original
+    order of the data. Return None if no reordering is needed."""
+    offsets = np.concatenate([[0], np.cumsum(sizes)])
+    output_order = np.concatenate(
+        [np.arange(offsets[i], offsets[i + 1]) for group in members for i in group]
+    )
+    if np.array_equal(output_order, np.arange(offsets[-1])):
+        return None
+    return np.argsort(output_order)
+
+
 def observable_generator(
-    spec_dict, positivity_initial=1.0, integrability=False, post_observable=None
+    spec_dict,
+    positivity_initial=1.0,
+    integrability=False,
+    post_observable=None,
+    fuse_datasets=False,
 ):  # pylint: disable=too-many-locals
     """
     This function generates the observable model for each experiment.
@@ -164,6 +305,10 @@ def observable_generator(
 
     If the dataset is a positivity dataset acts in consequence.
 
+    If ``fuse_datasets`` is True, the datasets of the experiment which share
+    an xgrid (and consist of just one fktable) are evaluated together by a single
+    observable layer, see ``_fuse_datasets``.
+
     The output is a dictionary (`layer_info`), each one of the three output functions
     have a signature:
 
@@ -178,6 +323,8 @@ def observable_generator(
             a dictionary-like object containing the information of the experiment
         positivity_initial: float
             set the positivity lagrange multiplier for epoch 1
+        fuse_datasets: bool
+            whether to fuse the observable layers of compatible datasets
 
     Returns
     ------
@@ -195,8 +342,23 @@ def observable_generator(
     model_obs_vl = []
     model_obs_ex = []
     model_inputs = []
+    # When the data is transformed (diagonal basis) or the training/validation split
+    # is different for every replica the observables are computed for the full dataset
+    full_observables = (
+        spec_dict.get("data_transformation_tr") is not None
+        or spec_dict.get("replica_trmasks") is not None
+    )
+    if full_observables:
+        split_tr = split_vl = "ex"
+    else:
+        split_tr, split_vl = "tr", "vl"
+    if fuse_datasets:
+        observable_datasets, members = _fuse_datasets(spec_dict["datasets"])
+    else:
+        observable_datasets = spec_dict["datasets"]
+        members = None
     # The first step is to compute the observable for each of the datasets
-    for dataset_dict in spec_dict["datasets"]:
+    for dataset_dict in observable_datasets:
         # Get the generic information of the dataset
         dataset_name = dataset_dict["name"]
 
@@ -238,8 +400,8 @@ def observable_generator(
                 name=f"dat_{dataset_name}",
             )
             obs_layer_ex = obs_layer_vl = None
-        elif spec_dict.get("data_transformation_tr") is not None:
-            # Data transformation needs access to the full array of output data
+        elif full_observables:
+            # Data transformation and per-replica masks need access to the full array of output data
             obs_layer_ex = Obs_Layer(
                 dataset_dict["fktables"],
                 dataset_dict["ex_fktables"],
@@ -288,6 +450,18 @@ def observable_generator(
         model_obs_vl.append(obs_layer_vl)
         model_obs_ex.append(obs_layer_ex)
 
+    # When datasets are fused, the output of the observables needs to be reordered
+    orders = {"tr": None, "vl": None, "ex": None}
+    if members is not None and spec_dict["datasets"]:
+        if full_observables:
+            fk_keys = {"tr": "ex_fktables", "vl": "ex_fktables", "ex": "ex_fktables"}
+        else:
+            fk_keys = {"tr": "tr_fktables", "vl": "vl_fktables", "ex": "ex_fktables"}
+        for split, fk_key in fk_keys.items():
+            if fk_key in spec_dict["datasets"][0]:
+                sizes = [i[fk_key][0].shape[0] for i in spec_dict["datasets"]]
+                orders[split] = _data_order(members, sizes)
+
     full_nx = sum(dataset_xsizes)
     if spec_dict["positivity"]:
         out_positivity = ObservableWrapper(
@@ -299,7 +473,8 @@ def observable_generator(
             integrability=integrability,
             spec_dict=spec_dict,
             split='ex',
-            post_observable=post_observable
+            post_observable=post_observable,
+            data_order=orders["tr"],
         )
 
         layer_info = {
@@ -326,8 +501,11 @@ def observable_generator(
         data=spec_dict["expdata"],
         rotation=obsrot_tr,
         spec_dict=spec_dict,
-        split='tr',
+        split=split_tr,
         post_observable=post_observable,
+        data_order=orders["tr"],
+        replica_masks=spec_dict.get("replica_trmasks"),
+        kernel_index=spec_dict.get("invcovmat_index"),
     )
     out_vl = ObservableWrapper(
         f"{spec_name}_val",
@@ -337,8 +515,11 @@ def observable_generator(
         data=spec_dict["expdata_vl"],
         rotation=obsrot_vl,
         spec_dict=spec_dict,
-        split='vl',
+        split=split_vl,
         post_observable=post_observable,
+        data_order=orders["vl"],
+        replica_masks=spec_dict.get("replica_vlmasks"),
+        kernel_index=spec_dict.get("invcovmat_vl_index"),
     )
     out_exp = ObservableWrapper(
         f"{spec_name}_exp",
@@ -351,6 +532,7 @@ def observable_generator(
         spec_dict=spec_dict,
         split='ex',
         post_observable=post_observable,
+        data_order=orders["ex"],
     )
 
     layer_info = {
@@ -475,6 +657,7 @@ def pdfNN_layer_generator(
     regularizer=None,
     regularizer_args=None,
     impose_sumrule=None,
+    msr_integration=None,
     scaler=None,
     parallel_models=1,
 ):  # pylint: disable=too-many-locals
@@ -564,6 +747,9 @@ def pdfNN_layer_generator(
             rate of dropout layer by layer
         impose_sumrule: str
             whether to impose sumrules on the output pdf and which one to impose (All, MSR, VSR)
+        msr_integration: dict
+            integration ``scheme`` and number of points ``nx`` used to impose the sumrules,
+            see :py:func:`n3fit.msr.gen_integration_input`
         scaler: scaler
             Function to apply to the input. If given the input to the model
             will be a (1, None, 2) tensor where dim [:,:,0] is scaled
@@ -639,7 +825,11 @@ def pdfNN_layer_generator(
 
     # Normalization and sum rules
     if impose_sumrule:
-        sumrule_layer, integrator_input = msr_impose(mode=impose_sumrule, scaler=scaler)
+        if msr_integration is None:
+            msr_integration = {}
+        sumrule_layer, integrator_input = msr_impose(
+            mode=impose_sumrule, scaler=scaler, **msr_integration
+        )
         model_input["integrator_input"] = integrator_input
     else:
         sumrule_layer = lambda x: x
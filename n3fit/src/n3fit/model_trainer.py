@@ -15,7 +15,9 @@ from scipy.interpolate import PchipInterpolator
 import n3fit.model_gen as model_gen
 from n3fit.backends import MetaModel, clear_backend_state, callbacks
 from n3fit.backends import operations as op
+from n3fit.io import checkpoint
 from n3fit.stopping import Stopping
+from n3fit.stopwatch import StopWatch
 from n3fit.vpinterface import N3PDF
 import n3fit.hyper_optimization.penalties
 import n3fit.hyper_optimization.rewards
@@ -131,6 +133,7 @@ class ModelTrainer:
         model_file=None,
         sum_rules=None,
         parallel_models=1,
+        stopwatch=None,
     ):
         """
         Parameters
@@ -154,7 +157,8 @@ class ModelTrainer:
             debug: bool
                 flag to activate some debug options
             kfold_parameters: dict
-                parameters defining the kfolding method
+                parameters defining the kfolding method, with ``parallel_folds: True``
+                all folds of a hyperopt trial are trained at once as parallel models
             max_cores: int
                 maximum number of cores the fitting can use to run
             model_file: str
@@ -165,6 +169,9 @@ class ModelTrainer:
                 number of models to fit in parallel
             n_simu_parameters: int
                 number of bsm coefficients in the fit
+            stopwatch: StopWatch
+                stopwatch where the phases of the fit (model building, compilation,
+                training steps...) are profiled, a new one is created if not given
         """
         # Save all input information
         self.exp_info = exp_info
@@ -190,6 +197,9 @@ class ModelTrainer:
         self.bsm_initialisation_seed = bsm_initialisation_seed
         self.fixed_pdf = fixed_pdf
         self.replicas = replicas
+        if stopwatch is None:
+            stopwatch = StopWatch()
+        self.stopwatch = stopwatch
 
         # Initialise internal variables which define behaviour
         if debug:
@@ -204,15 +214,18 @@ class ModelTrainer:
         if kfold_parameters is None:
             self.kpartitions = [None]
             self.hyper_threshold = None
+            self.parallel_folds = False
         else:
             self.kpartitions = kfold_parameters["partitions"]
             self.hyper_threshold = kfold_parameters.get("threshold", HYPER_THRESHOLD)
+            self.parallel_folds = kfold_parameters.get("parallel_folds", False)
             # if there are penalties enabled, set them up
             penalties = kfold_parameters.get("penalties", [])
             self.hyper_penalties = []
             for penalty in penalties:
-                pen_fun = getattr(n3fit.hyper_optimization.penalties, penalty)
-                self.hyper_penalties.append(pen_fun)
+                # Ensure the penalty exists, they are computed together by name
+                getattr(n3fit.hyper_optimization.penalties, penalty)
+                self.hyper_penalties.append(penalty)
                 log.info("Adding penalty: %s", penalty)
             # Check what is the hyperoptimization target function
             hyper_loss = kfold_parameters.get("target", None)
@@ -256,7 +269,7 @@ class ModelTrainer:
 
         self._fill_the_dictionaries()
 
-        if self.validation["ndata"] == 0:
+        if np.all(self.validation["ndata"] == 0):
             # If there is no validation, the validation chi2 = training chi2
             self.no_validation = True
             self.validation["expdata"] = self.training["expdata"]
@@ -267,6 +280,7 @@ class ModelTrainer:
         self.callbacks = []
         if debug:
             self.callbacks.append(callbacks.TimerCallback())
+        self._checkpoint = None
 
     def set_hyperopt(self, hyperopt_on, keys=None, status_ok="ok"):
         """Set hyperopt options on and off (mostly suppresses some printing)"""
@@ -332,7 +346,7 @@ class ModelTrainer:
                 self.training["expdata"].append(integ_dict["expdata"])
                 self.training["integdatasets"].append(integ_dict["name"])
 
-    def _model_generation(self, pdf_models, partition, partition_idx):
+    def _model_generation(self, pdf_models, fold_masks):
         """
         Fills the three dictionaries (``training``, ``validation``, ``experimental``)
         with the ``model`` entry
@@ -361,6 +375,9 @@ class ModelTrainer:
         ----------
             pdf_models: list(n3fit.backend.MetaModel)
                 a list of models that produce PDF values
+            fold_masks: tuple
+                the training, validation and experimental masks of the kfolding partition,
+                as returned by :py:meth:`_fold_masks` or :py:meth:`_parallel_fold_masks`
 
         Returns
         -------
@@ -398,14 +415,7 @@ class ModelTrainer:
         splitting_layer = op.as_layer(op.split, op_args=sp_ar, op_kwargs=sp_kw, name="pdf_split")
         splitted_pdf = splitting_layer(full_pdf_per_replica)
 
-        # If we are in a kfolding partition, select which datasets are out
-        training_mask = validation_mask = experimental_mask = [None]
-        if partition and partition["datasets"]:
-            if partition.get("overfit", False):
-                # If overfitting, don't apply folding masks to the training/validation
-                training_mask = [i[partition_idx] for i in self.training["folds"]]
-                validation_mask = [i[partition_idx] for i in self.validation["folds"]]
-            experimental_mask = [i[partition_idx] for i in self.experimental["folds"]]
+        training_mask, validation_mask, experimental_mask = fold_masks
 
         # Training and validation leave out the kofld dataset
         # experiment leaves out the negation
@@ -448,6 +458,60 @@ class ModelTrainer:
 
         return models
 
+    def _fold_masks(self, partition, partition_idx):
+        """Return the training, validation and experimental masks (one per experiment)
+        selecting which data enters the models for the kfolding ``partition``.
+        ``[None]`` means that no mask is applied"""
+        training_mask = validation_mask = experimental_mask = [None]
+        if partition and partition["datasets"]:
+            if partition.get("overfit", False):
+                # If overfitting, don't apply folding masks to the training/validation
+                training_mask = [i[partition_idx] for i in self.training["folds"]]
+                validation_mask = [i[partition_idx] for i in self.validation["folds"]]
+            experimental_mask = [i[partition_idx] for i in self.experimental["folds"]]
+        return training_mask, validation_mask, experimental_mask
+
+    def _parallel_fold_masks(self):
+        """Like :py:meth:`_fold_masks` but for all partitions at once, so that the
+        pdf model ``k`` of a parallel fit is trained and evaluated on the fold ``k``.
+        The masks of every experiment are stacked with shape ``(folds, ndata)``,
+        as the per-replica masks of the losses"""
+        all_masks = [self._fold_masks(p, k) for k, p in enumerate(self.kpartitions)]
+        stacked = []
+        for split, masks in zip(
+            (self.training, self.validation, self.experimental), zip(*all_masks)
+        ):
+            if all(mask[0] is None for mask in masks):
+                stacked.append([None])
+                continue
+            stacked.append(
+                [
+                    np.stack(
+                        [
+                            np.ones_like(folds[0], dtype=bool) if mask[0] is None else mask[i]
+                            for mask in masks
+                        ]
+                    )
+                    for i, folds in enumerate(split["folds"])
+                ]
+            )
+        return tuple(stacked)
+
+    def _fold_ndata(self, partition_idx):
+        """Number of points of the experimental model for the fold ``partition_idx``"""
+        ndata = np.sum([np.count_nonzero(i[partition_idx]) for i in self.experimental["folds"]])
+        # If ndata == 0 then it's the opposite, all data is in!
+        if ndata == 0:
+            ndata = self.experimental["ndata"]
+        return ndata
+
+    def _load_weights(self, pdf_models, replicas):
+        """Load the weights of ``self.model_file`` for the given replicas into ``pdf_models``"""
+        for pdf_model, replica in zip(pdf_models, replicas):
+            weights_path = l.resultspath / self.model_file.name / 'nnfit' / ('replica_%s' % replica) / 'weights.h5'
+            log.info("Loading weights from path: " + str(weights_path))
+            pdf_model.load_weights(weights_path)
+
     def _reset_observables(self):
         """
         Resets the 'output' and 'losses' entries of all 3 dictionaries:
@@ -481,6 +545,7 @@ class ModelTrainer:
         all_integ_initial,
         epochs,
         interpolation_points,
+        fuse_observables=False,
     ):
         """
         This functions fills the 3 dictionaries (training, validation, experimental)
@@ -498,6 +563,11 @@ class ModelTrainer:
                 initial value for the positivity lambda
             epochs: int
                 total number of epochs for the run
+            interpolation_points: int, None
+                number of points used for the feature scaling interpolation
+            fuse_observables: bool
+                whether the datasets of an experiment sharing an xgrid
+                should be evaluated by a single fused observable layer
         """
 
         # First reset the dictionaries
@@ -522,7 +592,9 @@ class ModelTrainer:
             if not self.mode_hyperopt:
                 log.info("Generating layers for experiment %s", exp_dict["name"])
 
-            exp_layer = model_gen.observable_generator(exp_dict, post_observable=combiner)
+            exp_layer = model_gen.observable_generator(
+                exp_dict, post_observable=combiner, fuse_datasets=fuse_observables
+            )
 
             # Save the input(s) corresponding to this experiment
             self.input_list += exp_layer["inputs"]
@@ -643,6 +715,8 @@ class ModelTrainer:
         regularizer,
         regularizer_args,
         seed,
+        parallel_models=None,
+        msr_integration=None,
     ):
         """
         Defines the internal variable layer_pdf
@@ -669,6 +743,10 @@ class ModelTrainer:
                 dictionary of arguments for the regularizer
             seed: int
                 seed for the NN
+            parallel_models: int
+                number of models generated, by default the number of parallel replicas
+            msr_integration: dict
+                integration scheme and number of points used to impose the sum rules
         see model_gen.pdfNN_layer_generator for more information
 
         Returns
@@ -692,8 +770,9 @@ class ModelTrainer:
             regularizer=regularizer,
             regularizer_args=regularizer_args,
             impose_sumrule=self.impose_sumrule,
+            msr_integration=msr_integration,
             scaler=self._scaler,
-            parallel_models=self._parallel_models,
+            parallel_models=parallel_models or self._parallel_models,
         )
         return pdf_models
 
@@ -728,23 +807,49 @@ class ModelTrainer:
         In the same way, every ``PUSH_INTEGRABILITY_EACH`` epochs the integrability
         will be multiplied by their respective integrability multipliers
         """
-        callback_st = callbacks.StoppingCallback(stopping_object)
+        callback_profile = callbacks.ProfilingCallback(self.stopwatch)
+        callback_st = callbacks.StoppingCallback(stopping_object, stopwatch=self.stopwatch)
         callback_pos = callbacks.LagrangeCallback(
             self.training["posdatasets"],
             self.training["posmultipliers"],
             update_freq=PUSH_POSITIVITY_EACH,
+            stopwatch=self.stopwatch,
+            phase_name="positivity_update",
         )
         callback_integ = callbacks.LagrangeCallback(
             self.training["integdatasets"],
             self.training["integmultipliers"],
             update_freq=PUSH_INTEGRABILITY_EACH,
+            stopwatch=self.stopwatch,
+            phase_name="integrability_update",
         )
 
-        training_model.perform_fit(
-            epochs=epochs,
-            verbose=False,
-            callbacks=self.callbacks + [callback_st, callback_pos, callback_integ],
-        )
+        fit_callbacks = [callback_profile] + self.callbacks + [callback_st, callback_pos, callback_integ]
+
+        initial_epoch = 0
+        if self._checkpoint is not None:
+            initial_epoch = self._resume_from_checkpoint(training_model, stopping_object)
+            writer = checkpoint.CheckpointWriter(self._checkpoint["path"])
+            fit_callbacks.append(
+                callbacks.CheckpointCallback(
+                    writer,
+                    stopping_object,
+                    self._checkpoint["each"],
+                    extra_info={
+                        "replicas": self._checkpoint["replicas"],
+                        "digest": self._checkpoint["digest"],
+                    },
+                    stopwatch=self.stopwatch,
+                )
+            )
+
+        with self.stopwatch.phase("training"):
+            training_model.perform_fit(
+                epochs=epochs,
+                initial_epoch=initial_epoch,
+                verbose=False,
+                callbacks=fit_callbacks,
+            )
 
         # TODO: in order to use multireplica in hyperopt is is necessary to define what "passing" means
         # for now consider the run as good if any replica passed
@@ -752,6 +857,24 @@ class ModelTrainer:
             return self.pass_status
         return self.failed_status
 
+    def _resume_from_checkpoint(self, training_model, stopping_object):
+        """If resuming is enabled and a checkpoint exists, restore the state of the fit
+        and return the epoch at which it has to continue, otherwise return 0"""
+        if not self._checkpoint["resume"]:
+            return 0
+        path = self._checkpoint["path"]
+        saved_state = checkpoint.load_checkpoint(path)
+        if saved_state is None:
+            log.info("No checkpoint found in %s, starting the fit from scratch", path)
+            return 0
+        checkpoint.check_checkpoint(
+            saved_state, path, self._checkpoint["replicas"], self._checkpoint["digest"]
+        )
+        with self.stopwatch.phase("resume"):
+            initial_epoch = callbacks.load_checkpoint(training_model, stopping_object, saved_state)
+        log.info("Resuming the fit from epoch %d", initial_epoch)
+        return initial_epoch
+
     def _hyperopt_override(self, params):
         """Unrolls complicated hyperopt structures into very simple dictionaries"""
         # If the input contains all parameters, then that's your dictionary of hyperparameters
@@ -782,6 +905,33 @@ class ModelTrainer:
         )
         self.callbacks.append(callback_tb)
 
+    def enable_checkpoint(self, path, each, replicas, resume=False, digest=None):
+        """Enables the checkpointing of the fit for further runs of the fitting procedure.
+        See :py:mod:`n3fit.io.checkpoint`
+
+        Parameters
+        ----------
+            path: Path
+                file where the checkpoints are saved
+            each: int
+                each how many epochs a checkpoint is saved
+            replicas: list(int)
+                replicas being fitted, the checkpoint can only be used to resume their fit
+            resume: bool
+                whether to resume the fit from the checkpoint saved in ``path``, if any
+            digest: str
+                digest of the parameters and data of the fit (see
+                :py:func:`n3fit.io.checkpoint.fit_digest`), a checkpoint saved with
+                a different digest cannot be used to resume the fit
+        """
+        self._checkpoint = {
+            "path": path,
+            "each": each,
+            "replicas": list(replicas),
+            "resume": resume,
+            "digest": digest,
+        }
+
     def evaluate(self, stopping_object):
         """Returns the training, validation and experimental chi2
 
@@ -806,6 +956,147 @@ class ModelTrainer:
         exp_chi2 = self.experimental["model"].compute_losses()["loss"] / self.experimental["ndata"]
         return train_chi2, val_chi2, exp_chi2
 
+    def _generate_pdf_from_params(self, params, seeds, parallel_models=None):
+        """Call :py:meth:`_generate_pdf` with the architecture defined in ``params``"""
+        return self._generate_pdf(
+            params["nodes_per_layer"],
+            params["activation_per_layer"],
+            params["initializer"],
+            params["layer_type"],
+            params["dropout"],
+            params.get("regularizer", None),  # regularizer optional
+            params.get("regularizer_args", None),
+            seeds,
+            parallel_models=parallel_models,
+            msr_integration=params.get("msr_integration"),
+        )
+
+    def _hyperopt_output(self, passed, l_hyper, l_valid, l_exper, n3pdfs, exp_models):
+        """Dictionary with the information about the losses of a hyperopt trial"""
+        # Hyperopt needs a dictionary with information about the losses
+        # it is possible to store arbitrary information in the trial file
+        # by adding it to this dictionary
+        return {
+            "status": passed,
+            "loss": self._hyper_loss(fold_losses=l_hyper, n3pdfs=n3pdfs, experimental_models=exp_models),
+            "validation_loss": np.average(l_valid),
+            "experimental_loss": np.average(l_exper),
+            "kfold_meta": {
+                "validation_losses": l_valid,
+                "experimental_losses": l_exper,
+                "hyper_losses": l_hyper,
+            },
+        }
+
+    def _train_parallel_folds(self, params, epochs, stopping_epochs, threshold_pos, threshold_chi2):
+        """Train all the folds of a hyperopt trial at once, as the parallel models of a
+        single compiled model in which the pdf model ``k`` is trained and evaluated with
+        the masks of the fold ``k``. Every fold stops independently.
+
+        The losses of every fold are computed as in the sequential loop of
+        :py:meth:`hyperparametrizable`, from the same per-replica losses and penalties.
+
+        Returns
+        -------
+            passed: str
+                status of the trial
+            l_hyper, l_valid, l_exper: list(float)
+                hyperopt, validation and experimental losses of every fold
+            n3pdfs: list(N3PDF)
+                the pdf of every fold
+            exp_models: list(MetaModel)
+                the experimental model (shared by all folds)
+        """
+        nfolds = len(self.kpartitions)
+        # The first fold uses the seeds of the replica and the others new ones,
+        # as when the folds are trained one after the other
+        seeds = list(self._nn_seeds) + [np.random.randint(0, pow(2, 31)) for _ in range(nfolds - 1)]
+        log.info("Training %d folds in parallel", nfolds)
+
+        with self.stopwatch.phase("pdf_build", folds=nfolds):
+            pdf_models = self._generate_pdf_from_params(params, seeds, parallel_models=nfolds)
+
+        if self.fixed_pdf:
+            log.info("Performing fixed PDF fit.")
+            for pdf_model in pdf_models:
+                pdf_model.trainable = False
+
+        with self.stopwatch.phase("model_build", folds=nfolds):
+            models = self._model_generation(pdf_models, self._parallel_fold_masks())
+
+        if self.model_file:
+            log.info("Using weights from fit: " + str(self.model_file))
+            self._load_weights(pdf_models, self.replicas[:1] * nfolds)
+
+        if self.no_validation:
+            models["validation"] = models["training"]
+
+        # The chi2 monitored by the stopping is normalized by the number of points of the full data
+        stopping_object = Stopping(
+            models["validation"],
+            self._prepare_reporting(None),
+            pdf_models,
+            total_epochs=epochs,
+            stopping_patience=stopping_epochs,
+            threshold_positivity=threshold_pos,
+            threshold_chi2=threshold_chi2,
+            combiner=self.combiner
+        )
+
+        with self.stopwatch.phase("compile", folds=nfolds):
+            for model in models.values():
+                model.compile(**params["optimizer"])
+
+        self._train_and_fit(models["training"], stopping_object, epochs=epochs)
+
+        best_epochs = np.atleast_1d(stopping_object.e_best_chi2)
+        validation_losses = np.atleast_1d(stopping_object.vl_chi2)
+        experimental_losses = np.atleast_1d(models["experimental"].compute_losses()["loss"])
+        penalties = {}
+        if self.hyper_penalties:
+            with self.stopwatch.phase("hyperopt_penalties", folds=nfolds):
+                penalties = n3fit.hyper_optimization.penalties.per_replica_penalties(
+                    self.hyper_penalties, pdf_models=pdf_models, stopping_object=stopping_object
+                )
+
+        passed = self.pass_status
+        l_hyper, l_valid, l_exper, n3pdfs, exp_models = [], [], [], [], []
+        for k in range(nfolds):
+            if not best_epochs[k]:
+                log.info("Hyperparameter combination fail to find a good fit, breaking")
+                passed = self.failed_status
+                break
+            experimental_loss = experimental_losses[k] / self._fold_ndata(k)
+            hyper_loss = experimental_loss
+            # Penalties without a per-replica version have a single value for all folds
+            fold_penalties = {
+                name: values[k : k + 1] if len(values) == nfolds else values
+                for name, values in penalties.items()
+            }
+            for name, value in n3fit.hyper_optimization.penalties.reduce_penalties(fold_penalties).items():
+                log.debug("Penalty %s: %s", name, value)
+                hyper_loss += value
+            log.info("Fold %d finished, loss=%.1f, pass=%s", k + 1, hyper_loss, passed)
+
+            l_hyper.append(hyper_loss)
+            l_valid.append(validation_losses[k])
+            l_exper.append(experimental_loss)
+            n3pdfs.append(N3PDF(pdf_models[k : k + 1], name=f"fold_{k}"))
+            exp_models.append(models["experimental"])
+
+            if hyper_loss > self.hyper_threshold:
+                log.info(
+                    "Loss above threshold (%.1f > %.1f), breaking",
+                    hyper_loss,
+                    self.hyper_threshold,
+                )
+                # Apply a penalty proportional to the number of folds not computed
+                pen_mul = nfolds - k
+                l_hyper = [i * pen_mul for i in l_hyper]
+                break
+
+        return passed, l_hyper, l_valid, l_exper, n3pdfs, exp_models
+
     def hyperparametrizable(self, params):
         """
         Wrapper around all the functions defining the fit.
@@ -843,17 +1134,26 @@ class ModelTrainer:
         # when k-folding, these are the same for all folds
         positivity_dict = params.get("positivity", {})
         integrability_dict = params.get("integrability", {})
-        self._generate_observables(
-            positivity_dict.get("multiplier"),
-            positivity_dict.get("initial"),
-            integrability_dict.get("multiplier"),
-            integrability_dict.get("initial"),
-            epochs,
-            params.get("interpolation_points"),
-        )
+        with self.stopwatch.phase("observables_build"):
+            self._generate_observables(
+                positivity_dict.get("multiplier"),
+                positivity_dict.get("initial"),
+                integrability_dict.get("multiplier"),
+                integrability_dict.get("initial"),
+                epochs,
+                params.get("interpolation_points"),
+                params.get("fuse_observables", False),
+            )
         threshold_pos = positivity_dict.get("threshold", 1e-6)
         threshold_chi2 = params.get("threshold_chi2", CHI2_THRESHOLD)
 
+        if self.parallel_folds and self.mode_hyperopt:
+            return self._hyperopt_output(
+                *self._train_parallel_folds(
+                    params, epochs, stopping_epochs, threshold_pos, threshold_chi2
+                )
+            )
+
         # Initialize the chi2 dictionaries
         l_valid = []
         l_exper = []
@@ -872,16 +1172,8 @@ class ModelTrainer:
                 seeds = [np.random.randint(0, pow(2, 31)) for _ in seeds]
 
             # Generate the pdf model
-            pdf_models = self._generate_pdf(
-                params["nodes_per_layer"],
-                params["activation_per_layer"],
-                params["initializer"],
-                params["layer_type"],
-                params["dropout"],
-                params.get("regularizer", None),  # regularizer optional
-                params.get("regularizer_args", None),
-                seeds,
-            )
+            with self.stopwatch.phase("pdf_build", fold=k):
+                pdf_models = self._generate_pdf_from_params(params, seeds)
 
             if self.fixed_pdf:
                 log.info("Performing fixed PDF fit.")
@@ -890,17 +1182,13 @@ class ModelTrainer:
 
             # Model generation joins all the different observable layers
             # together with pdf model generated above
-            models = self._model_generation(pdf_models, partition, k)
+            with self.stopwatch.phase("model_build", fold=k):
+                models = self._model_generation(pdf_models, self._fold_masks(partition, k))
 
             # Only after model generation, apply possible weight file
             if self.model_file:
                 log.info("Using weights from fit: " + str(self.model_file))
-                idx = 0
-                for pdf_model in pdf_models:
-                    weights_path = l.resultspath / self.model_file.name / 'nnfit' / ('replica_%s' % self.replicas[idx]) / 'weights.h5'
-                    log.info("Loading weights from path: " + str(weights_path))
-                    pdf_model.load_weights(weights_path)
-                    idx += 1
+                self._load_weights(pdf_models, self.replicas)
 
             if k > 0:
                 # Reset the positivity and integrability multipliers
@@ -932,8 +1220,9 @@ class ModelTrainer:
             )
 
             # Compile each of the models with the right parameters
-            for model in models.values():
-                model.compile(**params["optimizer"])
+            with self.stopwatch.phase("compile", fold=k):
+                for model in models.values():
+                    model.compile(**params["optimizer"])
 
             passed = self._train_and_fit(
                 models["training"],
@@ -950,19 +1239,24 @@ class ModelTrainer:
                 exp_loss_raw = np.average(models["experimental"].compute_losses()["loss"])
                 # And divide by the number of active points in this fold
                 # it would be nice to have a ndata_per_fold variable coming in the vp object...
-                ndata = np.sum([np.count_nonzero(i[k]) for i in self.experimental["folds"]])
-                # If ndata == 0 then it's the opposite, all data is in!
-                if ndata == 0:
-                    ndata = self.experimental["ndata"]
-                experimental_loss = exp_loss_raw / ndata
+                experimental_loss = exp_loss_raw / self._fold_ndata(k)
 
                 hyper_loss = experimental_loss
                 if passed != self.pass_status:
                     log.info("Hyperparameter combination fail to find a good fit, breaking")
                     # If the fit failed to fit, no need to add a penalty to the loss
                     break
-                for penalty in self.hyper_penalties:
-                    hyper_loss += penalty(pdf_models=pdf_models, stopping_object=stopping_object)
+                if self.hyper_penalties:
+                    # All penalties are computed with a single evaluation of the pdf models
+                    with self.stopwatch.phase("hyperopt_penalties", fold=k):
+                        penalties = n3fit.hyper_optimization.penalties.per_replica_penalties(
+                            self.hyper_penalties,
+                            pdf_models=pdf_models,
+                            stopping_object=stopping_object,
+                        )
+                    for name, value in n3fit.hyper_optimization.penalties.reduce_penalties(penalties).items():
+                        log.debug("Penalty %s: %s per replica", name, penalties[name])
+                        hyper_loss += value
                 log.info("Fold %d finished, loss=%.1f, pass=%s", k + 1, hyper_loss, passed)
 
                 # Now save all information from this fold
@@ -986,23 +1280,7 @@ class ModelTrainer:
             # endfor
 
         if self.mode_hyperopt:
-            # Hyperopt needs a dictionary with information about the losses
-            # it is possible to store arbitrary information in the trial file
-            # by adding it to this dictionary
-
-            dict_out = {
-                "status": passed,
-                "loss": self._hyper_loss(fold_losses=l_hyper, n3pdfs=n3pdfs, experimental_models=exp_models),
-                "validation_loss": np.average(l_valid),
-                "experimental_loss": np.average(l_exper),
-                "kfold_meta": {
-                    "validation_losses": l_valid,
-                    "experimental_losses": l_exper,
-                    "hyper_losses": l_hyper,
-                },
-            }
-
-            return dict_out
+            return self._hyperopt_output(passed, l_hyper, l_valid, l_exper, n3pdfs, exp_models)
 
         # Keep a reference to the models after training for future reporting
         self.training["model"] = models["training"]
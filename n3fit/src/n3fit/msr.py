@@ -1,8 +1,10 @@
 """
     The constraint module include functions to impose the momentum sum rules on the PDFs
 """
+import functools
 import logging
 import numpy as np
+from scipy.special import beta, betainc
 
 from n3fit.layers import xDivide, MSR_Normalization, xIntegrator
 from n3fit.backends import operations as op
@@ -10,33 +12,100 @@ from n3fit.backends import operations as op
 
 log = logging.getLogger(__name__)
 
+# Limits of the integration: the region below XMIN is neglected,
+# the grid is logarithmic below XMID and linear above
+XMIN = 1e-9
+XMID = 0.1
 
-def gen_integration_input(nx):
-    """
-    Generates a np.array (shaped (nx,1)) of nx elements where the
-    nx/2 first elements are a logspace between 0 and 0.1
-    and the rest a linspace from 0.1 to 0
-    """
+# Default number of points for each of the integration schemes
+INTEGRATION_SCHEMES = {"trapezoidal": 2000, "gauss_legendre": 100}
+
+# Exponents (a, b) of the x^a (1-x)^b functions used to estimate the error of the integration,
+# which cover the small-x and large-x behaviour of the integrands of the sum rules
+ERROR_TEST_EXPONENTS = [(a, b) for a in (-0.8, -0.5, -0.2, 0.1) for b in (0.2, 1.0, 3.0, 6.0)]
+
+
+def _trapezoidal(nx):
+    """Trapezoidal rule on a grid of nx points, where the nx/2
+    first elements are a logspace between XMIN and XMID
+    and the rest a linspace from XMID to 1"""
     lognx = int(nx / 2)
     linnx = int(nx - lognx)
-    xgrid_log = np.logspace(-9, -1, lognx + 1)
-    xgrid_lin = np.linspace(0.1, 1, linnx)
-    xgrid = np.concatenate([xgrid_log[:-1], xgrid_lin]).reshape(nx, 1)
+    xgrid_log = np.logspace(np.log10(XMIN), np.log10(XMID), lognx + 1)
+    xgrid_lin = np.linspace(XMID, 1, linnx)
+    xgrid = np.concatenate([xgrid_log[:-1], xgrid_lin])
 
-    spacing = [0.0]
-    for i in range(1, nx):
-        spacing.append(np.abs(xgrid[i - 1] - xgrid[i]))
-    spacing.append(0.0)
+    spacing = np.concatenate([[0.0], np.abs(np.diff(xgrid)), [0.0]])
+    weights = (spacing[:-1] + spacing[1:]) / 2.0
+    return xgrid, weights
 
-    weights = []
-    for i in range(nx):
-        weights.append((spacing[i] + spacing[i + 1]) / 2.0)
-    weights_array = np.array(weights).reshape(nx, 1)
 
+def _gauss_legendre(nx):
+    """Gauss-Legendre rule with nx/2 nodes in log(x) between XMIN and XMID
+    and the rest in x between XMID and 1"""
+    lognx = int(nx / 2)
+    linnx = int(nx - lognx)
+    # In the logarithmic region dx = x dlog(x)
+    nodes, weights = np.polynomial.legendre.leggauss(lognx)
+    half_width = (np.log(XMID) - np.log(XMIN)) / 2.0
+    xgrid_log = np.exp(np.log(XMIN) + half_width * (nodes + 1.0))
+    weights_log = half_width * weights * xgrid_log
+    nodes, weights = np.polynomial.legendre.leggauss(linnx)
+    half_width = (1.0 - XMID) / 2.0
+    xgrid_lin = XMID + half_width * (nodes + 1.0)
+    weights_lin = half_width * weights
+    return np.concatenate([xgrid_log, xgrid_lin]), np.concatenate([weights_log, weights_lin])
+
+
+@functools.lru_cache()
+def gen_integration_input(nx, scheme="trapezoidal"):
+    """
+    Generates the integration grid of nx points and its weights,
+    both as (nx, 1) read-only np.arrays, for the given ``scheme``:
+
+        - ``trapezoidal``: the nx/2 first elements are a logspace between XMIN and XMID
+          and the rest a linspace from XMID to 1, with the weights of the trapezoidal rule
+        - ``gauss_legendre``: Gauss-Legendre nodes and weights in log(x) between XMIN
+          and XMID and in x between XMID and 1, with nx/2 points each
+
+    The grids are cached so that they are computed only once per process
+    (and shared among replicas and hyperopt trials)
+    """
+    if scheme == "trapezoidal":
+        xgrid, weights = _trapezoidal(nx)
+    elif scheme == "gauss_legendre":
+        xgrid, weights = _gauss_legendre(nx)
+    else:
+        raise ValueError(
+            f"Integration scheme {scheme} not implemented, choose one of {list(INTEGRATION_SCHEMES)}"
+        )
+    xgrid = xgrid.reshape(nx, 1)
+    weights_array = weights.reshape(nx, 1)
+    xgrid.flags.writeable = False
+    weights_array.flags.writeable = False
     return xgrid, weights_array
 
 
-def msr_impose(nx=int(2e3), basis_size=8, mode='All', scaler=None):
+@functools.lru_cache()
+def integration_error(nx, scheme="trapezoidal"):
+    """
+    Estimate of the relative error of the integration with ``nx`` points
+    of the given ``scheme``, computed as the largest error
+    in the integration of x^a (1-x)^b between XMIN and 1
+    for the exponents in ERROR_TEST_EXPONENTS
+    """
+    xgrid, weights = gen_integration_input(nx, scheme)
+    xgrid = xgrid.ravel()
+    weights = weights.ravel()
+    errors = []
+    for a, b in ERROR_TEST_EXPONENTS:
+        exact = beta(a + 1, b + 1) * (1.0 - betainc(a + 1, b + 1, XMIN))
+        result = np.sum(weights * xgrid ** a * (1.0 - xgrid) ** b)
+        errors.append(abs(result / exact - 1.0))
+    return max(errors)
+
+
+def msr_impose(nx=None, basis_size=8, mode='All', scaler=None, scheme="trapezoidal"):
     """
         This function receives:
         Generates a function that applies a normalization layer to the fit.
@@ -50,7 +119,8 @@ def msr_impose(nx=int(2e3), basis_size=8, mode='All', scaler=None):
         Parameters
         ----------
             nx: int
-                number of points for the integration grid, default: 2000
+                number of points for the integration grid,
+                by default the one given for the scheme in INTEGRATION_SCHEMES
             basis_size: int
                 number of flavours output of the NN, default: 8
             mode: str
@@ -58,10 +128,20 @@ def msr_impose(nx=int(2e3), basis_size=8, mode='All', scaler=None):
             scaler: scaler
                 Function to apply to the input. If given the input to the model
                 will be a (1, None, 2) tensor where dim [:,:,0] is scaled 
+            scheme: str
+                integration scheme, see ``gen_integration_input``, default: trapezoidal
     """
+    if nx is None:
+        nx = INTEGRATION_SCHEMES[scheme]
 
     # 1. Generate the fake input which will be used to integrate
-    xgrid, weights_array = gen_integration_input(nx)
+    xgrid, weights_array = gen_integration_input(nx, scheme)
+    log.debug(
+        "Sum rules integrated with the %s scheme on %d points, estimated relative error: %.1e",
+        scheme,
+        nx,
+        integration_error(nx, scheme),
+    )
     # 1b If a scaler is provided, scale the input xgrid
     if scaler:
         xgrid = scaler(xgrid)
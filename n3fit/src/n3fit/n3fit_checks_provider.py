@@ -26,7 +26,10 @@ def n3fit_checks_action(
     hyperopt=None,
     kfold=None,
     tensorboard=None,
+    checkpoint=None,
     parallel_models=False,
-    same_trvl_per_replica=False
+    same_trvl_per_replica=False,
+    diagonal_basis=None,
+    structured_covmat=False,
 ):
     return
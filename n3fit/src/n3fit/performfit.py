@@ -5,6 +5,7 @@
 # Backend-independent imports
 import copy
 import logging
+import time
 import numpy as np
 import n3fit.checks
 from n3fit.vpinterface import N3PDF
@@ -12,6 +13,169 @@ from n3fit.vpinterface import N3PDF
 log = logging.getLogger(__name__)
 
 
+def _embed(matrix, mask):
+    """Embed a (mask.sum(), mask.sum()) matrix into a (len(mask), len(mask)) matrix
+    which is zero for the rows and columns not selected by ``mask``"""
+    # Structured covmats are made dense here
+    matrix = np.asarray(matrix)
+    full = np.zeros((len(mask), len(mask)), dtype=matrix.dtype)
+    full[np.ix_(mask, mask)] = matrix
+    return full
+
+
+def _shared_kernels(matrices, masks):
+    """Embed with :py:func:`_embed` the matrix of every replica, ``matrices``, defined
+    for the points selected by its mask in ``masks``. Replicas with the same mask
+    share the same matrix.
+
+    Returns the matrix of every distinct mask stacked in a (kernels, ndata, ndata)
+    array together with the index of the matrix of every replica, or just the
+    (ndata, ndata) matrix and None if all replicas have the same mask.
+    """
+    unique_masks, kernel_index = np.unique(masks, axis=0, return_inverse=True)
+    kernel_index = kernel_index.reshape(-1)
+    first_replicas = [np.flatnonzero(kernel_index == i)[0] for i in range(len(unique_masks))]
+    kernels = np.array([_embed(matrices[i], masks[i]) for i in first_replicas])
+    if len(kernels) == 1:
+        return kernels[0], None
+    return kernels, kernel_index
+
+
+def _per_replica_split_experiments(replica_experiments):
+    """Merge the experiments of several replicas, each one with its own
+    training/validation split, into one list of experiments.
+
+    The observables are evaluated for the full dataset and the training/validation
+    split of every replica is applied in the loss, for which every experiment will contain:
+
+        - ``expdata``, ``expdata_vl``: full (pseudo)data of every replica (replicas, ndata)
+        - ``invcovmat``, ``invcovmat_vl``: inverse of the training (validation)
+          covmat of every distinct mask embedded in a (kernels, ndata, ndata) array,
+          or a (ndata, ndata) array if all replicas share the mask
+        - ``invcovmat_index``, ``invcovmat_vl_index``: index of the inverse covmat
+          of every replica, or None if all replicas share the mask
+        - ``replica_trmasks``, ``replica_vlmasks``: masks of every replica (replicas, ndata)
+        - ``ndata``, ``ndata_vl``: number of training (validation) points per replica
+        - ``folds``: the kfold masks, which now refer to the full dataset
+    """
+    all_experiments = copy.deepcopy(replica_experiments[0])
+    for i_exp, exp_dict in enumerate(all_experiments):
+        if exp_dict.get("data_transformation_tr") is not None:
+            raise ValueError(
+                "Replicas with different training/validation masks cannot be fitted "
+                "in parallel in the diagonal basis"
+            )
+        replicas = [rep_exps[i_exp] for rep_exps in replica_experiments]
+        trmasks = np.array([rep["trmask"] for rep in replicas], dtype=bool)
+        vlmasks = ~trmasks
+        expdata = []
+        for rep, trmask in zip(replicas, trmasks):
+            full = np.empty(len(trmask))
+            full[trmask] = rep["expdata"].ravel()
+            full[~trmask] = rep["expdata_vl"].ravel()
+            expdata.append(full)
+        exp_dict["expdata"] = exp_dict["expdata_vl"] = np.array(expdata)
+        exp_dict["invcovmat"], exp_dict["invcovmat_index"] = _shared_kernels(
+            [rep["invcovmat"] for rep in replicas], trmasks
+        )
+        exp_dict["invcovmat_vl"], exp_dict["invcovmat_vl_index"] = _shared_kernels(
+            [rep["invcovmat_vl"] for rep in replicas], vlmasks
+        )
+        exp_dict["replica_trmasks"] = trmasks
+        exp_dict["replica_vlmasks"] = vlmasks
+        exp_dict["ndata"] = trmasks.sum(axis=1)
+        exp_dict["ndata_vl"] = vlmasks.sum(axis=1)
+        # The experimental folds are the negation of the kfold masks over the full dataset
+        folds = [~fold for fold in exp_dict["folds"]["experimental"]]
+        exp_dict["folds"]["training"] = folds
+        exp_dict["folds"]["validation"] = folds
+    return all_experiments
+
+
+def _record_setup_phases(stopwatch, replicas_info, process_start, setup_end):
+    """Record in ``stopwatch`` the phases which happened before the fit started:
+    the loading of the data and parsing of the fktables of every experiment,
+    as recorded by ``fitting_data_dict``, and the full setup of the process
+    (imports, data loading, covmats, replica generation...) from ``process_start``
+    to ``setup_end``"""
+    _, exp_info, _ = replicas_info[0]
+    for exp_dict in exp_info:
+        for name, (start, end) in exp_dict.get("timings", {}).items():
+            stopwatch.record_phase(name, start, end, category="setup", experiment=exp_dict["name"])
+    stopwatch.record_phase("setup", process_start, setup_end, category="setup")
+
+
+# State shared with the worker processes of _fork_server, inherited through fork
+_FORK_SERVER_STATE = {}
+
+
+def _run_forked(index):
+    """Entry point of the worker processes of :py:func:`_fork_server`"""
+    from n3fit.backends import set_initial_state
+    from n3fit.stopwatch import StopWatch
+
+    state = _FORK_SERVER_STATE
+    set_initial_state(debug=state["debug"], max_cores=state["maxcores"])
+    replica_idxs, exp_info, nnseeds = state["replicas_info"][index]
+    stopwatch = StopWatch()
+    _record_setup_phases(
+        stopwatch, state["replicas_info"], state["process_start"], state["fork_time"]
+    )
+    stopwatch.record_phase("fork", state["fork_time"], stopwatch.get_times()[1], category="setup")
+    state["fit_function"](replica_idxs, exp_info, nnseeds, stopwatch)
+    return replica_idxs
+
+
+def _fork_server(fit_function, replicas_info, jobs, debug=False, maxcores=None):
+    """Fit every element of ``replicas_info`` with ``fit_function`` in a pool of
+    ``jobs`` worker processes.
+
+    The workers are forked from the current process, which has already loaded
+    all the data (fktables, commondata, covmats and the replicas' pseudodata),
+    so they share its read only numpy arrays through copy-on-write instead of
+    reloading them. Nothing is sent to the workers except the index of the
+    replica to fit, and a fresh process is forked for every replica so that
+    the backend state of one fit does not leak into the next one.
+
+    The backend must not have been initialised (i.e., no tensorflow operation
+    must have been run) in the current process, since its runtime cannot be
+    safely forked, otherwise a ``RuntimeError`` is raised.
+    """
+    import multiprocessing
+
+    import psutil
+
+    from n3fit.backends import backend_initialized
+
+    if backend_initialized():
+        raise RuntimeError("Worker processes cannot be forked once the backend has been initialised")
+
+    if maxcores is None:
+        # Share the physical cores among the workers
+        maxcores = max(1, (psutil.cpu_count(logical=False) or 1) // jobs)
+    log.info(
+        "Fitting %d replicas with %d worker processes using %d cores each",
+        len(replicas_info),
+        jobs,
+        maxcores,
+    )
+    _FORK_SERVER_STATE.update(
+        fit_function=fit_function,
+        replicas_info=replicas_info,
+        debug=debug,
+        maxcores=maxcores,
+        process_start=psutil.Process().create_time(),
+        fork_time=time.time(),
+    )
+    try:
+        context = multiprocessing.get_context("fork")
+        with context.Pool(jobs, maxtasksperchild=1) as pool:
+            for replica_idxs in pool.imap_unordered(_run_forked, range(len(replicas_info))):
+                log.info("Worker finished replica %s", replica_idxs)
+    finally:
+        _FORK_SERVER_STATE.clear()
+
+
 # Action to be called by validphys
 # All information defining the NN should come here in the "parameters" dict
 @n3fit.checks.can_run_multiple_replicas
@@ -39,11 +203,14 @@ def performfit(
     hyperopt=None,
     kfold_parameters,
     tensorboard=None,
+    checkpoint=None,
+    resume=False,
     debug=False,
     maxcores=None,
     parallel_models=False, 
     simu_parameters_names=None,
     bsm_initialisation_seed=0,
+    jobs=None,
 ):
     """
         This action will (upon having read a validcard) process a full PDF fit
@@ -118,26 +285,32 @@ def performfit(
             tensorboard: None, dict
                 mapping containing tensorboard settings if it is to be used. By
                 default it is None and tensorboard is not enabled.
+            checkpoint: None, dict
+                mapping containing the checkpoint settings, i.e., ``each``: every how
+                many epochs the state of the fit is saved to the replica folder.
+                By default it is None and no checkpoints are saved.
+            resume: bool
+                if given (``n3fit --resume``), the fits with a checkpoint in the replica
+                folder continue from it instead of starting from scratch
             debug: bool
                 activate some debug options
             maxcores: int
                 maximum number of (logical) cores that the backend should be aware of
             parallel_models: bool
                 whether to run models in parallel
+            jobs: int
+                if given (``n3fit --jobs``), the replicas fitted one at a time are
+                distributed among this number of worker processes forked from
+                this one, see :py:func:`_fork_server`
     """
-    from n3fit.backends import set_initial_state
-
-    # If debug is active, the initial state will be fixed so that the run is reproducible
-    set_initial_state(debug=debug, max_cores=maxcores)
-
+    from n3fit.backends import backend_initialized, set_initial_state
     from n3fit.stopwatch import StopWatch
 
-    stopwatch = StopWatch()
-
     # All potentially backend dependent imports should come inside the fit function
     # so they can eventually be set from the runcard
     from n3fit.model_trainer import ModelTrainer
     from n3fit.io.writer import WriterWrapper
+    from n3fit.io.checkpoint import checkpoint_path, fit_completed, fit_digest, remove_checkpoint
 
     # Note: there are three possible scenarios for the loop of replicas:
     #   1.- Only one replica is being run, in this case the loop is only evaluated once
@@ -158,17 +331,27 @@ def performfit(
     n_models = len(replicas_nnseed_fitting_data_dict)
     if parallel_models and n_models != 1:
         replicas, replica_experiments, nnseeds = zip(*replicas_nnseed_fitting_data_dict)
-        # Parse the experiments so that the output data contain information for all replicas
-        # as the only different from replica to replica is the experimental training/validation data
-        all_experiments = copy.deepcopy(replica_experiments[0])
-        for i_exp in range(len(all_experiments)):
-            training_data = []
-            validation_data = []
-            for i_rep in range(n_models):
-                training_data.append(replica_experiments[i_rep][i_exp]['expdata'])
-                validation_data.append(replica_experiments[i_rep][i_exp]['expdata_vl'])
-            all_experiments[i_exp]['expdata'] = np.concatenate(training_data, axis=0)
-            all_experiments[i_exp]['expdata_vl'] = np.concatenate(validation_data, axis=0)
+        same_trvl = all(
+            np.array_equal(rep_exps[i_exp]["trmask"], exp_dict["trmask"])
+            for rep_exps in replica_experiments
+            for i_exp, exp_dict in enumerate(replica_experiments[0])
+        )
+        if same_trvl:
+            # Parse the experiments so that the output data contain information for all replicas
+            # as the only different from replica to replica is the experimental training/validation data
+            all_experiments = copy.deepcopy(replica_experiments[0])
+            for i_exp in range(len(all_experiments)):
+                training_data = []
+                validation_data = []
+                for i_rep in range(n_models):
+                    training_data.append(replica_experiments[i_rep][i_exp]['expdata'])
+                    validation_data.append(replica_experiments[i_rep][i_exp]['expdata_vl'])
+                all_experiments[i_exp]['expdata'] = np.concatenate(training_data, axis=0)
+                all_experiments[i_exp]['expdata_vl'] = np.concatenate(validation_data, axis=0)
+        else:
+            # Every replica has its own training/validation split, which is applied in the loss
+            log.info("Applying a different training/validation split for each replica")
+            all_experiments = _per_replica_split_experiments(replica_experiments)
         log.info(
             "Starting parallel fits from replica %d to %d",
             replicas[0],
@@ -178,7 +361,9 @@ def performfit(
     else:
         replicas_info = replicas_nnseed_fitting_data_dict
 
-    for replica_idxs, exp_info, nnseeds in replicas_info:
+    def fit_replica_set(replica_idxs, exp_info, nnseeds, stopwatch):
+        """Fit one element of ``replicas_info``, returns True if the rest of
+        the replicas should not be fitted (i.e., after a hyperparameter scan)"""
         if not parallel_models or n_models == 1:
             # Cases 1 and 2 above are a special case of 3 where the replica idx and the seed should
             # be a list of just one element
@@ -208,6 +393,7 @@ def performfit(
             simu_parameters_scales=simu_parameters_scales,
             bsm_fac_initialisations=bsm_fac_initialisations,
             bsm_initialisation_seed=bsm_initialisation_seed,
+            stopwatch=stopwatch,
         )
 
         # This is just to give a descriptive name to the fit function
@@ -231,6 +417,7 @@ def performfit(
             true_best = hyper_scan_wrapper(
                 replica_path_set, the_model_trainer, hyperscanner, max_evals=hyperopt
             )
+            stopwatch.write_profile(replica_path_set)
             print("##################")
             print("Best model found: ")
             for k, i in true_best.items():
@@ -238,7 +425,7 @@ def performfit(
 
             # In general after we do the hyperoptimization we do not care about the fit
             # so just let this die here
-            break
+            return True
         ####################################################################### end of hyperopt
 
         # Ensure hyperopt is off
@@ -257,6 +444,19 @@ def performfit(
             log_path = replica_path_set / "tboard"
             the_model_trainer.enable_tensorboard(log_path, weight_freq, profiling)
 
+        # Enable the checkpoints, they are saved in the folder of the first replica of the set
+        checkpoint_file = checkpoint_path(replica_path / f"replica_{replica_idxs[0]}")
+        if checkpoint is not None:
+            the_model_trainer.enable_checkpoint(
+                checkpoint_file,
+                checkpoint["each"],
+                replica_idxs,
+                resume=resume,
+                digest=fit_digest(parameters, nnseeds, exp_info),
+            )
+        elif resume:
+            log.warning("No checkpoint settings in the runcard, the fit cannot be resumed")
+
         #############################################################################
         # ### Fit                                                                   #
         # This function performs the actual fit, it reads all the parameters in the #
@@ -272,14 +472,13 @@ def performfit(
         all_training_chi2, all_val_chi2, all_exp_chi2 = the_model_trainer.evaluate(stopping_object)
 
         pdf_models = result["pdf_models"]
-        for i, (replica_number, pdf_model) in enumerate(zip(replica_idxs, pdf_models)):
+        # One pdf instance per replica, all replicas are evaluated together when exported
+        q0 = theoryid.get_description().get("Q0")
+        pdf_instances = N3PDF(pdf_models, fit_basis=basis, Q=q0).split_replicas()
+        for i, (replica_number, pdf_instance) in enumerate(zip(replica_idxs, pdf_instances)):
             # Each model goes into its own replica folder
             replica_path_set = replica_path / f"replica_{replica_number}"
 
-            # Create a pdf instance
-            q0 = theoryid.get_description().get("Q0")
-            pdf_instance = N3PDF(pdf_model, fit_basis=basis, Q=q0)
-
             bsm_fac_df=result["bsm_fac_df"]
 
             # Generate the writer wrapper
@@ -297,9 +496,10 @@ def performfit(
             exp_chi2 = np.take(all_exp_chi2, i)
 
             # And write the data down
-            writer_wrapper.write_data(
-                replica_path_set, output_path.name, training_chi2, val_chi2, exp_chi2, bsm_fac_df 
-            )
+            with stopwatch.phase("writing", replica=replica_number):
+                writer_wrapper.write_data(
+                    replica_path_set, output_path.name, training_chi2, val_chi2, exp_chi2, bsm_fac_df
+                )
             log.info(
                     "Best fit for replica #%d, chi2=%.3f (tr=%.3f, vl=%.3f)",
                     replica_number,
@@ -314,7 +514,50 @@ def performfit(
                 model_file_path = replica_path_set / save
                 log.info(" > Saving the weights for future in %s", model_file_path)
                 # Need to use "str" here because TF 2.2 has a bug for paths objects (fixed in 2.3)
-                pdf_model.save_weights(str(model_file_path), save_format="h5")
+                pdf_models[i].save_weights(str(model_file_path), save_format="h5")
+
+        # Once all the replicas of the set have been written there is nothing left to resume
+        remove_checkpoint(checkpoint_file)
+
+        # The profile of the phases is written in the folder of every replica of the set
+        for replica_number in replica_idxs:
+            stopwatch.write_profile(replica_path / f"replica_{replica_number}")
+        # so that each set of replicas fitted sequentially gets only its own phases
+        stopwatch.clear_phases()
 
         if tensorboard is not None:
             log.info("Tensorboard logging information is stored at %s", log_path)
+        return False
+
+    if resume and not hyperopt:
+        # The replicas whose fit was completed before the interruption are not fitted again
+        pending = []
+        for info in replicas_info:
+            replica_idxs = [int(i) for i in np.atleast_1d(info[0])]
+            if fit_completed(replica_path, replica_idxs, output_path.name):
+                log.info("The fit of the replicas %s is complete, skipping", replica_idxs)
+            else:
+                pending.append(info)
+        if not pending:
+            log.info("All the replicas have already been fitted")
+            return
+        replicas_info = pending
+
+    if jobs is not None and jobs > 1 and len(replicas_info) > 1 and not hyperopt:
+        if not backend_initialized():
+            _fork_server(fit_replica_set, replicas_info, jobs, debug=debug, maxcores=maxcores)
+            return
+        log.warning(
+            "The backend has already been initialised, the replicas are fitted in this process"
+        )
+
+    # If debug is active, the initial state will be fixed so that the run is reproducible
+    set_initial_state(debug=debug, max_cores=maxcores)
+    import psutil
+
+    stopwatch = StopWatch()
+    _, start_wall = stopwatch.get_times()
+    _record_setup_phases(stopwatch, replicas_info, psutil.Process().create_time(), start_wall)
+    for replica_idxs, exp_info, nnseeds in replicas_info:
+        if fit_replica_set(replica_idxs, exp_info, nnseeds, stopwatch):
+            break
@@ -0,0 +1,115 @@
+"""
+dy_benchmark.py
+
+Micro-benchmark of the hadronic (DY) observable layer. For every hadronic dataset
+in an n3fit runcard the time of the dense contraction with the full luminosity
+tensor is compared with the sparse (gather) contraction, together with the
+density of the fktables, which is what the automatic selection in
+:py:class:`n3fit.layers.DY` is based on.
+"""
+
+import logging
+import time
+from argparse import ArgumentParser
+
+import numpy as np
+import pandas as pd
+
+from validphys.utils import yaml_safe
+
+logging.basicConfig(level=logging.INFO)
+log = logging.getLogger(__name__)
+
+
+def _time_layer(layer, pdf, repetitions):
+    """Return the result of the layer and the mean time per call in ms"""
+    import tensorflow as tf
+
+    compiled = tf.function(layer)
+    # Compile and warm up
+    result = compiled(pdf).numpy()
+    start = time.perf_counter()
+    for _ in range(repetitions):
+        compiled(pdf)
+    return result, (time.perf_counter() - start) / repetitions * 1e3
+
+
+def benchmark_dataset(dataset_dict, replicas=1, repetitions=50):
+    """Benchmark the dense and sparse paths of the DY layer for a dataset loaded
+    by :py:func:`validphys.n3fit_data_utils.common_data_reader_dataset` with
+    ``sparse=True``"""
+    from n3fit.backends import operations as op
+    from n3fit.layers import DY
+
+    fktable_dicts = dataset_dict["fktables"]
+    sparse_fks = [i["fktable"] for i in fktable_dicts]
+    dense_fks = [i.to_dense() for i in sparse_fks]
+    operation = dataset_dict["operation"]
+    dense_layer = DY(fktable_dicts, dense_fks, operation)
+    sparse_layer = DY(fktable_dicts, sparse_fks, operation, sparse_threshold=1.0)
+
+    if dense_layer.splitting:
+        nx = sum(dense_layer.splitting)
+    else:
+        nx = fktable_dicts[0]["xgrid"].shape[1]
+    rng = np.random.default_rng(seed=1)
+    pdf = op.numpy_to_tensor(rng.random((1, nx, dense_layer.nfl, replicas)))
+
+    dense_res, dense_time = _time_layer(dense_layer, pdf, repetitions)
+    sparse_res, sparse_time = _time_layer(sparse_layer, pdf, repetitions)
+    nnz = sum(i.nnz for i in sparse_fks)
+    size = sum(i.size for i in dense_fks)
+    return {
+        "dataset": dataset_dict["name"],
+        "ndata": dataset_dict["ndata"],
+        "nx": nx,
+        "density": nnz / size,
+        "dense (ms)": dense_time,
+        "sparse (ms)": sparse_time,
+        "speedup": dense_time / sparse_time,
+        "max rel diff": np.max(np.abs(sparse_res - dense_res) / np.abs(dense_res).clip(1e-30)),
+    }
+
+
+def main():
+    parser = ArgumentParser(
+        description="Benchmark the dense and sparse convolutions of the hadronic datasets of a runcard"
+    )
+    parser.add_argument("runcard", help="n3fit runcard")
+    parser.add_argument("-r", "--replicas", type=int, default=1, help="Number of replicas in the PDF")
+    parser.add_argument(
+        "-n", "--repetitions", type=int, default=50, help="Number of evaluations to average over"
+    )
+    parser.add_argument("-o", "--output", help="Save the results as a csv file")
+    args = parser.parse_args()
+
+    from validphys.api import API
+    from validphys.n3fit_data_utils import common_data_reader_dataset
+
+    with open(args.runcard) as f:
+        runcard = yaml_safe.load(f, version="1.1")
+
+    data = API.data(
+        dataset_inputs=runcard["dataset_inputs"],
+        theoryid=runcard["theory"]["theoryid"],
+        use_cuts="internal",
+        **runcard.get("datacuts", {}),
+    )
+
+    results = []
+    for dataset in data.datasets:
+        dataset_c = dataset.load()
+        if not dataset_c.IsHadronic():
+            continue
+        log.info("Benchmarking %s", dataset.name)
+        [dataset_dict] = common_data_reader_dataset(dataset_c, dataset, sparse=True)
+        results.append(benchmark_dataset(dataset_dict, args.replicas, args.repetitions))
+
+    table = pd.DataFrame(results).set_index("dataset")
+    print(table.to_string(float_format="{:.3g}".format))
+    if args.output:
+        table.to_csv(args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -104,6 +104,8 @@ class N3FitEnvironment(Environment):
             "replica_path": "The replica output path",
             "output_path": "The runcard name",
             "hyperopt": "The hyperopt flag",
+            "jobs": "The number of worker processes",
+            "resume": "Whether to resume the fits from their checkpoints",
             **super().ns_dump_description(),
         }
 
@@ -230,6 +232,20 @@ class N3FitApp(App):
         parser.add_argument(
             "-r", "--replica_range", help="End of the range of replicas to compute", type=check_positive
         )
+        parser.add_argument(
+            "-j",
+            "--jobs",
+            help="Number of worker processes, forked after loading the data, "
+            "among which the replicas of the range are distributed",
+            type=check_positive,
+            default=None,
+        )
+        parser.add_argument(
+            "--resume",
+            help="Continue the fit of the replicas from the checkpoints saved in their folders "
+            "(see the 'checkpoint' key of the runcard)",
+            action="store_true",
+        )
         return parser
 
     def get_commandline_arguments(self, cmdline=None):
@@ -248,6 +264,8 @@ class N3FitApp(App):
                 replicas = [replica]
             self.environment.replicas = NSList(replicas, nskey="replica")
             self.environment.hyperopt = self.args["hyperopt"]
+            self.environment.jobs = self.args["jobs"]
+            self.environment.resume = self.args["resume"]
             super().run()
         except N3FitError as e:
             log.error(f"Error in n3fit:\n{e}")
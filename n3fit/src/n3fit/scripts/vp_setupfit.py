@@ -49,6 +49,7 @@ SETUPFIT_PROVIDERS = [
     "validphys.theorycovariance.construction",
     "validphys.results",
     "validphys.covmats",
+    "validphys.n3fit_data",
     "n3fit.n3fit_checks_provider",
 ]
 
@@ -153,6 +154,15 @@ class SetupFitConfig(Config):
 
         SETUPFIT_FIXED_CONFIG["actions_"] += [check_n3fit_action, filter_action]
 
+        # Store the t0 covmats so that the replicas don't need to recompute them.
+        # The closure test replicas with fakedata fit the filtered fake data,
+        # for which the matrices are never stored nor read.
+        closuretest = file_content.get("closuretest") or {}
+        if not closuretest.get("fakedata", False):
+            SETUPFIT_FIXED_CONFIG["actions_"].append(
+                "datacuts::theory::fitting exps_write_t0_cache"
+            )
+
         if file_content.get("theorycovmatconfig") is not None:
             SETUPFIT_FIXED_CONFIG["actions_"].append(
                 "datacuts::theory::theorycovmatconfig nnfit_theory_covmat"
@@ -68,9 +68,10 @@ def parse_ndata(all_data):
         if dictionary.get("count_chi2"):
             tr_ndata = dictionary["ndata"]
             vl_ndata = dictionary["ndata_vl"]
-            if tr_ndata:
+            # The number of points can be given per replica
+            if np.any(tr_ndata):
                 tr_ndata_dict[exp_name] = tr_ndata
-            if vl_ndata:
+            if np.any(vl_ndata):
                 vl_ndata_dict[exp_name] = vl_ndata
         if dictionary.get("positivity") and not dictionary.get("integrability"):
             pos_set.append(exp_name)
@@ -296,6 +297,24 @@ class ReplicaState:
             self._pdf_model.trainable = False
             self._stop_epoch = epoch
 
+    def get_checkpoint(self):
+        """ Return the state of the replica, to be restored with ``load_checkpoint`` """
+        return {
+            "weights": self._weights,
+            "best_epoch": self._best_epoch,
+            "stop_epoch": self._stop_epoch,
+            "best_vl_chi2": self._best_vl_chi2,
+            "trainable": self._pdf_model.trainable,
+        }
+
+    def load_checkpoint(self, checkpoint):
+        """ Restore the state of the replica returned by ``get_checkpoint`` """
+        self._weights = checkpoint["weights"]
+        self._best_epoch = checkpoint["best_epoch"]
+        self._stop_epoch = checkpoint["stop_epoch"]
+        self._best_vl_chi2 = checkpoint["best_vl_chi2"]
+        self._pdf_model.trainable = checkpoint["trainable"]
+
 
 class FitHistory:
     """
@@ -396,6 +415,22 @@ class FitHistory:
             replica.stop_training(self.final_epoch)
             replica.reload()
 
+    def get_checkpoint(self):
+        """Return the state of the history and of all replicas,
+        to be restored with ``load_checkpoint``"""
+        return {
+            "replicas": [replica.get_checkpoint() for replica in self._replicas],
+            "history": [(state.training, state.validation) for state in self._history],
+            "final_epoch": self.final_epoch,
+        }
+
+    def load_checkpoint(self, checkpoint):
+        """ Restore the state returned by ``get_checkpoint`` """
+        for replica, replica_checkpoint in zip(self._replicas, checkpoint["replicas"]):
+            replica.load_checkpoint(replica_checkpoint)
+        self._history = [FitState(tr, vl) for tr, vl in checkpoint["history"]]
+        self.final_epoch = checkpoint["final_epoch"]
+
     def __next__(self):
         return next(self._iter_replicas)
 
@@ -568,6 +603,28 @@ class Stopping:
             self.make_stop()
         return True
 
+    def get_checkpoint(self):
+        """Return the state of the stopping algorithm (including the history of the fit
+        and the best state of every replica) as a dictionary of python and numpy objects,
+        to be restored with ``load_checkpoint``"""
+        return {
+            "history": self._history.get_checkpoint(),
+            "stopping_degree": self.stopping_degree.copy(),
+            "count": self.count.copy(),
+            "stop_now": self.stop_now,
+        }
+
+    def load_checkpoint(self, checkpoint):
+        """ Restore the state returned by ``get_checkpoint`` """
+        if len(checkpoint["count"]) != self.n_replicas:
+            raise ValueError(
+                f"The checkpoint contains {len(checkpoint['count'])} replicas, expected {self.n_replicas}"
+            )
+        self._history.load_checkpoint(checkpoint["history"])
+        self.stopping_degree = checkpoint["stopping_degree"].copy()
+        self.count = checkpoint["count"].copy()
+        self.stop_now = checkpoint["stop_now"]
+
     def make_stop(self):
         """Convenience method to set the stop_now flag
         and reload the history to the point of the best model if any
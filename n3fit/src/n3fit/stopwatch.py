@@ -1,9 +1,29 @@
 """
     StopWatch module for computing the time performance of n3fit
+
+    Other than the coarse cpu and wall times of the events registered with
+    ``register_times``, the stopwatch can profile the different phases of the fit
+    (data loading, model building, compilation, every training step...)
+    recording their timings and the peak resident memory of the process.
+    The profile can be written to the replica folder both as a JSON summary
+    and as a trace which can be opened with ``chrome://tracing`` or
+    https://ui.perfetto.dev
 """
 
+import contextlib
+import json
+import os
+import resource
+import sys
+import threading
 import time
 
+PROFILE_FILE = "profile.json"
+TRACE_FILE = "profile_trace.json"
+# Maximum number of events kept for the trace, the summary of the phases
+# is computed with all events
+MAX_TRACE_EVENTS = 20000
+
 
 def get_time():
     """ Returns the cputime and walltime
@@ -13,6 +33,15 @@ def get_time():
     return cpu_time, wall_time
 
 
+def peak_rss():
+    """Returns the peak resident set size of the process in MB"""
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is given in bytes in macOS and in kB in Linux
+    if sys.platform == "darwin":
+        return maxrss / 1024**2
+    return maxrss / 1024
+
+
 class StopWatch:
     """
         This class works as a stopwatch, upon initialization it will register
@@ -31,6 +60,7 @@ class StopWatch:
         self._walltimes = {}
         self.reference_list = []
         self.register_times(self.start_key)
+        self.clear_phases()
 
     def get_times(self, tag=None):
         """ Return a tuple with the `tag` time of the watch
@@ -94,3 +124,113 @@ class StopWatch:
         """
         self.register_times(tag)
         self.reference_list.append((tag, reference))
+
+    def clear_phases(self):
+        """ Drop all the profiled phases """
+        self.events = []
+        self.phase_stats = {}
+
+    def record_phase(self, name, start, end, cputime=None, category="n3fit", **args):
+        """ Record a phase ``name`` which started and finished at the
+        wall times ``start`` and ``end`` (as given by ``time.time()``)
+
+        Parameters
+        ----------
+            `name`
+                name of the phase, all phases with the same name are summarised together
+            `start`, `end`
+                wall times at the beginning and at the end of the phase
+            `cputime`
+                cpu time spent during the phase, if known
+            `category`
+                category of the phase in the trace
+            `args`
+                extra information to be added to the event in the trace
+        """
+        walltime = end - start
+        rss = peak_rss()
+        stats = self.phase_stats.setdefault(
+            name, {"count": 0, "walltime": 0.0, "cputime": 0.0, "peak_rss_mb": 0.0}
+        )
+        stats["count"] += 1
+        stats["walltime"] += walltime
+        stats["cputime"] += cputime or 0.0
+        stats["peak_rss_mb"] = max(stats["peak_rss_mb"], rss)
+        if len(self.events) < MAX_TRACE_EVENTS:
+            self.events.append(
+                {
+                    "name": name,
+                    "category": category,
+                    "start": start,
+                    "walltime": walltime,
+                    "cputime": cputime,
+                    "peak_rss_mb": rss,
+                    "thread": threading.get_ident(),
+                    "args": args,
+                }
+            )
+
+    @contextlib.contextmanager
+    def phase(self, name, category="n3fit", **args):
+        """ Context manager which records the execution of its block as a phase ``name``,
+        see ``record_phase``
+
+        Example
+        -------
+        >>> watch = StopWatch()
+        >>> with watch.phase("compile"):
+        ...     model.compile()
+        """
+        start_cpu, start_wall = get_time()
+        try:
+            yield
+        finally:
+            end_cpu, end_wall = get_time()
+            self.record_phase(
+                name, start_wall, end_wall, cputime=end_cpu - start_cpu, category=category, **args
+            )
+
+    def profile(self):
+        """ Returns a dictionary with the summary of all phases and the
+        individual events, with their start relative to the start of the stopwatch
+        """
+        start_wall = self._walltimes[self.start_key]
+        events = [dict(event, start=event["start"] - start_wall) for event in self.events]
+        return {
+            "phases": self.phase_stats,
+            "events": events,
+            "dropped_events": sum(i["count"] for i in self.phase_stats.values()) - len(events),
+            "peak_rss_mb": peak_rss(),
+            "timing": self.stop(),
+        }
+
+    def chrome_trace(self):
+        """ Returns the phases as a dictionary in the Chrome trace event format """
+        pid = os.getpid()
+        trace_events = []
+        for event in self.events:
+            args = {"cputime": event["cputime"], "peak_rss_mb": event["peak_rss_mb"]}
+            args.update(event["args"])
+            trace_events.append(
+                {
+                    "name": event["name"],
+                    "cat": event["category"],
+                    "ph": "X",
+                    # The trace format uses microseconds
+                    "ts": event["start"] * 1e6,
+                    "dur": event["walltime"] * 1e6,
+                    "pid": pid,
+                    "tid": event["thread"],
+                    "args": args,
+                }
+            )
+        return {"traceEvents": trace_events, "displayTimeUnit": "ms"}
+
+    def write_profile(self, folder):
+        """ Write the profile of the phases (``PROFILE_FILE``) and
+        its trace (``TRACE_FILE``) in ``folder`` """
+        os.makedirs(folder, exist_ok=True)
+        with open(os.path.join(folder, PROFILE_FILE), "w") as fs:
+            json.dump(self.profile(), fs, indent=2, default=float)
+        with open(os.path.join(folder, TRACE_FILE), "w") as fs:
+            json.dump(self.chrome_trace(), fs, default=float)
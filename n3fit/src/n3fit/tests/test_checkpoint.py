@@ -0,0 +1,147 @@
+"""
+    Test the checkpoints of the fit and the resuming of a fit from them
+"""
+import numpy as np
+import pytest
+
+from n3fit.backends import Input, Lambda, MetaModel, base_layer_selector, callbacks
+from n3fit.backends import operations as op
+from n3fit.io.checkpoint import (
+    CheckpointWriter,
+    check_checkpoint,
+    fit_completed,
+    fit_digest,
+    load_checkpoint,
+    remove_checkpoint,
+)
+from n3fit.stopping import Stopping
+
+EPOCHS = 20
+KILL_AT = 13
+CHECKPOINT_EACH = 5
+XGRID = np.linspace(0.1, 1.0, 5).reshape(1, 5, 1)
+REPORTING = [
+    {"name": name, "count_chi2": True, "positivity": False, "ndata": 5, "ndata_vl": 0}
+    for name in ("exp1", "exp2")
+]
+
+
+class KillCallback(callbacks.Callback):
+    """Simulates a fit killed at the end of a given epoch"""
+
+    def __init__(self, epoch):
+        super().__init__()
+        self.epoch = epoch
+
+    def on_epoch_end(self, epoch, logs=None):
+        if epoch + 1 == self.epoch:
+            raise KeyboardInterrupt
+
+
+def _generate_models():
+    """Generate a pdf model and a training model with two outputs
+    (experiments) computing a chi2-like loss"""
+    x = Input(shape=(None, 1), batch_size=1, name="x")
+    dense = base_layer_selector(
+        "dense", nodes_in=1, nodes_out=2, activation="sigmoid", initializer_name="glorot_normal", seed=4
+    )
+    pdf_model = MetaModel({"x": x}, dense(x), name="pdf")
+    pdf = pdf_model.apply_as_layer({"x": x})[1]
+    outputs = [
+        Lambda(lambda y, i=i: op.sum((y[..., i] - 0.5) ** 2, axis=-1), name=name)(pdf)
+        for i, name in enumerate(("exp1", "exp2"))
+    ]
+    training_model = MetaModel({"x": x}, outputs, input_values={"x": XGRID})
+    training_model.compile(optimizer_name="Adam", learning_rate=0.05)
+    stopping_object = Stopping(
+        training_model, REPORTING, [pdf_model], total_epochs=EPOCHS, threshold_chi2=1e3
+    )
+    return training_model, pdf_model, stopping_object
+
+
+def _fit(training_model, stopping_object, extra_callbacks=(), initial_epoch=0):
+    fit_callbacks = [callbacks.StoppingCallback(stopping_object)] + list(extra_callbacks)
+    training_model.perform_fit(
+        epochs=EPOCHS, initial_epoch=initial_epoch, verbose=False, callbacks=fit_callbacks
+    )
+
+
+def test_checkpoint_writer(tmp_path):
+    path = tmp_path / "checkpoint.pickle"
+    assert load_checkpoint(path) is None
+    writer = CheckpointWriter(path)
+    for epoch in range(3):
+        writer.write({"epoch": epoch, "weights": [np.ones(epoch)]})
+    writer.wait()
+    checkpoint = load_checkpoint(path)
+    assert checkpoint["epoch"] == 2
+    np.testing.assert_array_equal(checkpoint["weights"][0], np.ones(2))
+    remove_checkpoint(path)
+    remove_checkpoint(path)
+    assert not path.exists()
+
+
+def test_resume(tmp_path):
+    """A fit killed and resumed from its last checkpoint is the same as a fit run at once"""
+    # Reference: the fit is run at once
+    training_model, pdf_model, stopping_object = _generate_models()
+    initial_weights = training_model.get_weights()
+    _fit(training_model, stopping_object)
+    reference_weights = pdf_model.get_weights()
+    reference_log = stopping_object.chi2exps_json(log_each=1)
+
+    # The fit is killed after some checkpoints have been written
+    path = tmp_path / "checkpoint.pickle"
+    training_model, _, stopping_object = _generate_models()
+    training_model.set_weights(initial_weights)
+    writer = CheckpointWriter(path)
+    checkpoint_callback = callbacks.CheckpointCallback(writer, stopping_object, CHECKPOINT_EACH)
+    with pytest.raises(KeyboardInterrupt):
+        _fit(training_model, stopping_object, [checkpoint_callback, KillCallback(KILL_AT)])
+    writer.wait()
+
+    # And resumed in new models, where the training starts from another point
+    training_model, pdf_model, stopping_object = _generate_models()
+    initial_epoch = callbacks.load_checkpoint(training_model, stopping_object, load_checkpoint(path))
+    assert initial_epoch == KILL_AT - KILL_AT % CHECKPOINT_EACH
+    _fit(training_model, stopping_object, initial_epoch=initial_epoch)
+
+    for weight, reference in zip(pdf_model.get_weights(), reference_weights):
+        np.testing.assert_array_equal(weight, reference)
+    assert stopping_object.chi2exps_json(log_each=1) == reference_log
+
+
+def test_fit_digest():
+    """The digest changes with the parameters, the seeds and the data of the fit"""
+    parameters = {"epochs": 10, "optimizer": {"learning_rate": 1e-3, "optimizer_name": "Adam"}}
+    experiments = [{"name": "EXP", "expdata": np.ones((1, 3)), "expdata_vl": np.zeros((1, 2))}]
+    digest = fit_digest(parameters, [4], experiments)
+    reordered = {"optimizer": {"optimizer_name": "Adam", "learning_rate": 1e-3}, "epochs": 10}
+    assert fit_digest(reordered, [4], experiments) == digest
+    assert fit_digest(dict(parameters, epochs=20), [4], experiments) != digest
+    assert fit_digest(parameters, [5], experiments) != digest
+    other_data = [dict(experiments[0], expdata=2 * np.ones((1, 3)))]
+    assert fit_digest(parameters, [4], other_data) != digest
+
+    saved = {"replicas": [1], "digest": digest}
+    check_checkpoint(saved, "checkpoint", [1], digest)
+    with pytest.raises(ValueError, match="replicas"):
+        check_checkpoint(saved, "checkpoint", [2], digest)
+    with pytest.raises(ValueError, match="different parameters"):
+        check_checkpoint(saved, "checkpoint", [1], fit_digest(parameters, [5], experiments))
+
+
+def test_fit_completed(tmp_path):
+    """A set of replicas is complete once the metadata of all of them has been
+    written and its checkpoint has been removed"""
+    replicas = [1, 2]
+    for replica in replicas:
+        (tmp_path / f"replica_{replica}").mkdir()
+    assert not fit_completed(tmp_path, replicas, "fit")
+    (tmp_path / "replica_1" / "fit.json").write_text("{}")
+    assert not fit_completed(tmp_path, replicas, "fit")
+    (tmp_path / "replica_2" / "fit.json").write_text("{}")
+    assert fit_completed(tmp_path, replicas, "fit")
+    # The set was killed while writing the replicas
+    (tmp_path / "replica_1" / "checkpoint.pickle").write_bytes(b"")
+    assert not fit_completed(tmp_path, replicas, "fit")
@@ -72,6 +72,25 @@ def test_check_dropout():
     checks.check_dropout({"dropout": 0.5})
 
 
+def test_check_msr_integration():
+    """ Test the checks of the integration of the sum rules """
+    wrong = [{"scheme": "simpson"}, {"scheme": "gauss_legendre", "nx": 1}, {"points": 10}]
+    for msr_integration in wrong:
+        with pytest.raises(CheckError):
+            checks.check_msr_integration({"msr_integration": msr_integration})
+    checks.check_msr_integration({"msr_integration": {"scheme": "gauss_legendre", "nx": 64}})
+    checks.check_msr_integration({})
+
+
+def test_check_checkpoint():
+    """ Test the checkpoint checks """
+    for each in (0, -100, 10.5, None):
+        with pytest.raises(CheckError):
+            checks.check_checkpoint({"each": each})
+    checks.check_checkpoint({"each": 500})
+    checks.check_checkpoint(None)
+
+
 def test_check_hyperopt_architecture():
     """ Test the checks for the hyperopt architecture """
     params = {"initializers": ["Fake_bad_non"]}
@@ -125,6 +144,17 @@ def test_check_kfold_options():
     params = {"penalties": ["Fake_penalty_doesnt_exists"]}
     with pytest.raises(CheckError):
         checks.check_kfold_options(params)
+    partitions = [{"datasets": ["NMC"]}, {"datasets": []}]
+    params = {"partitions": partitions, "parallel_folds": True}
+    checks.check_kfold_options(params)
+    with pytest.raises(CheckError):
+        checks.check_kfold_options(params, parallel_models=True)
+    with pytest.raises(CheckError):
+        checks.check_kfold_options({**params, "target": "fit_future_tests"})
+    future_tests = {"partitions": partitions, "target": "fit_future_tests"}
+    checks.check_kfold_options(future_tests)
+    with pytest.raises(CheckError):
+        checks.check_kfold_options(future_tests, structured_covmat=True)
 
 
 def test_check_hyperopt_stopping():
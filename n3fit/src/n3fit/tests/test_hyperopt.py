@@ -2,8 +2,16 @@
     Test hyperoptimization features
 """
 
-from numpy.testing import assert_approx_equal
-from n3fit.hyper_optimization import rewards
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+from numpy.testing import assert_allclose, assert_approx_equal
+
+from validphys import fitveto
+from n3fit.hyper_optimization import penalties, rewards
+from n3fit.model_gen import pdfNN_layer_generator
+from n3fit.vpinterface import N3PDF, integrability_numbers
 
 def test_rewards():
     """ Ensure that rewards continue doing what they are supposed to do """
@@ -11,3 +19,217 @@ def test_rewards():
     assert_approx_equal(rewards.average(losses), 1.0)
     assert_approx_equal(rewards.best_worst(losses), 2.0)
     assert_approx_equal(rewards.std(losses), 0.816496580927726)
+
+
+def _fake_pdf_models(replicas):
+    fake_fl = [
+        {"fl": i, "largex": [0, 1], "smallx": [1, 2]}
+        for i in ["u", "ubar", "d", "dbar", "c", "cbar", "s", "sbar"]
+    ]
+    return pdfNN_layer_generator(
+        nodes=[8],
+        activations=["linear"],
+        seed=list(range(replicas)),
+        flav_info=fake_fl,
+        parallel_models=replicas,
+    )
+
+
+def test_batched_penalties():
+    """ The penalties evaluated together for all replicas agree with the
+    penalties computed one replica at a time """
+    pdf_models = _fake_pdf_models(3)
+    fake_stopping = SimpleNamespace(
+        e_best_chi2=[1000, 2000, 3000], stopping_patience=500, total_epochs=5000, vl_chi2=[2.4, 2.5, 2.6]
+    )
+    res = penalties.per_replica_penalties(
+        ["saturation", "patience", "integrability"], pdf_models, fake_stopping
+    )
+    for values in res.values():
+        assert values.shape == (3,)
+
+    x = np.logspace(-6, -4, 100)
+    integrability = integrability_numbers(N3PDF(pdf_models))
+    for i, pdf_model in enumerate(pdf_models):
+        single_values = pdf_model.predict({"pdf_input": x.reshape(1, -1, 1)})
+        assert_allclose(res["saturation"][i], penalties.saturation_per_replica(single_values, x)[0])
+        integ = integrability[i]
+        overflow = np.sum(integ[integ > fitveto.INTEG_THRESHOLD])
+        assert_allclose(res["integrability"][i], np.expm1(min(overflow, 50.0)), rtol=1e-6)
+    assert_allclose(res["patience"], [2.4 * np.exp(0.35), 2.5 * np.exp(0.25), 2.6 * np.exp(0.15)])
+
+    # The reductions give back the values of the single penalties
+    total = penalties.reduce_penalties(res)
+    assert_allclose(total["saturation"], penalties.saturation(pdf_models))
+    assert_allclose(total["integrability"], penalties.integrability(pdf_models), rtol=1e-6)
+    assert_allclose(total["patience"], penalties.patience(fake_stopping))
+
+
+def test_predict_many():
+    """ The function evaluating several models together gives the predictions
+    of the single models, for inputs of different shapes """
+    from n3fit.backends import compile_predict_many
+
+    pdf_models = _fake_pdf_models(2)
+    predict = compile_predict_many(pdf_models)
+    for size in (20, 7):
+        x = {"pdf_input": np.logspace(-6, -4, size).reshape(1, -1, 1)}
+        values = predict(x)
+        for i, pdf_model in enumerate(pdf_models):
+            assert_allclose(values[i : i + 1], pdf_model.predict(x), rtol=1e-6)
+
+
+FIT_BASIS = [
+    {"fl": "sng", "smallx": [1.05, 1.19], "largex": [1.47, 2.70]},
+    {"fl": "g", "smallx": [0.94, 1.25], "largex": [0.11, 5.87]},
+    {"fl": "v", "smallx": [0.54, 0.75], "largex": [1.15, 2.76]},
+    {"fl": "v3", "smallx": [0.21, 0.57], "largex": [1.35, 3.08]},
+    {"fl": "v8", "smallx": [0.52, 0.76], "largex": [0.77, 3.56]},
+    {"fl": "t3", "smallx": [-0.37, 1.52], "largex": [1.74, 3.39]},
+    {"fl": "t8", "smallx": [0.56, 1.29], "largex": [1.45, 3.03]},
+    {"fl": "cp", "smallx": [0.12, 1.19], "largex": [1.83, 6.70]},
+]
+# Partitions of the two datasets of ``kfold_experiment``, the last one does not
+# leave out any dataset
+PARTITIONS = [
+    {"datasets": ["DIS1"], "overfit": True},
+    {"datasets": ["DIS0"]},
+    {"datasets": []},
+]
+
+
+def _kfold_dataset(name, tr_mask, fktable, xgrid):
+    basis = [1, 2, 3, 9, 10]
+    return {
+        "fktables": [{"ndata": len(tr_mask), "basis": basis, "xgrid": xgrid, "fktable": fktable}],
+        "tr_fktables": [fktable[tr_mask]],
+        "vl_fktables": [fktable[~tr_mask]],
+        "ex_fktables": [fktable],
+        "ds_tr_mask": tr_mask,
+        "hadronic": False,
+        "operation": "NULL",
+        "name": name,
+        "frac": 0.75,
+        "ndata": len(tr_mask),
+        "use_fixed_predictions": False,
+    }
+
+
+@pytest.fixture
+def kfold_experiment():
+    """ One experiment with the structure of the output of
+    ``validphys.n3fit_data.fitting_data_dict``, made of two DIS datasets
+    of 6 points each, with the folds of ``PARTITIONS`` """
+    rng = np.random.default_rng(3)
+    ndata, nx = 6, 5
+    xgrid = np.logspace(-3, -0.1, nx).reshape(1, nx)
+    ds_tr_mask = np.array([1, 1, 0, 1, 1, 0], dtype=bool)
+    datasets = [
+        _kfold_dataset(f"DIS{i}", ds_tr_mask, rng.random((ndata, 5, nx)), xgrid) for i in range(2)
+    ]
+    trmask = np.concatenate([ds_tr_mask, ds_tr_mask])
+    vlmask = ~trmask
+    ntotal = len(trmask)
+    sqrtcov = rng.random((ntotal, ntotal))
+    covmat = sqrtcov @ sqrtcov.T / ntotal + np.eye(ntotal)
+    expdata = rng.uniform(1.0, 2.0, (1, ntotal))
+    exp_info = {
+        "datasets": datasets,
+        "name": "EXP",
+        "expdata_true": expdata,
+        "invcovmat_true": np.linalg.inv(covmat),
+        "covmat": covmat,
+        "trmask": trmask,
+        "invcovmat": np.linalg.inv(covmat[np.ix_(trmask, trmask)]),
+        "ndata": np.count_nonzero(trmask),
+        "expdata": expdata[:, trmask],
+        "vlmask": vlmask,
+        "invcovmat_vl": np.linalg.inv(covmat[np.ix_(vlmask, vlmask)]),
+        "ndata_vl": np.count_nonzero(vlmask),
+        "expdata_vl": expdata[:, vlmask],
+        "positivity": False,
+        "count_chi2": True,
+        "folds": {"training": [], "validation": [], "experimental": []},
+        "data_transformation_tr": None,
+        "data_transformation_vl": None,
+    }
+    # Masks of the data kept by every partition
+    folds = [np.arange(ntotal) < ndata, np.arange(ntotal) >= ndata, np.ones(ntotal, dtype=bool)]
+    for fold in folds:
+        exp_info["folds"]["training"].append(fold[trmask])
+        exp_info["folds"]["validation"].append(fold[vlmask])
+        exp_info["folds"]["experimental"].append(~fold)
+    return exp_info
+
+
+def _kfold_trainer(exp_info, parallel_folds):
+    from n3fit.model_trainer import ModelTrainer
+
+    kfold_parameters = {
+        "partitions": PARTITIONS,
+        "target": "average",
+        "threshold": 1e8,
+        "parallel_folds": parallel_folds,
+    }
+    return ModelTrainer(
+        [exp_info],
+        [],
+        None,
+        FIT_BASIS,
+        "NN31IC",
+        [4],
+        [1],
+        simu_parameters_names=[],
+        simu_parameters_scales=[],
+        bsm_fac_initialisations=[],
+        kfold_parameters=kfold_parameters,
+        max_cores=1,
+    )
+
+
+def test_parallel_fold_masks(kfold_experiment):
+    """ When the folds are trained in parallel, the masks of every fold are
+    stacked in the same order as the pdf models """
+    trainer = _kfold_trainer(kfold_experiment, parallel_folds=True)
+    assert trainer.parallel_folds
+
+    stacked = trainer._parallel_fold_masks()
+    for split, masks in enumerate(stacked):
+        [exp_masks] = masks
+        assert exp_masks.shape[0] == len(PARTITIONS)
+        for k, partition in enumerate(PARTITIONS):
+            [fold_mask] = trainer._fold_masks(partition, k)[split]
+            if fold_mask is None:
+                assert exp_masks[k].all()
+            else:
+                np.testing.assert_array_equal(exp_masks[k], fold_mask)
+
+
+def test_parallel_folds(kfold_experiment):
+    """ The losses of every fold are the same whether the folds are trained
+    one after the other or at once as parallel models """
+    params = {
+        "nodes_per_layer": [4, 8],
+        "activation_per_layer": ["tanh", "linear"],
+        "initializer": "glorot_normal",
+        "optimizer": {"optimizer_name": "RMSprop", "learning_rate": 1e-3},
+        "epochs": 20,
+        "stopping_patience": 1.0,
+        "threshold_chi2": 1e8,
+        "layer_type": "dense",
+        "dropout": 0.0,
+    }
+    results = []
+    for parallel_folds in (False, True):
+        trainer = _kfold_trainer(kfold_experiment, parallel_folds)
+        trainer.set_hyperopt(True, keys=[])
+        # The seeds of the folds after the first one are drawn from numpy
+        np.random.seed(7)
+        results.append(trainer.hyperparametrizable(dict(params)))
+    sequential, parallel = results
+
+    assert sequential["status"] == parallel["status"] == "ok"
+    for key in ("hyper_losses", "validation_losses", "experimental_losses"):
+        assert len(parallel["kfold_meta"][key]) == len(PARTITIONS)
+        assert_allclose(parallel["kfold_meta"][key], sequential["kfold_meta"][key], rtol=1e-4)
+    assert_allclose(parallel["loss"], sequential["loss"], rtol=1e-4)
@@ -5,6 +5,7 @@
 
 import numpy as np
 from validphys.pdfbases import fitbasis_to_NN31IC
+from validphys.coredata import SparseFKTable
 from n3fit.backends import operations as op
 import n3fit.layers as layers
 
@@ -182,6 +183,23 @@ def test_DY():
         assert np.allclose(result, reference, THRESHOLD)
 
 
+def test_DY_sparse():
+    """Check that the sparse contraction gives the same result as the dense one"""
+    tests = [(2, "ADD"), (1, "NULL")]
+    for nfk, ope in tests:
+        fkdicts = generate_had(nfk)
+        # Remove most of the entries of the fktables
+        fks = [i["fktable"] * (np.random.rand(*i["fktable"].shape) > 0.9) for i in fkdicts]
+        sparse_fks = [SparseFKTable.from_dense(fk) for fk in fks]
+        dense_layer = layers.DY(fkdicts, fks, ope, nfl=FLAVS)
+        sparse_layer = layers.DY(fkdicts, sparse_fks, ope, nfl=FLAVS, sparse_threshold=1.0)
+        pdf = np.random.rand(1, XSIZE, FLAVS, 2)
+        kp = op.numpy_to_tensor(pdf)
+        dense_result = op.evaluate(dense_layer(kp))
+        sparse_result = op.evaluate(sparse_layer(kp))
+        assert np.allclose(dense_result, sparse_result, THRESHOLD)
+
+
 def test_rotation_flavour():
     # Input dictionary to build the rotation matrix using vp2 functions
     flav_info = [
@@ -2,7 +2,10 @@
     Test the losses layers
 """
 import numpy as np
+import pytest
+
 from n3fit.layers import losses
+from validphys.covmats_utils import BlockLowRankMatrix
 from .test_backend import are_equal, DIM
 
 ARR1 = np.random.rand(DIM)
@@ -21,6 +24,69 @@ def test_l_invcovmat():
     are_equal(result, reference, threshold=1e-4)
 
 
+def test_l_invcovmat_per_replica():
+    """Check the loss with a different training mask for every replica"""
+    nrep = 3
+    cov = C @ C.T + np.eye(DIM)
+    masks = np.random.rand(nrep, DIM) > 0.4
+    masks[:, 0] = True
+    data = np.random.rand(nrep, DIM)
+    pred = np.random.rand(1, nrep, DIM)
+    invcovmats = np.zeros((nrep, DIM, DIM))
+    reference = []
+    for i, mask in enumerate(masks):
+        invcov = np.linalg.inv(cov[mask][:, mask])
+        invcovmats[i][np.ix_(mask, mask)] = invcov
+        y = data[i][mask] - pred[0, i][mask]
+        reference.append(y @ invcov @ y)
+    loss_f = losses.LossInvcovmat(invcovmats, data, masks)
+    result = loss_f(pred)
+    are_equal(result, np.array(reference), threshold=1e-4)
+
+    # The replicas with the same mask can share the inverse covmat
+    masks[1] = masks[0]
+    invcovmats[1] = invcovmats[0]
+    y = data[1][masks[1]] - pred[0, 1][masks[1]]
+    reference[1] = y @ invcovmats[0][np.ix_(masks[1], masks[1])] @ y
+    kernels = invcovmats[[0, 2]]
+    loss_f = losses.LossInvcovmat(kernels, data, masks, kernel_index=np.array([0, 0, 1]))
+    are_equal(loss_f(pred), np.array(reference), threshold=1e-4)
+
+
+def test_l_invcovmat_add_covmat():
+    """Adding a covmat to a per-replica loss updates the inverse covmat of every replica"""
+    cov = C @ C.T + np.eye(DIM)
+    extra = np.diag(np.random.rand(DIM))
+    masks = np.ones((2, DIM), dtype=bool)
+    masks[1, :2] = False
+    data = np.random.rand(2, DIM)
+    pred = np.random.rand(1, 2, DIM)
+    invcovmats = np.zeros((2, DIM, DIM))
+    reference = []
+    for i, mask in enumerate(masks):
+        idx = np.ix_(mask, mask)
+        invcovmats[i][idx] = np.linalg.inv(cov[idx])
+        y = data[i][mask] - pred[0, i][mask]
+        reference.append(y @ np.linalg.inv((cov + extra)[idx]) @ y)
+    loss_f = losses.LossInvcovmat(invcovmats, data, masks, covmat=cov)
+    loss_f(pred)
+    loss_f.add_covmat(extra)
+    are_equal(loss_f(pred), np.array(reference), threshold=1e-4)
+
+
+def test_l_invcovmat_structured():
+    """Check the loss with a block diagonal plus low rank inverse covmat"""
+    blocks = [C[:2, :2] @ C[:2, :2].T + np.eye(2), C[2:, 2:] @ C[2:, 2:].T + np.eye(DIM - 2)]
+    cov = BlockLowRankMatrix(blocks, np.random.rand(DIM, 2))
+    loss_f = losses.LossInvcovmat(cov.inverse(), ARR1)
+    result = loss_f(np.expand_dims(ARR2, [0, 1]))
+    y = ARR1 - ARR2
+    reference = y @ np.linalg.inv(np.asarray(cov)) @ y
+    are_equal(result, reference, threshold=1e-4)
+    with pytest.raises(ValueError, match="structured"):
+        loss_f.add_covmat(np.eye(DIM))
+
+
 def test_l_positivity():
     alpha = 1e-7
     loss_f = losses.LossPositivity(alpha=alpha)
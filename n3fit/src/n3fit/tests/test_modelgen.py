@@ -64,3 +64,127 @@ def test_generate_dense_per_flavour_network():
     expected_sizes += BASIS_SIZE * [(OUT_SIZES[0], 1), (1,)]
     for weight, esize in zip(modelito.weights, expected_sizes):
         assert weight.shape == esize
+
+
+def test_fuse_datasets():
+    """Check that fusing DIS datasets sharing a xgrid gives the same observables"""
+    nx = 5
+    xgrid = np.linspace(0.1, 1.0, nx).reshape(1, nx)
+    datasets = []
+    for i, basis in enumerate([[1, 2, 5], [2, 3], [1, 9, 10, 11]]):
+        basis = np.array(basis)
+        fktable = np.random.rand(i + 2, len(basis), nx)
+        datasets.append(
+            {
+                "name": f"dataset_{i}",
+                "hadronic": False,
+                "operation": "NULL",
+                "ndata": i + 2,
+                "fktables": [{"xgrid": xgrid, "basis": basis}],
+                "ex_fktables": [fktable],
+            }
+        )
+    # The last one gets its own xgrid and should not be fused
+    datasets[-1]["fktables"][0]["xgrid"] = xgrid / 2.0
+    fused, members = n3fit.model_gen._fuse_datasets(datasets)
+    assert members == [[0, 1], [2]]
+
+    pdf = op.numpy_to_tensor(np.random.rand(1, nx, 14, 1))
+    separate = [
+        n3fit.model_gen.DIS(i["fktables"], i["ex_fktables"], "NULL")(pdf) for i in datasets
+    ]
+    together = [
+        n3fit.model_gen.DIS(i["fktables"], i["ex_fktables"], "NULL")(pdf) for i in fused
+    ]
+    sizes = [i["ndata"] for i in datasets]
+    order = n3fit.model_gen._data_order([[0, 2], [1]], sizes)
+    reference = np.concatenate([op.evaluate(i) for i in separate], axis=-1)
+    result = np.concatenate([op.evaluate(i) for i in together], axis=-1)
+    np.testing.assert_allclose(result, reference, rtol=1e-6)
+    # Reordering of the output
+    shuffled = np.concatenate([reference[..., :2], reference[..., 5:], reference[..., 2:5]], axis=-1)
+    np.testing.assert_allclose(shuffled[..., order], reference)
+
+
+def _observable_spec(rng):
+    """Experiment with DIS datasets sharing an xgrid, hadronic datasets sharing
+    another xgrid and one dataset with its own xgrid, some of them with BSM factors"""
+    from types import SimpleNamespace
+
+    dis_xgrid = np.linspace(0.1, 1.0, 5).reshape(1, 5)
+    dy_xgrid = np.linspace(0.2, 0.9, 4).reshape(1, 4)
+    configurations = [
+        ("DIS_A", False, dis_xgrid, [1, 2, 5]),
+        ("DY_A", True, dy_xgrid, [1, 2, 3, 3]),
+        ("DIS_B", False, dis_xgrid, [2, 3]),
+        ("DY_B", True, dy_xgrid, [2, 2, 1, 2, 9, 1]),
+        ("DIS_C", False, dis_xgrid / 2.0, [1, 9]),
+    ]
+    datasets = []
+    for i, (name, hadronic, xgrid, basis) in enumerate(configurations):
+        basis = np.array(basis)
+        ndata = i + 3
+        nx = xgrid.shape[1]
+        if hadronic:
+            fktable = rng.random((ndata, len(basis) // 2, nx, nx))
+        else:
+            fktable = rng.random((ndata, len(basis), nx))
+        mask = np.arange(ndata) % 2 == 0
+        bsm = {}
+        if name in ("DIS_A", "DY_B", "DIS_C"):
+            bsm["None_OtZ"] = SimpleNamespace(central_value=rng.random(ndata))
+        datasets.append(
+            {
+                "name": name,
+                "hadronic": hadronic,
+                "operation": "NULL",
+                "use_fixed_predictions": False,
+                "ndata": ndata,
+                "ds_tr_mask": mask,
+                "fktables": [{"xgrid": xgrid, "basis": basis}],
+                "tr_fktables": [fktable[mask]],
+                "vl_fktables": [fktable[~mask]],
+                "ex_fktables": [fktable],
+                "simu_parameters_names_CF": bsm,
+            }
+        )
+    spec = {"name": "EXP", "positivity": False, "datasets": datasets, "covmat": None}
+    for key in ("invcovmat", "invcovmat_vl", "invcovmat_true", "expdata", "expdata_vl", "expdata_true"):
+        spec[key] = None
+    return spec
+
+
+def test_fused_observable_generator():
+    """The fused observables give the same predictions as the separate ones,
+    with layer names made of the names of the fused datasets"""
+    spec = _observable_spec(np.random.default_rng(3))
+
+    def combiner(inputs, linear_values):
+        """Linear BSM correction with a coefficient of 0.5 for the only operator"""
+        return inputs * (1.0 + 0.5 * linear_values["OtZ"].astype(np.float32))
+
+    def predictions(fuse_datasets):
+        layer_info = n3fit.model_gen.observable_generator(
+            spec, post_observable=combiner, fuse_datasets=fuse_datasets
+        )
+        # A PDF with a different dependence on x for every flavour
+        xgrid = np.concatenate(layer_info["inputs"], axis=1)
+        pdf = xgrid[..., np.newaxis] ** np.linspace(0.5, 2.0, 14)
+        pdf = op.numpy_to_tensor(pdf[..., np.newaxis])
+        outputs = [layer_info[i] for i in ("output", "output_tr", "output_vl")]
+        names = [obs.name for obs in layer_info["output"].observables]
+        return names, [op.evaluate(i._generate_experimental_layer(pdf)) for i in outputs]
+
+    names, reference = predictions(False)
+    assert names == [f"exp_{i['name']}" for i in spec["datasets"]]
+    fused_names, fused = predictions(True)
+    assert fused_names == ["exp_DIS_A_DIS_B", "exp_DY_A_DY_B", "exp_DIS_C"]
+    for result, ref in zip(fused, reference):
+        np.testing.assert_allclose(result, ref, rtol=1e-5)
+
+    fused_datasets, _ = n3fit.model_gen._fuse_datasets(spec["datasets"])
+    assert [i.get("fused_names") for i in fused_datasets] == [
+        ["DIS_A", "DIS_B"],
+        ["DY_A", "DY_B"],
+        None,
+    ]
@@ -0,0 +1,45 @@
+"""
+    Test the integration grids used to impose the sum rules
+"""
+import numpy as np
+import pytest
+from scipy.special import beta, betainc
+
+from n3fit import msr
+
+
+@pytest.mark.parametrize("scheme", list(msr.INTEGRATION_SCHEMES))
+def test_gen_integration_input(scheme):
+    nx = 51
+    xgrid, weights = msr.gen_integration_input(nx, scheme)
+    assert xgrid.shape == weights.shape == (nx, 1)
+    assert (xgrid >= msr.XMIN).all() and (xgrid <= 1.0).all()
+    # The integral of 1 between XMIN and 1
+    np.testing.assert_allclose(weights.sum(), 1.0 - msr.XMIN, rtol=1e-3)
+    # The grids are cached and can't be modified
+    assert msr.gen_integration_input(nx, scheme)[0] is xgrid
+    with pytest.raises(ValueError):
+        xgrid[0] = 1.0
+
+
+def test_trapezoidal_grid():
+    xgrid, weights = msr.gen_integration_input(4)
+    np.testing.assert_allclose(xgrid.ravel(), [1e-9, 1e-5, 0.1, 1.0])
+    np.testing.assert_allclose(weights.ravel(), [5e-6, 0.05, 0.5, 0.45], rtol=1e-3)
+
+
+def test_gauss_legendre_accuracy():
+    """Gauss-Legendre needs far fewer points than the trapezoidal rule for the same accuracy"""
+    a, b = -0.5, 3.0
+    exact = beta(a + 1, b + 1) * (1.0 - betainc(a + 1, b + 1, msr.XMIN))
+    xgrid, weights = msr.gen_integration_input(100, "gauss_legendre")
+    result = np.sum(weights * xgrid ** a * (1.0 - xgrid) ** b)
+    np.testing.assert_allclose(result, exact, rtol=1e-5)
+    gl_error = msr.integration_error(100, "gauss_legendre")
+    assert gl_error < 1e-5
+    assert gl_error < msr.integration_error(2000, "trapezoidal") / 10
+
+
+def test_unknown_scheme():
+    with pytest.raises(ValueError):
+        msr.gen_integration_input(10, "simpson")
@@ -0,0 +1,137 @@
+"""
+    Test the distribution of the replicas among forked worker processes
+"""
+import multiprocessing
+import os
+
+import numpy as np
+import pytest
+
+from n3fit.performfit import _fork_server
+
+DATA = np.arange(10.0)
+REPLICAS_INFO = [
+    (i, [{"name": "EXP", "data": DATA, "timings": {"fk_parsing": (1.0, 2.0)}}], 100 + i)
+    for i in range(1, 6)
+]
+
+
+def _run_fork_server(tmp_path):
+    """Run the fork server on a fake fit, which writes the data it sees and its pid"""
+
+    def fake_fit(replica_idxs, exp_info, nnseeds, stopwatch):
+        np.save(tmp_path / f"replica_{replica_idxs}.npy", exp_info[0]["data"] * nnseeds)
+        (tmp_path / f"pid_{replica_idxs}").write_text(str(os.getpid()))
+        # The phases before the fork are recorded in every worker
+        assert {"setup", "fork", "fk_parsing"} <= set(stopwatch.phase_stats)
+
+    _fork_server(fake_fit, REPLICAS_INFO, jobs=2, maxcores=1)
+
+
+def test_fork_server(tmp_path):
+    """Every replica is fitted once, in a process other than the parent,
+    which sees the data loaded by the parent"""
+    # The parent runs in a fresh process, as the backend may have been
+    # initialised in this one by other tests
+    process = multiprocessing.get_context("spawn").Process(target=_run_fork_server, args=(tmp_path,))
+    process.start()
+    process.join()
+    assert process.exitcode == 0
+    for replica, _, nnseed in REPLICAS_INFO:
+        np.testing.assert_array_equal(np.load(tmp_path / f"replica_{replica}.npy"), DATA * nnseed)
+        assert int((tmp_path / f"pid_{replica}").read_text()) not in (os.getpid(), process.pid)
+
+
+def test_fork_server_initialized_backend(tmp_path):
+    """Forking is refused once the backend has been initialised"""
+    from n3fit.backends import backend_initialized, operations, set_initial_state
+
+    operations.numpy_to_tensor(DATA)
+    assert backend_initialized()
+    # The number of threads can no longer be set, but the state can still be reset
+    set_initial_state(max_cores=1)
+    with pytest.raises(RuntimeError):
+        _run_fork_server(tmp_path)
+
+
+def _replica_experiment(name, covmat, data, trmask, fktable, xgrid):
+    """Experiment of one replica as given by fitting_data_dict, with one DIS dataset"""
+    vlmask = ~trmask
+    ndata = len(trmask)
+    dataset = {
+        "name": f"{name}_DIS",
+        "hadronic": False,
+        "operation": "NULL",
+        "use_fixed_predictions": False,
+        "ndata": ndata,
+        "ds_tr_mask": trmask,
+        "fktables": [{"xgrid": xgrid, "basis": np.arange(fktable.shape[1])}],
+        "tr_fktables": [fktable[trmask]],
+        "vl_fktables": [fktable[vlmask]],
+        "ex_fktables": [fktable],
+    }
+    return {
+        "name": name,
+        "positivity": False,
+        "datasets": [dataset],
+        "trmask": trmask,
+        "expdata": data[trmask].reshape(1, -1),
+        "expdata_vl": data[vlmask].reshape(1, -1),
+        "invcovmat": np.linalg.inv(covmat[np.ix_(trmask, trmask)]),
+        "invcovmat_vl": np.linalg.inv(covmat[np.ix_(vlmask, vlmask)]),
+        "expdata_true": data.reshape(1, -1),
+        "invcovmat_true": np.linalg.inv(covmat),
+        "covmat": covmat,
+        "ndata": trmask.sum(),
+        "ndata_vl": vlmask.sum(),
+        "folds": {"training": [], "validation": [], "experimental": []},
+    }
+
+
+def test_per_replica_split():
+    """The training and validation losses of replicas fitted together, each with
+    its own split, are those of the replicas fitted separately"""
+    from n3fit.backends import operations as op
+    from n3fit.model_gen import observable_generator
+    from n3fit.performfit import _per_replica_split_experiments
+
+    rng = np.random.default_rng(7)
+    nrep, ndata, nx = 3, 6, 4
+    xgrid = np.linspace(0.1, 0.9, nx).reshape(1, nx)
+    # The first experiment has the same split for the first two replicas,
+    # the second the same split for all replicas
+    all_trmasks = [
+        np.array([[1, 1, 0, 1, 0, 1], [1, 1, 0, 1, 0, 1], [0, 1, 1, 1, 1, 0]], dtype=bool),
+        np.array([[1, 0, 1, 1, 0, 1]] * nrep, dtype=bool),
+    ]
+    replica_experiments = [[] for _ in range(nrep)]
+    for i, trmasks in enumerate(all_trmasks):
+        sqrtcov = rng.random((ndata, ndata))
+        covmat = sqrtcov @ sqrtcov.T + np.eye(ndata)
+        fktable = rng.random((ndata, 3, nx))
+        for rep, trmask in enumerate(trmasks):
+            replica_experiments[rep].append(
+                _replica_experiment(f"EXP{i}", covmat, rng.random(ndata), trmask, fktable, xgrid)
+            )
+
+    experiments = _per_replica_split_experiments(replica_experiments)
+    assert experiments[0]["invcovmat"].shape == (2, ndata, ndata)
+    assert experiments[1]["invcovmat"].shape == (ndata, ndata)
+    assert experiments[1]["invcovmat_index"] is None
+
+    pdf = rng.random((1, nx, 14, nrep))
+    for exp_dict, replicas in zip(experiments, zip(*replica_experiments)):
+        np.testing.assert_array_equal(exp_dict["ndata"], [rep["ndata"] for rep in replicas])
+        layer_info = observable_generator(exp_dict)
+        for output, data_key, invcovmat_key, split in (
+            ("output_tr", "expdata", "invcovmat", "tr_fktables"),
+            ("output_vl", "expdata_vl", "invcovmat_vl", "vl_fktables"),
+        ):
+            loss = op.evaluate(layer_info[output](op.numpy_to_tensor(pdf)))
+            reference = []
+            for i, rep in enumerate(replicas):
+                fktable = rep["datasets"][0][split][0]
+                prediction = np.einsum("nfx, xf -> n", fktable, pdf[0, :, :3, i])
+                diff = rep[data_key].ravel() - prediction
+                reference.append(diff @ rep[invcovmat_key] @ diff)
+            np.testing.assert_allclose(loss, reference, rtol=1e-4)
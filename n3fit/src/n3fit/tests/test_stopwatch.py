@@ -1,6 +1,8 @@
 """ Tests the stopwatch does what is supposed to do """
 
-from n3fit.stopwatch import StopWatch
+import json
+
+from n3fit.stopwatch import PROFILE_FILE, TRACE_FILE, StopWatch
 
 
 def time_comparer(internal_dict, computed_dict, base_time):
@@ -39,3 +41,28 @@ def test_register_ref():
     keyname = f"{base1}_to_{base2}"
     assert time_dict["cputime"][keyname] == cpu_diff
     assert time_dict["walltime"][keyname] == wall_diff
+
+
+def test_phases(tmp_path):
+    watch = StopWatch()
+    with watch.phase("build", fold=0):
+        pass
+    watch.record_phase("train_step", 1.0, 1.5, category="epoch")
+    watch.record_phase("train_step", 2.0, 2.25, category="epoch")
+    assert watch.phase_stats["train_step"]["count"] == 2
+    assert watch.phase_stats["train_step"]["walltime"] == 0.75
+    assert watch.phase_stats["build"]["peak_rss_mb"] > 0
+
+    trace = watch.chrome_trace()["traceEvents"]
+    assert [i["name"] for i in trace] == ["build", "train_step", "train_step"]
+    assert trace[1]["dur"] == 0.5e6
+    assert trace[0]["args"]["fold"] == 0
+
+    watch.write_profile(tmp_path)
+    profile = json.loads((tmp_path / PROFILE_FILE).read_text())
+    assert profile["phases"] == watch.phase_stats
+    assert len(profile["events"]) == 3
+    assert "traceEvents" in json.loads((tmp_path / TRACE_FILE).read_text())
+
+    watch.clear_phases()
+    assert not watch.events and not watch.phase_stats
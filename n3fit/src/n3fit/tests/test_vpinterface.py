@@ -69,3 +69,28 @@ def test_vpinterface():
     assert distances[1].grid_values.data.shape == (1, 8, 40)
     np.testing.assert_allclose(distances[0].grid_values.data, 0.0)
     assert not np.allclose(distances[1].grid_values.data, 0.0)
+
+
+def test_batched_replicas():
+    """All replicas are evaluated together and the result is shared by the
+    single-replica instances until the cache is invalidated"""
+    n3pdf = generate_n3pdf(layers=1, members=3)
+    xx = np.random.rand(7)
+    all_values = n3pdf(xx, flavours="n3fit")
+    for i, (replica, model) in enumerate(zip(n3pdf.split_replicas(), n3pdf._models)):
+        single = model.predict({"pdf_input": xx.reshape(1, -1, 1)})
+        np.testing.assert_allclose(replica(xx, flavours="n3fit"), single, rtol=1e-6)
+        np.testing.assert_allclose(all_values[i : i + 1], single, rtol=1e-6)
+        np.testing.assert_allclose(n3pdf(xx, "n3fit", replica=i + 1), single, rtol=1e-6)
+    np.testing.assert_allclose(n3pdf(xx, "n3fit", replica=0), all_values.mean(axis=0, keepdims=True))
+
+    # The cached values are kept until they are explicitly invalidated
+    model = n3pdf._models[0]
+    model.set_weights([w * 0.5 for w in model.get_weights()])
+    np.testing.assert_array_equal(n3pdf(xx, flavours="n3fit"), all_values)
+    n3pdf.invalidate_cache()
+    new_values = n3pdf(xx, flavours="n3fit")
+    np.testing.assert_allclose(new_values[1:], all_values[1:])
+    np.testing.assert_allclose(
+        new_values[:1], model.predict({"pdf_input": xx.reshape(1, -1, 1)}), rtol=1e-6
+    )
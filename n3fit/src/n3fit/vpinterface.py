@@ -19,6 +19,7 @@
 
 """
 import logging
+from collections import OrderedDict
 from collections.abc import Iterable
 import numpy as np
 import numpy.linalg as la
@@ -58,10 +59,56 @@ class N3Stats(MCStats):
         return np.mean(self.data, axis=0)
 
 
+# Number of x-grids for which the values of the replicas are kept
+XGRID_CACHE_SIZE = 8
+
+
+class ReplicaEvaluator:
+    """Evaluates all the ``pdf_models`` of a fit at once, with a single compiled
+    function, and keeps the result for the last ``XGRID_CACHE_SIZE`` x-grids.
+    The cached values assume that the models are not trained any further:
+    whoever changes their weights must call :py:meth:`ReplicaEvaluator.invalidate`.
+    """
+
+    def __init__(self, pdf_models):
+        self._models = pdf_models
+        self._predict = None
+        self._cache = OrderedDict()
+
+    def invalidate(self):
+        """Drop the cached values, to be called after the weights of the models change"""
+        self._cache.clear()
+
+    def __call__(self, xarr):
+        """Returns a read only array of shape (replicas, xgrid_size, 14) with the
+        values of all the models in ``xarr``"""
+        mod_xgrid = np.ascontiguousarray(xarr).reshape(1, -1, 1)
+        key = (mod_xgrid.dtype.str, mod_xgrid.tobytes())
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            return self._cache[key]
+        if self._predict is None:
+            # Imported here since it requires tensorflow
+            from n3fit.backends import compile_predict_many
+
+            self._predict = compile_predict_many(self._models)
+        result = self._predict({"pdf_input": mod_xgrid})
+        result.flags.writeable = False
+        self._cache[key] = result
+        while len(self._cache) > XGRID_CACHE_SIZE:
+            self._cache.popitem(last=False)
+        return result
+
+
 class N3LHAPDFSet(LHAPDFSet):
-    """Extension of LHAPDFSet using n3fit models"""
+    """Extension of LHAPDFSet using n3fit models
+
+    All replicas are evaluated together by a :py:class:`ReplicaEvaluator`,
+    which can be shared with other sets containing only some of the replicas
+    (``members``, the indexes of the models of this set in the evaluator).
+    """
 
-    def __init__(self, name, pdf_models, Q=1.65):
+    def __init__(self, name, pdf_models, Q=1.65, evaluator=None, members=None):
         log.debug("Creating LHAPDF-like n3fit PDF")
         self._error_type = "replicas"
         self._name = name
@@ -69,6 +116,17 @@ class N3LHAPDFSet(LHAPDFSet):
         self._flavors = None
         self._fitting_q = Q
         self.basis = check_basis("evolution", EVOL_LIST)["basis"]
+        if evaluator is None:
+            evaluator = ReplicaEvaluator(pdf_models)
+        self._evaluator = evaluator
+        self._members = members
+
+    def replica_values(self, xarr):
+        """Values of all replicas of the set in ``xarr``, with shape (replicas, xgrid_size, 14)"""
+        result = self._evaluator(xarr)
+        if self._members is not None:
+            result = result[self._members]
+        return result
 
     def xfxQ(self, x, Q, n, fl):
         """Return the value of the PDF member for the given value in x"""
@@ -99,18 +157,16 @@ class N3LHAPDFSet(LHAPDFSet):
         """
         if flavours is None:
             flavours = EVOL_LIST
-        # Ensures that the input has the shape the model expect, no matter the input
-        # as the scaling is done by the model itself
-        mod_xgrid = xarr.reshape(1, -1, 1)
-
-        if replica is None or replica == 0:
-            # We need generate output values for all replicas
-            result = np.concatenate([m.predict({"pdf_input": mod_xgrid}) for m in self._lhapdf_set], axis=0)
-            if replica == 0:
-                # We want _only_ the central value
-                result = np.mean(result, axis=0, keepdims=True)
+        # All replicas are evaluated together (and cached), then the requested ones are selected
+        all_replicas = self.replica_values(xarr)
+
+        if replica is None:
+            result = all_replicas.copy()
+        elif replica == 0:
+            # We want _only_ the central value
+            result = np.mean(all_replicas, axis=0, keepdims=True)
         else:
-            result = self._lhapdf_set[replica - 1].predict({"pdf_input": mod_xgrid})
+            result = all_replicas[replica - 1 : replica].copy()
 
         if flavours != "n3fit":
             # Ensure that the result has its flavour in the basis-defined order
@@ -191,6 +247,29 @@ class N3PDF(PDF):
         """If the function needs an LHAPDF object, return a N3LHAPDFSet"""
         return self._lhapdf_set
 
+    def split_replicas(self):
+        """Return one N3PDF per replica. All of them share the evaluation of this
+        set, so that all replicas are evaluated together the first time any of
+        them is evaluated in a given x-grid"""
+        ret = []
+        for i, model in enumerate(self._models):
+            n3pdf = N3PDF(model, fit_basis=self.fit_basis, name=self.name, Q=self._lhapdf_set._fitting_q)
+            n3pdf._lhapdf_set = N3LHAPDFSet(
+                self.name,
+                [model],
+                Q=self._lhapdf_set._fitting_q,
+                evaluator=self._lhapdf_set._evaluator,
+                members=[i],
+            )
+            ret.append(n3pdf)
+        return ret
+
+    def invalidate_cache(self):
+        """Drop the values of the replicas cached so far (shared with the sets
+        returned by :py:meth:`N3PDF.split_replicas`), must be called if the weights
+        of the models are changed after the PDF has been evaluated"""
+        self._lhapdf_set._evaluator.invalidate()
+
     def get_nn_weights(self):
         """Outputs all weights of the NN as numpy.ndarrays"""
         return [model.get_weights() for model in self._models]
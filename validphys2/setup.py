@@ -34,6 +34,8 @@ setup(name= "validphys",
                         'vp-hyperoptplot = validphys.scripts.vp_hyperoptplot:main',
                         'vp-deltachi2 = validphys.scripts.vp_deltachi2:main',
                         'vp-fakeevolve = validphys.scripts.vp_fakeevolve:main',
+                        'vp-predictions-cache = validphys.scripts.vp_predictions_cache:main',
+                        'vp-benchmark = validphys.scripts.vp_benchmark:main',
                     ]},
       package_dir = {'': 'src'},
       packages = find_packages('src'),
@@ -47,6 +49,7 @@ setup(name= "validphys",
             'scalevariations': ['*'],
             'hyperplot': ['*'],
             'deltachi2': ['*'],
+            'benchmarks/baselines': ['*'],
        },
       zip_safe = False,
       classifiers=[
@@ -8,19 +8,26 @@ declared here.
 
 The entry point of the validphys application is the ``main`` funcion of this
 module.
+
+The provider modules are only imported when an action needs them (see
+:py:mod:`validphys.lazyproviders`) and the ``--import-profile`` flag reports
+the time spent importing each module when the application exits.
 """
 import sys
 import os
 import logging
 import contextlib
 
+# The profiler must be installed before any heavy module is imported
+from validphys import importprofile
+
+importprofile.install_from_argv()
 
-import lhapdf
 from reportengine import app
 
 from validphys.config import Config, Environment
-from validphys import uploadutils
 from validphys import mplstyles
+from validphys.lazyproviders import lazy_provider
 
 
 providers = [
@@ -121,8 +128,27 @@ including the contents of the following file:
             help="Upload the resulting output folder to the Milan server.",
         )
 
+        parser.add_argument(
+            importprofile.FLAG,
+            action="store_true",
+            help="Print the time spent importing each module when the program exits.",
+        )
+
         return parser
 
+    def init_providers(self, args):
+        """Load the default providers lazily, so that their modules are only
+        imported if the resolved actions need them. The extra providers given
+        in the command line are imported eagerly, as reportengine does."""
+        extra_providers = args["extra_providers"]
+        if extra_providers is None:
+            extra_providers = []
+        default_providers = [
+            lazy_provider(p) if isinstance(p, str) else p for p in self.default_providers
+        ]
+        extra_providers = self.load_providers(extra_providers)
+        self.providers = list(reversed(default_providers + extra_providers))
+
     def init(self):
         super().init()
         cout = self.args["cout"]
@@ -131,6 +157,7 @@ including the contents of the following file:
                 cout = True
         if not cout:
             import NNPDF
+            import lhapdf
 
             NNPDF.SetVerbosity(0)
             lhapdf.setVerbosity(0)
@@ -142,6 +169,9 @@ including the contents of the following file:
         upload the output path if do_upload is True. Otherwise do nothing.
         Raise SystemExit on error."""
         if do_upload:
+            # uploadutils needs an NNPDF profile at import time
+            from validphys import uploadutils
+
             return uploadutils.ReportUploader().upload_or_exit_context(output)
         return contextlib.ExitStack()
 
@@ -0,0 +1,9 @@
+"""
+Benchmarks of the hot paths of validphys and n3fit, run with ``vp-benchmark``.
+
+The benchmarks use synthetic inputs (fktables, commondata, covariance matrices
+and PDF grids) of configurable size, generated by
+:py:mod:`validphys.benchmarks.synthetic`, so that they run offline. The results
+are compared with the baselines stored in the ``baselines`` folder, see
+:py:mod:`validphys.benchmarks.runner`.
+"""
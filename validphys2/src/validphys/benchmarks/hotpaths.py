@@ -0,0 +1,158 @@
+"""
+hotpaths.py
+
+Benchmarks of the hot paths of validphys, run on synthetic inputs generated by
+:py:mod:`validphys.benchmarks.synthetic`.
+"""
+import itertools
+from types import SimpleNamespace
+
+import numpy as np
+
+from validphys.benchmarks import synthetic
+from validphys.benchmarks.runner import benchmark
+
+
+def _hadronic_fkspec(params, workdir):
+    from validphys.core import FKTableSpec
+
+    path = synthetic.write_fktable(
+        workdir / "FK_SYNTHETIC.dat",
+        params["ndata"],
+        params["nx"],
+        hadronic=True,
+        x_density=params["x_density"],
+    )
+    return FKTableSpec(path, ())
+
+
+@benchmark("fkparser.load_fktable")
+def bench_load_fktable(params, workdir):
+    from validphys.fkparser import load_fktable
+
+    spec = _hadronic_fkspec(params, workdir)
+
+    def run():
+        # Time the parsing, not the cache
+        load_fktable.cache_clear()
+        return load_fktable(spec).sigma
+
+    return run
+
+
+@benchmark("convolution.hadron_predictions")
+def bench_hadron_predictions(params, workdir):
+    from validphys.convolution import FK_FLAVOURS, _gv_hadron_predictions
+    from validphys.fkparser import load_fktable
+
+    loaded_fk = load_fktable(_hadronic_fkspec(params, workdir))
+    gv = synthetic.synthetic_grid_values(params["nmembers"], len(FK_FLAVOURS), params["nx"])
+
+    def run():
+        return _gv_hadron_predictions(loaded_fk, gv)
+
+    return run
+
+
+@benchmark("covmats.dataset_inputs_covmat_from_systematics")
+def bench_covmat_from_systematics(params, workdir):
+    from validphys.covmats import dataset_inputs_covmat_from_systematics
+
+    commondata = synthetic.synthetic_commondata_list(
+        params["ndatasets"], params["ndata"], params["nsys"], params["nspecial"]
+    )
+    data_input = [SimpleNamespace(weight=1) for _ in commondata]
+
+    def run():
+        return dataset_inputs_covmat_from_systematics(commondata, data_input)
+
+    return run
+
+
+@benchmark("calcutils.calc_chi2")
+def bench_calc_chi2(params, workdir):
+    from validphys.calcutils import calc_chi2
+
+    ndata = params["ndata"] * params["ndatasets"]
+    sqrtcov = np.linalg.cholesky(synthetic.synthetic_covmat(ndata))
+    diffs = np.random.default_rng(0).normal(size=(ndata, params["nmembers"]))
+
+    def run():
+        return calc_chi2(sqrtcov, diffs)
+
+    return run
+
+
+@benchmark("filters.get_cuts_for_dataset")
+def bench_get_cuts_for_dataset(params, workdir):
+    from validphys.filters import Rule, default_filter_settings_input, get_cuts_for_dataset
+
+    spec = synthetic.SyntheticCommonDataSpec(
+        synthetic.synthetic_commondata("SYNTHETIC", params["ndata"] * params["ndatasets"], 1)
+    )
+    rules = [
+        Rule(
+            initial_data=data,
+            defaults=default_filter_settings_input(),
+            theory_parameters={"ID": 0, "PTO": 2},
+        )
+        for data in (
+            {"process_type": "DIS_ALL", "rule": "Q2 > q2min", "reason": "Synthetic"},
+            {
+                "process_type": "DIS_ALL",
+                "local_variables": {"W2": "Q2 * (1 - x) / x"},
+                "rule": "W2 > w2min",
+                "reason": "Synthetic",
+            },
+            {"process_type": "DIS_ALL", "rule": "x > 1e-2 or y < 0.9", "reason": "Synthetic"},
+        )
+    ]
+
+    def run():
+        return get_cuts_for_dataset(spec, rules)
+
+    return run
+
+
+@benchmark("pseudodata.make_replica")
+def bench_make_replica(params, workdir):
+    from validphys.pseudodata import make_replica
+
+    commondata = synthetic.synthetic_commondata_list(
+        params["ndatasets"], params["ndata"], params["nsys"], params["nspecial"]
+    )
+
+    def run():
+        return make_replica(commondata, replica_mcseed=1)
+
+    return run
+
+
+@benchmark("lhio.write_replica_stack")
+def bench_write_replica_stack(params, workdir):
+    from validphys.lhio import write_replica_stack
+
+    grid = synthetic.synthetic_lhapdf_grid(params["nmembers"], params["nx"], params["nq"])
+    runs = itertools.count()
+
+    def run():
+        # Write a new set every time, as the files of an existing one are overwritten
+        set_root = workdir / f"SYNTHETIC{next(runs)}"
+        set_root.mkdir()
+        write_replica_stack(set_root, grid)
+
+    return run
+
+
+@benchmark("paramfits.bootstrapping_stats_errors")
+def bench_bootstrapping_stats_errors(params, workdir):
+    from validphys.paramfits.dataops import StandardSampleWrapper, bootstrapping_stats_errors
+
+    rng = np.random.default_rng(0)
+    determination = StandardSampleWrapper(rng.normal(0.118, 0.002, params["nmembers"]))
+    nresamplings = 1000 * params["nmembers"]
+
+    def run():
+        return bootstrapping_stats_errors(determination, nresamplings, boot_seed=0)
+
+    return run
@@ -0,0 +1,237 @@
+"""
+runner.py
+
+Registry, timing and comparison against stored baselines of the benchmarks.
+
+A benchmark is registered with the :py:func:`benchmark` decorator on a setup
+function, which takes the size parameters (one of :py:data:`SIZES`) and a
+working directory, builds the synthetic inputs and returns a function without
+arguments that runs the code being measured. The setup is not timed. The
+returned function can return a result, which is reduced to a checksum so that
+a faster version giving a different answer is reported as such.
+
+Baselines are stored as YAML files with, for each benchmark, the checksum of
+the result. By default only the checksums are compared. Timings are only
+comparable on the same machine, so they are opt-in: a baseline with the best
+time of the repetitions is saved with ``vp-benchmark --save-baseline --timings``
+on the machine where the work on a hot path is done, and compared with
+``vp-benchmark --timings``. The baselines shipped with the code contain no timings.
+"""
+import dataclasses
+import importlib
+import logging
+import pathlib
+import statistics
+import tempfile
+import time
+
+import numpy as np
+from ruamel.yaml import YAML
+
+from validphys.utils import yaml_safe
+
+log = logging.getLogger(__name__)
+
+BASELINE_FOLDER = pathlib.Path(__file__).parent / "baselines"
+
+# Parameters controlling the size of the synthetic inputs
+SIZES = {
+    "small": {
+        "ndata": 10,
+        "nx": 15,
+        "x_density": 0.3,
+        "nsys": 20,
+        "nspecial": 5,
+        "ndatasets": 3,
+        "nmembers": 10,
+        "nq": 10,
+        "nreplicas": 1,
+        "epochs": 20,
+    },
+    "medium": {
+        "ndata": 50,
+        "nx": 30,
+        "x_density": 0.5,
+        "nsys": 100,
+        "nspecial": 20,
+        "ndatasets": 10,
+        "nmembers": 100,
+        "nq": 20,
+        "nreplicas": 2,
+        "epochs": 200,
+    },
+    "large": {
+        "ndata": 200,
+        "nx": 50,
+        "x_density": 0.5,
+        "nsys": 500,
+        "nspecial": 100,
+        "ndatasets": 20,
+        "nmembers": 1000,
+        "nq": 30,
+        "nreplicas": 4,
+        "epochs": 1000,
+    },
+}
+
+# Modules defining the benchmarks of the vp-benchmark suite
+SUITE_MODULES = ("validphys.benchmarks.hotpaths", "n3fit.benchmarks")
+
+DEFAULT_REPEAT = 5
+# Relative slowdown with respect to the baseline before a benchmark fails
+DEFAULT_TOLERANCE = 0.5
+# Relative tolerance of the checksums
+CHECKSUM_RTOL = 1e-6
+
+BENCHMARKS = {}
+
+
+def benchmark(name):
+    """Register the decorated setup function as the benchmark ``name``"""
+
+    def decorator(setup):
+        if name in BENCHMARKS:
+            raise ValueError(f"Benchmark {name!r} is already registered")
+        BENCHMARKS[name] = setup
+        return setup
+
+    return decorator
+
+
+def load_suite(modules=SUITE_MODULES):
+    """Import the modules registering the benchmarks. Modules that can't be
+    imported (e.g. because an optional dependency is missing) are skipped."""
+    for modname in modules:
+        try:
+            importlib.import_module(modname)
+        except ImportError as e:
+            log.warning("Skipping the benchmarks in %s: %s", modname, e)
+
+
+def checksum(result):
+    """Reduce the result of a benchmark to a single float, or None if
+    there is no result to check"""
+    if result is None:
+        return None
+    if hasattr(result, "to_numpy"):
+        result = result.to_numpy()
+    return float(np.sum(np.asarray(result, dtype=float)))
+
+
+@dataclasses.dataclass
+class BenchmarkResult:
+    """Timings, in seconds, of a benchmark"""
+
+    name: str
+    best: float = None
+    median: float = None
+    checksum: float = None
+    error: str = None
+
+    def as_baseline(self, timings=False):
+        entry = {"checksum": self.checksum}
+        if timings:
+            entry["time"] = float(f"{self.best:.4g}")
+        return entry
+
+
+def run_benchmark(name, size="small", repeat=DEFAULT_REPEAT, workdir=None):
+    """Set up and time the benchmark ``name``, running it once
+    to warm up and then ``repeat`` times"""
+    params = SIZES[size]
+    with tempfile.TemporaryDirectory() as tmp:
+        workdir = pathlib.Path(workdir or tmp)
+        run = BENCHMARKS[name](params, workdir)
+        result = checksum(run())
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            run()
+            times.append(time.perf_counter() - start)
+    return BenchmarkResult(name, min(times), statistics.median(times), result)
+
+
+def run_benchmarks(names=None, size="small", repeat=DEFAULT_REPEAT):
+    """Run the benchmarks in ``names`` (all the registered ones by default)"""
+    if names is None:
+        names = sorted(BENCHMARKS)
+    results = []
+    for name in names:
+        if name not in BENCHMARKS:
+            raise KeyError(f"Unknown benchmark {name!r}. Available: {sorted(BENCHMARKS)}")
+        log.info("Running %s", name)
+        try:
+            results.append(run_benchmark(name, size, repeat))
+        except Exception as e:
+            log.error("Benchmark %s failed: %s", name, e)
+            results.append(BenchmarkResult(name, error=str(e)))
+    return results
+
+
+def baseline_path(size):
+    return BASELINE_FOLDER / f"{size}.yaml"
+
+
+def load_baseline(path):
+    with open(path) as f:
+        return yaml_safe.load(f) or {}
+
+
+def save_baseline(results, path, timings=False):
+    """Add ``results`` to the baseline file ``path``, replacing existing entries.
+    The best times are only stored if ``timings`` is True."""
+    path = pathlib.Path(path)
+    baseline = load_baseline(path) if path.exists() else {}
+    baseline.update(
+        {res.name: res.as_baseline(timings) for res in results if res.error is None}
+    )
+    dumper = YAML(typ="safe")
+    dumper.default_flow_style = False
+    with open(path, "w") as f:
+        dumper.dump(dict(sorted(baseline.items())), f)
+
+
+def compare(result, baseline, tolerance=None, rtol=CHECKSUM_RTOL):
+    """Compare a :py:class:`BenchmarkResult` with its baseline entry. Returns
+    one of ``"error"``, ``"no baseline"``, ``"wrong result"``, ``"slower"``, ``"faster"``
+    and ``"ok"``. The timings are only compared if a ``tolerance`` is given and
+    the baseline entry has a time."""
+    if result.error is not None:
+        return "error"
+    if baseline is None:
+        return "no baseline"
+    expected = baseline.get("checksum")
+    if expected is not None and result.checksum is not None:
+        if not np.isclose(result.checksum, expected, rtol=rtol, atol=0):
+            return "wrong result"
+    if tolerance is None or baseline.get("time") is None:
+        return "ok"
+    if result.best > baseline["time"] * (1 + tolerance):
+        return "slower"
+    if result.best < baseline["time"] / (1 + tolerance):
+        return "faster"
+    return "ok"
+
+
+FAILED_STATUSES = ("error", "slower", "wrong result")
+
+
+def report(results, baseline, tolerance=None):
+    """Return the comparison table of ``results`` against ``baseline`` and
+    whether any benchmark failed, is slower or gives a different result.
+    The timings are only compared if a ``tolerance`` is given."""
+    lines = [f"{'benchmark':<48} {'best (ms)':>10} {'median (ms)':>12} {'baseline (ms)':>14}  status"]
+    failed = False
+    for res in results:
+        entry = baseline.get(res.name)
+        status = compare(res, entry, tolerance)
+        failed |= status in FAILED_STATUSES
+        has_time = entry is not None and entry.get("time") is not None
+        ref = f"{entry['time'] * 1e3:.2f}" if has_time else "-"
+        if res.error is not None:
+            lines.append(f"{res.name:<48} {'-':>10} {'-':>12} {ref:>14}  {status}: {res.error}")
+            continue
+        lines.append(
+            f"{res.name:<48} {res.best * 1e3:>10.2f} {res.median * 1e3:>12.2f} {ref:>14}  {status}"
+        )
+    return "\n".join(lines), failed
@@ -0,0 +1,200 @@
+"""
+synthetic.py
+
+Generators of synthetic inputs (fktables, commondata, covariance matrices and
+PDF grids) of configurable size, so that the benchmarks can run offline without
+any theory or data installed. All generators take a ``seed`` and produce the
+same output for the same arguments.
+"""
+import numpy as np
+import pandas as pd
+
+from validphys.coredata import CommonData
+from validphys.lhio import LHAPDFGrid, SubGrid
+
+# Number of flavours of the FK tables
+NFK = 14
+# Kinematic process of the synthetic commondata
+SYNTHETIC_PROCESS = "DIS_NCE"
+# Name of the systematics shared between the synthetic datasets
+SPECIAL_SYS_NAME = "SYNTHETICSYS"
+
+
+def synthetic_xgrid(nx):
+    """Logarithmic grid of ``nx`` points in x"""
+    return np.geomspace(1e-5, 0.9, nx)
+
+
+def _header(name, marker="_"):
+    return f"{marker}{name}".ljust(60, "_") + "\n"
+
+
+def write_fktable(path, ndata, nx, hadronic=True, x_density=0.5, seed=0, setname="SYNTHETIC"):
+    """Write a synthetic FK table in the format read by
+    :py:func:`validphys.fkparser.parse_fktable` to ``path``.
+
+    A fraction ``x_density`` of the ``(x1, x2)`` pairs of the hadronic
+    tables are non zero. Returns ``path``.
+    """
+    rng = np.random.default_rng(seed)
+    xgrid = synthetic_xgrid(nx)
+    if hadronic:
+        flavour_map = rng.random((NFK, NFK)) < 0.3
+        flavour_map[0, 0] = True
+        x1, x2 = np.indices((nx, nx)).reshape(2, -1)
+        keep = rng.random(len(x1)) < x_density
+        x1, x2 = x1[keep], x2[keep]
+        data = np.repeat(np.arange(ndata), len(x1))
+        index = np.stack([data, np.tile(x1, ndata), np.tile(x2, ndata)], axis=1)
+        values = rng.random((len(index), NFK * NFK)) * flavour_map.ravel()
+    else:
+        flavour_map = rng.random((1, NFK)) < 0.6
+        flavour_map[0, 0] = True
+        index = np.stack(np.indices((ndata, nx)).reshape(2, -1), axis=1)
+        values = rng.random((len(index), NFK)) * flavour_map.ravel()
+
+    with open(path, "w") as f:
+        f.write(_header("GridDesc", "{"))
+        f.write(f"Synthetic FK table {setname}\n")
+        f.write(_header("VersionInfo"))
+        f.write("*CODEVERSION: synthetic\n")
+        f.write(_header("GridInfo"))
+        f.write(f"*SETNAME: {setname}\n*HADRONIC: {int(hadronic)}\n*NDATA: {ndata}\n*NX: {nx}\n")
+        f.write(_header("FlavourMap", "{"))
+        np.savetxt(f, flavour_map.astype(int), fmt="%d")
+        f.write(_header("xGrid"))
+        np.savetxt(f, xgrid, fmt="%.10e")
+        f.write(_header("TheoryInfo"))
+        f.write("*ID: 0\n*PTO: 2\n*Q0: 1.65\n")
+        f.write(_header("FastKernel"))
+        fmt = ["%d"] * index.shape[1] + ["%.6e"] * values.shape[1]
+        np.savetxt(f, np.concatenate([index, values], axis=1), fmt=fmt)
+    return path
+
+
+def synthetic_commondata(setname, ndata, nsys, nspecial=0, seed=0):
+    """Return a :py:class:`validphys.coredata.CommonData` with ``nsys``
+    systematics, half additive and half multiplicative, of which the last
+    ``nspecial`` are correlated with the other synthetic datasets"""
+    rng = np.random.default_rng(seed)
+    x = np.sort(rng.uniform(1e-3, 0.8, ndata))
+    q2 = rng.uniform(1.0, 1e4, ndata)
+    y = rng.uniform(0.0, 1.0, ndata)
+    central = rng.uniform(1.0, 2.0, ndata)
+    table = pd.DataFrame(
+        {
+            "process": SYNTHETIC_PROCESS,
+            "kin1": x,
+            "kin2": q2,
+            "kin3": y,
+            "data": central,
+            "stat": 0.02 * central,
+        },
+        index=pd.RangeIndex(1, ndata + 1, name="entry"),
+    )
+    types = np.where(np.arange(nsys) % 2 == 0, "ADD", "MULT")
+    names = np.where(rng.random(nsys) < 0.5, "CORR", "UNCORR").astype(object)
+    if nspecial:
+        names[nsys - nspecial :] = [f"{SPECIAL_SYS_NAME}{i}" for i in range(nspecial)]
+    mult = rng.uniform(0.1, 2.0, (ndata, nsys))
+    add = mult * central[:, np.newaxis] / 100
+    sys_columns = pd.DataFrame(
+        np.stack([add, mult], axis=2).reshape(ndata, 2 * nsys),
+        index=table.index,
+        columns=["ADD", "MULT"] * nsys,
+    )
+    systype_table = pd.DataFrame(
+        {"type": types, "name": names}, index=pd.RangeIndex(1, nsys + 1, name="sys_index")
+    )
+    return CommonData(
+        setname=setname,
+        ndata=ndata,
+        commondataproc=SYNTHETIC_PROCESS,
+        nkin=3,
+        nsys=nsys,
+        commondata_table=pd.concat([table, sys_columns], axis=1),
+        systype_table=systype_table,
+    )
+
+
+def synthetic_commondata_list(ndatasets, ndata, nsys, nspecial=0, seed=0):
+    """Return ``ndatasets`` synthetic commondata sharing ``nspecial`` systematics"""
+    return [
+        synthetic_commondata(f"SYNTHETIC{i}", ndata, nsys, nspecial, seed=seed + i)
+        for i in range(ndatasets)
+    ]
+
+
+class SyntheticCDataset:
+    """Stand-in for the ``libnnpdf`` ``CommonData`` of a
+    :py:class:`validphys.coredata.CommonData`, as needed by the cut rules"""
+
+    def __init__(self, commondata):
+        self.commondata = commondata
+        self._table = commondata.commondata_table
+        self._kinematics = self._table[["kin1", "kin2", "kin3"]].to_numpy()
+        self._data = self._table["data"].to_numpy()
+
+    def GetNData(self):
+        return self.commondata.ndata
+
+    def GetSetName(self):
+        return self.commondata.setname
+
+    def GetProc(self, idat):
+        return self.commondata.commondataproc
+
+    def GetData(self, idat):
+        return self._data[idat]
+
+    def GetKinematics(self, idat, jkin):
+        return self._kinematics[idat, jkin]
+
+
+class SyntheticCommonDataSpec:
+    """Minimal ``CommonDataSpec`` whose ``load`` returns a :py:class:`SyntheticCDataset`"""
+
+    def __init__(self, commondata):
+        self.name = commondata.setname
+        self._dataset = SyntheticCDataset(commondata)
+
+    def load(self):
+        return self._dataset
+
+
+def synthetic_covmat(ndata, seed=0):
+    """Random, well conditioned, covariance matrix of size ``ndata``"""
+    rng = np.random.default_rng(seed)
+    a = rng.normal(size=(ndata, ndata))
+    return a @ a.T / ndata + np.eye(ndata)
+
+
+def synthetic_grid_values(nmembers, nfl, nx, seed=0):
+    """Return a function with the interface of
+    :py:func:`validphys.pdfbases.evolution.grid_values` (without the PDF)
+    returning values of shape ``(nmembers, nfl, nx, 1)``"""
+    rng = np.random.default_rng(seed)
+    values = rng.random((nmembers, nfl, nx, 1))
+
+    def grid_values(qmat, vmat, xmat):
+        return values[:, : len(vmat), : len(xmat)]
+
+    return grid_values
+
+
+def synthetic_lhapdf_grid(nmembers, nx, nq, nsubgrids=2, seed=0):
+    """Return a :py:class:`validphys.lhio.LHAPDFGrid` with ``nmembers`` members"""
+    rng = np.random.default_rng(seed)
+    flavours = np.array([-5, -4, -3, -2, -1, 1, 2, 3, 4, 5, 21])
+    xgrid = synthetic_xgrid(nx)
+    qedges = np.geomspace(1.65, 1e5, nsubgrids + 1)
+    subgrids = [
+        SubGrid(
+            xgrid,
+            np.geomspace(qlow, qhigh, nq),
+            flavours,
+            rng.random((nmembers, nx, nq, len(flavours))),
+        )
+        for qlow, qhigh in zip(qedges[:-1], qedges[1:])
+    ]
+    return LHAPDFGrid(subgrids)
@@ -4,15 +4,26 @@ calcutils.py
 Low level utilities to calculate χ² and such. These are used to implement the
 higher level functions in results.py
 """
+from collections import OrderedDict
+import hashlib
 import logging
+import threading
 from typing import Callable
 
 import numpy as np
 import scipy.linalg as la
 import pandas as pd
 
+from validphys.covmats_utils import BlockLowRankMatrix
+
 log = logging.getLogger(__name__)
 
+# Maximum total size, in bytes, of the factorised covariance matrices kept by
+# ``cached_cholesky``, the least recently used ones are discarded first
+CHOLESKY_CACHE_BYTES = 2**30
+# Number of elements of the covariance matrix sampled for the cache key
+CHOLESKY_KEY_SAMPLES = 2**14
+
 
 def calc_chi2(sqrtcov, diffs):
     """Elementary function to compute the chi², given a Cholesky decomposed
@@ -22,7 +33,10 @@ def calc_chi2(sqrtcov, diffs):
     ----------
     sqrtcov : matrix
         A lower tringular matrix corresponding to the lower part of
-        the Cholesky decomposition of the covariance matrix.
+        the Cholesky decomposition of the covariance matrix. A structured
+        covariance matrix (:py:class:`validphys.covmats_utils.BlockLowRankMatrix`)
+        can be given instead, in which case the χ² is computed from its
+        structure without decomposing the full matrix.
     diffs : array
         A vector of differences (e.g. between data and theory).
         The first dimenssion must match the shape of `sqrtcov`.
@@ -57,6 +71,8 @@ def calc_chi2(sqrtcov, diffs):
     44.64401691354948
 
     """
+    if isinstance(sqrtcov, BlockLowRankMatrix):
+        return sqrtcov.chi2(diffs)
     #Note la.cho_solve doesn't really improve things here
     #NOTE: Do not enable check_finite. The upper triangular part is not
     #guaranteed to make any sense. If this causes a problem, it is a bug in
@@ -66,6 +82,157 @@ def calc_chi2(sqrtcov, diffs):
     #Sum the squares over the first dimension and leave the others alone
     return np.einsum('i...,i...->...', vec,vec)
 
+_cholesky_cache = OrderedDict()
+_cholesky_cache_nbytes = 0
+_cholesky_lock = threading.Lock()
+
+
+def cached_cholesky(covmat, decompose=None):
+    """Lower triangular Cholesky factor of ``covmat``, computed only once for
+    each distinct matrix within the process.
+
+    The factors are looked up by a fingerprint of the content of the matrix
+    (see ``_cholesky_key``), so that the same covariance matrix reaching the chi²
+    from different namespaces (e.g. the same dataset in several fits, or for
+    several PDFs) is factorised only once. The returned array is read only since
+    it is shared between the callers.
+
+    Parameters
+    ----------
+    covmat : matrix
+        A positive definite matrix.
+    decompose : callable, optional
+        Function computing the lower triangular factor. By default
+        ``scipy.linalg.cholesky(covmat, lower=True)``.
+    """
+    covmat = np.ascontiguousarray(covmat, dtype=float)
+    if decompose is None:
+        decompose = _lower_cholesky
+    key = _cholesky_key(covmat, decompose)
+    with _cholesky_lock:
+        if key in _cholesky_cache:
+            _cholesky_cache.move_to_end(key)
+            return _cholesky_cache[key]
+    sqrtcov = decompose(covmat)
+    sqrtcov.flags.writeable = False
+    _store_cholesky(key, sqrtcov)
+    return sqrtcov
+
+
+def store_cholesky(covmat, sqrtcov, decompose=None):
+    """Register ``sqrtcov`` as the factor of ``covmat`` returned by
+    :py:func:`cached_cholesky` with the same ``decompose``, e.g. when the factor
+    has been computed by another process and loaded from disk."""
+    covmat = np.ascontiguousarray(covmat, dtype=float)
+    if decompose is None:
+        decompose = _lower_cholesky
+    if not isinstance(sqrtcov, np.memmap):
+        sqrtcov = np.array(sqrtcov, dtype=float)
+    sqrtcov.flags.writeable = False
+    _store_cholesky(_cholesky_key(covmat, decompose), sqrtcov)
+
+
+def _cholesky_key(covmat, decompose):
+    """Fingerprint of ``covmat`` made of its shape, its diagonal, the sums of its
+    columns and a strided sample of its elements. Hashing the full matrix would
+    cost about as much as the factorisation for large matrices, on every lookup."""
+    flat = covmat.ravel()
+    stride = max(1, flat.size // CHOLESKY_KEY_SAMPLES)
+    # A stride multiple of the row length plus one would only sample the diagonal
+    if covmat.ndim == 2 and stride % (covmat.shape[0] + 1) == 0:
+        stride += 1
+    h = hashlib.blake2b(digest_size=16)
+    h.update(np.diagonal(covmat).tobytes())
+    h.update(covmat.sum(axis=0).tobytes())
+    h.update(flat[::stride].tobytes())
+    return (decompose, covmat.shape, h.digest())
+
+
+def _store_cholesky(key, sqrtcov):
+    global _cholesky_cache_nbytes
+    # Factors larger than the whole cache are not kept
+    if sqrtcov.nbytes > CHOLESKY_CACHE_BYTES:
+        return
+    with _cholesky_lock:
+        if key in _cholesky_cache:
+            _cholesky_cache_nbytes -= _cholesky_cache.pop(key).nbytes
+        _cholesky_cache[key] = sqrtcov
+        _cholesky_cache_nbytes += sqrtcov.nbytes
+        while _cholesky_cache_nbytes > CHOLESKY_CACHE_BYTES:
+            _, discarded = _cholesky_cache.popitem(last=False)
+            _cholesky_cache_nbytes -= discarded.nbytes
+
+
+def _lower_cholesky(covmat):
+    return la.cholesky(covmat, lower=True)
+
+
+def dense_sqrtcov(sqrtcov):
+    """Return the dense lower triangular factor corresponding to ``sqrtcov``, as
+    returned by :py:func:`validphys.covmats.sqrt_covmat`. Structured covariance
+    matrices (:py:class:`validphys.covmats_utils.BlockLowRankMatrix`) are not
+    decomposed by it, so their dense matrix is decomposed here."""
+    if isinstance(sqrtcov, BlockLowRankMatrix):
+        return cached_cholesky(sqrtcov.to_dense())
+    return sqrtcov
+
+
+def calc_chi2_stacked(sqrtcov, diffs_list):
+    """Compute the χ² of several sets of differences sharing the same covariance
+    matrix, by solving a single triangular system with all of them as right hand
+    side.
+
+    Parameters
+    ----------
+    sqrtcov : matrix
+        Lower triangular Cholesky factor of the covariance matrix.
+    diffs_list : list of arrays
+        Arrays of differences with shape ``(ndata,)`` or ``(ndata, n)``,
+        where ``n`` can be different for each element.
+
+    Returns
+    -------
+    chi2s : list of arrays
+        The χ² for each element of ``diffs_list``, with shape ``diffs.shape[1:]``.
+    """
+    diffs_list = [np.asarray(diffs) for diffs in diffs_list]
+    columns = [diffs.reshape(len(diffs), -1) for diffs in diffs_list]
+    chi2 = calc_chi2(sqrtcov, np.concatenate(columns, axis=1))
+    splits = np.cumsum([c.shape[1] for c in columns])[:-1]
+    # Indexing with () returns a scalar, like calc_chi2, for one dimensional differences
+    return [
+        res.reshape(diffs.shape[1:])[()]
+        for res, diffs in zip(np.split(chi2, splits), diffs_list)
+    ]
+
+
+def results_chi2(data_result, th_result, sqrtcov=None):
+    """Compute the χ² of every member and of the central value of the
+    predictions in ``th_result`` with a single triangular solve.
+
+    Parameters
+    ----------
+    data_result : DataResult
+        The data, with its covariance matrix.
+    th_result : ThPredictionsResult
+        The theory predictions.
+    sqrtcov : matrix, optional
+        Lower triangular factor of the covariance matrix to use instead of the
+        one of ``data_result``.
+
+    Returns
+    -------
+    member_chi2, central_chi2 : array, float
+        The χ² of each member and of the central prediction.
+    """
+    if sqrtcov is None:
+        sqrtcov = data_result.sqrtcovmat
+    cv = data_result.central_value
+    diffs = [th_result.rawdata - cv[:, np.newaxis], th_result.central_value - cv]
+    member_chi2, central_chi2 = calc_chi2_stacked(sqrtcov, diffs)
+    return member_chi2, central_chi2
+
+
 def all_chi2(results):
     """Return the chi² for all elements in the result, regardless of the Stats class
     Note that the interpretation of the result will depend on the PDF error type"""
@@ -86,16 +253,14 @@ def all_chi2_theory(results, totcov):
     that is the sum of the experimental covmat and the theory covmat."""
     data_result, th_result = results
     diffs = th_result.rawdata - data_result.central_value[:,np.newaxis]
-    total_covmat = np.array(totcov)
-    return calc_chi2(sqrtcov=la.cholesky(total_covmat, lower=True), diffs=diffs)
+    return calc_chi2(sqrtcov=cached_cholesky(totcov), diffs=diffs)
 
 def central_chi2_theory(results, totcov):
     """Like central_chi2 but here the chi² is calculated using a covariance matrix
     that is the sum of the experimental covmat and the theory covmat."""
     data_result, th_result = results
     central_diff = th_result.central_value - data_result.central_value
-    total_covmat = np.array(totcov)
-    return calc_chi2(la.cholesky(total_covmat, lower=True), central_diff)
+    return calc_chi2(cached_cholesky(totcov), central_diff)
 
 def calc_phi(sqrtcov, diffs):
     """Low level function which calculates phi given a Cholesky decomposed
@@ -9,8 +9,6 @@ import platform
 import tempfile
 import json
 
-from matplotlib import scale as mscale
-
 import lhapdf
 
 from reportengine.checks import (make_check, CheckError, require_one,
@@ -95,6 +93,9 @@ def check_scale(scalename, allow_none=False):
         val = ns[scalename]
         if val is None and allow_none:
             return
+        # Imported here because matplotlib is slow to import
+        from matplotlib import scale as mscale
+
         valid_scales = mscale.get_scale_names()
         if not val in valid_scales:
             e = CheckError("Invalid plotting scale: %s" % scalename,
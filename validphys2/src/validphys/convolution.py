@@ -46,6 +46,7 @@ import yaml
 
 from validphys.pdfbases import evolution
 from validphys.fkparser import load_fktable, parse_cfactor
+from validphys.predictions_cache import get_predictions_cache
 
 
 FK_FLAVOURS = evolution.to_known_elements(
@@ -104,8 +105,11 @@ def _predictions(dataset, pdf, fkfunc):
     reduction operation defined therein. Dispatch the kind of predictions (for
     all replicas, central, etc) according to the provided ``fkfunc``, which
     should have the same interface as e.g. ``fk_predictions``.
+
+    If the persistent predictions store of
+    :py:mod:`validphys.predictions_cache` is enabled, the predictions are
+    read from it when available.
     """
-    opfunc = OP[dataset.op]
     if dataset.cuts is None:
         raise PredictionsRequireCutsError(
             "FKTables do not always generate predictions for some datapoints "
@@ -113,6 +117,17 @@ def _predictions(dataset, pdf, fkfunc):
             "therefore produce predictions whose shape doesn't match the uncut "
             "commondata and is not supported."
         )
+    kind = _CACHED_KINDS.get(fkfunc)
+    cache = get_predictions_cache() if kind is not None else None
+    if cache is None:
+        return _compute_predictions(dataset, pdf, fkfunc)
+    return cache.cached(
+        dataset, pdf, kind, functools.partial(_compute_predictions, dataset, pdf, fkfunc)
+    )
+
+
+def _compute_predictions(dataset, pdf, fkfunc):
+    opfunc = OP[dataset.op]
     cuts = dataset.cuts.load()
 
     # When making predictions, we check each set to see whether we should use fixed
@@ -276,6 +291,14 @@ def linear_fk_predictions(loaded_fk, pdf):
         return dis_predictions(loaded_fk, pdf)
 
 
+# Kinds of predictions kept in the persistent predictions store
+_CACHED_KINDS = {
+    fk_predictions: "full",
+    central_fk_predictions: "central",
+    linear_fk_predictions: "linear",
+}
+
+
 def _gv_hadron_predictions(loaded_fk, gv1func, gv2func=None):
     """Compute hadronic convolutions between the loaded FKTable
     and the PDF evaluation functions `gv1func` and `gv2func`.
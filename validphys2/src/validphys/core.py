@@ -39,7 +39,6 @@ from NNPDF import (LHAPDFSet as libNNPDF_LHAPDFSet,
 from validphys import lhaindex, filters
 from validphys.tableloader import parse_exp_mat
 from validphys.theorydbutils import fetch_theory
-from validphys.hyperoptplot import HyperoptTrial
 from validphys.utils import experiments_to_dataset_inputs
 from validphys.lhapdfset import LHAPDFSet
 
@@ -749,6 +748,9 @@ class HyperscanSpec(FitSpec):
 
         Each hyperopt trial object will also have a reference to all trials in its own file
         """
+        # hyperoptplot imports matplotlib, which is slow to import
+        from validphys.hyperoptplot import HyperoptTrial
+
         all_trials = []
         for trial_file in self.tries_files.values():
             with open(trial_file, "r") as tf:
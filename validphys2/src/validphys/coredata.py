@@ -98,6 +98,77 @@ class FKTableData:
         return dataclasses.replace(self, ndata=newndata, sigma=newsigma)
 
 
+@dataclasses.dataclass(eq=False)
+class SparseFKTable:
+    """
+    Coordinate (COO) representation of the dense fktable arrays used by n3fit,
+    where only the non-zero entries are kept.
+
+    Parameters
+    ----------
+    shape : tuple
+        Shape of the equivalent dense array, ``(ndata, nbasis, nx, nx)`` for
+        hadronic tables and ``(ndata, nbasis, nx)`` for DIS.
+
+    coords : array, shape (ndim, nnz)
+        Indices of the non-zero entries, one row per dimension of ``shape``.
+        The entries are sorted in row-major order, so the first row (the data
+        index) is non-decreasing.
+
+    values : array, shape (nnz)
+        Value of the fktable at each of the ``coords``.
+    """
+
+    shape: tuple
+    coords: np.array
+    values: np.array
+
+    @classmethod
+    def from_dense(cls, array):
+        """Build the sparse representation of a dense (possibly non-contiguous)
+        array. Only the non-zero entries are copied."""
+        coords = np.array(np.nonzero(array), dtype=np.int32).reshape(array.ndim, -1)
+        values = array[tuple(coords)]
+        return cls(shape=tuple(array.shape), coords=coords, values=values)
+
+    @property
+    def ndata(self):
+        return self.shape[0]
+
+    @property
+    def nnz(self):
+        return len(self.values)
+
+    @property
+    def density(self):
+        """Fraction of non-zero entries of the equivalent dense array"""
+        size = np.prod(self.shape)
+        if size == 0:
+            return 0.0
+        return self.nnz / size
+
+    def to_dense(self):
+        """Return the equivalent dense numpy array"""
+        dense = np.zeros(self.shape, dtype=self.values.dtype)
+        dense[tuple(self.coords)] = self.values
+        return dense
+
+    def with_data_mask(self, mask):
+        """Return a copy of the table keeping only the data points for which
+        the boolean ``mask`` is True. Equivalent to ``dense[mask]``.
+        """
+        mask = np.asarray(mask, dtype=bool)
+        # Map the old data index to the new one
+        new_index = np.cumsum(mask) - 1
+        keep = mask[self.coords[0]]
+        coords = self.coords[:, keep].copy()
+        coords[0] = new_index[coords[0]]
+        shape = (int(np.count_nonzero(mask)),) + tuple(self.shape[1:])
+        return dataclasses.replace(
+            self, shape=shape, coords=coords, values=self.values[keep]
+        )
+
+
 @dataclasses.dataclass(eq=False)
 class CFactorData:
     """
@@ -10,7 +10,13 @@ import scipy.linalg as la
 from reportengine import collect
 from reportengine.table import table
 
-from validphys.calcutils import regularize_covmat, get_df_block
+from validphys.calcutils import (
+    cached_cholesky,
+    dense_sqrtcov,
+    get_df_block,
+    regularize_covmat,
+    store_cholesky,
+)
 from validphys.checks import (
     check_dataset_cuts_match_theorycovmat,
     check_norm_threshold,
@@ -21,7 +27,7 @@ from validphys.checks import (
 )
 from validphys.convolution import central_predictions
 from validphys.core import PDF, DataGroupSpec, DataSetSpec
-from validphys.covmats_utils import construct_covmat, systematics_matrix
+from validphys.covmats_utils import BlockLowRankMatrix, construct_covmat, systematics_matrix
 from validphys.results import ThPredictionsResult
 
 log = logging.getLogger(__name__)
@@ -138,7 +144,8 @@ def dataset_inputs_covmat_from_systematics(
     data_input,
     use_weights_in_covmat=True,
     norm_threshold=None,
-    _list_of_central_values=None
+    _list_of_central_values=None,
+    structured_covmat: bool = False,
 ):
     """Given a list containing :py:class:`validphys.coredata.CommonData` s,
     construct the full covariance matrix.
@@ -168,6 +175,12 @@ def dataset_inputs_covmat_from_systematics(
         combined with the multiplicative errors to calculate their absolute
         contribution. By default this is None and the experimental central
         values are used.
+    structured_covmat: bool
+        If True, the covariance matrix is returned as a
+        :py:class:`validphys.covmats_utils.BlockLowRankMatrix`, with the
+        covariance matrix of each dataset as the diagonal blocks and the special
+        systematics as the low rank term, instead of a dense matrix. This is
+        ignored if ``norm_threshold`` is set.
 
     Returns
     -------
@@ -218,6 +231,16 @@ def dataset_inputs_covmat_from_systematics(
     # non-overlapping systematics are set to NaN by concat, fill with 0 instead.
     special_sys.fillna(0, inplace=True)
 
+    if structured_covmat and norm_threshold is not None:
+        log.warning("The covariance matrix is regularized, so it is built as a dense matrix")
+        structured_covmat = False
+
+    if structured_covmat:
+        covmat = BlockLowRankMatrix(block_diags, special_sys.to_numpy())
+        if use_weights_in_covmat:
+            covmat = covmat.scaled(1 / np.sqrt(np.concatenate(weights)))
+        return covmat
+
     diag = la.block_diag(*block_diags)
     covmat = diag + special_sys.to_numpy() @ special_sys.to_numpy().T
     if use_weights_in_covmat:
@@ -310,7 +333,8 @@ def dataset_inputs_t0_covmat_from_systematics(
     data_input,
     use_weights_in_covmat=True,
     norm_threshold=None,
-    dataset_inputs_t0_predictions
+    dataset_inputs_t0_predictions,
+    structured_covmat: bool = False,
 ):
     """Like :py:func:`t0_covmat_from_systematics` except for all data
 
@@ -328,6 +352,9 @@ def dataset_inputs_t0_covmat_from_systematics(
         Whether to weight the covmat, True by default.
     dataset_inputs_t0_predictions: list[np.array]
         The t0 predictions for all datasets.
+    structured_covmat: bool
+        Whether to return a structured covariance matrix, see
+        :py:func:`dataset_inputs_covmat_from_systematics`.
 
     Returns
     -------
@@ -339,7 +366,8 @@ def dataset_inputs_t0_covmat_from_systematics(
         data_input,
         use_weights_in_covmat=use_weights_in_covmat,
         norm_threshold=norm_threshold,
-        _list_of_central_values=dataset_inputs_t0_predictions
+        _list_of_central_values=dataset_inputs_t0_predictions,
+        structured_covmat=structured_covmat,
     )
 
 
@@ -400,6 +428,11 @@ def sqrt_covmat(covariance_matrix):
     True
 
     """
+    if isinstance(covariance_matrix, BlockLowRankMatrix):
+        # Structured matrices are not decomposed, they compute the χ² directly
+        # (see validphys.calcutils.calc_chi2)
+        return covariance_matrix
+
     dimensions = covariance_matrix.shape
 
     if covariance_matrix.size == 0:
@@ -409,6 +442,21 @@ def sqrt_covmat(covariance_matrix):
                          f"instead it has dimensions {dimensions[0]} x "
                          f"{dimensions[1]}")
 
+    # The same matrix is often requested from several namespaces, e.g. for
+    # several PDFs or fits, so it is only decomposed once
+    return cached_cholesky(covariance_matrix, _sqrt_from_correlation)
+
+
+def store_sqrt_covmat(covariance_matrix, sqrt_matrix):
+    """Register ``sqrt_matrix``, e.g. loaded from disk, as the result of
+    :py:func:`sqrt_covmat` for ``covariance_matrix``, so that it is not
+    decomposed again in this process."""
+    store_cholesky(covariance_matrix, sqrt_matrix, _sqrt_from_correlation)
+
+
+def _sqrt_from_correlation(covariance_matrix):
+    """Lower triangular factor of ``covariance_matrix`` computed from the
+    decomposition of the correlation matrix, see :py:func:`sqrt_covmat`"""
     sqrt_diags = np.sqrt(np.diag(covariance_matrix))
     correlation_matrix = covariance_matrix / sqrt_diags[:, np.newaxis] / sqrt_diags
     decomp = la.cholesky(correlation_matrix)
@@ -454,8 +502,7 @@ def groups_sqrtcovmat(
     for group, group_sqrt_covmat in zip(
             groups_data, groups_sqrt_covmat):
         name = group.name
-        group_sqrt_covmat[np.triu_indices_from(group_sqrt_covmat, k=1)] = 0
-        df.loc[[name],[name]] = group_sqrt_covmat
+        df.loc[[name],[name]] = np.tril(dense_sqrtcov(group_sqrt_covmat))
     return df
 
 
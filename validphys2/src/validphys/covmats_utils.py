@@ -8,6 +8,7 @@ actions/providers.
 """
 import numpy as np
 import pandas as pd
+import scipy.linalg as la
 
 def systematics_matrix(stat_errors: np.array, sys_errors: pd.DataFrame):
     """Basic function to create a systematics matrix , :math:`A`, such that:
@@ -85,3 +86,214 @@ def construct_covmat(stat_errors: np.array, sys_errors: pd.DataFrame):
 
     corr_sys_mat = sys_errors.loc[:, ~is_uncorr].to_numpy()
     return np.diag(diagonal) + corr_sys_mat @ corr_sys_mat.T
+
+
+class BlockLowRankMatrix:
+    """
+    A symmetric matrix with the structure
+
+    .. math::
+
+        M = \\mathrm{blockdiag}(B_1, \\dots, B_n) + s A A^T
+
+    where the blocks :math:`B_i` are dense (e.g. the covariance matrix of
+    each dataset), :math:`A` is a ``(ndata, nsys)`` matrix (e.g. the special
+    systematics which are correlated across datasets) and :math:`s` is either
+    +1 or -1. A covariance matrix is represented with :math:`s=+1` and its
+    inverse, which by the Woodbury identity has the same structure, with
+    :math:`s=-1`.
+
+    The matrix is never stored in dense form. Converting it to a numpy array
+    (e.g. ``np.asarray(matrix)``) builds the dense matrix, so it can be
+    passed to functions which are not aware of the structure.
+
+    Parameters
+    ----------
+    blocks: list[np.array]
+        The square diagonal blocks, in order.
+    low_rank: np.array
+        The ``(ndata, nsys)`` low rank factor :math:`A`.
+    sign: int
+        The sign :math:`s` of the low rank term.
+    """
+
+    def __init__(self, blocks, low_rank, sign=1):
+        if sign not in (1, -1):
+            raise ValueError(f"The sign of the low rank term must be 1 or -1, not {sign}")
+        self.blocks = [np.atleast_2d(np.asarray(block, dtype=float)) for block in blocks]
+        self.offsets = np.cumsum([0] + [len(block) for block in self.blocks])
+        self.low_rank = np.asarray(low_rank, dtype=float).reshape(self.ndata, -1)
+        self.sign = sign
+        self._factors = None
+
+    @property
+    def ndata(self):
+        return int(self.offsets[-1])
+
+    @property
+    def shape(self):
+        return (self.ndata, self.ndata)
+
+    @property
+    def size(self):
+        return self.ndata ** 2
+
+    @property
+    def ndim(self):
+        return 2
+
+    @property
+    def dtype(self):
+        return np.dtype(float)
+
+    @property
+    def block_slices(self):
+        return [slice(start, end) for start, end in zip(self.offsets[:-1], self.offsets[1:])]
+
+    def to_dense(self):
+        """Return the dense ``(ndata, ndata)`` matrix"""
+        dense = np.zeros(self.shape)
+        for sl, block in zip(self.block_slices, self.blocks):
+            dense[sl, sl] = block
+        dense += self.sign * self.low_rank @ self.low_rank.T
+        return dense
+
+    def __array__(self, dtype=None, copy=None):
+        dense = self.to_dense()
+        return dense if dtype is None else dense.astype(dtype)
+
+    def __len__(self):
+        return self.ndata
+
+    def diagonal(self):
+        block_diagonal = np.concatenate([np.diag(block) for block in self.blocks] or [[]])
+        return block_diagonal + self.sign * (self.low_rank ** 2).sum(axis=1)
+
+    def scaled(self, factors):
+        """Return the matrix :math:`F M F` where :math:`F` is the diagonal
+        matrix with ``factors``, e.g. to apply dataset weights"""
+        factors = np.asarray(factors, dtype=float)
+        blocks = [
+            block * factors[sl, np.newaxis] * factors[np.newaxis, sl]
+            for sl, block in zip(self.block_slices, self.blocks)
+        ]
+        return type(self)(blocks, self.low_rank * factors[:, np.newaxis], self.sign)
+
+    def submatrix(self, mask):
+        """Return the matrix restricted to the rows and columns selected by
+        the boolean ``mask``, which has the same structure"""
+        mask = np.asarray(mask, dtype=bool)
+        blocks = []
+        for sl, block in zip(self.block_slices, self.blocks):
+            block_mask = mask[sl]
+            if block_mask.any():
+                blocks.append(block[np.ix_(block_mask, block_mask)])
+        return type(self)(blocks, self.low_rank[mask], self.sign)
+
+    def matvec(self, x):
+        """Compute :math:`M x`, where ``x`` has ``ndata`` elements in the first
+        dimension and any shape in the rest"""
+        x = np.asarray(x, dtype=float)
+        res = self.sign * (self.low_rank @ np.tensordot(self.low_rank.T, x, axes=1))
+        for sl, block in zip(self.block_slices, self.blocks):
+            res[sl] += np.tensordot(block, x[sl], axes=1)
+        return res
+
+    def quadratic_form(self, x):
+        """Compute :math:`x^T M x` for each vector ``x[:, ...]``"""
+        x = np.asarray(x, dtype=float)
+        low = np.tensordot(self.low_rank.T, x, axes=1)
+        res = self.sign * np.einsum("k...,k...->...", low, low)
+        for sl, block in zip(self.block_slices, self.blocks):
+            res = res + np.einsum("i...,i...->...", x[sl], np.tensordot(block, x[sl], axes=1))
+        return res
+
+    # The methods below only make sense for a covariance matrix (sign=+1)
+    def _covariance_factors(self):
+        """The Cholesky factors :math:`L_i` of the blocks, :math:`V = L^{-1}A`
+        and the Cholesky factor of the capacitance matrix :math:`1 + V^TV`"""
+        if self.sign != 1:
+            raise ValueError("This operation requires a covariance matrix (sign=+1)")
+        if self._factors is None:
+            block_factors = [la.cholesky(block, lower=True) for block in self.blocks]
+            v = self._solve_lower(self.low_rank, block_factors=block_factors)
+            nsys = v.shape[1]
+            capacitance = np.eye(nsys) + v.T @ v
+            capacitance_factor = la.cholesky(capacitance, lower=True) if nsys else capacitance
+            self._factors = block_factors, v, capacitance_factor
+        return self._factors
+
+    def _solve_lower(self, x, trans=0, block_factors=None):
+        """Solve the block lower triangular system :math:`L y = x`
+        (or :math:`L^T y = x` if ``trans``)"""
+        if block_factors is None:
+            block_factors = self._covariance_factors()[0]
+        x = np.asarray(x, dtype=float)
+        res = np.empty_like(x)
+        for sl, factor in zip(self.block_slices, block_factors):
+            res[sl] = la.solve_triangular(factor, x[sl], lower=True, trans=trans, check_finite=False)
+        return res
+
+    def chi2(self, diffs):
+        """Compute :math:`d^T M^{-1} d` for each vector of differences
+        ``diffs[:, ...]``, like :py:func:`validphys.calcutils.calc_chi2`"""
+        _, v, capacitance_factor = self._covariance_factors()
+        u = self._solve_lower(diffs)
+        res = np.einsum("i...,i...->...", u, u)
+        if v.shape[1]:
+            z = la.solve_triangular(
+                capacitance_factor, np.tensordot(v.T, u, axes=1), lower=True, check_finite=False
+            )
+            res = res - np.einsum("k...,k...->...", z, z)
+        return res
+
+    def solve(self, b):
+        """Compute :math:`M^{-1} b` using the Woodbury identity"""
+        _, v, capacitance_factor = self._covariance_factors()
+        u = self._solve_lower(b)
+        if v.shape[1]:
+            t = la.cho_solve((capacitance_factor, True), np.tensordot(v.T, u, axes=1))
+            u = u - np.tensordot(v, t, axes=1)
+        return self._solve_lower(u, trans=1)
+
+    def logdet(self):
+        """The logarithm of the determinant of the matrix"""
+        block_factors, _, capacitance_factor = self._covariance_factors()
+        res = sum(2 * np.log(np.diag(factor)).sum() for factor in block_factors)
+        return res + 2 * np.log(np.diag(capacitance_factor)).sum()
+
+    def sample(self, rng=None, size=None):
+        """Draw samples from a normal distribution with zero mean and this
+        covariance matrix, as :math:`L z_1 + A z_2` with :math:`z_1, z_2`
+        standard normal. The result has shape ``(ndata,)`` for ``size=None``
+        and ``(ndata, size)`` otherwise."""
+        if rng is None:
+            rng = np.random.default_rng()
+        block_factors = self._covariance_factors()[0]
+        shape = () if size is None else (size,)
+        z = rng.normal(size=(self.ndata, *shape))
+        res = self.low_rank @ rng.normal(size=(self.low_rank.shape[1], *shape))
+        for sl, factor in zip(self.block_slices, block_factors):
+            res[sl] += factor @ z[sl]
+        return res
+
+    def inverse(self):
+        """Return the inverse matrix, with the same structure, computed with
+        the Woodbury identity:
+
+        .. math::
+
+            M^{-1} = \\mathrm{blockdiag}(B_i^{-1}) - (B^{-1} A K^{-T/2}) (B^{-1} A K^{-T/2})^T
+
+        where :math:`K = 1 + A^T B^{-1} A`.
+        """
+        block_factors, v, capacitance_factor = self._covariance_factors()
+        inverse_blocks = [
+            la.cho_solve((factor, True), np.eye(len(factor))) for factor in block_factors
+        ]
+        correction = self._solve_lower(v, trans=1)
+        if v.shape[1]:
+            correction = la.solve_triangular(
+                capacitance_factor, correction.T, lower=True, check_finite=False
+            ).T
+        return type(self)(inverse_blocks, correction, sign=-1)
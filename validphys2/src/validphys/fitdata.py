@@ -25,6 +25,8 @@ from validphys.plotoptions import get_info
 LITERAL_FILES = ['chi2exps.log']
 REPLICA_FILES = ['.dat', '.json']
 BSM_FAC_FILE = 'bsm_fac.csv'
+# Profile of the phases of the fit written by n3fit in each replica folder
+PROFILE_FILE = 'profile.json'
 FIT_SUMRULES = [
     "momentum",
     "uvalence",
@@ -497,3 +499,58 @@ def fits_version_table(fits_fit_code_version):
     # Fill NaNs with "unavailable"
     vtable.fillna("unavailable", inplace=True)
     return vtable
+
+
+@make_argcheck
+def _check_has_phase_profiles(fit):
+    """Check that n3fit wrote the profile of the phases of the fit"""
+    check(
+        any(fit.path.glob(f"nnfit/replica_*/{PROFILE_FILE}")),
+        f"Fit '{fit}' does not contain {PROFILE_FILE} files in its replica folders.",
+    )
+
+
+@_check_has_phase_profiles
+def fit_phase_profiles(fit):
+    """Load the profile of the phases of the fit (``profile.json``) written by
+    n3fit in the folder of each replica. Returns a DataFrame with one row per
+    replica and phase, with the number of times the phase happened, the total
+    wall and cpu times spent on it and the peak resident memory of the process
+    at the end of the phase"""
+    records = []
+    for profile_path in sorted(fit.path.glob(f"nnfit/replica_*/{PROFILE_FILE}")):
+        replica = int(profile_path.parent.name.split("_")[-1])
+        phases = json.loads(profile_path.read_text(encoding="utf-8"))["phases"]
+        for phase, stats in phases.items():
+            records.append({"replica": replica, "phase": phase, **stats})
+    return pd.DataFrame(records).set_index(["replica", "phase"]).sort_index()
+
+
+@table
+def fit_phase_profile_table(fit, fit_phase_profiles):
+    """Summary of the profile of the phases of the fit across replicas: mean and
+    standard deviation of the wall time per replica, mean cpu time, mean number of
+    calls and maximum peak resident memory of each phase"""
+    grouped = fit_phase_profiles.groupby(level="phase")
+    res = pd.DataFrame(
+        {
+            "replicas": grouped.size(),
+            "calls": grouped["count"].mean(),
+            "walltime (s)": grouped["walltime"].mean(),
+            "walltime std (s)": grouped["walltime"].std(),
+            "cputime (s)": grouped["cputime"].mean(),
+            "peak RSS (MB)": grouped["peak_rss_mb"].max(),
+        }
+    )
+    res.columns = pd.MultiIndex.from_product([[fit.name], res.columns])
+    return res.sort_values((fit.name, "walltime (s)"), ascending=False)
+
+
+fits_fit_phase_profile_table = collect("fit_phase_profile_table", ("fits",))
+
+
+@table
+def fits_phase_profile_table(fits_fit_phase_profile_table):
+    """Compare the profile of the phases (see ``fit_phase_profile_table``)
+    of several fits side by side"""
+    return pd.concat(fits_fit_phase_profile_table, axis=1)
@@ -0,0 +1,117 @@
+"""
+importprofile.py
+
+Measure the time spent importing every module, for the ``--import-profile``
+option of the validphys applications. The profiler has to be installed before
+the modules of interest are imported, which is why the applications install it
+(from :py:mod:`validphys.app`) as soon as the flag is found in the command line,
+before parsing the rest of the arguments.
+
+The report lists, for the slowest modules, the time spent executing the module
+itself (``self``) and including the modules it imported (``cumulative``), like
+``python -X importtime``.
+"""
+import atexit
+import importlib.abc
+import sys
+import time
+
+FLAG = "--import-profile"
+# Number of modules shown in the report
+DEFAULT_REPORT_SIZE = 30
+
+
+class _TimedLoader:
+    """Wrapper around a loader which times the execution of the module"""
+
+    def __init__(self, loader, profiler):
+        self._loader = loader
+        self._profiler = profiler
+
+    def __getattr__(self, attr):
+        return getattr(self._loader, attr)
+
+    def create_module(self, spec):
+        return self._loader.create_module(spec)
+
+    def exec_module(self, module):
+        with self._profiler.timing(module.__name__):
+            self._loader.exec_module(module)
+
+
+class _Timing:
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        self.profiler._stack.append(0.0)
+
+    def __exit__(self, *exc):
+        cumulative = time.perf_counter() - self.start
+        children = self.profiler._stack.pop()
+        if self.profiler._stack:
+            self.profiler._stack[-1] += cumulative
+        self.profiler.times[self.name] = (cumulative - children, cumulative)
+
+
+class ImportProfiler(importlib.abc.MetaPathFinder):
+    """Meta path finder which wraps the loader of every module imported
+    while it is installed, recording its ``(self, cumulative)`` import time"""
+
+    def __init__(self):
+        self.times = {}
+        self._stack = []
+
+    def timing(self, name):
+        return _Timing(self, name)
+
+    def find_spec(self, fullname, path, target=None):
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, "find_spec"):
+                continue
+            spec = finder.find_spec(fullname, path, target)
+            if spec is not None:
+                if spec.loader is not None and hasattr(spec.loader, "exec_module"):
+                    spec.loader = _TimedLoader(spec.loader, self)
+                return spec
+        return None
+
+    def install(self):
+        sys.meta_path.insert(0, self)
+
+    def uninstall(self):
+        if self in sys.meta_path:
+            sys.meta_path.remove(self)
+
+    def report(self, n=DEFAULT_REPORT_SIZE):
+        """Return a table with the ``n`` modules with the largest self import time"""
+        total = sum(t for t, _ in self.times.values())
+        lines = [
+            f"Imported {len(self.times)} modules in {total:.2f} s",
+            f"{'self (ms)':>10} {'cumulative (ms)':>16}  module",
+        ]
+        slowest = sorted(self.times.items(), key=lambda item: item[1][0], reverse=True)
+        for name, (self_time, cumulative) in slowest[:n]:
+            lines.append(f"{self_time * 1e3:>10.1f} {cumulative * 1e3:>16.1f}  {name}")
+        return "\n".join(lines)
+
+
+def install_from_argv(argv=None):
+    """Install an :py:class:`ImportProfiler` if ``--import-profile`` is in the
+    command line, printing its report to stderr when the program exits.
+    Returns the profiler or None."""
+    if argv is None:
+        argv = sys.argv
+    if FLAG not in argv:
+        return None
+    profiler = ImportProfiler()
+    profiler.install()
+
+    def print_report():
+        profiler.uninstall()
+        print(profiler.report(), file=sys.stderr)
+
+    atexit.register(print_report)
+    return profiler
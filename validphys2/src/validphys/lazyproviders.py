@@ -0,0 +1,211 @@
+"""
+lazyproviders.py
+
+Proxies for the provider modules of the validphys applications, so that a
+provider module is only imported when an action of the resolved graph needs
+one of its functions.
+
+reportengine resolves each name of the graph by looking, in order, for the
+first provider module with that attribute. A :py:class:`LazyProvider` knows the
+top level names of its module by parsing the source, without executing it, and
+only imports the module when one of those names is requested. Modules whose
+namespace cannot be known statically (e.g. because they use ``import *``) are
+imported straight away.
+"""
+import ast
+import importlib
+import importlib.machinery
+import importlib.util
+import logging
+import pkgutil
+import types
+
+log = logging.getLogger(__name__)
+
+
+class _NamesVisitor(ast.NodeVisitor):
+    """Collect the names bound at the top level of a module"""
+
+    def __init__(self):
+        self.names = set()
+        self.star_imports = []
+        self.dynamic = False
+
+    def _add_target(self, target):
+        for node in ast.walk(target):
+            if isinstance(node, ast.Name):
+                self.names.add(node.id)
+
+    def visit_FunctionDef(self, node):
+        self.names.add(node.name)
+        self._check_globals(node)
+
+    visit_AsyncFunctionDef = visit_FunctionDef
+
+    def visit_ClassDef(self, node):
+        self.names.add(node.name)
+        self._check_globals(node)
+
+    def visit_Import(self, node):
+        for alias in node.names:
+            self.names.add(alias.asname or alias.name.split(".")[0])
+
+    def visit_ImportFrom(self, node):
+        for alias in node.names:
+            if alias.name == "*":
+                if node.level:
+                    self.dynamic = True
+                else:
+                    self.star_imports.append(node.module)
+            else:
+                self.names.add(alias.asname or alias.name)
+
+    def visit_Assign(self, node):
+        for target in node.targets:
+            self._add_target(target)
+        self._check_dynamic(node)
+
+    def visit_AnnAssign(self, node):
+        self._add_target(node.target)
+        self._check_dynamic(node)
+
+    def visit_AugAssign(self, node):
+        self._add_target(node.target)
+
+    def visit_For(self, node):
+        self._add_target(node.target)
+        self.generic_visit(node)
+
+    def visit_With(self, node):
+        for item in node.items:
+            if item.optional_vars is not None:
+                self._add_target(item.optional_vars)
+        self.generic_visit(node)
+
+    def visit_ExceptHandler(self, node):
+        if node.name:
+            self.names.add(node.name)
+        self.generic_visit(node)
+
+    def visit_Expr(self, node):
+        self._check_dynamic(node)
+
+    def _check_dynamic(self, node):
+        """Modules modifying their namespace at runtime can't be proxied"""
+        for child in ast.walk(node):
+            if isinstance(child, ast.Call) and isinstance(child.func, ast.Name):
+                if child.func.id in ("globals", "setattr", "exec"):
+                    self.dynamic = True
+
+    def _check_globals(self, node):
+        """Within functions, only writing to ``globals()`` changes the namespace"""
+        for child in ast.walk(node):
+            if isinstance(child, ast.Subscript) and isinstance(child.ctx, ast.Store):
+                target = child.value
+            elif isinstance(child, ast.Attribute) and child.attr in ("update", "setdefault"):
+                target = child.value
+            else:
+                continue
+            if (
+                isinstance(target, ast.Call)
+                and isinstance(target.func, ast.Name)
+                and target.func.id == "globals"
+            ):
+                self.dynamic = True
+
+
+def _find_spec(modname):
+    """Like :py:func:`importlib.util.find_spec`, but without importing the
+    parent packages, which could themselves be expensive to import"""
+    spec = None
+    path = None
+    parts = modname.split(".")
+    for i in range(len(parts)):
+        name = ".".join(parts[: i + 1])
+        if i == 0:
+            spec = importlib.util.find_spec(name)
+        else:
+            spec = importlib.machinery.PathFinder.find_spec(name, path)
+        if spec is None:
+            return None
+        path = spec.submodule_search_locations
+        if path is None and i < len(parts) - 1:
+            return None
+    return spec
+
+
+def module_names(modname):
+    """Return the set of names bound at the top level of the module ``modname``,
+    without importing it, or None if they can't be determined from the source."""
+    try:
+        spec = _find_spec(modname)
+    except (ImportError, ValueError):
+        return None
+    if spec is None or spec.loader is None or not hasattr(spec.loader, "get_source"):
+        return None
+    try:
+        source = spec.loader.get_source(modname)
+    except (ImportError, OSError):
+        return None
+    if source is None:
+        return None
+    visitor = _NamesVisitor()
+    visitor.visit(ast.parse(source, filename=spec.origin or modname))
+    # A module level __getattr__ can provide any name
+    if visitor.dynamic or "__getattr__" in visitor.names:
+        return None
+    names = visitor.names
+    # Importing a submodule binds it in the package namespace
+    if spec.submodule_search_locations:
+        names |= {info.name for info in pkgutil.iter_modules(spec.submodule_search_locations)}
+    for starmod in visitor.star_imports:
+        starnames = module_names(starmod)
+        # Resolving __all__ would require executing the module
+        if starnames is None or "__all__" in starnames:
+            return None
+        names |= {name for name in starnames if not name.startswith("_")}
+    return names
+
+
+class LazyProvider(types.ModuleType):
+    """Stand-in for the provider module ``modname`` exposing only the names in
+    ``names``, which imports the module the first time one of them is accessed.
+    Use :py:func:`lazy_provider` to construct it."""
+
+    def __init__(self, modname, names):
+        super().__init__(modname)
+        self.__dict__["_lazy_names"] = frozenset(names)
+        self.__dict__["_lazy_module"] = None
+
+    def _load(self):
+        mod = self.__dict__["_lazy_module"]
+        if mod is None:
+            log.debug("Importing provider module %s", self.__name__)
+            mod = importlib.import_module(self.__name__)
+            self.__dict__["_lazy_module"] = mod
+        return mod
+
+    def __getattr__(self, attr):
+        if self.__dict__["_lazy_module"] is None and attr not in self._lazy_names:
+            raise AttributeError(f"module {self.__name__!r} has no attribute {attr!r}")
+        return getattr(self._load(), attr)
+
+    def __dir__(self):
+        mod = self.__dict__["_lazy_module"]
+        if mod is not None:
+            return dir(mod)
+        return sorted(self._lazy_names)
+
+    def __repr__(self):
+        state = "loaded" if self.__dict__["_lazy_module"] is not None else "not loaded"
+        return f"<lazy provider {self.__name__!r} ({state})>"
+
+
+def lazy_provider(modname):
+    """Return a :py:class:`LazyProvider` for ``modname``, or the imported
+    module itself if its names can't be determined statically."""
+    names = module_names(modname)
+    if names is None:
+        log.debug("Cannot load provider module %s lazily", modname)
+        return importlib.import_module(modname)
+    return LazyProvider(modname, names)
@@ -92,11 +92,14 @@ class LHAPDFSet:
             self._flavors = self.members[0].flavors()
         return self._flavors
 
-    def grid_values(self, flavors: np.ndarray, xgrid: np.ndarray, qgrid: np.ndarray):
+    def grid_values(
+        self, flavors: np.ndarray, xgrid: np.ndarray, qgrid: np.ndarray, members: slice = None
+    ):
         """Returns the PDF values for every member for the required
         flavours, points in x and pointx in q
         The return shape is
             (members, flavors, xgrid, qgrid)
+        If ``members`` is given, only that slice of the members is evaluated.
         Return
         ------
             ndarray of shape (members, flavors, xgrid, qgrid)
@@ -114,6 +117,7 @@ class LHAPDFSet:
         # Create an array of x and q of equal length for LHAPDF
         xarr, qarr = (g.ravel() for g in np.meshgrid(xgrid, qgrid))
         # Ask LHAPDF for the values and swap the flavours and xgrid-qgrid axes
-        raw = np.array([member.xfxQ(flavors, xarr, qarr) for member in self.members]).swapaxes(1, 2)
+        selected = self.members if members is None else self.members[members]
+        raw = np.array([member.xfxQ(flavors, xarr, qarr) for member in selected]).swapaxes(1, 2)
         # Unroll the xgrid-qgrid axes
-        return raw.reshape(self.n_members, len(flavors), len(xgrid), len(qgrid))
+        return raw.reshape(len(selected), len(flavors), len(xgrid), len(qgrid))
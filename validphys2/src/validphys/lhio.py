@@ -2,30 +2,125 @@
 A module that reads and writes LHAPDF grids.
 """
 
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import dataclasses
+import io
+import itertools
 import logging
 import os
-import os.path as osp
 import pathlib
 import shutil
+import time
 
 import lhapdf
 import numpy as np
-import pandas as pd
 
 from validphys.utils import yaml_safe
 from validphys import lhaindex
-from validphys.core import PDF
 
 log = logging.getLogger(__name__)
 
+REPLICA_HEADER = b"PdfType: replica\nFormat: lhagrid1\n"
+CENTRAL_HEADER = b"PdfType: central\nFormat: lhagrid1\n"
+
+# Number of members kept in memory at once when streaming over a set
+MEMBER_CHUNK_SIZE = 100
+
 def split_sep(f):
     for line in f:
         if line.startswith(b'---'):
             break
         yield line
 
-def read_xqf_from_file(f):
 
+@dataclasses.dataclass(eq=False)
+class SubGrid:
+    """
+    One subgrid of a LHAPDF grid, for any number of members
+
+    Parameters
+    ----------
+    xgrid : array, shape (nx)
+        The knots in x
+    qgrid : array, shape (nq)
+        The knots in Q (in GeV)
+    flavours : array, shape (nfl)
+        The PDG ids of the flavours
+    values : array, shape (nmembers, nx, nq, nfl)
+        The value of xf(x, Q) for each member at each knot
+    """
+
+    xgrid: np.array
+    qgrid: np.array
+    flavours: np.array
+    values: np.array
+
+    def same_knots(self, other):
+        """Whether the two subgrids are defined on the same knots and flavours"""
+        return (
+            np.array_equal(self.xgrid, other.xgrid)
+            and np.array_equal(self.qgrid, other.qgrid)
+            and np.array_equal(self.flavours, other.flavours)
+        )
+
+    def with_values(self, values):
+        return dataclasses.replace(self, values=values)
+
+
+@dataclasses.dataclass(eq=False)
+class LHAPDFGrid:
+    """
+    The grids of several members of a LHAPDF set, stored as one contiguous
+    array per subgrid.
+
+    Parameters
+    ----------
+    subgrids : list of SubGrid
+        The subgrids, all of them with the same number of members
+    """
+
+    subgrids: list
+
+    @property
+    def nmembers(self):
+        return len(self.subgrids[0].values)
+
+    def same_knots(self, other):
+        return len(self.subgrids) == len(other.subgrids) and all(
+            i.same_knots(j) for i, j in zip(self.subgrids, other.subgrids)
+        )
+
+    def map_values(self, function):
+        """Return a new grid with ``function`` applied to the values of each subgrid"""
+        return LHAPDFGrid([g.with_values(function(g.values)) for g in self.subgrids])
+
+    def member(self, index):
+        """Return a grid containing only the member at position ``index``"""
+        return self.map_values(lambda v: v[index : index + 1])
+
+    def central_value(self):
+        """Return a single member grid with the average over all members"""
+        return self.map_values(lambda v: v.mean(axis=0, keepdims=True))
+
+    @classmethod
+    def stack(cls, grids):
+        """Concatenate the members of several grids defined on the same knots.
+        A ``ValueError`` is raised if the knots are not the same."""
+        first = grids[0]
+        for grid in grids[1:]:
+            if not first.same_knots(grid):
+                raise ValueError("Incompatible grid specifications")
+        return cls(
+            [
+                g.with_values(np.concatenate([grid.subgrids[i].values for grid in grids]))
+                for i, g in enumerate(first.subgrids)
+            ]
+        )
+
+
+def read_xqf_from_file(f):
+    """Read the next subgrid from the open file ``f``. Returns None when the
+    end of the file is reached."""
     lines = split_sep(f)
     try:
         (xtext, qtext, ftext) = [next(lines) for _ in range(3)]
@@ -35,23 +130,54 @@ def read_xqf_from_file(f):
     qvals = np.fromstring(qtext, sep = " ")
     fvals = np.fromstring(ftext, sep = " ", dtype=int)
     vals = np.fromstring(b''.join(lines), sep= " ")
-    return pd.Series(vals, index = pd.MultiIndex.from_product((xvals, qvals, fvals)))
+    return SubGrid(xvals, qvals, fvals, vals.reshape(1, len(xvals), len(qvals), len(fvals)))
 
 
-def read_xqf_from_lhapdf(pdf, replica, kin_grids):
-    indexes = tuple(kin_grids.index)
+def _evaluate_member(pdf_name, replica, kin_grids):
+    """Evaluate one member of the set at all the knots of ``kin_grids``, with one
+    vectorised LHAPDF call per subgrid"""
     #Use LHAPDF directly to avoid the insanely deranged replica 0 convention
     #of libnnpdf.
-    #TODO: Find a way around this
-    import lhapdf
+    member = lhapdf.mkPDF(pdf_name, int(replica))
+    subgrids = []
+    for g in kin_grids.subgrids:
+        # Points in the same (x, Q) order as the values of the subgrid
+        xarr, qarr = (a.ravel() for a in np.meshgrid(g.xgrid, g.qgrid, indexing="ij"))
+        vals = np.array(member.xfxQ(g.flavours, xarr, qarr))
+        subgrids.append(g.with_values(vals.reshape(1, len(g.xgrid), len(g.qgrid), len(g.flavours))))
+    return LHAPDFGrid(subgrids)
 
-    xfxQ = lhapdf.mkPDF(pdf.name, int(replica)).xfxQ
+def read_xqf_from_lhapdf(pdf, replica, kin_grids):
+    """Evaluate the given replica of ``pdf`` at the knots of ``kin_grids``"""
+    return _evaluate_member(pdf.name, replica, kin_grids)
 
-    vals = []
-    for x in indexes:
-        #TODO: Change this for a faster grid_values call
-        vals += [xfxQ(x[3],x[1],x[2])]
-    return pd.Series(vals, index = kin_grids.index)
+def read_members_from_lhapdf(pdf, replicas, kin_grids, max_workers=None):
+    """Evaluate the given replicas of ``pdf`` at the knots of ``kin_grids``,
+    distributing the members over a pool of ``max_workers`` processes.
+
+    Returns
+    -------
+    grid: LHAPDFGrid
+        A grid with the members in the same order as ``replicas``
+    """
+    replicas = [int(i) for i in replicas]
+    # Only the knots need to be sent to the workers
+    knots = kin_grids.map_values(lambda v: v[:0])
+    start = time.perf_counter()
+    if max_workers == 1 or len(replicas) == 1:
+        grids = [_evaluate_member(pdf.name, i, knots) for i in replicas]
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            grids = list(
+                executor.map(_evaluate_member, itertools.repeat(pdf.name), replicas,
+                             itertools.repeat(knots))
+            )
+    elapsed = time.perf_counter() - start
+    npoints = len(replicas) * sum(g.xgrid.size * g.qgrid.size * g.flavours.size
+                                  for g in knots.subgrids)
+    log.info("Evaluated %d points of %s with LHAPDF in %.2fs (%.3g points/s)",
+             npoints, pdf, elapsed, npoints / max(elapsed, 1e-9))
+    return LHAPDFGrid.stack(grids)
 
 def read_all_xqf(f):
     while True:
@@ -60,14 +186,47 @@ def read_all_xqf(f):
             return
         yield result
 
-def load_replica(pdf, rep, kin_grids=None):
-
-    suffix = str(rep).zfill(4)
+def read_replica_file(path):
+    """Read a LHAPDF member file.
 
+    Returns
+    -------
+    header: bytes
+        The header of the file
+    grid: LHAPDFGrid
+        A grid with a single member
+    """
+    with open(path, 'rb') as inn:
+        header = b"".join(split_sep(inn))
+        grid = LHAPDFGrid(list(read_all_xqf(inn)))
+    return header, grid
+
+def stack_replica_files(paths):
+    """Read the LHAPDF member files in ``paths`` into a single
+    :py:class:`LHAPDFGrid`, with the members in the same order.
+    All members must share the same grids, otherwise a ``ValueError`` is raised."""
+    paths = list(paths)
+    first = None
+    for i, path in enumerate(paths):
+        _header, grid = read_replica_file(path)
+        if first is None:
+            # Fill a preallocated array rather than concatenating at the end
+            first = grid.map_values(lambda v: np.empty((len(paths),) + v.shape[1:]))
+        if not first.same_knots(grid):
+            raise ValueError(f"Incompatible grid specifications in {path}")
+        for target, subgrid in zip(first.subgrids, grid.subgrids):
+            target.values[i] = subgrid.values[0]
+    return first
+
+def _replica_path(pdf, rep):
     pdf_name = str(pdf)
+    return pathlib.Path(lhaindex.finddir(pdf_name)) / f"{pdf_name}_{rep:04d}.dat"
 
-    path = osp.join(lhaindex.finddir(pdf_name),
-                    pdf_name + "_" + suffix + ".dat")
+def load_replica(pdf, rep, kin_grids=None):
+    """Load a member of ``pdf`` as a single member :py:class:`LHAPDFGrid`.
+    If ``kin_grids`` is given, the member is evaluated with LHAPDF at its knots
+    instead of being read from the file."""
+    path = _replica_path(pdf, int(rep))
 
     log.debug("Loading replica {rep} at {path}".format(rep=rep,
                                                        path=path))
@@ -76,82 +235,155 @@ def load_replica(pdf, rep, kin_grids=None):
         header = b"".join(split_sep(inn))
 
         if kin_grids is not None:
-            xfqs = read_xqf_from_lhapdf(pdf, rep, kin_grids)
+            grid = read_xqf_from_lhapdf(pdf, rep, kin_grids)
         else:
-            xfqs = list(read_all_xqf(inn))
-            xfqs = pd.concat(xfqs, keys=range(len(xfqs)))
-    return header, xfqs
+            grid = LHAPDFGrid(list(read_all_xqf(inn)))
+    return header, grid
+
+def _subgrid_to_buffer(out, subgrid, index=0):
+    """Write one member of a subgrid formatting the whole block at once"""
+    xgrid, qgrid, flavours = subgrid.xgrid, subgrid.qgrid, subgrid.flavours
+    out.write(b'\n')
+    out.write((("%.7E " * len(xgrid)) % tuple(xgrid)).encode())
+    out.write(b'\n')
+    out.write((("%.7E " * len(qgrid)) % tuple(qgrid)).encode())
+    out.write(b'\n')
+    #Integer format
+    out.write((("%d " * len(flavours)) % tuple(flavours)).encode())
+    out.write(b'\n ')
+    row = " ".join(["%14.7E"] * len(flavours)) + "\n"
+    nrows = len(xgrid) * len(qgrid)
+    out.write(((row * nrows) % tuple(subgrid.values[index].ravel())).encode())
 
 #Split this to debug easily
-def _rep_to_buffer(out, header, subgrids):
+def _rep_to_buffer(out, header, grid, index=0):
+    """Write the member at position ``index`` of ``grid`` in the LHAPDF format"""
     sep = b'---'
     out.write(header)
     out.write(sep)
-    for _,g in subgrids.groupby(level=0):
-        out.write(b'\n')
-        ind = g.index.get_level_values(1).unique()
-        np.savetxt(out, ind, fmt='%.7E',delimiter=' ', newline=' ')
-        out.write(b'\n')
-        ind = g.index.get_level_values(2).unique()
-        np.savetxt(out, ind, fmt='%.7E',delimiter=' ', newline=' ')
-        out.write(b'\n')
-        #Integer format
-        ind = g.index.get_level_values(3).unique()
-        np.savetxt(out, ind, delimiter=' ', fmt="%d",
-                      newline=' ')
-        out.write(b'\n ')
-        #Reshape so printing is easy
-        reshaped = g.values.reshape((len(g.groupby(level=1))*len(g.groupby(level=2)),
-                              len(g.groupby(level=3))))
-        np.savetxt(out, reshaped, delimiter=" ", newline="\n", fmt='%14.7E')
+    for subgrid in grid.subgrids:
+        _subgrid_to_buffer(out, subgrid, index)
         out.write(sep)
 
-def write_replica(rep, set_root, header, subgrids):
+def write_replica(rep, set_root, header, grid, index=0):
     suffix = str(rep).zfill(4)
     target_file = set_root / f'{set_root.name}_{suffix}.dat'
     if target_file.is_file():
         log.warning(f"Overwriting replica file {target_file}")
-    with open(target_file, 'wb') as out:
-        _rep_to_buffer(out, header, subgrids)
+    # Format in memory so that the file is written in a single call
+    buffer = io.BytesIO()
+    _rep_to_buffer(buffer, header, grid, index)
+    target_file.write_bytes(buffer.getvalue())
+
+def write_replica_stack(
+        set_root, grid, start=1, write_members=True, write_central=True,
+        header=REPLICA_HEADER, max_workers=None):
+    """Write a LHAPDF set from the grid of all its members.
+
+    Every member file is formatted in memory and written in a single call, with
+    the files being written in parallel. Replica 0 is computed as the mean of
+    the stack, so the member files don't need to be read again.
+
+    Parameters
+    ----------
+    set_root: pathlib.Path
+        Folder of the LHAPDF set, which must exist. Its name is used as the set name.
+    grid: LHAPDFGrid
+        The members to write, as returned e.g. by :py:func:`stack_replica_files`.
+    start: int
+        Member index of the first member of ``grid``.
+    write_members: bool
+        Whether to write the members of ``grid``.
+    write_central: bool
+        Whether to write replica 0 as the average of ``grid``.
+    header: bytes
+        Header of the member files.
+    max_workers: int, optional
+        Number of files written concurrently.
+    """
+    set_root = pathlib.Path(set_root)
+    if not set_root.is_dir():
+        raise RuntimeError(f"Target directory {set_root} does not exist")
+
+    jobs = []
+    if write_central:
+        jobs.append((0, CENTRAL_HEADER, grid.central_value(), 0))
+    if write_members:
+        jobs += [(start + i, header, grid, i) for i in range(grid.nmembers)]
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        # Consume the iterator so that errors are raised here
+        list(executor.map(lambda job: write_replica(job[0], set_root, *job[1:]), jobs))
 
 def load_all_replicas(pdf, db=None):
+    """Load all the members of ``pdf`` into a single :py:class:`LHAPDFGrid`.
+
+    If the members don't share the same grid, replicas 1 to N are evaluated with
+    LHAPDF at the knots of replica 0.
+
+    Returns
+    -------
+    headers: list
+        The header of each member
+    grid: LHAPDFGrid
+        The grid with all the members, with replica 0 at position 0
+    """
     if db is not None:
         #removing str() will crash as it casts to unicode due to pdf name
         key = str("(load_all_replicas, %s)" % pdf.get_key())
         if key in db:
             return db[key]
-    rep0headers, rep0grids = load_replica(pdf, 0)
-
-    headers, grids = zip(*[load_replica(pdf, rep, rep0grids)
-                         for rep in range(1, len(pdf))])
-    result = [rep0headers] + list(headers), [rep0grids] + list(grids)
+    headers, grids = zip(*[load_replica(pdf, rep) for rep in range(len(pdf))])
+    try:
+        grid = LHAPDFGrid.stack(grids)
+    except ValueError:
+        log.warning("The members of %s use different grids. "
+                    "Evaluating them at the grid of replica 0.", pdf)
+        members = read_members_from_lhapdf(pdf, range(1, len(pdf)), grids[0])
+        grid = LHAPDFGrid.stack([grids[0], members])
+    result = list(headers), grid
     if db is not None:
         db[key] = result
     return result
 
-def big_matrix(gridlist):
-    """Return a properly indexes matrix of the differences between each member
-    and the central value"""
-    central_value = gridlist[0]
-    X = pd.concat(gridlist[1:], axis=1,
-                 keys=range(1,len(gridlist)+1), #avoid confusion with rep0
-                 ).subtract(central_value, axis=0)
-    if np.any(X.isnull()) or X.shape[0] != len(central_value):
-        raise ValueError("Incompatible grid specifications")
-    return X
-
-def rep_matrix(gridlist):
-    """Return a properly indexes matrix of all the members"""
-    X = pd.concat(gridlist, axis=1,
-                 keys=range(1,len(gridlist)+1), #avoid confusion with rep0
-                 )
-    if np.ravel(pd.isnull(X)).any():
-        raise ValueError("Found null values in grid")
-    return X
+def iter_member_chunks(pdf, kin_grids, chunk_size=MEMBER_CHUNK_SIZE):
+    """Iterate over the members 1 to N of ``pdf`` in chunks of ``chunk_size``,
+    yielding the index of the first member of the chunk and a
+    :py:class:`LHAPDFGrid` with the members of the chunk. Members with knots
+    different from those of ``kin_grids`` are evaluated at its knots with LHAPDF."""
+    for start in range(1, len(pdf), chunk_size):
+        indexes = range(start, min(start + chunk_size, len(pdf)))
+        try:
+            grid = stack_replica_files(_replica_path(pdf, i) for i in indexes)
+        except ValueError:
+            grid = None
+        if grid is None or not grid.same_knots(kin_grids):
+            grid = read_members_from_lhapdf(pdf, indexes, kin_grids)
+        yield start, grid
+
+def link_or_copy(source, target):
+    """Hard link ``target`` to ``source`` if possible (e.g. when both are in
+    the same filesystem), otherwise copy it. Only use it for files that are
+    not modified in place afterwards, such as the grids of the members."""
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copy(source, target)
 
 def _index_to_path(set_folder, set_name,  index):
     return set_folder/('%s_%04d.dat' % (set_name, index))
 
+def _load_members(pdf, indexes, kin_grids=None):
+    """Load the given members of ``pdf`` into a single :py:class:`LHAPDFGrid`,
+    evaluating them at the knots of ``kin_grids`` if given"""
+    if kin_grids is not None:
+        return read_members_from_lhapdf(pdf, indexes, kin_grids)
+    try:
+        return stack_replica_files(_replica_path(pdf, int(i)) for i in indexes)
+    except ValueError as e:
+        raise ValueError("The replica grids don't match. "
+                         "If this is intentional try using use_rep0grid=True") from e
+
 def generate_replica0(pdf, kin_grids=None, extra_fields=None):
     """ Generates a replica 0 as an average over an existing set of LHAPDF
         replicas and outputs it to the PDF's parent folder
@@ -162,7 +394,8 @@ def generate_replica0(pdf, kin_grids=None, extra_fields=None):
         An existing validphys PDF object from which the average replica will be
         (re-)computed
 
-    kin_grids: Grids in (x,Q) used to print replica0 upon. If None, the grids
+    kin_grids: LHAPDFGrid, optional
+        Grids in (x,Q) used to print replica0 upon. If None, the grids
         of the source replicas are used.
     """
 
@@ -174,25 +407,8 @@ def generate_replica0(pdf, kin_grids=None, extra_fields=None):
     if not set_root.exists():
         raise RuntimeError(f"Target directory {set_root} does not exist")
 
-    loaded_grids = {}
-    grids = []
-
-    for irep in range(1, len(pdf)):
-        if irep in loaded_grids:
-            grid = loaded_grids[irep]
-        else:
-            _header, grid = load_replica(pdf, irep, kin_grids=kin_grids)
-            loaded_grids[irep] = grid
-        grids.append(grid)
-    # This takes care of failing if headers don't match
-    try:
-        M = rep_matrix(grids)
-    except ValueError as e:
-        raise ValueError("Null values found in replica grid matrix. "
-                         "This may indicate that the headers don't match"
-                         "If this is intentional try using use_rep0grid=True") from e
-    header = b'PdfType: central\nFormat: lhagrid1\n'
-    write_replica(0, set_root, header, M.mean(axis=1))
+    grid = _load_members(pdf, range(1, len(pdf)), kin_grids)
+    write_replica_stack(set_root, grid, write_members=False)
 
 def new_pdf_from_indexes(
         pdf, indexes, set_name=None, folder=None,
@@ -254,24 +470,18 @@ def new_pdf_from_indexes(
             else:
                 new_file.write(line)
 
-    if use_rep0grid:
-        _, rep0grid = load_replica(pdf, 0)
-    else:
-        rep0grid = None
-
     for newindex,oldindex in enumerate(indexes, 1):
         original_path = _index_to_path(original_folder, pdf, oldindex)
         new_path = _index_to_path(set_root, set_name, newindex)
-        shutil.copy(original_path, new_path)
+        link_or_copy(original_path, new_path)
 
-    # Generate replica 0
-    oldpaths = lhapdf.paths()
-    try:
-        lhapdf.setPaths([str(folder)])
-        generatedPDF = PDF(set_name)
-        generate_replica0(generatedPDF, rep0grid)
-    finally:
-        lhapdf.setPaths(oldpaths)
+    # Generate replica 0 from the selected members of the original set
+    if use_rep0grid:
+        _, rep0grid = load_replica(pdf, 0)
+    else:
+        rep0grid = None
+    grid = _load_members(pdf, indexes, rep0grid)
+    write_replica_stack(set_root, grid, write_members=False)
 
     if installgrid:
         newpath = pathlib.Path(lhaindex.get_lha_datapath()) /  set_name
@@ -279,8 +489,13 @@ def new_pdf_from_indexes(
         shutil.copytree(set_root, newpath)
 
 
-def hessian_from_lincomb(pdf, V, set_name=None, folder = None, extra_fields=None):
-    """Construct a new LHAPDF grid from a linear combination of members"""
+def hessian_from_lincomb(pdf, V, set_name=None, folder = None, extra_fields=None,
+                         chunk_size=MEMBER_CHUNK_SIZE):
+    """Construct a new LHAPDF grid from a linear combination of members.
+
+    The members are read ``chunk_size`` at a time, so that only the new members
+    and one chunk of the original ones are kept in memory.
+    """
 
     # preparing output folder
     neig = V.shape[1]
@@ -317,10 +532,15 @@ def hessian_from_lincomb(pdf, V, set_name=None, folder = None, extra_fields=None
         if extra_fields is not None:
             yaml_safe.dump(extra_fields, out, default_flow_style=False)
 
-    _headers, grids = load_all_replicas(pdf)
-    result  = (big_matrix(grids).dot(V)).add(grids[0], axis=0, )
+    # Accumulate the linear combination one chunk of replicas at a time
+    _, central = load_replica(pdf, 0)
+    result = central.map_values(lambda v: np.repeat(v, neig, axis=0))
+    for start, chunk in iter_member_chunks(pdf, central, chunk_size):
+        Vchunk = V[start - 1 : start - 1 + chunk.nmembers]
+        for res, members, cv in zip(result.subgrids, chunk.subgrids, central.subgrids):
+            res.values += np.tensordot(Vchunk.T, members.values - cv.values, axes=1)
+
     hess_header = b"PdfType: error\nFormat: lhagrid1\n"
-    for column in result.columns:
-        write_replica(column + 1, set_root, hess_header, result[column])
+    write_replica_stack(set_root, result, write_central=False, header=hess_header)
     log.info("Hessian PDF stored at %s", set_root)
     return set_root
@@ -4,6 +4,7 @@ mc2hessian.py
 This module containts the functionality to compute reduced set using the `mc2hessian` algorithm
 (See section 2.1 of of `1602.00005 <https://arxiv.org/pdf/1602.00005.pdf#subsection.2.1>`_).
 """
+import functools
 import logging
 import numbers
 import pathlib
@@ -15,12 +16,16 @@ from reportengine.checks import check, check_positive, make_argcheck
 
 from validphys import lhaindex
 from validphys.lhio import hessian_from_lincomb
+from validphys.pdfbases import check_basis, flavour
 from validphys.pdfgrids import xplotting_grid
 
 from validphys.checks import check_pdf_is_montecarlo
 
 log = logging.getLogger(__name__)
 
+# Number of replicas evaluated at once by the randomized SVD
+REPLICA_CHUNK_SIZE = 100
+
 
 def gridname(pdf, Neig, mc2hname: (str, type(None)) = None):
     """If no custom `mc2hname' is specified, the name of the Hessian PDF is automatically generated.
@@ -62,7 +67,14 @@ def mc2hessian_xgrid(
 
 @check_pdf_is_montecarlo
 def mc2hessian(
-    pdf, Q, Neig: int, mc2hessian_xgrid, output_path, gridname, installgrid: bool = False
+    pdf,
+    Q,
+    Neig: int,
+    mc2hessian_xgrid,
+    output_path,
+    gridname,
+    installgrid: bool = False,
+    randomized_svd: bool = False,
 ):
     """Produces a Hessian PDF by transfroming a Monte Carlo PDF set.
 
@@ -82,9 +94,21 @@ def mc2hessian(
         Name of the Hessian PDF set
     installgrid : bool, optional, default=``False``
         Whether to copyt the Hessian grid to the LHAPDF path
+    randomized_svd : bool, optional, default=``False``
+        Whether to compute only the leading ``Neig`` components with a
+        randomized SVD instead of the full SVD. This avoids the cost of the
+        full decomposition for sets with thousands of replicas. The replicas are
+        then evaluated in blocks of ``REPLICA_CHUNK_SIZE``, several times, and the
+        full matrix of replica values is never held in memory.
     """
     result_path = _create_mc2hessian(
-        pdf, Q=Q, xgrid=mc2hessian_xgrid, Neig=Neig, output_path=output_path, name=gridname
+        pdf,
+        Q=Q,
+        xgrid=mc2hessian_xgrid,
+        Neig=Neig,
+        output_path=output_path,
+        name=gridname,
+        randomized=randomized_svd,
     )
     if installgrid:
         lhafolder = pathlib.Path(lhaindex.get_lha_datapath())
@@ -102,9 +126,13 @@ def mc2hessian(
         log.info("Hessian PDF set installed at %s", dest)
 
 
-def _create_mc2hessian(pdf, Q, xgrid, Neig, output_path, name=None):
-    X = _get_X(pdf, Q, xgrid, reshape=True)
-    vec = _compress_X(X, Neig)
+def _create_mc2hessian(pdf, Q, xgrid, Neig, output_path, name=None, randomized=False):
+    if randomized:
+        npoints, blocks = _X_blocks(pdf, Q, xgrid)
+        vec = _randomized_compress_blocks(blocks, npoints, len(pdf) - 1, Neig)
+    else:
+        X = _get_X(pdf, Q, xgrid, reshape=True)
+        vec = _compress_X(X, Neig)
     norm = _pdf_normalization(pdf)
     return hessian_from_lincomb(pdf, vec / norm, folder=output_path, set_name=name)
 
@@ -120,12 +148,91 @@ def _get_X(pdf, Q, xgrid, reshape=False):
     return Xt.T
 
 
+def _X_blocks(pdf, Q, xgrid, chunk_size=REPLICA_CHUNK_SIZE):
+    """Return the number of rows of the matrix ``X`` of :py:func:`_get_X` (with
+    ``reshape=True``) and a function iterating over its transpose in blocks of
+    ``chunk_size`` replicas. The PDF is evaluated for each block of members as
+    in :py:func:`validphys.pdfgrids.xplotting_grid`, so ``X`` is never held in
+    full. Each call of the function evaluates the PDF again."""
+    lpdf = pdf.load()
+    basis = flavour
+    flavours = check_basis(basis, None)["flavours"]
+
+    def evaluate(members):
+        func = functools.partial(_member_grid_values, lpdf, members=members)
+        gv = basis.apply_grid_values(func, flavours, xgrid, [Q])
+        return gv.reshape(gv.shape[0], -1)
+
+    central = evaluate(slice(0, 1))
+    nmembers = len(pdf)
+
+    def blocks():
+        for start in range(1, nmembers, chunk_size):
+            yield evaluate(slice(start, min(start + chunk_size, nmembers))) - central
+
+    return central.shape[1], blocks
+
+
+def _member_grid_values(lpdf, flmat, xmat, qmat, members):
+    return lpdf.grid_values(
+        np.atleast_1d(flmat), np.atleast_1d(xmat), np.atleast_1d(qmat), members=members
+    )
+
+
 def _compress_X(X, neig):
     _U, _S, V = np.linalg.svd(X, full_matrices=False)
     vec = V[:neig, :].T
     return vec
 
 
+def _randomized_compress_X(X, neig, chunk_size=REPLICA_CHUNK_SIZE, **kwargs):
+    """Same as :py:func:`_compress_X` but computing only the leading ``neig``
+    right singular vectors with :py:func:`_randomized_compress_blocks`, for a
+    matrix ``X`` held in memory"""
+    npoints, nrep = X.shape
+
+    def blocks():
+        for start in range(0, nrep, chunk_size):
+            yield X[:, start : start + chunk_size].T
+
+    return _randomized_compress_blocks(blocks, npoints, nrep, neig, **kwargs)
+
+
+def _randomized_compress_blocks(
+    blocks, npoints, nrep, neig, oversampling=10, power_iterations=4, seed=0
+):
+    """Leading ``neig`` right singular vectors of the ``(npoints, nrep)`` matrix
+    ``X`` computed with a randomized SVD (Halko, Martinsson and Tropp,
+    `0909.4061 <https://arxiv.org/abs/0909.4061>`_), which only decomposes
+    matrices of ``neig + oversampling`` rows or columns.
+
+    ``X`` is only accessed through the products ``X @ M`` and ``X.T @ M``, which are
+    accumulated over the blocks of replicas (rows of ``X.T``) yielded by each call of
+    ``blocks()``. The blocks are gone through ``2 * power_iterations + 2`` times."""
+    rank = min(neig + oversampling, npoints, nrep)
+    rng = np.random.default_rng(seed)
+
+    def X_dot(m):
+        res = np.zeros((npoints, m.shape[1]))
+        start = 0
+        for block in blocks():
+            res += block.T @ m[start : start + len(block)]
+            start += len(block)
+        return res
+
+    def Xt_dot(m):
+        return np.concatenate([block @ m for block in blocks()])
+
+    # Orthonormal basis for the range of X, refined with power iterations
+    q, _ = np.linalg.qr(X_dot(rng.standard_normal((nrep, rank))))
+    for _ in range(power_iterations):
+        z, _ = np.linalg.qr(Xt_dot(q))
+        q, _ = np.linalg.qr(X_dot(z))
+    # SVD of the small (rank, nrep) projection of X
+    _u, _s, v = np.linalg.svd(Xt_dot(q).T, full_matrices=False)
+    return v[:neig, :].T
+
+
 def _pdf_normalization(pdf):
     """Extract the quantity by which we have to divide the eigenvectors to
     get the correct errors, depending on the `error_type` of `pdf`."""
@@ -9,7 +9,10 @@ functions make calls to libnnpdf C++ library.
 from collections import defaultdict
 from copy import deepcopy
 import hashlib
+import json
 import logging
+import os
+import time
 
 import numpy as np
 import pandas as pd
@@ -25,6 +28,15 @@ from validphys.n3fit_data_utils import (
 )
 
 from validphys.fkparser import parse_cfactor
+from validphys.coredata import SparseFKTable
+from validphys.covmats import (
+    dataset_inputs_covmat_from_systematics,
+    dataset_t0_predictions,
+    sqrt_covmat,
+    store_sqrt_covmat,
+)
+from validphys.covmats_utils import BlockLowRankMatrix
+from validphys.predictions_cache import pdf_digest
 
 from pathlib import Path
 
@@ -181,9 +193,14 @@ def _mask_fk_tables(dataset_dicts, tr_masks):
         ex_fks = []
         vl_mask = ~tr_mask
         for fktable_dict in dataset_dict["fktables"]:
-            tr_fks.append(fktable_dict["fktable"][tr_mask])
-            vl_fks.append(fktable_dict["fktable"][vl_mask])
-            ex_fks.append(fktable_dict.get("fktable"))
+            fktable = fktable_dict["fktable"]
+            if isinstance(fktable, SparseFKTable):
+                tr_fks.append(fktable.with_data_mask(tr_mask))
+                vl_fks.append(fktable.with_data_mask(vl_mask))
+            else:
+                tr_fks.append(fktable[tr_mask])
+                vl_fks.append(fktable[vl_mask])
+            ex_fks.append(fktable)
             dataset_dict['ds_tr_mask'] = tr_mask
         dataset_dict["tr_fktables"] = tr_fks
         dataset_dict["vl_fktables"] = vl_fks
@@ -191,17 +208,186 @@ def _mask_fk_tables(dataset_dicts, tr_masks):
 
     return np.concatenate(trmask_partial)
 
+T0_CACHE_FOLDER = "t0_cache"
+
+
+def _file_stamp(path):
+    """Name, size and modification time of a file, as a cheap proxy for its content"""
+    st = os.stat(path)
+    return f"{path}:{st.st_size}:{st.st_mtime_ns}"
+
+
+def t0_cache_key(
+    data,
+    dataset_inputs_loaded_cd_with_cuts,
+    data_input,
+    t0set=None,
+    use_weights_in_covmat=True,
+    norm_threshold=None,
+):
+    """Hash of everything that determines the t0 covariance matrix of ``data``:
+    the (cut) commondata, the weights, the fktables and cfactors, the t0 PDF and
+    the covmat options. It is used to check that the matrices stored by
+    :py:func:`write_t0_cache` correspond to the current fit."""
+    h = hashlib.sha256()
+    h.update(json.dumps([str(data), use_weights_in_covmat, norm_threshold]).encode())
+    h.update(b"t0set:" + (pdf_digest(t0set) if t0set is not None else "none").encode())
+    for dataset, cd, dsinput in zip(data.datasets, dataset_inputs_loaded_cd_with_cuts, data_input):
+        h.update(f"dataset:{dataset.name}:{dsinput.weight}".encode())
+        for fk in dataset.fkspecs:
+            if fk.use_fixed_predictions:
+                h.update(_file_stamp(fk.fixed_predictions_path).encode())
+            else:
+                h.update(_file_stamp(fk.fkpath).encode())
+                for cfactor in fk.cfactors:
+                    h.update(_file_stamp(cfactor).encode())
+        for df in (cd.commondata_table, cd.systype_table):
+            h.update(pd.util.hash_pandas_object(df).to_numpy().tobytes())
+    return h.hexdigest()
+
+
+def _t0_predictions_and_covmat(
+    data, dataset_inputs_loaded_cd_with_cuts, data_input, t0set, use_weights_in_covmat,
+    norm_threshold, structured_covmat=False,
+):
+    """Compute the t0 predictions (None without t0set) and the t0 covmat of ``data``"""
+    if t0set is None:
+        predictions = None
+    else:
+        predictions = [dataset_t0_predictions(dataset, t0set) for dataset in data.datasets]
+    covmat = dataset_inputs_covmat_from_systematics(
+        dataset_inputs_loaded_cd_with_cuts,
+        data_input,
+        use_weights_in_covmat=use_weights_in_covmat,
+        norm_threshold=norm_threshold,
+        _list_of_central_values=predictions,
+        structured_covmat=structured_covmat,
+    )
+    return predictions, covmat
+
+
+def save_t0_cache(folder, name, key, covmat, sqrtcovmat):
+    """Write the t0 ``covmat`` and its lower triangular factor ``sqrtcovmat`` of
+    the group ``name`` as ``.npy`` files in ``folder``, together with a ``.json``
+    file with the ``key`` they correspond to. The json file is written last, so
+    that an interrupted write is never read back."""
+    folder = Path(folder)
+    folder.mkdir(parents=True, exist_ok=True)
+    (folder / f"{name}.json").unlink(missing_ok=True)
+    arrays = {"covmat": covmat, "sqrtcovmat": sqrtcovmat}
+    for kind, array in arrays.items():
+        np.save(folder / f"{name}_{kind}.npy", np.asarray(array, dtype=float))
+    with open(folder / f"{name}.json", "w") as f:
+        json.dump({"key": key, "ndata": len(covmat), "arrays": list(arrays)}, f)
+
+
+def load_t0_cache(folder, name, key):
+    """Memory map the arrays written by :py:func:`save_t0_cache` for the group
+    ``name``. Returns a dictionary with the read only arrays, or None if they are
+    not present or correspond to a ``key`` different from the given one."""
+    folder = Path(folder)
+    try:
+        with open(folder / f"{name}.json") as f:
+            metadata = json.load(f)
+    except FileNotFoundError:
+        return None
+    if metadata["key"] != key:
+        log.warning("The t0 covmat stored in %s for %s is outdated, it will be recomputed", folder, name)
+        return None
+    return {
+        kind: np.load(folder / f"{name}_{kind}.npy", mmap_mode="r") for kind in metadata["arrays"]
+    }
+
+
+def write_t0_cache(
+    data,
+    output_path,
+    dataset_inputs_loaded_cd_with_cuts,
+    data_input,
+    t0set=None,
+    use_weights_in_covmat=True,
+    norm_threshold=None,
+):
+    """Action run by ``vp-setupfit`` which computes the t0 covariance matrix and
+    its Cholesky factor for ``data`` and stores them in the ``t0_cache`` folder of
+    the fit, see :py:func:`save_t0_cache`. The replicas of the fit then load them
+    with :py:func:`fitting_t0_covmat` instead of computing the t0 predictions and
+    the decomposition again."""
+    key = t0_cache_key(
+        data, dataset_inputs_loaded_cd_with_cuts, data_input, t0set, use_weights_in_covmat,
+        norm_threshold,
+    )
+    _, covmat = _t0_predictions_and_covmat(
+        data, dataset_inputs_loaded_cd_with_cuts, data_input, t0set, use_weights_in_covmat,
+        norm_threshold,
+    )
+    folder = Path(output_path) / T0_CACHE_FOLDER
+    save_t0_cache(folder, str(data), key, covmat, sqrt_covmat(covmat))
+    log.info("Stored the t0 covariance matrix of %s in %s", data, folder)
+
+
+exps_write_t0_cache = collect("write_t0_cache", ("group_dataset_inputs_by_experiment",))
+
+
+def fitting_t0_covmat(
+    data,
+    output_path,
+    dataset_inputs_loaded_cd_with_cuts,
+    data_input,
+    t0set=None,
+    use_weights_in_covmat=True,
+    norm_threshold=None,
+    structured_covmat: bool = False,
+    use_fitcommondata=False,
+):
+    """The t0 covariance matrix of ``data`` used in the fit. This is the same as
+    :py:func:`validphys.covmats.dataset_inputs_t0_covmat_from_systematics`, but
+    if ``vp-setupfit`` stored the matrix in the fit folder (see
+    :py:func:`write_t0_cache`) it is memory mapped from there, and its stored
+    Cholesky factor is registered as the result of
+    :py:func:`validphys.covmats.sqrt_covmat`, instead of computing the t0
+    predictions and the decomposition again in every replica. The stored
+    matrices are only used if the data, the cuts, the fktables and the t0 PDF
+    they were computed with are unchanged.
+
+    Structured covmats (``structured_covmat: true``) and the covmats of the
+    closure test fake data (``use_fitcommondata``), which ``vp-setupfit`` does
+    not store, are always computed.
+    """
+    if not structured_covmat and not use_fitcommondata:
+        key = t0_cache_key(
+            data, dataset_inputs_loaded_cd_with_cuts, data_input, t0set, use_weights_in_covmat,
+            norm_threshold,
+        )
+        cached = load_t0_cache(Path(output_path) / T0_CACHE_FOLDER, str(data), key)
+        if cached is not None:
+            log.info("Loaded the t0 covariance matrix of %s from the fit folder", data)
+            store_sqrt_covmat(cached["covmat"], cached["sqrtcovmat"])
+            return cached["covmat"]
+    _, covmat = _t0_predictions_and_covmat(
+        data, dataset_inputs_loaded_cd_with_cuts, data_input, t0set, use_weights_in_covmat,
+        norm_threshold, structured_covmat,
+    )
+    return covmat
+
+
 def fitting_data_dict(
     data,
     make_replica,
-    dataset_inputs_t0_covmat_from_systematics,
+    fitting_t0_covmat,
     tr_masks,
     kfold_masks,
     diagonal_basis=None,
+    sparse_fktables=False,
 ):
     """
     Provider which takes  the information from validphys ``data``.
 
+    If ``sparse_fktables`` is set to True in the runcard the hadronic fktables
+    are kept in coordinate form (:py:class:`validphys.coredata.SparseFKTable`)
+    with only their non-zero entries, which reduces the memory footprint of
+    large hadronic tables.
+
     Returns
     -------
     all_dict_out: dict
@@ -238,18 +424,31 @@ def fitting_data_dict(
             bool - is this a positivity set?
         'count_chi2'
             should this be counted towards the chi2
+        'timings'
+            ``(start, end)`` wall times of the loading of the data
+            (``data_loading``) and of the parsing of the fktables (``fk_parsing``)
+
+    If the t0 covmat is structured (``structured_covmat: true`` in the
+    runcard), the covmats and their inverses are
+    :py:class:`validphys.covmats_utils.BlockLowRankMatrix` and are never built
+    as dense matrices.
     """
 
     # TODO: Plug in the python data loading when available. Including but not
     # limited to: central values, ndata, replica generation, covmat construction
+    timings = {}
     if data.datasets:
+        start = time.time()
         try:
             spec_c = data.load()
         except:
             breakpoint()
         ndata = spec_c.GetNData()
         expdata_true = spec_c.get_cv().reshape(1, ndata)
-        datasets = common_data_reader_experiment(spec_c, data)
+        timings["data_loading"] = (start, time.time())
+        start = time.time()
+        datasets = common_data_reader_experiment(spec_c, data, sparse=sparse_fktables)
+        timings["fk_parsing"] = (start, time.time())
         for i in range(len(data.datasets)):
             if data.datasets[i].use_fixed_predictions:
                 datasets[i]['use_fixed_predictions'] = True
@@ -272,8 +471,14 @@ def fitting_data_dict(
     expdata = make_replica
 
     # t0 covmat
-    covmat = dataset_inputs_t0_covmat_from_systematics
-    inv_true = np.linalg.inv(covmat)
+    covmat = fitting_t0_covmat
+    structured = isinstance(covmat, BlockLowRankMatrix)
+    if structured and diagonal_basis:
+        log.warning("The diagonal basis requires the dense covariance matrix")
+        covmat = covmat.to_dense()
+        structured = False
+    # The inverse of a structured covmat keeps the same structure
+    inv_true = covmat.inverse() if structured else np.linalg.inv(covmat)
 
     if diagonal_basis:
         log.info("working in diagonal basis.")
@@ -309,6 +514,12 @@ def fitting_data_dict(
         # prepare a masking rotation
         dt_trans_tr = dt_trans[tr_mask]
         dt_trans_vl = dt_trans[vl_mask]
+    elif structured:
+        covmat_tr = covmat.submatrix(total_tr_mask)
+        invcovmat_tr = covmat_tr.inverse()
+
+        covmat_vl = covmat.submatrix(total_vl_mask)
+        invcovmat_vl = covmat_vl.inverse()
     else:
         covmat_tr = covmat[total_tr_mask].T[total_tr_mask]
         invcovmat_tr = np.linalg.inv(covmat_tr)
@@ -351,6 +562,7 @@ def fitting_data_dict(
         "folds" : folds,
         "data_transformation_tr": dt_trans_tr,
         "data_transformation_vl": dt_trans_vl,
+        "timings": timings,
     }
     return dict_out
 
@@ -7,12 +7,26 @@ import numpy as np
 import yaml
 from validphys.fkparser import parse_cfactor
 
-from validphys.coredata import CFactorData
+from validphys.coredata import CFactorData, SparseFKTable
 
-def fk_parser(fk, is_hadronic=False):
+def _unpad_sigma(sigma_flat, ndata, dsz, block_size):
+    """
+    libnnpdf stores the fktable as ``ndata`` blocks of ``dsz`` entries
+    where only the first ``block_size = nx * nonzero`` entries of each block are
+    meaningful, the rest being padding. Return a strided view of shape
+    ``(ndata, block_size)`` skipping the padding without copying any data.
+    """
+    return sigma_flat[: ndata * dsz].reshape(ndata, dsz)[:, :block_size]
+
+
+def fk_parser(fk, is_hadronic=False, sparse=False):
     """
     # Arguments:
         - `fk`: fktable object
+        - `is_hadronic`: whether the fktable is hadronic
+        - `sparse`: if True (and the fktable is hadronic) the fktable is returned
+                    as a :py:class:`validphys.coredata.SparseFKTable` containing
+                    only the non-zero entries
 
     # Return:
         - `dict_out`: dictionary with all information about the fktable
@@ -45,22 +59,13 @@ def fk_parser(fk, is_hadronic=False):
         shape_out = (ndata, nbasis, nx)
         xgrid = xgrid_flat.reshape(1, nx)
 
-    # remove padding from the fktable (if any)
-    l = len(fktable_flat)
-    # get the padding
-    pad_position = fk.GetDSz()
-    pad_size = fk.GetDSz() - nx * nonzero
-    # remove the padding
-    if pad_size > 0:
-        mask = np.ones(l, dtype=bool)
-        for i in range(1, int(l / pad_position) + 1):
-            marker = pad_position * i
-            mask[marker - pad_size : marker] = False
-        fktable_array = fktable_flat[mask]
+    # remove padding from the fktable (if any), this is a view of fktable_flat
+    fktable_view = _unpad_sigma(fktable_flat, ndata, fk.GetDSz(), nx * nonzero)
+    fktable_view = fktable_view.reshape(shape_out)
+    if sparse and is_hadronic:
+        fktable = SparseFKTable.from_dense(fktable_view)
     else:
-        fktable_array = fktable_flat
-    # reshape
-    fktable = fktable_array.reshape(shape_out)
+        fktable = np.ascontiguousarray(fktable_view)
 
     dict_out = {
         "ndata": ndata,
@@ -125,13 +130,14 @@ def parse_simu_parameters_names_CF(simu_parameters_names_CF, simu_parameters_lin
     return name_cfac_map
 
 
-def common_data_reader_dataset(dataset_c, dataset_spec):
+def common_data_reader_dataset(dataset_c, dataset_spec, sparse=False):
     """
     Import fktable, common data and experimental data for the given data_name
 
     # Arguments:
         - `dataset_c`: c representation of the dataset object
         - `dataset_spec`: python representation of the dataset object
+        - `sparse`: whether to load hadronic fktables in sparse form (see ``fk_parser``)
 
     #Returns:
         - `[dataset_dict]`: a (len 1 list of) dictionary with:
@@ -145,6 +151,7 @@ def common_data_reader_dataset(dataset_c, dataset_spec):
                 - nx: number of points in the xgrid (1-D), i.e., for hadronic the total number is nx * nx
                 - xgrid: grid of x points
                 - fktable: 3/4-D array of shape (ndata, nonzero, nx, (nx))
+                           or a SparseFKTable for hadronic datasets if `sparse` is True
 
     instead of the dictionary object that model_gen needs
     """
@@ -153,7 +160,7 @@ def common_data_reader_dataset(dataset_c, dataset_spec):
     dict_fktables = []
     for i in range(how_many):
         fktable = dataset_c.GetFK(i)
-        dict_fktables.append(fk_parser(fktable, dataset_c.IsHadronic()))
+        dict_fktables.append(fk_parser(fktable, dataset_c.IsHadronic(), sparse=sparse))
 
     dataset_dict = {
         "fktables": dict_fktables,
@@ -169,7 +176,7 @@ def common_data_reader_dataset(dataset_c, dataset_spec):
     return [dataset_dict]
 
 
-def common_data_reader_experiment(experiment_c, experiment_spec):
+def common_data_reader_experiment(experiment_c, experiment_spec, sparse=False):
     """
     Wrapper around the experiments. Loop over all datasets in an experiment,
     calls common_data_reader on them and return a list with the content.
@@ -177,13 +184,14 @@ def common_data_reader_experiment(experiment_c, experiment_spec):
     # Arguments:
         - `experiment_c`: c representation of the experiment object
         - `experiment_spec`: python representation of the experiment object
+        - `sparse`: whether to load hadronic fktables in sparse form
 
     # Returns:
         - `[parsed_datasets]`: a list of dictionaries output from `common_data_reader_dataset`
     """
     parsed_datasets = []
     for dataset_c, dataset_spec in zip(experiment_c.DataSets(), experiment_spec.datasets):
-        parsed_datasets += common_data_reader_dataset(dataset_c, dataset_spec)
+        parsed_datasets += common_data_reader_dataset(dataset_c, dataset_spec, sparse=sparse)
     return parsed_datasets
 
 
@@ -9,7 +9,7 @@ be consumed by plotting functions.
 import logging
 import warnings
 import functools
-from collections import defaultdict
+from collections import defaultdict, namedtuple
 
 import numpy as np
 import pandas as pd
@@ -496,40 +496,117 @@ quadratic_datasets_pseudoreplicas_chi2 = collect(
 dataspecs_parabolic_as_determination_for_total = collect(
         'parabolic_as_determination_for_total', ['dataspecs'])
 
+# Maximum number of elements of the matrix of resamples held in memory at any time
+BOOTSTRAP_CHUNK_ELEMENTS = 2**22
+
+
+def _resampled_mean_std(data, nresamplings, rng, chunk_elements=BOOTSTRAP_CHUNK_ELEMENTS):
+    """Return the mean and the standard deviation of each of `nresamplings`
+    resamplings with replacement of `data`, drawn with the numpy Generator `rng`.
+    The resamplings are drawn in chunks of at most `chunk_elements` elements
+    so that the memory used does not grow with `nresamplings`."""
+    data = np.asarray(data, dtype=float)
+    ndata = len(data)
+    # Both statistics are computed from the sums of the centered data and of its
+    # squares, the centering avoids the loss of precision of the variance
+    shift = data.mean()
+    centered = data - shift
+    means = np.empty(nresamplings)
+    stds = np.empty(nresamplings)
+    chunk = max(1, chunk_elements // ndata)
+    for start in range(0, nresamplings, chunk):
+        stop = min(start + chunk, nresamplings)
+        resamples = centered[rng.integers(0, ndata, size=(stop - start, ndata))]
+        chunk_means = resamples.mean(axis=1)
+        chunk_squares = np.einsum("ij,ij->i", resamples, resamples) / ndata
+        means[start:stop] = chunk_means + shift
+        stds[start:stop] = np.sqrt(np.maximum(chunk_squares - chunk_means ** 2, 0))
+    return means, stds
+
+
+BootstrapStatsErrors = namedtuple(
+    "BootstrapStatsErrors",
+    ("stats_error", "stats_error_on_the_error", "half_sample_stats_error"),
+)
+
+
+@check_positive('nresamplings')
+def bootstrapping_stats_errors(
+    parabolic_as_determination, nresamplings: int = 100000, boot_seed: int = None
+):
+    """Compute in one pass the measures of the statistical error of the
+    distribution of determinations of as returned by
+    `bootstrapping_stats_error`, `bootstrapping_stats_error_on_the_error` and
+    `half_sample_stats_error`, as a `BootstrapStatsErrors` tuple.
+    The first two are computed from the same resamplings of the distribution.
+    `boot_seed` can be given to obtain the same resamplings every time. With
+    `boot_seed=None` the resamplings are drawn from a fresh, unseeded
+    `np.random.default_rng`, so seeding the global `np.random` state has no
+    effect on them."""
+    rng = np.random.default_rng(boot_seed)
+    distribution = parabolic_as_determination.data
+    if not len(distribution):
+        log.error("Cannot compute stats error. Empty data.")
+        return BootstrapStatsErrors(np.nan, np.nan, np.nan)
+    means, stds = _resampled_mean_std(distribution, nresamplings, rng)
+    half = distribution[: len(distribution) // 2]
+    if len(half):
+        half_means, _ = _resampled_mean_std(half, nresamplings, rng)
+        half_error = half_means.std()
+    else:
+        log.error("Cannot compute half stats. Too few data")
+        half_error = np.nan
+    return BootstrapStatsErrors(means.std(), stds.std(), half_error)
+
+
 @check_positive('nresamplings')
-def bootstrapping_stats_error(parabolic_as_determination, nresamplings:int=100000, suptitle=""):
+def bootstrapping_stats_error(
+    parabolic_as_determination, nresamplings: int = 100000, suptitle="", boot_seed: int = None
+):
     """Compute the bootstrapping uncertainty of the distribution of
     determinations of as, by resampling the list of points with replacement
     from the original sampling distribution `nresamplings` times
-    and then computing the standard deviation of the means."""
+    and then computing the standard deviation of the means.
+    The resamplings are drawn from `np.random.default_rng(boot_seed)`: a
+    `boot_seed` of None gives a fresh unseeded generator, which does not use the
+    global `np.random` seed."""
     distribution = parabolic_as_determination.data
-    shape = (nresamplings, len(distribution))
     if not len(distribution):
         log.error("Cannot compute stats error. Empty data.")
         return np.nan
-    return np.random.choice(distribution, shape).mean(axis=1).std()
+    rng = np.random.default_rng(boot_seed)
+    return _resampled_mean_std(distribution, nresamplings, rng)[0].std()
 
 @check_positive('nresamplings')
-def bootstrapping_stats_error_on_the_error(parabolic_as_determination, nresamplings:int=100000, suptitle=""):
-    """Compute the bootstrapping uncertainty of standard deviation on the parabolic determination."""
+def bootstrapping_stats_error_on_the_error(
+    parabolic_as_determination, nresamplings: int = 100000, suptitle="", boot_seed: int = None
+):
+    """Compute the bootstrapping uncertainty of standard deviation on the parabolic determination.
+    The resamplings are the same as in `bootstrapping_stats_error` for the same
+    `boot_seed`. Without a `boot_seed` they come from a fresh unseeded
+    `np.random.default_rng` and the global `np.random` seed is ignored."""
     distribution = parabolic_as_determination.data
-    shape = (nresamplings, len(distribution))
     if not len(distribution):
         log.error("Cannot compute stats error. Empty data.")
         return np.nan
-    return np.random.choice(distribution, shape).std(axis=1).std()
+    rng = np.random.default_rng(boot_seed)
+    return _resampled_mean_std(distribution, nresamplings, rng)[1].std()
 
 
 @check_positive('nresamplings')
-def half_sample_stats_error(parabolic_as_determination, nresamplings:int=100000):
-    """Like the bootstrapping error, but using only half og the data"""
+def half_sample_stats_error(
+    parabolic_as_determination, nresamplings: int = 100000, boot_seed: int = None
+):
+    """Like the bootstrapping error, but using only half og the data.
+    As there, `boot_seed=None` uses a fresh unseeded `np.random.default_rng`
+    rather than the global `np.random` state."""
     sample = parabolic_as_determination.data
     distribution = sample[:len(sample)//2]
     if not len(distribution):
         log.error("Cannot compute half stats. Too few data")
         return np.nan
-    shape = (nresamplings, len(distribution))
-    return np.random.choice(distribution, shape).mean(axis=1).std()
+    rng = np.random.default_rng(boot_seed)
+    return _resampled_mean_std(distribution, nresamplings, rng)[0].std()
 
 
 
@@ -547,6 +624,10 @@ as_datasets_half_sample_stats_error = collect(half_sample_stats_error,
     ['fits_matched_pseudoreplicas_chi2_by_dataset_item',]
 )
 
+as_datasets_bootstrapping_stats_errors = collect(bootstrapping_stats_errors,
+    ['fits_matched_pseudoreplicas_chi2_by_dataset_item',]
+)
+
 
 #Don't write complicated column names everywhere
 ps_mean = "pseudoreplica mean"
@@ -574,18 +655,14 @@ cv_error = "central error"
 
 def pseudoreplicas_stats_error(
         as_datasets_pseudoreplicas_chi2,
-        as_datasets_bootstrapping_stats_error,
-        as_datasets_bootstrapping_stats_error_on_the_error,
-        as_datasets_half_sample_stats_error):
+        as_datasets_bootstrapping_stats_errors):
     """Return a dictionary (easily convertible to a DataFrame) with the mean,
     error and the measures of statistical error for each dataset."""
     d = defaultdict(dict)
 
-    for (distribution, tag), statserr, staterrerr, halfstaterr in zip(
+    for (distribution, tag), (statserr, staterrerr, halfstaterr) in zip(
                 as_datasets_pseudoreplicas_chi2,
-                as_datasets_bootstrapping_stats_error,
-                as_datasets_bootstrapping_stats_error_on_the_error,
-                as_datasets_half_sample_stats_error):
+                as_datasets_bootstrapping_stats_errors):
         d[ps_mean][tag] = distribution.location
         d[n][tag] = len(distribution.data)
         d[ps_error][tag] = distribution.scale
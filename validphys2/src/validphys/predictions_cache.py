@@ -0,0 +1,253 @@
+"""
+predictions_cache.py
+
+An opt-in persistent store for the theory predictions computed in
+:py:mod:`validphys.convolution`, so that they can be reused between
+different validphys runs.
+
+The store is enabled by setting the environment variable
+``VP_PREDICTIONS_CACHE`` (or the ``predictions_cache_path`` key of the
+nnprofile) to a folder. The maximum size of the store in MB can be set with
+``VP_PREDICTIONS_CACHE_MAX_SIZE`` (or ``predictions_cache_max_size``), the
+least recently used entries are removed when the limit is exceeded. The size
+of the store is only scanned the first time an entry is written, after that a
+running total is kept, so entries written by other processes are only noticed
+the next time the store is pruned.
+
+Entries are addressed by a hash of everything that determines the predictions:
+the content of the FKTables and CFactors, the operation combining the
+FKTables, the cuts, the PDF (name and content of the ``.info`` file and of the member
+files) and the kind of prediction (full, central or linear). The content of
+every file is hashed once per process for each size and modification time of
+the file. Every entry is an uncompressed ``.npz`` file which is
+written to a temporary file and atomically renamed, so the store can be shared
+by concurrent processes.
+"""
+import functools
+import hashlib
+import logging
+import os
+import pathlib
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from validphys.core import PDF
+
+log = logging.getLogger(__name__)
+
+CACHE_PATH_VARIABLE = "VP_PREDICTIONS_CACHE"
+CACHE_SIZE_VARIABLE = "VP_PREDICTIONS_CACHE_MAX_SIZE"
+DEFAULT_MAX_SIZE_MB = 2048
+
+# Kinds of predictions that can be stored
+KINDS = ("full", "central", "linear")
+
+_BLOCK_SIZE = 1 << 20
+
+
+@functools.lru_cache(maxsize=None)
+def _file_digest(path, mtime_ns, size):
+    """Hash of the content of a file. The modification time and size are part
+    of the arguments so that the memoization is invalidated when the file changes."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(_BLOCK_SIZE), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def file_digest(path):
+    """Hash of the content of the file at ``path``, computed once per process
+    for each version of the file"""
+    st = os.stat(path)
+    return _file_digest(str(path), st.st_mtime_ns, st.st_size)
+
+
+def pdf_digest(pdf):
+    """Hash identifying a PDF set: its name and the content of the ``.info`` file
+    and of every member file. The content of each file is hashed once per process
+    for each version of the file (see :py:func:`file_digest`), so only the files
+    that changed are read again."""
+    info = pdf.infopath
+    h = hashlib.sha256(pdf.name.encode())
+    h.update(file_digest(info).encode())
+    for member in sorted(info.parent.glob("*.dat")):
+        h.update(f"{member.name}:{file_digest(member)}".encode())
+    return h.hexdigest()
+
+
+def predictions_key(dataset, pdf, kind):
+    """Content hash of everything that determines the predictions of ``kind``
+    for ``dataset`` with ``pdf``"""
+    if kind not in KINDS:
+        raise ValueError(f"Unknown kind of predictions {kind}, expected one of {KINDS}")
+    h = hashlib.sha256()
+    h.update(kind.encode())
+    h.update(dataset.op.encode())
+    for fk in dataset.fkspecs:
+        if fk.use_fixed_predictions:
+            h.update(b"fixed:" + file_digest(fk.fixed_predictions_path).encode())
+        else:
+            h.update(b"fktable:" + file_digest(fk.fkpath).encode())
+            for cfactor in fk.cfactors:
+                h.update(b"cfactor:" + file_digest(cfactor).encode())
+    cuts = np.ascontiguousarray(dataset.cuts.load(), dtype=np.int64)
+    h.update(b"cuts:" + hashlib.sha256(cuts.tobytes()).hexdigest().encode())
+    h.update(b"pdf:" + pdf_digest(pdf).encode())
+    return h.hexdigest()
+
+
+def _storable(index):
+    """Array with the labels of a pandas index that can be loaded without pickling"""
+    arr = np.asarray(index)
+    if arr.dtype == object:
+        if not all(isinstance(i, str) for i in arr):
+            raise ValueError(f"Cannot store labels of mixed types: {index}")
+        arr = arr.astype(str)
+    return arr
+
+
+class PredictionsCache:
+    """A folder of stored predictions with a maximum size in bytes"""
+
+    def __init__(self, path, max_size=DEFAULT_MAX_SIZE_MB * 1024**2):
+        self.path = pathlib.Path(path)
+        self.max_size = max_size
+        # Running total of the size of the store, scanned on the first write
+        self._size = None
+
+    def _entry_path(self, key):
+        return self.path / key[:2] / f"{key}.npz"
+
+    def entries(self):
+        """List of the stored files, least recently used first"""
+        if not self.path.is_dir():
+            return []
+        entries = []
+        for p in self.path.glob("*/*.npz"):
+            try:
+                st = p.stat()
+            except FileNotFoundError:
+                # Removed by another process
+                continue
+            entries.append((st.st_mtime, st.st_size, p))
+        entries.sort()
+        return [(p, size) for _, size, p in entries]
+
+    def stats(self):
+        """Number of entries and total size in bytes of the store"""
+        entries = self.entries()
+        return {"entries": len(entries), "size": sum(size for _, size in entries)}
+
+    def get(self, key):
+        """Return the stored dataframe for ``key`` or None if not present"""
+        path = self._entry_path(key)
+        try:
+            with np.load(path, allow_pickle=False) as f:
+                index = pd.Index(f["index"], name=str(f["index_name"]) or None)
+                df = pd.DataFrame(f["values"], index=index, columns=f["columns"])
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError) as e:
+            log.warning("Removing unreadable predictions cache entry %s: %s", path, e)
+            path.unlink(missing_ok=True)
+            return None
+        # Mark the entry as recently used
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        return df
+
+    def put(self, key, df):
+        """Store the dataframe ``df`` under ``key``, pruning the store if
+        it grows above the maximum size"""
+        path = self._entry_path(key)
+        if self._size is None:
+            self._size = self.stats()["size"]
+        try:
+            replaced = path.stat().st_size
+        except FileNotFoundError:
+            replaced = 0
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.savez(
+                    f,
+                    values=df.to_numpy(),
+                    index=_storable(df.index),
+                    index_name=np.asarray(str(df.index.name or "")),
+                    columns=_storable(df.columns),
+                )
+            size = os.stat(tmp).st_size
+            os.replace(tmp, path)
+        except ValueError as e:
+            # e.g. columns of mixed types, which cannot be stored without pickling
+            log.debug("Predictions for %s cannot be cached: %s", key, e)
+            os.unlink(tmp)
+            return
+        except BaseException:
+            os.unlink(tmp)
+            raise
+        self._size += size - replaced
+        if self._size > self.max_size:
+            self.prune()
+
+    def prune(self, max_size=None):
+        """Remove the least recently used entries until the store is below
+        ``max_size`` bytes (by default the size of the store). Returns the number
+        of removed entries."""
+        if max_size is None:
+            max_size = self.max_size
+        entries = self.entries()
+        total = sum(size for _, size in entries)
+        removed = 0
+        for p, size in entries:
+            if total <= max_size:
+                break
+            p.unlink(missing_ok=True)
+            total -= size
+            removed += 1
+        self._size = total
+        return removed
+
+    def cached(self, dataset, pdf, kind, compute):
+        """Return the predictions of ``kind`` from the store, or compute them
+        with ``compute()`` and store them"""
+        # PDFs that only exist in memory, such as the n3fit models, are never stored
+        if type(pdf) is not PDF:
+            return compute()
+        key = predictions_key(dataset, pdf, kind)
+        df = self.get(key)
+        if df is not None:
+            log.debug("Loaded %s predictions for %s with %s from the cache", kind, dataset, pdf)
+            return df
+        df = compute()
+        self.put(key, df)
+        return df
+
+
+@functools.lru_cache()
+def get_predictions_cache():
+    """Return the :py:class:`PredictionsCache` configured through the environment
+    or the nnprofile, or None if the store is not enabled"""
+    path = os.environ.get(CACHE_PATH_VARIABLE)
+    max_size = os.environ.get(CACHE_SIZE_VARIABLE)
+    if path is None:
+        from validphys.loader import LoaderError, _get_nnpdf_profile
+
+        try:
+            profile = _get_nnpdf_profile()
+        except LoaderError:
+            return None
+        path = profile.get("predictions_cache_path")
+        if max_size is None:
+            max_size = profile.get("predictions_cache_max_size")
+    if not path:
+        return None
+    if max_size is None:
+        max_size = DEFAULT_MAX_SIZE_MB
+    return PredictionsCache(path, max_size=float(max_size) * 1024**2)
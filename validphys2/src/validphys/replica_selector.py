@@ -16,9 +16,9 @@ from reportengine.checks import check_positive, make_argcheck, check
 from reportengine.table import table
 from reportengine.figure import figuregen
 
-from validphys.pdfbases import flavour
+from validphys.pdfbases import evolution, flavour
 from validphys.pdfoutput import pdfset
-from validphys.lhio import new_pdf_from_indexes
+from validphys.lhio import link_or_copy, new_pdf_from_indexes
 from validphys.checks import check_pdf_is_montecarlo, check_scale
 from validphys.core import PDF
 from validphys.pdfplots import ReplicaPDFPlotter
@@ -43,6 +43,14 @@ def _fixup_new_replica(alphas_pdf: PDF, new_replica_file):
         out_stream.write(f"AlphaS_MZ: {AlphaS_MZ}\nAlphaS_Vals: {AlphaS_Vals}\n".encode())
         out_stream.write(data)
 
+def _link_grid_or_copy(source, target):
+    """Link the ``.dat`` grids with :py:func:`validphys.lhio.link_or_copy` and
+    copy everything else, which might be edited afterwards"""
+    if str(source).endswith('.dat'):
+        link_or_copy(source, target)
+    else:
+        shutil.copy2(source, target)
+
 @make_argcheck
 def _check_target_name(target_name):
     """Make sure this specifies a name and not some kid of path"""
@@ -93,8 +101,11 @@ def alpha_s_bundle_pdf(pdf, pdfs, output_path, target_name: (str, type(None)) =
     with tempfile_cleaner(
         root=output_path, exit_func=shutil.rmtree, exc=KeyboardInterrupt
     ) as tempdir:
-        # Copy the base pdf into the temporary directory
-        temp_pdf = shutil.copytree(base_pdf_path, tempdir / pdf.name)
+        # Copy the base pdf into the temporary directory. The member grids are
+        # not modified so they are linked when possible
+        temp_pdf = shutil.copytree(
+            base_pdf_path, tempdir / pdf.name, copy_function=_link_grid_or_copy
+        )
 
         # Copy the alphas PDF replica0s into the new PDF
         for i, (alphas_pdf, rep) in enumerate(zip(pdfs, alphas_replica0s)):
@@ -130,12 +141,21 @@ def alpha_s_bundle_pdf(pdf, pdfs, output_path, target_name: (str, type(None)) =
 
 
 @check_positive('Q')
-def gluon_values(pdf, Q, xgrid):
-    """Return the x*gluon values of the PDF at Q and for each element in xgrid."""
+def gluon_values(pdf, Q, xgrid, xplotting_grid):
+    """Return the x*gluon values of the replicas of the PDF at Q and for each
+    element in xgrid. The values are taken from ``xplotting_grid`` when it contains the gluon at
+    the same Q and x, so that the PDF is only evaluated once for all the selection criteria."""
     scale, x = xgrid
+    if (
+        xplotting_grid.Q == Q
+        and xplotting_grid.basis in (flavour, evolution)
+        and 'g' in list(xplotting_grid.flavours)
+        and np.array_equal(xplotting_grid.xgrid, x)
+    ):
+        return xplotting_grid.select_flavour('g').grid_values.error_members()
     grid = flavour.grid_values(pdf, ['g'], x, Q)
-    #Remove Q and flavour axes
-    return grid.reshape((grid.shape[0], grid.shape[2]))
+    #Remove Q and flavour axes and replica 0, like ``error_members`` above
+    return grid.reshape((grid.shape[0], grid.shape[2]))[1:]
 
 
 @check_positive('range_percent')
@@ -199,24 +219,12 @@ def _filter_exponents(values, xgrid, max_allowed_diff):
     if len(values.shape) == 2:
         values = values[:, np.newaxis, :]
     exps = _get_exponent_along_xgrid(values, xgrid)
-    reshaped = exps.reshape(
-        values.shape[0] * values.shape[1], values.shape[2]).T
-    #Throw away negative stuff
-    with warnings.catch_warnings():
-        warnings.simplefilter('ignore')
-        #polyfit throws an MKL error if the inputs are NaNs. While the outputs
-        #are also nans as expected, and while probably an overkill,
-        #I couldn't find in the documentation that
-        #this must be the case, so just set bogus values manually.
-        nanmask = np.isnan(reshaped).any(axis=0)
-        #bogus values.
-        reshaped[:, nanmask] = -1000
-        fitted_exps = (np.polyfit(xgrid, reshaped, 0))
-        fitted_exps[:, nanmask] = np.nan
-        fitted_exps = fitted_exps.reshape(values.shape[0], values.shape[1])
-        mask = (
-            np.abs(exps - fitted_exps[..., np.newaxis]).max(axis=2) <
-            max_allowed_diff).all(axis=1)
+    # The least squares fit of a constant is the mean. Replicas with
+    # negative values (and therefore NaN exponents) get a NaN fit and fail the
+    # comparison below.
+    fitted_exps = exps.mean(axis=2, keepdims=True)
+    with np.errstate(invalid='ignore'):
+        mask = (np.abs(exps - fitted_exps).max(axis=2) < max_allowed_diff).all(axis=1)
     return mask
 
 
@@ -229,7 +237,7 @@ def frozen_exponents_mask(
     x^ in the uncinstrained region."""
     lim = unconstrained_region_index
     x = xplotting_grid.xgrid[:lim]
-    gv = xplotting_grid.grid_values[..., :lim]
+    gv = xplotting_grid.grid_values.error_members()[..., :lim]
     return _filter_exponents(gv, x, max_allowed_diff=max_allowed_diff)
 
 
@@ -26,12 +26,13 @@ from validphys.checks import (
 )
 
 from validphys.core import DataSetSpec, PDF, DataGroupSpec, Stats
+from validphys.covmats_utils import BlockLowRankMatrix
 from validphys.calcutils import (
-    all_chi2,
-    central_chi2,
     calc_chi2,
     calc_phi,
+    dense_sqrtcov,
     bootstrap_values,
+    results_chi2,
 )
 from validphys.convolution import (
     predictions,
@@ -97,6 +98,8 @@ class DataResult(StatsResult):
 
     @property
     def std_error(self):
+        if isinstance(self.covmat, BlockLowRankMatrix):
+            return np.sqrt(self.covmat.diagonal())
         return np.sqrt(np.diag(self.covmat))
 
     @property
@@ -497,8 +500,7 @@ def experiments_sqrtcovmat(
         experiments_data, experiments_sqrt_covmat
     ):
         name = experiment.name
-        experiments_sqrt_covmat[np.triu_indices_from(experiments_sqrt_covmat, k=1)] = 0
-        df.loc[[name], [name]] = experiments_sqrt_covmat
+        df.loc[[name], [name]] = np.tril(dense_sqrtcov(experiments_sqrt_covmat))
     return df
 
 
@@ -634,9 +636,8 @@ def abs_chi2_data(results):
     given dataset"""
     data_result, th_result = results
 
-    chi2s = all_chi2(results)
-
-    central_result = central_chi2(results)
+    # The members and the central value are solved for at once
+    chi2s, central_result = results_chi2(data_result, th_result)
 
     return Chi2Data(
         th_result.stats_class(chi2s[:, np.newaxis]), central_result, len(data_result)
@@ -973,6 +974,53 @@ groups_datasets_chi2_data = collect(
 fits_datasets_chi2_data = collect("groups_datasets_chi2_data", ("fits", "fitcontext"))
 
 
+def datasets_replica_chi2_frame(groups, groups_datasets_chi2):
+    """Tidy table with the χ² of each member of the PDF to each dataset, indexed
+    by group, dataset and replica, with columns ``npoints`` and ``chi2``.
+    Replica 0 holds the χ² of the central prediction and the rest the χ² of
+    each error member. ``groups_datasets_chi2`` contains the
+    :py:class:`Chi2Data` for each dataset of each group."""
+    labels = []
+    npoints = []
+    chi2s = []
+    for group, dsets_chi2 in zip(groups, groups_datasets_chi2):
+        for dataset, chi2 in zip(group.datasets, dsets_chi2):
+            values = np.concatenate(
+                [np.atleast_1d(chi2.central_result), chi2.replica_result.error_members().ravel()]
+            )
+            labels.append((str(group), str(dataset), len(values)))
+            npoints.append(np.full(len(values), chi2.ndata))
+            chi2s.append(values)
+    index = pd.MultiIndex.from_arrays(
+        [
+            np.repeat([group for group, _, _ in labels], [n for _, _, n in labels]),
+            np.repeat([dataset for _, dataset, _ in labels], [n for _, _, n in labels]),
+            np.concatenate([np.arange(n) for _, _, n in labels]),
+        ],
+        names=["group", "dataset", "replica"],
+    )
+    return pd.DataFrame(
+        {"npoints": np.concatenate(npoints), "chi2": np.concatenate(chi2s)}, index=index
+    )
+
+
+@table
+def fits_replica_chi2_table(
+    fits_name_with_covmat_label, fits_groups, fits_datasets_chi2_data
+):
+    """The χ² of each replica of each fit to each of the datasets in the fit, as
+    a tidy table indexed by fit, group, dataset and replica. See
+    :py:func:`datasets_replica_chi2_frame`."""
+    return pd.concat(
+        [
+            datasets_replica_chi2_frame(groups, groups_dsets_chi2)
+            for groups, groups_dsets_chi2 in zip(fits_groups, fits_datasets_chi2_data)
+        ],
+        keys=fits_name_with_covmat_label,
+        names=["fit"],
+    )
+
+
 @table
 def fits_datasets_chi2_table(
     fits_name_with_covmat_label,
@@ -992,25 +1040,9 @@ def fits_datasets_chi2_table(
     for label, groups, groups_dsets_chi2 in zip(
         fits_name_with_covmat_label, fits_groups, fits_datasets_chi2_data
     ):
-        records = []
-        for group, dsets_chi2 in zip(groups, groups_dsets_chi2):
-            for dataset, chi2 in zip(group.datasets, dsets_chi2):
-                ndata = chi2.ndata
-
-                records.append(
-                    dict(
-                        group=str(group),
-                        dataset=str(dataset),
-                        npoints=ndata,
-                        mean_chi2=chi2.central_result.mean(),
-                    )
-                )
-
-        df = pd.DataFrame.from_records(
-            records,
-            columns=("group", "dataset", "npoints", "mean_chi2"),
-            index=("group", "dataset"),
-        )
+        # The central χ² is the replica 0 of the tidy table
+        df = datasets_replica_chi2_frame(groups, groups_dsets_chi2).xs(0, level="replica")
+        df = df.rename(columns={"chi2": "mean_chi2"})
         if per_point_data:
             df["mean_chi2"] /= df["npoints"]
         df.columns = pd.MultiIndex.from_product(([label], cols))
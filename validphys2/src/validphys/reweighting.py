@@ -46,22 +46,40 @@ def chi2_data_for_reweighting_experiments(
     return chi2_data_for_reweighting_experiments_inner
 
 
-def nnpdf_weights_numerator(chi2_data_for_reweighting_experiments):
-    """Compute the numerator of the NNPDF weights. This is useful for P(α),
-    which uses a different normalization."""
+# Maximum number of (alpha, replica) pairs evaluated at once in P(α) scans
+_P_ALPHA_BLOCK_SIZE = 10_000_000
+
+
+def _stacked_chi2(chi2_data_for_reweighting_experiments):
+    """Return the total χ² of each replica, summed over all the reweighting
+    experiments, and the total number of data points. The central member is
+    not included, so the result has one entry per replica 1..N"""
     total_ndata = 0
     chi2s = np.zeros_like(chi2_data_for_reweighting_experiments[0][0].error_members())
     for data in chi2_data_for_reweighting_experiments:
         res, _, ndata = data
         total_ndata += ndata
-        chi2s += res.data
+        chi2s += res.error_members()
+    return np.ravel(chi2s), total_ndata
 
-    chi2s = np.ravel(chi2s)
 
-    logw = ((total_ndata - 1)/2)*np.log(chi2s) - 0.5*chi2s
-    logw -= np.max(logw)
-    w = np.exp(logw)
-    return w
+def _weights_numerator(chi2s, ndata, alphas=1):
+    """Numerator of the NNPDF weights of each replica for the total χ²
+    ``chi2s`` rescaled by each of the ``alphas``, normalised so that the largest
+    weight for each alpha is 1. The result has shape ``(len(alphas), nreplicas)``,
+    or ``(nreplicas,)`` for a scalar alpha."""
+    alphas = np.asarray(alphas, dtype=float)
+    scaled = chi2s / alphas[..., np.newaxis] ** 2
+    logw = ((ndata - 1) / 2) * np.log(scaled) - 0.5 * scaled
+    logw -= np.max(logw, axis=-1, keepdims=True)
+    return np.exp(logw)
+
+
+def nnpdf_weights_numerator(chi2_data_for_reweighting_experiments):
+    """Compute the numerator of the NNPDF weights. This is useful for P(α),
+    which uses a different normalization."""
+    chi2s, total_ndata = _stacked_chi2(chi2_data_for_reweighting_experiments)
+    return _weights_numerator(chi2s, total_ndata)
 
 @table
 #will call list[0]
@@ -101,23 +119,25 @@ def reweighting_stats(pdf, nnpdf_weights, p_alpha_study):
 
     return pd.Series(result, index=result.keys(), name='Reweighting stats')
 
-def _get_p_alpha_val(alpha, chi2_data_for_reweighting_experiments):
-     new_chi2 = [((type(res)(res.error_members()/alpha**2)), central, ndata)
-                    for (res,central,ndata) in
-                    chi2_data_for_reweighting_experiments]
+def _p_alpha_values(alphas, chi2s, ndata):
+    """Unnormalised P(α) for every alpha in ``alphas``, computed in blocks of
+    alphas so that memory is bounded for large numbers of replicas"""
+    alphas = np.atleast_1d(np.asarray(alphas, dtype=float))
+    block = max(1, _P_ALPHA_BLOCK_SIZE // len(chi2s))
+    vals = np.empty(len(alphas))
+    for i in range(0, len(alphas), block):
+        sl = slice(i, i + block)
+        vals[sl] = np.sum(_weights_numerator(chi2s, ndata, alphas[sl]), axis=1) / alphas[sl]
+    return vals
 
-     new_ws = nnpdf_weights_numerator(new_chi2)
-     val = np.sum(new_ws / alpha)
-     return val
 
+def _get_p_alpha_val(alpha, chi2_data_for_reweighting_experiments):
+    return _get_p_alpha_vals([alpha], chi2_data_for_reweighting_experiments)[0]
 
-def _get_p_alpha_vals(alphas, chi2_data_for_reweighting_experiments):
-    vals = []
-    for alpha in alphas:
-        val = _get_p_alpha_val(alpha, chi2_data_for_reweighting_experiments)
-        vals.append(val)
 
-    return vals
+def _get_p_alpha_vals(alphas, chi2_data_for_reweighting_experiments):
+    chi2s, ndata = _stacked_chi2(chi2_data_for_reweighting_experiments)
+    return _p_alpha_values(alphas, chi2s, ndata)
 
 
 def p_alpha_study(chi2_data_for_reweighting_experiments):
@@ -127,7 +147,8 @@ def p_alpha_study(chi2_data_for_reweighting_experiments):
 
     small = 0.5
 
-    f = lambda alpha: -_get_p_alpha_val(alpha, chi2_data_for_reweighting_experiments)
+    chi2s, ndata = _stacked_chi2(chi2_data_for_reweighting_experiments)
+    f = lambda alpha: -_p_alpha_values(alpha, chi2s, ndata)[0]
     #Ignore warnings for nonsensical alphas
     with warnings.catch_warnings():
         warnings.simplefilter('ignore')
@@ -158,10 +179,10 @@ def p_alpha_study(chi2_data_for_reweighting_experiments):
 
 
     alphas = np.linspace(small, big, 1000)
-    vals = _get_p_alpha_vals(alphas, chi2_data_for_reweighting_experiments)
+    vals = _p_alpha_values(alphas, chi2s, ndata)
 
 
-    return pd.Series(np.array(vals), index=alphas)
+    return pd.Series(vals, index=alphas)
 
 @figure
 def plot_p_alpha(p_alpha_study):
@@ -185,10 +206,18 @@ def plot_p_alpha(p_alpha_study):
 def unweighted_index(nnpdf_weights, nreplicas:int=100):
     """The index of the input replicas that corresponds to an unweighted set,
     for the given weights. This can be saved for testing purposes."""
-    nnpdf_weights = np.ravel(nnpdf_weights)
-    res = 1 + np.random.choice(len(nnpdf_weights), size=nreplicas, p=nnpdf_weights)
+    res = 1 + _sample_replicas(np.ravel(nnpdf_weights), nreplicas)
     return pd.DataFrame(res, index=np.arange(1,nreplicas+1))
 
+def _sample_replicas(weights, nreplicas):
+    """Draw ``nreplicas`` indexes with probability proportional to ``weights``,
+    by inverting the cumulative distribution of the weights"""
+    cdf = np.cumsum(weights)
+    cdf /= cdf[-1]
+    res = np.searchsorted(cdf, np.random.random_sample(nreplicas), side='right')
+    # Guard against rounding in the last bin
+    return np.minimum(res, len(weights) - 1)
+
 @pdfset
 @checks.check_can_save_grid
 def make_unweighted_pdf(pdf, unweighted_index,
@@ -19,16 +19,20 @@ import shutil
 import pathlib
 import argparse
 import itertools
+import contextlib
+import json
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
 from glob import glob
 import logging
 
 import lhapdf
+import numpy as np
 
 from reportengine import colors
 from validphys import lhio
 from validphys import fitdata
 from validphys import fitveto
-from validphys.core import PDF
 from validphys.fitveto import NSIGMA_DISCARD_ARCLENGTH, NSIGMA_DISCARD_CHI2, INTEG_THRESHOLD
 from validphys.utils import tempfile_cleaner
 
@@ -36,6 +40,10 @@ log = logging.getLogger()
 log.setLevel(logging.DEBUG)
 log.addHandler(colors.ColorHandler())
 
+# Files written to the postfit folder so that it can be updated incrementally
+STATE_FILE = "postfit_state.json"
+CENTRAL_SUM_FILE = "postfit_central_sum.npz"
+
 
 def splash():
     print("                                                        ")
@@ -71,29 +79,122 @@ class FatalPostfitError(Exception):
     """Exception raised when some corrupted input is detected"""
     pass
 
-def filter_replicas(postfit_path, nnfit_path, fitname, chi2_threshold, arclength_threshold, integ_threshold):
+def _replica_signature(path, fitname):
+    """Size and modification time of the files of the replica at ``path``,
+    used to detect the replicas that changed since they were last validated"""
+    names = fitdata.LITERAL_FILES + [fitname + suffix for suffix in fitdata.REPLICA_FILES]
+    signature = []
+    for name in names:
+        try:
+            st = (path / name).stat()
+        except FileNotFoundError:
+            signature.append(None)
+        else:
+            signature.append([st.st_mtime_ns, st.st_size])
+    return signature
+
+
+def _fitinfo_to_json(fitinfo):
+    return {
+        **fitinfo._asdict(),
+        "is_positive": bool(fitinfo.is_positive),
+        "arclengths": np.asarray(fitinfo.arclengths).tolist(),
+        "integnumbers": np.asarray(fitinfo.integnumbers).tolist(),
+    }
+
+
+def _fitinfo_from_json(fitinfo):
+    return fitdata.FitInfo(
+        **{
+            **fitinfo,
+            "arclengths": np.array(fitinfo["arclengths"]),
+            "integnumbers": np.array(fitinfo["integnumbers"]),
+        }
+    )
+
+
+def _validate_replica(path, fitname):
+    """Check the files of the replica at ``path`` and load its fit information.
+    Returns None if the replica is not complete."""
+    if not fitdata.check_replica_files(path, fitname):
+        return None
+    try:
+        return _fitinfo_to_json(fitdata.load_fitinfo(pathlib.Path(path), fitname))
+    except Exception as e:
+        raise FatalPostfitError(
+            f"Corrupted replica replica at {path}. "
+            f"Error when loading replica information:\n {e}") from e
+
+
+def validate_replicas(replica_paths, fitname, state=None, max_workers=None):
+    """Validate the replicas in ``replica_paths`` and load their fit information.
+
+    Replicas found in ``state`` (as returned by a previous call) whose files have
+    not changed since are not read again. The rest are validated in a pool of
+    ``max_workers`` processes.
+
+    Returns
+    -------
+    state: dict
+        For each replica directory name, the signature of its files and its fit
+        information as a dictionary, or None if the replica is not valid.
+    """
+    state = state or {}
+    new_state = {}
+    pending = []
+    for path in replica_paths:
+        name = pathlib.Path(path).name
+        signature = _replica_signature(pathlib.Path(path), fitname)
+        previous = state.get(name)
+        if previous is not None and previous["signature"] == signature:
+            new_state[name] = previous
+        else:
+            pending.append((path, name, signature))
+    log.info(f"{len(new_state)} replicas already validated, validating {len(pending)} replicas")
+
+    paths = [path for path, _, _ in pending]
+    if max_workers == 1 or len(paths) <= 1:
+        fitinfos = [_validate_replica(path, fitname) for path in paths]
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            fitinfos = list(executor.map(_validate_replica, paths, itertools.repeat(fitname)))
+    for (_, name, signature), fitinfo in zip(pending, fitinfos):
+        new_state[name] = {"signature": signature, "fitinfo": fitinfo}
+    # Keep the same order as replica_paths
+    return {pathlib.Path(path).name: new_state[pathlib.Path(path).name] for path in replica_paths}
+
+
+def filter_replicas(
+    postfit_path,
+    nnfit_path,
+    fitname,
+    chi2_threshold,
+    arclength_threshold,
+    integ_threshold,
+    state=None,
+    max_workers=None,
+):
     """ Find the paths of all replicas passing the standard NNPDF fit vetoes
-    as defined in fitveto.py. Returns a list of the replica directories that pass."""
+    as defined in fitveto.py. Returns a list of the replica directories that pass
+    together with the validation state of all the replicas, see
+    :py:func:`validate_replicas`."""
     # This glob defines what is considered a valid replica
     # all the following code uses paths from this glob
     # We sort the paths so that the selection of replicas is deterministic
     all_replicas   = sorted(glob(f"{nnfit_path}/replica_*/"))
-    valid_paths = [path for path in all_replicas if fitdata.check_replica_files(path, fitname)]
+    state = validate_replicas(all_replicas, fitname, state, max_workers)
+    valid_paths = [
+        path for path in all_replicas if state[pathlib.Path(path).name]["fitinfo"] is not None
+    ]
     log.info(f"{len(all_replicas)} total replicas found")
     log.info(f"{len(valid_paths)} valid replicas found")
 
     if len(valid_paths) == 0:
         raise PostfitError("No valid replicas found")
 
-    # Read FitInfo and compute vetoes
-    fitinfo = []
-    for path in valid_paths:
-        try:
-            fitinfo.append(fitdata.load_fitinfo(pathlib.Path(path), fitname))
-        except Exception as e:
-            raise FatalPostfitError(
-                f"Corrupted replica replica at {path}. "
-                f"Error when loading replica information:\n {e}") from e
+    # The vetoes depend on the distribution over all replicas, so they are always
+    # recomputed from the (cheap) fit information
+    fitinfo = [_fitinfo_from_json(state[pathlib.Path(path).name]["fitinfo"]) for path in valid_paths]
     fit_vetoes = fitveto.determine_vetoes(fitinfo, chi2_threshold, arclength_threshold, integ_threshold)
     fitveto.save_vetoes_info(
         fit_vetoes, chi2_threshold, arclength_threshold, integ_threshold, postfit_path / "veto_count.json"
@@ -102,7 +203,141 @@ def filter_replicas(postfit_path, nnfit_path, fitname, chi2_threshold, arclength
     for key in fit_vetoes:
         log.info("%d replicas pass %s" % (sum(fit_vetoes[key]), key))
     passing_paths = list(itertools.compress(valid_paths, fit_vetoes["Total"]))
-    return passing_paths
+    return passing_paths, state
+
+
+def update_symlinks(postfit_path, LHAPDF_path, fitname, selected_paths):
+    """Point ``replica_<i>`` in the postfit folder and the members of the LHAPDF set
+    to the selected replicas. Only the links that do not point to the right
+    replica are rewritten, and links beyond the number of selected replicas are
+    removed. Returns the number of links written."""
+    targets = {}
+    for drep, source_path in enumerate(selected_paths, 1):
+        source_dir = pathlib.Path(source_path).resolve()
+        targets[postfit_path / f'replica_{drep}'] = source_dir
+        targets[LHAPDF_path / f'{fitname}_{drep:04d}.dat'] = source_dir / f'{fitname}.dat'
+
+    existing = itertools.chain(postfit_path.glob('replica_*'), LHAPDF_path.glob(f'{fitname}_*.dat'))
+    for path in existing:
+        # Replica 0 is a regular file
+        if path.is_symlink() and path not in targets:
+            path.unlink()
+
+    written = 0
+    for dest, source in targets.items():
+        if dest.is_symlink():
+            if os.readlink(dest) == os.path.relpath(source, dest.parent):
+                continue
+            dest.unlink()
+        relative_symlink(source, dest)
+        written += 1
+    return written
+
+
+def _member_sum(paths):
+    """Sum over the members in the LHAPDF files at ``paths``"""
+    return lhio.stack_replica_files(paths).map_values(lambda v: v.sum(axis=0, keepdims=True))
+
+
+def _save_central_sum(path, names, grid):
+    arrays = {"selected": np.array(names, dtype=str)}
+    for i, subgrid in enumerate(grid.subgrids):
+        arrays[f"xgrid_{i}"] = subgrid.xgrid
+        arrays[f"qgrid_{i}"] = subgrid.qgrid
+        arrays[f"flavours_{i}"] = subgrid.flavours
+        arrays[f"values_{i}"] = subgrid.values
+    with open(path, "wb") as f:
+        np.savez(f, **arrays)
+
+
+def _load_central_sum(path):
+    """Return the names of the replicas and the sum of their grids saved with
+    ``_save_central_sum``, or None if not available"""
+    try:
+        with np.load(path, allow_pickle=False) as f:
+            names = f["selected"].tolist()
+            subgrids = [
+                lhio.SubGrid(f[f"xgrid_{i}"], f[f"qgrid_{i}"], f[f"flavours_{i}"], f[f"values_{i}"])
+                for i in range(sum(1 for key in f.files if key.startswith("values_")))
+            ]
+    except (OSError, ValueError, KeyError) as e:
+        log.warning(f"Cannot load the sum of the replicas at {path}: {e}")
+        return None
+    return names, lhio.LHAPDFGrid(subgrids)
+
+
+def update_central_sum(nnfit_path, fitname, selected_paths, previous=None, unchanged=()):
+    """Sum of the grids of the selected replicas, from which replica 0 is computed.
+
+    If ``previous`` contains the names of the replicas and the sum returned by a
+    previous call, and all those replicas are in ``unchanged``, the sum is
+    updated by adding the newly selected replicas and subtracting the ones that
+    are no longer selected, instead of reading all the grids again.
+    """
+    names = [pathlib.Path(path).name for path in selected_paths]
+
+    def grid_file(name):
+        return nnfit_path / name / f'{fitname}.dat'
+
+    if previous is not None:
+        old_names, old_sum = previous
+        added = [name for name in names if name not in set(old_names)]
+        removed = [name for name in old_names if name not in set(names)]
+        if set(old_names) <= set(unchanged) and len(added) + len(removed) < len(names):
+            log.info(
+                f"Updating replica 0 with {len(added)} new and {len(removed)} removed replicas"
+            )
+            new_sum = old_sum
+            try:
+                if added:
+                    added_sum = _member_sum([grid_file(name) for name in added])
+                    new_sum = lhio.LHAPDFGrid.stack([new_sum, added_sum]).map_values(
+                        lambda v: v.sum(axis=0, keepdims=True)
+                    )
+                if removed:
+                    removed_sum = _member_sum([grid_file(name) for name in removed])
+                    new_sum = lhio.LHAPDFGrid.stack([new_sum, removed_sum]).map_values(
+                        lambda v: v[:1] - v[1:]
+                    )
+                return new_sum
+            except ValueError as e:
+                log.warning(f"Cannot update replica 0 incrementally: {e}")
+    log.info(f"Averaging {len(names)} replicas for replica 0")
+    return _member_sum([grid_file(name) for name in names])
+
+
+def _load_state(postfit_path):
+    try:
+        with open(postfit_path / STATE_FILE) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _save_state(postfit_path, state):
+    tmp = postfit_path / f"{STATE_FILE}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(state, f)
+    os.replace(tmp, postfit_path / STATE_FILE)
+
+@contextlib.contextmanager
+def incremental_workdir(result_path, final_postfit_path):
+    """Copy of the existing postfit folder in which it is updated. The copy is
+    renamed into place only once the update has succeeded, so an interrupted or
+    failed update leaves the existing postfit folder untouched. The copy lives
+    next to the postfit folder, so the relative symlinks stay valid."""
+    workdir = pathlib.Path(tempfile.mkdtemp(prefix="postfit_work_deleteme_", dir=result_path))
+    try:
+        shutil.copytree(final_postfit_path, workdir, symlinks=True, dirs_exist_ok=True)
+        yield workdir
+    except BaseException:
+        shutil.rmtree(workdir)
+        raise
+    old_postfit_path = workdir.with_name(f"{workdir.name}_old")
+    os.rename(final_postfit_path, old_postfit_path)
+    os.rename(workdir, final_postfit_path)
+    shutil.rmtree(old_postfit_path)
+
 
 def type_fitname(fitname: str):
     """ Ensure the sanity of the fitname """
@@ -118,22 +353,46 @@ def type_fitname(fitname: str):
     return fitpath
 
 
-def _postfit(results: str, nrep: int, chi2_threshold: float, arclength_threshold: float, integ_threshold: float, at_least_nrep: bool):
+def _postfit(
+    results: str,
+    nrep: int,
+    chi2_threshold: float,
+    arclength_threshold: float,
+    integ_threshold: float,
+    at_least_nrep: bool,
+    incremental: bool = False,
+    jobs: int = None,
+):
     result_path = pathlib.Path(results).resolve()
     fitname = result_path.name
 
     # Paths
     nnfit_path   = result_path / 'nnfit'    # Path of nnfit replica output
     final_postfit_path = result_path / 'postfit'
-    # Create a temporary path to store work in progress and move it to
-    # the final location in the end,
-    with tempfile_cleaner(
-        root=result_path,
-        exit_func=shutil.move,
-        exc=(KeyboardInterrupt, PostfitError),
-        prefix="postfit_work_deleteme_",
-        dst=final_postfit_path,
-    ) as postfit_path:
+
+    previous_state = None
+    if incremental:
+        previous_state = _load_state(final_postfit_path)
+        if previous_state is None or previous_state.get("fitname") != fitname:
+            log.warning("No previous postfit state found, running the full postfit")
+            previous_state = None
+
+    if previous_state is None:
+        # Create a temporary path to store work in progress and move it to
+        # the final location in the end,
+        workdir = tempfile_cleaner(
+            root=result_path,
+            exit_func=shutil.move,
+            exc=(KeyboardInterrupt, PostfitError),
+            prefix="postfit_work_deleteme_",
+            dst=final_postfit_path,
+        )
+    else:
+        # A copy of the existing postfit folder is updated and then moved into place
+        log.info(f"Updating the existing postfit folder: {final_postfit_path}")
+        workdir = incremental_workdir(result_path, final_postfit_path)
+
+    with workdir as postfit_path:
 
         LHAPDF_path  = postfit_path/fitname     # Path for LHAPDF grid output
 
@@ -152,18 +411,30 @@ def _postfit(results: str, nrep: int, chi2_threshold: float, arclength_threshold
         else:
             log.warning(f"Postfit aiming for {nrep} replicas")
 
-        # Generate postfit and LHAPDF directory
-        if final_postfit_path.is_dir():
-            log.warning(f"Removing existing postfit directory: {final_postfit_path}")
-            shutil.rmtree(final_postfit_path)
-        os.mkdir(LHAPDF_path)
+        if previous_state is None:
+            # Generate postfit and LHAPDF directory
+            if final_postfit_path.is_dir():
+                log.warning(f"Removing existing postfit directory: {final_postfit_path}")
+                shutil.rmtree(final_postfit_path)
+            os.mkdir(LHAPDF_path)
 
         # Setup postfit log
-        postfitlog = logging.FileHandler(postfit_path/'postfit.log', mode='w')
+        postfitlog = logging.FileHandler(
+            postfit_path/'postfit.log', mode='w' if previous_state is None else 'a'
+        )
         log.addHandler(postfitlog)
 
         # Perform postfit selection
-        passing_paths = filter_replicas(postfit_path, nnfit_path, fitname, chi2_threshold, arclength_threshold, integ_threshold)
+        passing_paths, replica_state = filter_replicas(
+            postfit_path,
+            nnfit_path,
+            fitname,
+            chi2_threshold,
+            arclength_threshold,
+            integ_threshold,
+            state=previous_state and previous_state["replicas"],
+            max_workers=jobs,
+        )
         if len(passing_paths) < nrep:
             raise PostfitError("Number of requested replicas is too large")
         # Select the first nrep passing replicas
@@ -180,26 +451,46 @@ def _postfit(results: str, nrep: int, chi2_threshold: float, arclength_threshold
         set_lhapdf_info(info_target_path, len(selected_paths))
 
         # Generate symlinks
-        for drep, source_path in enumerate(selected_paths, 1):
-            # Symlink results to postfit directory
-            source_dir = pathlib.Path(source_path).resolve()
-            target_dir = postfit_path.joinpath('replica_%d' % drep)
-            relative_symlink(source_dir, target_dir)
-            # Symlink results to pdfset directory
-            source_grid = source_dir.joinpath(fitname+'.dat')
-            target_file = f'{fitname}_{drep:04d}.dat'
-            target_grid = LHAPDF_path.joinpath(target_file)
-            relative_symlink(source_grid, target_grid)
-
-        log.info(f"{len(selected_paths)} replicas written to the postfit folder")
+        written = update_symlinks(postfit_path, LHAPDF_path, fitname, selected_paths)
+        log.info(
+            f"{len(selected_paths)} replicas written to the postfit folder "
+            f"({written} links updated)"
+        )
 
         # Generate final PDF with replica 0
         log.info("Beginning construction of replica 0")
+        # Replica 0 is kept as the sum over the selected replicas, so that only
+        # the grids of the replicas which changed need to be read in the next run
+        previous_sum = None
+        unchanged = ()
+        if previous_state is not None:
+            previous_sum = _load_central_sum(postfit_path / CENTRAL_SUM_FILE)
+            unchanged = {
+                name
+                for name, replica in replica_state.items()
+                if previous_state["replicas"].get(name) == replica
+            }
+        central_sum = update_central_sum(
+            nnfit_path, fitname, selected_paths, previous_sum, unchanged
+        )
+        central_path = LHAPDF_path / f'{fitname}_0000.dat'
+        central_path.unlink(missing_ok=True)
+        lhio.write_replica(
+            0,
+            LHAPDF_path,
+            lhio.CENTRAL_HEADER,
+            central_sum.map_values(lambda v: v / len(selected_paths)),
+        )
+        _save_central_sum(
+            postfit_path / CENTRAL_SUM_FILE,
+            [pathlib.Path(path).name for path in selected_paths],
+            central_sum,
+        )
+        _save_state(postfit_path, {"fitname": fitname, "replicas": replica_state})
+
         # It's important that this is prepended, so that any existing instance of
         # `fitname` is not read from some other path
         lhapdf.pathsPrepend(str(postfit_path))
-        generatingPDF = PDF(fitname)
-        lhio.generate_replica0(generatingPDF)
 
         # Test replica 0
         try:
@@ -252,6 +543,17 @@ def main():
         action='store_true',
         help="nrep becomes the minimum number of required replicas. If there are more than nrep "
              "good replicas, all good replicas are written to the postfit folder.")
+    parser.add_argument(
+        '--incremental',
+        action='store_true',
+        help="Update an existing postfit folder, validating only the replicas that are new or "
+             "changed since the last run and updating replica 0 with them. A full postfit is "
+             "run if there is no previous postfit state.")
+    parser.add_argument(
+        '-j', '--jobs',
+        type=int,
+        default=None,
+        help="Number of processes used to validate the replicas. By default, the number of CPUs.")
     parser.add_argument('-d', '--debug', action='store_true', help='show debug messages')
     args = parser.parse_args()
     if args.debug:
@@ -259,7 +561,16 @@ def main():
     else:
         log.setLevel(logging.INFO)
     try:
-        _postfit(args.result_path, args.nrep, args.chi2_threshold, args.arclength_threshold, args.integrability_threshold, args.at_least_nrep)
+        _postfit(
+            args.result_path,
+            args.nrep,
+            args.chi2_threshold,
+            args.arclength_threshold,
+            args.integrability_threshold,
+            args.at_least_nrep,
+            incremental=args.incremental,
+            jobs=args.jobs,
+        )
     except PostfitError as e:
         log.error(f"Error in postfit:\n{e}")
         sys.exit(1)
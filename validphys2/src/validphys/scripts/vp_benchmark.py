@@ -0,0 +1,98 @@
+"""
+vp-benchmark
+
+Time the hot paths of validphys and n3fit on synthetic inputs and compare the
+results with a stored baseline (see :py:mod:`validphys.benchmarks`):
+
+    vp-benchmark --size small
+    vp-benchmark --only fkparser.load_fktable pseudodata.make_replica
+    vp-benchmark --size medium --save-baseline --timings --baseline mine.yaml
+    vp-benchmark --size medium --timings --baseline mine.yaml
+
+The command fails if any benchmark fails or gives a different result. Timings
+depend on the machine, so they are only compared with --timings: save a baseline
+with --timings on the machine where the comparison is done before changing the
+code, and the command also fails if a benchmark is slower than the baseline by
+more than the tolerance.
+"""
+import argparse
+import logging
+import sys
+
+from reportengine import colors
+
+from validphys.benchmarks import runner
+
+log = logging.getLogger()
+log.setLevel(logging.INFO)
+log.addHandler(colors.ColorHandler())
+
+
+def main(command_line=None):
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        "--size", choices=list(runner.SIZES), default="small", help="Size of the synthetic inputs"
+    )
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        default=runner.DEFAULT_REPEAT,
+        help="Number of timed runs of each benchmark, after a warm up run",
+    )
+    parser.add_argument("--only", nargs="+", metavar="NAME", help="Run only these benchmarks")
+    parser.add_argument(
+        "--baseline", help="Baseline file, by default the one stored for the given size"
+    )
+    parser.add_argument(
+        "--save-baseline",
+        action="store_true",
+        help="Store the results in the baseline file instead of comparing with it",
+    )
+    parser.add_argument(
+        "--timings",
+        action="store_true",
+        help="Store or compare the timings of the benchmarks as well as their checksums",
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=runner.DEFAULT_TOLERANCE,
+        help="Relative slowdown with respect to the baseline considered a failure "
+        "(only with --timings)",
+    )
+    parser.add_argument("--list", action="store_true", help="List the benchmarks and exit")
+    args = parser.parse_args(command_line)
+
+    runner.load_suite()
+    if args.list:
+        print("\n".join(sorted(runner.BENCHMARKS)))
+        return
+
+    baseline_file = args.baseline or runner.baseline_path(args.size)
+    try:
+        results = runner.run_benchmarks(args.only, args.size, args.repeat)
+    except KeyError as e:
+        log.error(e.args[0])
+        sys.exit(1)
+
+    if args.save_baseline:
+        runner.save_baseline(results, baseline_file, timings=args.timings)
+        log.info("Baseline written to %s", baseline_file)
+        return
+
+    try:
+        baseline = runner.load_baseline(baseline_file)
+    except FileNotFoundError:
+        log.warning("No baseline found at %s", baseline_file)
+        baseline = {}
+    tolerance = args.tolerance if args.timings else None
+    table, failed = runner.report(results, baseline, tolerance)
+    print(table)
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""
+vp-predictions-cache
+
+Manage the persistent store of theory predictions described in
+:py:mod:`validphys.predictions_cache`:
+
+    vp-predictions-cache stats
+    vp-predictions-cache prune --max-size 500
+    vp-predictions-cache clear
+    vp-predictions-cache prewarm runcard.yaml
+
+The runcard used for ``prewarm`` must contain ``dataset_inputs``, ``theoryid``
+and ``pdfs`` (or ``pdf``). The cuts are taken from ``use_cuts`` (``internal`` by
+default) and the kinds of predictions from ``kinds`` (``[full]`` by default).
+"""
+import argparse
+import logging
+import os
+import sys
+
+from reportengine import colors
+
+from validphys import predictions_cache
+from validphys.utils import yaml_safe
+
+log = logging.getLogger()
+log.setLevel(logging.INFO)
+log.addHandler(colors.ColorHandler())
+
+
+def _get_cache():
+    cache = predictions_cache.get_predictions_cache()
+    if cache is None:
+        log.error(
+            "The predictions cache is not enabled. Set %s or use --cache-dir",
+            predictions_cache.CACHE_PATH_VARIABLE,
+        )
+        sys.exit(1)
+    return cache
+
+
+def stats(args):
+    cache = _get_cache()
+    result = cache.stats()
+    print(f"Location: {cache.path}")
+    print(f"Entries: {result['entries']}")
+    print(f"Size: {result['size'] / 1024**2:.1f} MB (limit {cache.max_size / 1024**2:.1f} MB)")
+
+
+def prune(args):
+    cache = _get_cache()
+    max_size = cache.max_size if args.max_size is None else args.max_size * 1024**2
+    removed = cache.prune(max_size)
+    log.info("Removed %d entries from %s", removed, cache.path)
+
+
+def clear(args):
+    cache = _get_cache()
+    removed = cache.prune(0)
+    log.info("Removed %d entries from %s", removed, cache.path)
+
+
+def prewarm(args):
+    from validphys.api import API
+    from validphys.convolution import central_predictions, linear_predictions, predictions
+
+    functions = {"full": predictions, "central": central_predictions, "linear": linear_predictions}
+
+    _get_cache()
+    with open(args.runcard) as f:
+        runcard = yaml_safe.load(f)
+    pdfs = runcard.get("pdfs", [runcard.get("pdf")])
+    kinds = runcard.get("kinds", ["full"])
+    for kind in kinds:
+        if kind not in functions:
+            log.error("Unknown kind of predictions %s, expected one of %s", kind, list(functions))
+            sys.exit(1)
+
+    data = API.data(
+        dataset_inputs=runcard["dataset_inputs"],
+        theoryid=runcard["theoryid"],
+        use_cuts=runcard.get("use_cuts", "internal"),
+    )
+    for pdfname in pdfs:
+        pdf = API.pdf(pdf=pdfname)
+        for dataset in data.datasets:
+            for kind in kinds:
+                log.info("Computing %s predictions for %s with %s", kind, dataset, pdf)
+                functions[kind](dataset, pdf)
+
+
+def main(command_line=None):
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        "--cache-dir",
+        help=f"Location of the store, overrides {predictions_cache.CACHE_PATH_VARIABLE}",
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    subparsers.add_parser("stats", help="Show the number of entries and size of the store")
+
+    prune_parser = subparsers.add_parser(
+        "prune", help="Remove the least recently used entries above the size limit"
+    )
+    prune_parser.add_argument(
+        "--max-size", type=float, help="Size limit in MB, by default the configured one"
+    )
+
+    subparsers.add_parser("clear", help="Remove all the entries")
+
+    prewarm_parser = subparsers.add_parser(
+        "prewarm", help="Compute and store the predictions described in a runcard"
+    )
+    prewarm_parser.add_argument("runcard", help="Runcard with the datasets and PDFs")
+
+    args = parser.parse_args(command_line)
+    if args.cache_dir is not None:
+        os.environ[predictions_cache.CACHE_PATH_VARIABLE] = args.cache_dir
+        predictions_cache.get_predictions_cache.cache_clear()
+
+    {"stats": stats, "prune": prune, "clear": clear, "prewarm": prewarm}[args.command](args)
+
+
+if __name__ == "__main__":
+    main()
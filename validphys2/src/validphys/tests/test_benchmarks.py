@@ -0,0 +1,95 @@
+"""
+test_benchmarks.py
+
+Test the synthetic inputs of the benchmarks and the comparison of their results
+with the stored baselines.
+"""
+import numpy as np
+import pytest
+
+from validphys.benchmarks import hotpaths  # noqa: F401 (registers the benchmarks)
+from validphys.benchmarks import runner, synthetic
+from validphys.fkparser import open_fkpath, parse_fktable
+
+
+@pytest.mark.parametrize("hadronic", [True, False])
+def test_synthetic_fktable(tmp_path, hadronic):
+    path = synthetic.write_fktable(tmp_path / "FK_TEST.dat", ndata=4, nx=6, hadronic=hadronic)
+    with open_fkpath(path) as f:
+        fktable = parse_fktable(f)
+    assert fktable.hadronic == hadronic
+    assert fktable.ndata == 4
+    np.testing.assert_allclose(fktable.xgrid, synthetic.synthetic_xgrid(6))
+    assert set(fktable.sigma.index.get_level_values(0)) == set(range(4))
+
+
+def test_synthetic_commondata():
+    cd = synthetic.synthetic_commondata("TEST", ndata=5, nsys=4, nspecial=2)
+    assert cd.ndata == 5
+    assert cd.systematics_table.shape == (5, 8)
+    assert list(cd.systype_table["name"][-2:]) == ["SYNTHETICSYS0", "SYNTHETICSYS1"]
+    assert (cd.central_values > 0).all()
+
+
+@pytest.mark.parametrize(
+    "name",
+    [
+        "calcutils.calc_chi2",
+        "convolution.hadron_predictions",
+        "covmats.dataset_inputs_covmat_from_systematics",
+        "fkparser.load_fktable",
+    ],
+)
+def test_benchmark_results(name):
+    """The results of the benchmarks match the stored checksums"""
+    baseline = runner.load_baseline(runner.baseline_path("small"))
+    result = runner.run_benchmark(name, "small", repeat=1)
+    assert result.best > 0
+    assert runner.compare(result, baseline[name], tolerance=np.inf) != "wrong result"
+
+
+def test_stored_baselines():
+    """Every benchmark has an entry in the stored baselines, which have no timings"""
+    runner.load_suite()
+    for size in runner.SIZES:
+        path = runner.baseline_path(size)
+        if not path.exists():
+            continue
+        baseline = runner.load_baseline(path)
+        assert set(baseline) == set(runner.BENCHMARKS)
+        assert all("time" not in entry for entry in baseline.values())
+
+
+def test_compare():
+    baseline = {"time": 1.0, "checksum": 10.0}
+    tol = runner.DEFAULT_TOLERANCE
+    assert runner.compare(runner.BenchmarkResult("a", 1.1, 1.2, 10.0), baseline, tol) == "ok"
+    assert runner.compare(runner.BenchmarkResult("a", 2.0, 2.0, 10.0), baseline, tol) == "slower"
+    assert runner.compare(runner.BenchmarkResult("a", 0.5, 0.5, 10.0), baseline, tol) == "faster"
+    assert runner.compare(runner.BenchmarkResult("a", 1.0, 1.0, 11.0), baseline) == "wrong result"
+    assert runner.compare(runner.BenchmarkResult("a", 1.0, 1.0, None), baseline) == "ok"
+    assert runner.compare(runner.BenchmarkResult("a", 1.0, 1.0), None) == "no baseline"
+    assert runner.compare(runner.BenchmarkResult("a", error="failed"), baseline) == "error"
+    # The timings are only compared when a tolerance is given and there is a stored time
+    assert runner.compare(runner.BenchmarkResult("a", 2.0, 2.0, 10.0), baseline) == "ok"
+    no_time = {"checksum": 10.0}
+    assert runner.compare(runner.BenchmarkResult("a", 2.0, 2.0, 10.0), no_time, tol) == "ok"
+    results = [runner.BenchmarkResult("a", 2.0, 2.0, 10.0), runner.BenchmarkResult("b", 1.0, 1.0)]
+    table, failed = runner.report(results, {"a": baseline})
+    assert not failed
+    assert "no baseline" in table
+    table, failed = runner.report(results, {"a": baseline}, tol)
+    assert failed
+    assert "slower" in table
+
+
+def test_save_baseline(tmp_path):
+    path = tmp_path / "baseline.yaml"
+    results = [
+        runner.BenchmarkResult("a", 1.23456, 2.0, 10.0),
+        runner.BenchmarkResult("b", error="failed"),
+    ]
+    runner.save_baseline(results, path)
+    assert runner.load_baseline(path) == {"a": {"checksum": 10.0}}
+    runner.save_baseline(results, path, timings=True)
+    assert runner.load_baseline(path) == {"a": {"checksum": 10.0, "time": 1.235}}
@@ -1,3 +1,5 @@
+from types import SimpleNamespace
+
 import numpy as np
 import scipy.linalg as la
 from hypothesis import given
@@ -23,3 +25,89 @@ def test_calc_chi2(s, d):
     dd = np.repeat(d, 5).reshape(len(d), 5)
     calcdd = calcutils.calc_chi2(chol, dd)
     assert np.allclose(chi2, calcdd)
+
+
+def test_calc_chi2_stacked():
+    rng = np.random.default_rng(1)
+    s = rng.random((10, 10))
+    cov = s @ s.T + np.eye(10)
+    chol = la.cholesky(cov, lower=True)
+    diffs = [rng.random(10), rng.random((10, 3)), rng.random((10, 1))]
+    stacked = calcutils.calc_chi2_stacked(chol, diffs)
+    for d, res in zip(diffs, stacked):
+        assert res.shape == d.shape[1:]
+        np.testing.assert_allclose(res, calcutils.calc_chi2(chol, d))
+
+
+def test_results_chi2():
+    """The member and central χ² are solved for at once"""
+    rng = np.random.default_rng(2)
+    s = rng.random((6, 6))
+    chol = la.cholesky(s @ s.T + np.eye(6), lower=True)
+    members = rng.random((6, 4))
+    data_result = SimpleNamespace(central_value=rng.random(6), sqrtcovmat=chol)
+    th_result = SimpleNamespace(rawdata=members, central_value=members.mean(axis=1))
+    member_chi2, central_chi2 = calcutils.results_chi2(data_result, th_result)
+    diffs = members - data_result.central_value[:, np.newaxis]
+    np.testing.assert_allclose(member_chi2, calcutils.calc_chi2(chol, diffs))
+    np.testing.assert_allclose(central_chi2, calcutils.calc_chi2(chol, diffs.mean(axis=1)))
+    # Another factor of the covariance matrix can be given
+    member_chi2, _ = calcutils.results_chi2(data_result, th_result, sqrtcov=2 * chol)
+    np.testing.assert_allclose(member_chi2, calcutils.calc_chi2(chol, diffs) / 4)
+
+
+def test_cached_cholesky():
+    rng = np.random.default_rng(2)
+    s = rng.random((10, 10))
+    cov = s @ s.T + np.eye(10)
+    chol = calcutils.cached_cholesky(cov)
+    np.testing.assert_allclose(chol, la.cholesky(cov, lower=True))
+    assert not chol.flags.writeable
+    # The same content gives back the same factor
+    assert calcutils.cached_cholesky(cov.copy()) is chol
+    assert calcutils.cached_cholesky(cov + np.eye(10)) is not chol
+    # The key sees changes in the correlations with the same diagonal
+    correlated = cov.copy()
+    correlated[2, 7] = correlated[7, 2] = cov[2, 7] + 0.5
+    assert calcutils.cached_cholesky(correlated) is not chol
+
+
+def test_cholesky_key(monkeypatch):
+    """The key samples the matrix but any change to a column changes its sum"""
+    monkeypatch.setattr(calcutils, "CHOLESKY_KEY_SAMPLES", 8)
+    cov = np.eye(40)
+    key = calcutils._cholesky_key(cov, None)
+    assert calcutils._cholesky_key(cov.copy(), None) == key
+    for i, j in [(0, 1), (5, 33), (39, 20)]:
+        other = cov.copy()
+        other[i, j] = other[j, i] = 0.1
+        assert calcutils._cholesky_key(other, None) != key
+
+
+def test_cholesky_cache_size(monkeypatch):
+    """The cache keeps the most recently used factors within its size in bytes"""
+    monkeypatch.setattr(calcutils, "_cholesky_cache", calcutils.OrderedDict())
+    monkeypatch.setattr(calcutils, "_cholesky_cache_nbytes", 0)
+    # Room for two 10x10 factors
+    monkeypatch.setattr(calcutils, "CHOLESKY_CACHE_BYTES", 2000)
+    covs = [np.eye(10) * (i + 1) for i in range(3)]
+    chols = [calcutils.cached_cholesky(cov) for cov in covs]
+    assert calcutils._cholesky_cache_nbytes == 1600
+    assert calcutils.cached_cholesky(covs[2]) is chols[2]
+    assert calcutils.cached_cholesky(covs[1]) is chols[1]
+    assert calcutils.cached_cholesky(covs[0]) is not chols[0]
+    # Factors larger than the cache are not kept
+    big = np.eye(20)
+    assert calcutils.cached_cholesky(big) is not calcutils.cached_cholesky(big)
+    assert calcutils._cholesky_cache_nbytes == 1600
+
+
+def test_store_cholesky():
+    rng = np.random.default_rng(4)
+    s = rng.random((6, 6))
+    cov = s @ s.T + np.eye(6)
+    chol = la.cholesky(cov, lower=True)
+    calcutils.store_cholesky(cov, chol)
+    stored = calcutils.cached_cholesky(cov.copy())
+    np.testing.assert_array_equal(stored, chol)
+    assert not stored.flags.writeable
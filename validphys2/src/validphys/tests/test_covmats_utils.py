@@ -0,0 +1,73 @@
+"""
+test_covmats_utils.py
+
+Tests for the structured covariance matrices in
+:py:mod:`validphys.covmats_utils`.
+"""
+import numpy as np
+import pytest
+
+from validphys.calcutils import calc_chi2, dense_sqrtcov
+from validphys.covmats_utils import BlockLowRankMatrix
+
+
+def _random_structured(nsys, seed=0):
+    rng = np.random.default_rng(seed)
+    blocks = []
+    for n in (3, 5, 4):
+        s = rng.random((n, n))
+        blocks.append(s @ s.T + np.eye(n))
+    return BlockLowRankMatrix(blocks, rng.random((12, nsys)))
+
+
+@pytest.mark.parametrize("nsys", [0, 4])
+def test_block_low_rank_linear_algebra(nsys):
+    cov = _random_structured(nsys)
+    dense = np.asarray(cov)
+    assert dense.shape == cov.shape == (12, 12)
+    np.testing.assert_allclose(cov.diagonal(), np.diag(dense))
+
+    diffs = np.random.default_rng(1).random((12, 6))
+    np.testing.assert_allclose(cov.matvec(diffs), dense @ diffs)
+    np.testing.assert_allclose(cov.solve(diffs), np.linalg.solve(dense, diffs))
+    reference = np.einsum("ij,ij->j", diffs, np.linalg.solve(dense, diffs))
+    np.testing.assert_allclose(cov.chi2(diffs), reference)
+    # The chi2 functions accept the structured covmat directly
+    np.testing.assert_allclose(calc_chi2(cov, diffs), reference)
+    np.testing.assert_allclose(cov.logdet(), np.linalg.slogdet(dense)[1])
+
+    inverse = cov.inverse()
+    assert inverse.sign == -1
+    np.testing.assert_allclose(np.asarray(inverse), np.linalg.inv(dense), atol=1e-10)
+    np.testing.assert_allclose(inverse.quadratic_form(diffs), reference)
+
+
+def test_block_low_rank_submatrix_and_scaling():
+    cov = _random_structured(4)
+    dense = np.asarray(cov)
+    mask = np.array([True, False, True] + [False] * 5 + [True, True, False, True])
+    np.testing.assert_allclose(np.asarray(cov.submatrix(mask)), dense[np.ix_(mask, mask)])
+    factors = np.linspace(0.5, 2, 12)
+    np.testing.assert_allclose(
+        np.asarray(cov.scaled(factors)), dense * factors[:, np.newaxis] * factors
+    )
+
+
+def test_block_low_rank_sample():
+    cov = _random_structured(4)
+    samples = cov.sample(np.random.default_rng(2), size=100_000)
+    assert samples.shape == (12, 100_000)
+    dense = np.asarray(cov)
+    np.testing.assert_allclose(np.cov(samples), dense, atol=0.05 * np.abs(dense).max())
+
+
+def test_dense_sqrtcov():
+    """The structured covmats, which are not decomposed by sqrt_covmat, are
+    decomposed for the tables of the lower triangular factors"""
+    cov = _random_structured(4)
+    dense = np.asarray(cov)
+    sqrtcov = dense_sqrtcov(cov)
+    np.testing.assert_allclose(sqrtcov, np.tril(sqrtcov))
+    np.testing.assert_allclose(sqrtcov @ sqrtcov.T, dense)
+    factor = np.linalg.cholesky(dense)
+    assert dense_sqrtcov(factor) is factor
@@ -1,5 +1,13 @@
+import json
+from types import SimpleNamespace
+
 from validphys.api import API
-from validphys.fitdata import print_systype_overlap
+from validphys.fitdata import (
+    PROFILE_FILE,
+    fit_phase_profile_table,
+    fit_phase_profiles,
+    print_systype_overlap,
+)
 
 def test_print_systype_overlap():
     """Test that print_systype_overlap does expected thing
@@ -42,3 +50,28 @@ def test_print_systype_overlap():
     # no groups, no overlap
     match5 = print_systype_overlap([], [])
     assert isinstance(match5, str)
+
+
+def test_fit_phase_profile_table(tmp_path):
+    """Aggregate fake profiles of the phases written by n3fit"""
+    for replica, walltime in [(1, 2.0), (2, 4.0)]:
+        replica_path = tmp_path / "nnfit" / f"replica_{replica}"
+        replica_path.mkdir(parents=True)
+        phases = {
+            "train_step": {
+                "count": 10,
+                "walltime": walltime,
+                "cputime": 1.0,
+                "peak_rss_mb": 100.0 * replica,
+            },
+            "compile": {"count": 1, "walltime": 0.5, "cputime": 0.5, "peak_rss_mb": 50.0},
+        }
+        (replica_path / PROFILE_FILE).write_text(json.dumps({"phases": phases}))
+    fit = SimpleNamespace(name="fakefit", path=tmp_path)
+    profiles = fit_phase_profiles(fit)
+    assert len(profiles) == 4
+    res = fit_phase_profile_table(fit, profiles)
+    assert list(res.index) == ["train_step", "compile"]
+    assert res.loc["train_step", ("fakefit", "walltime (s)")] == 3.0
+    assert res.loc["train_step", ("fakefit", "peak RSS (MB)")] == 200.0
+    assert res.loc["compile", ("fakefit", "replicas")] == 2
@@ -0,0 +1,104 @@
+"""
+test_lazyproviders.py
+
+Test that the provider modules are only imported when needed and that starting
+the validphys applications does not import the heavy libraries.
+"""
+import subprocess
+import sys
+import textwrap
+
+import pytest
+
+from validphys.importprofile import ImportProfiler
+from validphys.lazyproviders import LazyProvider, lazy_provider, module_names
+
+# Modules that no action is guaranteed to need and are slow to import
+HEAVY_MODULES = ("matplotlib.pyplot", "seaborn", "tensorflow", "prompt_toolkit")
+
+PROVIDER_SOURCE = textwrap.dedent(
+    """
+    import os.path as osp
+    from collections import namedtuple
+
+    IMPORTED = True
+    a, (b, c) = 1, (2, 3)
+
+    def action(x):
+        return x
+
+    class Result:
+        pass
+
+    if IMPORTED:
+        conditional = 1
+    """
+)
+
+
+@pytest.fixture
+def provider_module(tmp_path, monkeypatch):
+    name = "_vp_test_lazy_provider"
+    (tmp_path / f"{name}.py").write_text(PROVIDER_SOURCE)
+    monkeypatch.syspath_prepend(str(tmp_path))
+    yield name
+    sys.modules.pop(name, None)
+
+
+def test_module_names(provider_module):
+    names = module_names(provider_module)
+    assert names == {
+        "osp",
+        "namedtuple",
+        "IMPORTED",
+        "a",
+        "b",
+        "c",
+        "action",
+        "Result",
+        "conditional",
+    }
+    # Star imports are resolved, unless they can't be determined statically
+    assert module_names("validphys.closuretest") >= module_names(
+        "validphys.closuretest.closure_results"
+    ) - {"log"}
+    assert module_names("validphys.does_not_exist") is None
+
+
+def test_lazy_provider(provider_module):
+    provider = lazy_provider(provider_module)
+    assert isinstance(provider, LazyProvider)
+    assert not hasattr(provider, "checks")
+    assert provider_module not in sys.modules
+    assert "action" in dir(provider)
+    assert provider.action(3) == 3
+    assert provider_module in sys.modules
+    assert provider.Result is sys.modules[provider_module].Result
+
+
+def test_import_profiler(provider_module):
+    profiler = ImportProfiler()
+    profiler.install()
+    try:
+        __import__(provider_module)
+    finally:
+        profiler.uninstall()
+    self_time, cumulative = profiler.times[provider_module]
+    assert 0 <= self_time <= cumulative
+    assert provider_module in profiler.report()
+
+
+def test_startup_imports():
+    """Starting the application should not import the heavy modules"""
+    code = textwrap.dedent(
+        f"""
+        import sys
+        from validphys.app import App
+        App().init_providers({{"extra_providers": None}})
+        print(",".join(m for m in {HEAVY_MODULES!r} if m in sys.modules))
+        """
+    )
+    out = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    ).stdout
+    assert out.strip() == ""
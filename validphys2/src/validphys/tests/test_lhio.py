@@ -0,0 +1,107 @@
+"""
+test_lhio.py
+
+Tests for the reading and writing of LHAPDF grids
+"""
+import numpy as np
+import pytest
+
+from validphys import lhio
+from validphys.lhio import LHAPDFGrid, SubGrid
+
+NMEMBERS = 4
+
+
+def _random_grid(nmembers):
+    rng = np.random.default_rng(seed=3)
+    xgrid = np.array([1e-5, 1e-4, 1e-3, 1e-2, 0.1, 0.5, 1.0])
+    flavours = np.array([-3, -2, -1, 21, 1, 2, 3])
+    subgrids = []
+    for qgrid in (np.array([1.65, 2.0, 5.0]), np.array([5.0, 10.0])):
+        values = rng.random((nmembers, len(xgrid), len(qgrid), len(flavours))) - 0.5
+        subgrids.append(SubGrid(xgrid, qgrid, flavours, values))
+    return LHAPDFGrid(subgrids)
+
+
+def _reference_format(grid, index):
+    """Format a member the way the LHAPDF files are written, one line at a time"""
+    lines = [lhio.REPLICA_HEADER.decode()]
+    for g in grid.subgrids:
+        lines.append("---\n")
+        lines.append("".join(f"{x:.7E} " for x in g.xgrid) + "\n")
+        lines.append("".join(f"{q:.7E} " for q in g.qgrid) + "\n")
+        lines.append("".join(f"{f:d} " for f in g.flavours) + "\n ")
+        for row in g.values[index].reshape(-1, len(g.flavours)):
+            lines.append(" ".join(f"{v:14.7E}" for v in row) + "\n")
+    lines.append("---")
+    return "".join(lines).encode()
+
+
+@pytest.fixture
+def written_set(tmp_path):
+    grid = _random_grid(NMEMBERS)
+    set_root = tmp_path / "TESTSET"
+    set_root.mkdir()
+    lhio.write_replica_stack(set_root, grid, max_workers=2)
+    return set_root, grid
+
+
+def test_write_replica_stack(written_set):
+    """The members are written in the LHAPDF format and replica 0 is their average"""
+    set_root, grid = written_set
+    for i in range(NMEMBERS):
+        assert (set_root / f"TESTSET_{i + 1:04d}.dat").read_bytes() == _reference_format(grid, i)
+
+    header, central = lhio.read_replica_file(set_root / "TESTSET_0000.dat")
+    assert header == lhio.CENTRAL_HEADER
+    assert central.nmembers == 1
+    assert central.same_knots(grid)
+    for g, ref in zip(central.subgrids, grid.central_value().subgrids):
+        np.testing.assert_allclose(g.values, ref.values, atol=1e-7)
+
+
+def test_stack_replica_files(written_set):
+    set_root, grid = written_set
+    paths = [set_root / f"TESTSET_{i + 1:04d}.dat" for i in range(NMEMBERS)]
+    stacked = lhio.stack_replica_files(paths)
+    assert stacked.nmembers == NMEMBERS
+    for g, ref in zip(stacked.subgrids, grid.subgrids):
+        np.testing.assert_allclose(g.values, ref.values, atol=1e-7)
+    reversed_stack = lhio.stack_replica_files(paths[::-1])
+    np.testing.assert_array_equal(
+        reversed_stack.subgrids[0].values, stacked.subgrids[0].values[::-1]
+    )
+    # Grids with different knots can't be stacked
+    other = grid.member(0)
+    other.subgrids[0].xgrid = other.subgrids[0].xgrid * 0.5
+    with pytest.raises(ValueError):
+        LHAPDFGrid.stack([grid, other])
+
+
+def test_read_members_from_lhapdf():
+    """The vectorised evaluation agrees with evaluating LHAPDF one point at a time
+    and, at the knots, with the content of the files"""
+    import lhapdf
+
+    from validphys.loader import FallbackLoader as Loader
+    from validphys.tests.conftest import PDF
+
+    pdf = Loader().check_pdf(PDF)
+    _, rep0 = lhio.load_replica(pdf, 0)
+    # Keep the test fast by using a few knots of the first subgrid
+    g = rep0.subgrids[0]
+    knots = LHAPDFGrid([SubGrid(g.xgrid[::10], g.qgrid[:2], g.flavours, g.values[:, ::10, :2])])
+    replicas = [1, 3]
+    grid = lhio.read_members_from_lhapdf(pdf, replicas, knots, max_workers=2)
+    assert grid.nmembers == len(replicas)
+    values = grid.subgrids[0].values
+    for i, rep in enumerate(replicas):
+        member = lhapdf.mkPDF(pdf.name, rep)
+        for ix, x in enumerate(knots.subgrids[0].xgrid):
+            for iq, q in enumerate(knots.subgrids[0].qgrid):
+                for ifl, fl in enumerate(knots.subgrids[0].flavours):
+                    assert values[i, ix, iq, ifl] == pytest.approx(member.xfxQ(int(fl), x, q))
+    _, rep1 = lhio.load_replica(pdf, 1)
+    np.testing.assert_allclose(
+        values[0], rep1.subgrids[0].values[0, ::10, :2], rtol=1e-5, atol=1e-7
+    )
@@ -3,7 +3,11 @@
 """
 import contextlib
 import lhapdf
+import numpy as np
 from validphys.api import API
+from validphys.core import MCStats
+from validphys.lhapdfset import LHAPDFSet
+from validphys.mc2hessian import _compress_X, _get_X, _randomized_compress_X, _X_blocks
 
 NEIG = 5
 
@@ -52,3 +56,62 @@ def test_mc2hessian(data_config, tmp):
                 assert item != new_item
             else:
                 assert item == new_item
+
+
+def test_randomized_compress_X():
+    """The randomized SVD finds the same leading directions as the full SVD
+    for a matrix with a decaying spectrum"""
+    rng = np.random.default_rng(seed=2)
+    npoints, nrep = 200, 1500
+    u, _ = np.linalg.qr(rng.standard_normal((npoints, npoints)))
+    v, _ = np.linalg.qr(rng.standard_normal((nrep, npoints)))
+    X = (u * np.exp(-np.arange(npoints) / 5)) @ v.T
+    exact = _compress_X(X, NEIG)
+    randomized = _randomized_compress_X(X, NEIG)
+    assert randomized.shape == (nrep, NEIG)
+    # The singular vectors are only defined up to a sign
+    np.testing.assert_allclose(np.abs(np.diag(exact.T @ randomized)), 1, atol=1e-8)
+
+
+class _FakeMember:
+    """A member of a PDF set with ``x*f(x) = c x^-a (1 - x)^b`` for every flavour"""
+
+    def __init__(self, rng):
+        self.a, self.b = rng.uniform(0.1, 0.3), rng.uniform(2, 4)
+        self.c = rng.uniform(0.5, 1.5, size=30)
+
+    def xfxQ(self, flavors, xarr, qarr):
+        shape = xarr ** (-self.a) * (1 - xarr) ** self.b * np.log(qarr)
+        return shape[:, np.newaxis] * self.c[np.asarray(flavors) % 30]
+
+
+class _FakePDF:
+    stats_class = MCStats
+
+    def __init__(self, nmembers):
+        rng = np.random.default_rng(5)
+        self.lpdf = object.__new__(LHAPDFSet)
+        self.lpdf._error_type = "replicas"
+        self.lpdf._lhapdf_set = [_FakeMember(rng) for _ in range(nmembers)]
+
+    def load(self):
+        return self.lpdf
+
+    def __len__(self):
+        return len(self.lpdf.members)
+
+
+def test_X_blocks():
+    """The blocks of replicas evaluated separately make up the full matrix"""
+    pdf = _FakePDF(24)
+    xgrid = np.geomspace(1e-4, 0.9, 7)
+    X = _get_X(pdf, 10, xgrid, reshape=True)
+    npoints, blocks = _X_blocks(pdf, 10, xgrid, chunk_size=5)
+    assert npoints == X.shape[0]
+    chunks = list(blocks())
+    assert [len(chunk) for chunk in chunks] == [5, 5, 5, 5, 3]
+    np.testing.assert_allclose(np.concatenate(chunks).T, X)
+    np.testing.assert_allclose(
+        _randomized_compress_X(X, 3, chunk_size=7),
+        _randomized_compress_X(X, 3, chunk_size=len(pdf)),
+    )
@@ -0,0 +1,47 @@
+"""
+test_n3fit_data.py
+
+Test the t0 covariance matrices stored in the fit folder by vp-setupfit
+"""
+import numpy as np
+
+from validphys import n3fit_data
+from validphys.covmats import sqrt_covmat, store_sqrt_covmat
+from validphys.n3fit_data import fitting_t0_covmat, load_t0_cache, save_t0_cache
+
+
+def test_t0_cache(tmp_path):
+    rng = np.random.default_rng(3)
+    s = rng.random((8, 8))
+    cov = s @ s.T + np.eye(8)
+    sqrtcov = np.linalg.cholesky(cov)
+
+    assert load_t0_cache(tmp_path, "EXP", "key") is None
+    save_t0_cache(tmp_path, "EXP", "key", cov, sqrtcov)
+    # A different key means that the stored matrices are outdated
+    assert load_t0_cache(tmp_path, "EXP", "other") is None
+
+    cached = load_t0_cache(tmp_path, "EXP", "key")
+    assert isinstance(cached["covmat"], np.memmap)
+    assert not cached["covmat"].flags.writeable
+    np.testing.assert_array_equal(cached["covmat"], cov)
+    np.testing.assert_array_equal(cached["sqrtcovmat"], sqrtcov)
+    # Only the matrices are stored, the t0 predictions are not needed by the fit
+    assert set(cached) == {"covmat", "sqrtcovmat"}
+
+    # The stored factor is used instead of decomposing the matrix again
+    store_sqrt_covmat(cached["covmat"], cached["sqrtcovmat"])
+    assert sqrt_covmat(cached["covmat"]) is cached["sqrtcovmat"]
+
+
+def test_t0_cache_closure(tmp_path, monkeypatch):
+    """The covmat of the closure test fake data is never read from the fit folder"""
+    cov = np.eye(3)
+
+    def load_t0_cache(*args):
+        raise AssertionError("The t0 cache should not be read")
+
+    monkeypatch.setattr(n3fit_data, "load_t0_cache", load_t0_cache)
+    monkeypatch.setattr(n3fit_data, "_t0_predictions_and_covmat", lambda *args: (None, cov))
+    covmat = fitting_t0_covmat("EXP", tmp_path, [], [], use_fitcommondata=True)
+    assert covmat is cov
@@ -0,0 +1,79 @@
+"""
+test_n3fit_data_utils.py
+
+Test the parsing of libnnpdf fktables into the arrays used by n3fit
+"""
+import numpy as np
+import pytest
+
+from validphys.coredata import SparseFKTable
+from validphys.n3fit_data_utils import fk_parser
+
+
+class FakeFKTable:
+    """Mimics the interface of a libnnpdf FKTable with a padded sigma"""
+
+    def __init__(self, ndata, nbasis, nx, pad, hadronic):
+        rng = np.random.default_rng(seed=42)
+        self.ndata = ndata
+        self.nbasis = nbasis
+        self.nx = nx * nx if hadronic else nx
+        self.dsz = self.nx * nbasis + pad
+        self.xgrid = np.linspace(0.1, 1.0, nx)
+        sigma = rng.random(ndata * self.dsz)
+        self.sigma = sigma * (rng.random(sigma.size) > 0.7)
+
+    def GetNonZero(self):
+        return self.nbasis
+
+    def GetNData(self):
+        return self.ndata
+
+    def GetTx(self):
+        return self.nx
+
+    def GetDSz(self):
+        return self.dsz
+
+    def get_flmap(self):
+        return np.arange(self.nbasis)
+
+    def get_xgrid(self):
+        return self.xgrid
+
+    def get_sigma(self):
+        return self.sigma
+
+
+def _reference_unpad(fk):
+    """Remove the padding one block at a time"""
+    block = fk.GetTx() * fk.GetNonZero()
+    return np.concatenate(
+        [fk.sigma[i * fk.dsz : i * fk.dsz + block] for i in range(fk.ndata)]
+    )
+
+
+@pytest.mark.parametrize("hadronic", [True, False])
+@pytest.mark.parametrize("pad", [0, 3])
+def test_fk_parser_padding(hadronic, pad):
+    fk = FakeFKTable(5, 3, 4, pad, hadronic)
+    parsed = fk_parser(fk, hadronic)
+    fktable = parsed["fktable"]
+    assert fktable.shape[0] == 5
+    np.testing.assert_array_equal(fktable.ravel(), _reference_unpad(fk))
+
+
+@pytest.mark.parametrize("pad", [0, 3])
+def test_fk_parser_sparse(pad):
+    fk = FakeFKTable(5, 3, 4, pad, True)
+    dense = fk_parser(fk, True)["fktable"]
+    sparse = fk_parser(fk, True, sparse=True)["fktable"]
+    assert isinstance(sparse, SparseFKTable)
+    assert sparse.nnz == np.count_nonzero(dense)
+    np.testing.assert_array_equal(sparse.to_dense(), dense)
+    mask = np.array([True, False, True, True, False])
+    np.testing.assert_array_equal(sparse.with_data_mask(mask).to_dense(), dense[mask])
+    np.testing.assert_array_equal(sparse.with_data_mask(~mask).to_dense(), dense[~mask])
+    # DIS tables are never made sparse
+    fk_dis = FakeFKTable(5, 3, 4, pad, False)
+    assert isinstance(fk_parser(fk_dis, False, sparse=True)["fktable"], np.ndarray)
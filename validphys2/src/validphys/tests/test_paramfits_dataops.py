@@ -0,0 +1,73 @@
+"""
+test_paramfits_dataops.py
+
+Tests of the bootstrapping estimates of the statistical error of the
+paramfits determinations.
+"""
+import numpy as np
+import pytest
+
+from validphys.paramfits import dataops
+from validphys.paramfits.dataops import (
+    StandardSampleWrapper,
+    bootstrapping_stats_error,
+    bootstrapping_stats_error_on_the_error,
+    bootstrapping_stats_errors,
+    half_sample_stats_error,
+)
+
+NRESAMPLINGS = 20000
+
+
+@pytest.fixture
+def determination():
+    rng = np.random.default_rng(42)
+    return StandardSampleWrapper(rng.normal(0.118, 0.002, 100))
+
+
+def test_resampled_mean_std_chunks():
+    """The statistics of each resampling do not depend on the size of the chunks"""
+    data = np.random.default_rng(0).normal(size=7)
+    means, stds = dataops._resampled_mean_std(data, 10, np.random.default_rng(1), chunk_elements=7)
+    indexes = np.random.default_rng(1).integers(0, 7, size=(10, 7))
+    np.testing.assert_allclose(means, data[indexes].mean(axis=1))
+    np.testing.assert_allclose(stds, data[indexes].std(axis=1))
+    for chunk_elements in (20, 1000):
+        other = dataops._resampled_mean_std(
+            data, 10, np.random.default_rng(1), chunk_elements=chunk_elements
+        )
+        np.testing.assert_allclose(other, (means, stds))
+
+
+def test_bootstrapping_stats_errors(determination):
+    """The errors are reproducible given a seed and agree with their
+    analytical estimates for a normal distribution"""
+    errors = bootstrapping_stats_errors(determination, NRESAMPLINGS, boot_seed=3)
+    assert errors == bootstrapping_stats_errors(determination, NRESAMPLINGS, boot_seed=3)
+    data = determination.data
+    n = len(data)
+    np.testing.assert_allclose(errors.stats_error, data.std() / np.sqrt(n), rtol=0.05)
+    np.testing.assert_allclose(
+        errors.stats_error_on_the_error, data.std() / np.sqrt(2 * n), rtol=0.15
+    )
+    np.testing.assert_allclose(
+        errors.half_sample_stats_error, data[: n // 2].std() / np.sqrt(n // 2), rtol=0.05
+    )
+    assert bootstrapping_stats_error(determination, NRESAMPLINGS, boot_seed=3) == errors.stats_error
+    # Both errors are computed from the same resamplings
+    assert (
+        bootstrapping_stats_error_on_the_error(determination, NRESAMPLINGS, boot_seed=3)
+        == errors.stats_error_on_the_error
+    )
+    assert np.isclose(
+        half_sample_stats_error(determination, NRESAMPLINGS, boot_seed=3),
+        errors.half_sample_stats_error,
+        rtol=0.05,
+    )
+
+
+def test_bootstrapping_stats_errors_few_data():
+    errors = bootstrapping_stats_errors(StandardSampleWrapper(np.array([0.118])), 10)
+    assert np.isclose(errors.stats_error, 0)
+    assert np.isnan(errors.half_sample_stats_error)
+    assert all(np.isnan(bootstrapping_stats_errors(StandardSampleWrapper(np.array([])), 10)))
@@ -8,7 +8,12 @@ import subprocess as sp
 import os
 import shutil
 
+import numpy as np
+import pytest
+
+from validphys import lhio
 from validphys.loader import FallbackLoader as Loader
+from validphys.scripts import postfit
 from validphys.tests.conftest import FIT
 from validphys.utils import yaml_safe
 
@@ -110,3 +115,93 @@ def test_postfit(tmp):
         assert (
             veto_count["integrability_threshold"] == integrability_threshold
         ), f"Postfit has not written the integrability threshold correctly to {vetopath}."
+
+
+def test_postfit_incremental(tmp):
+    """Checks that running postfit incrementally on top of a previous run gives
+    the same PDF set, with the state files written to the postfit folder"""
+    l = Loader()
+    fit = l.check_fit(FIT)
+    shutil.copytree(fit.path, tmp / FIT)
+    TMPFIT = "TEST"
+    sp.run(f"vp-fitrename -c {fit.name} {TMPFIT}".split(), cwd=tmp, check=True)
+    pdfsetpath = tmp / TMPFIT / "postfit" / TMPFIT
+
+    sp.run(f"postfit 2 {TMPFIT}".split(), cwd=tmp, check=True)
+    full_central = (pdfsetpath / f"{TMPFIT}_0000.dat").read_text()
+    full_files = set(os.listdir(pdfsetpath))
+    assert (tmp / TMPFIT / "postfit" / "postfit_state.json").is_file()
+
+    sp.run(f"postfit 2 {TMPFIT} --incremental -j 1".split(), cwd=tmp, check=True)
+    assert set(os.listdir(pdfsetpath)) == full_files
+    assert (pdfsetpath / f"{TMPFIT}_0000.dat").read_text() == full_central
+
+
+def _pdfset_contents(pdfsetpath):
+    """Files of the PDF set with the targets of the replica links"""
+    return {
+        name: os.readlink(pdfsetpath / name) if (pdfsetpath / name).is_symlink() else None
+        for name in os.listdir(pdfsetpath)
+    }
+
+
+def _central_values(pdfsetpath, fitname):
+    _header, grid = lhio.read_replica_file(pdfsetpath / f"{fitname}_0000.dat")
+    return np.concatenate([subgrid.values.ravel() for subgrid in grid.subgrids])
+
+
+@pytest.mark.parametrize("change", ["added", "removed"])
+def test_postfit_incremental_changes(tmp, change):
+    """Updating the postfit folder incrementally after replicas are added to or
+    removed from the fit gives the same PDF set as running postfit from scratch"""
+    l = Loader()
+    fit = l.check_fit(FIT)
+    shutil.copytree(fit.path, tmp / FIT)
+    TMPFIT = "TEST"
+    sp.run(f"vp-fitrename -c {fit.name} {TMPFIT}".split(), cwd=tmp, check=True)
+    nnfitpath = tmp / TMPFIT / "nnfit"
+    pdfsetpath = tmp / TMPFIT / "postfit" / TMPFIT
+    postfit = f"postfit 1 {TMPFIT} --at-least-nrep".split()
+
+    sp.run(postfit, cwd=tmp, check=True)
+    replicas = sorted(nnfitpath.glob("replica_*"), key=lambda p: int(p.name.split("_")[1]))
+    if change == "added":
+        shutil.copytree(replicas[0], nnfitpath / f"replica_{len(replicas) + 1}", symlinks=True)
+    else:
+        shutil.rmtree(replicas[0])
+
+    sp.run(postfit + ["--incremental", "-j", "1"], cwd=tmp, check=True)
+    incremental_contents = _pdfset_contents(pdfsetpath)
+    incremental_central = _central_values(pdfsetpath, TMPFIT)
+    assert not list(tmp.glob(f"{TMPFIT}/postfit_work_deleteme_*"))
+
+    sp.run(postfit, cwd=tmp, check=True)
+    assert incremental_contents == _pdfset_contents(pdfsetpath)
+    np.testing.assert_allclose(incremental_central, _central_values(pdfsetpath, TMPFIT), rtol=1e-6)
+
+
+def test_incremental_workdir(tmp_path):
+    """The postfit folder is only replaced once the update succeeds"""
+    postfit_path = tmp_path / "postfit"
+    postfit_path.mkdir()
+    (tmp_path / "nnfit").mkdir()
+    (tmp_path / "nnfit" / "replica_1").write_text("1")
+    os.symlink("../nnfit/replica_1", postfit_path / "replica_1")
+    (postfit_path / "postfit.log").write_text("first\n")
+
+    with pytest.raises(postfit.PostfitError):
+        with postfit.incremental_workdir(tmp_path, postfit_path) as workdir:
+            (workdir / "postfit.log").write_text("broken\n")
+            (workdir / "replica_1").unlink()
+            raise postfit.PostfitError("Number of requested replicas is too large")
+    assert (postfit_path / "postfit.log").read_text() == "first\n"
+    assert (postfit_path / "replica_1").read_text() == "1"
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["nnfit", "postfit"]
+
+    with postfit.incremental_workdir(tmp_path, postfit_path) as workdir:
+        assert (workdir / "replica_1").read_text() == "1"
+        with open(workdir / "postfit.log", "a") as f:
+            f.write("second\n")
+    assert (postfit_path / "postfit.log").read_text() == "first\nsecond\n"
+    assert os.readlink(postfit_path / "replica_1") == "../nnfit/replica_1"
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["nnfit", "postfit"]
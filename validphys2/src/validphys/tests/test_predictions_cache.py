@@ -0,0 +1,113 @@
+"""
+test_predictions_cache.py
+
+Tests for the persistent store of theory predictions
+"""
+import os
+import time
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+
+from validphys.predictions_cache import PredictionsCache, pdf_digest
+
+
+def _predictions(seed, ndata=5, nmembers=10):
+    rng = np.random.default_rng(seed=seed)
+    return pd.DataFrame(
+        rng.random((ndata, nmembers)),
+        index=pd.Index(np.arange(ndata) * 2, name="data"),
+        columns=range(nmembers),
+    )
+
+
+def test_roundtrip(tmp_path):
+    cache = PredictionsCache(tmp_path)
+    assert cache.get("ab" * 32) is None
+    df = _predictions(1)
+    cache.put("ab" * 32, df)
+    pd.testing.assert_frame_equal(cache.get("ab" * 32), df, check_column_type=False)
+    central = pd.DataFrame(np.ones((3, 1)), columns=["data"])
+    cache.put("cd" * 32, central)
+    pd.testing.assert_frame_equal(cache.get("cd" * 32), central, check_index_type=False)
+    assert cache.stats()["entries"] == 2
+
+
+def test_corrupted_entry(tmp_path):
+    cache = PredictionsCache(tmp_path)
+    cache.put("ab" * 32, _predictions(1))
+    path = next(tmp_path.glob("*/*.npz"))
+    path.write_bytes(b"garbage")
+    assert cache.get("ab" * 32) is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_prune_least_recently_used(tmp_path):
+    cache = PredictionsCache(tmp_path)
+    keys = [f"{i:02d}" * 32 for i in range(4)]
+    for i, key in enumerate(keys):
+        cache.put(key, _predictions(i))
+    # Give the entries increasing access times and then use the first one, so
+    # that the second one becomes the least recently used
+    for i, p in enumerate(sorted(tmp_path.glob("*/*.npz"))):
+        os.utime(p, (time.time() - 100 + i, time.time() - 100 + i))
+    assert cache.get(keys[0]) is not None
+    entry_size = cache.stats()["size"] / len(keys)
+    removed = cache.prune(max_size=2.5 * entry_size)
+    assert removed == 2
+    assert cache.get(keys[0]) is not None
+    assert cache.get(keys[1]) is None
+    assert cache.get(keys[2]) is None
+    assert cache.get(keys[3]) is not None
+
+
+def test_running_size(tmp_path, monkeypatch):
+    """The store is only scanned on the first write and when it must be pruned"""
+    cache = PredictionsCache(tmp_path)
+    scans = []
+    entries = cache.entries
+    monkeypatch.setattr(cache, "entries", lambda: scans.append(1) or entries())
+    cache.put("00" * 32, _predictions(0))
+    entry_size = cache.stats()["size"]
+    scans.clear()
+    cache.max_size = 2.5 * entry_size
+    cache.put("01" * 32, _predictions(1))
+    # Overwriting an entry does not change the size of the store
+    cache.put("01" * 32, _predictions(2))
+    assert not scans
+    assert cache._size == 2 * entry_size
+    cache.put("02" * 32, _predictions(3))
+    assert len(scans) == 1
+    assert cache.stats()["entries"] == 2
+    assert cache._size == 2 * entry_size
+    assert cache.get("00" * 32) is None
+
+
+def test_pdf_digest(tmp_path):
+    """The digest of a PDF changes with the info file and the members of the set"""
+    folder = tmp_path / "PDFSET"
+    folder.mkdir()
+    info = folder / "PDFSET.info"
+    info.write_text("NumMembers: 1\n")
+    (folder / "PDFSET_0000.dat").write_text("0")
+    pdf = SimpleNamespace(name="PDFSET", infopath=info)
+    digest = pdf_digest(pdf)
+    assert pdf_digest(pdf) == digest
+    member = folder / "PDFSET_0001.dat"
+    member.write_text("1")
+    with_member = pdf_digest(pdf)
+    assert with_member != digest
+    # A member rewritten in place, which leaves the folder untouched
+    folder_mtime = folder.stat().st_mtime_ns
+    member.write_text("2")
+    os.utime(member, ns=(0, 1))
+    os.utime(folder, ns=(0, folder_mtime))
+    rewritten = pdf_digest(pdf)
+    assert rewritten != with_member
+    # Only the content matters
+    os.utime(member, ns=(0, 2))
+    assert pdf_digest(pdf) == rewritten
+    info.write_text("NumMembers: 2\n")
+    os.utime(info, ns=(0, 2))
+    assert pdf_digest(pdf) not in (digest, with_member, rewritten)
@@ -0,0 +1,155 @@
+"""
+test_replica_selector.py
+
+Tests for the masks used to select replicas in :py:mod:`validphys.replica_selector`
+"""
+import numpy as np
+import pytest
+
+from validphys import replica_selector
+from validphys.core import MCStats
+from validphys.pdfbases import flavour
+from validphys.pdfgrids import XPlottingGrid
+from validphys.replica_selector import (
+    _filter_exponents,
+    frozen_exponents_mask,
+    gluon_values,
+    growing_gluon_mask,
+    mcpdf_total_mask,
+    not_outlier_mask,
+)
+
+Q = 1.65
+XGRID = np.logspace(-5, -1, 10)
+ALPHAS = np.array([-0.2, -0.1, 0.0, 0.1, 0.2])
+
+
+def _power_law_values(alphas, xgrid=XGRID):
+    """x*f(x) = x^alpha for each alpha, i.e. exponents frozen along x"""
+    return xgrid[np.newaxis, :] ** np.asarray(alphas)[:, np.newaxis]
+
+
+def _xplotting_grid(values, flavours=("g",), xgrid=XGRID, q=Q):
+    """Grid with replica 0 (the mean of ``values``) followed by ``values``, which has shape
+    (replicas, flavours, x)"""
+    data = np.concatenate([values.mean(axis=0, keepdims=True), values])
+    return XPlottingGrid(q, flavour, list(flavours), xgrid, MCStats(data), "log")
+
+
+def _polyfit_filter_exponents(values, xgrid, max_allowed_diff):
+    """Reference implementation of ``_filter_exponents`` using ``np.polyfit``"""
+    exps = np.log(values) / np.log(xgrid)
+    mask = []
+    for rep in exps:
+        if np.isnan(rep).any():
+            mask.append(False)
+            continue
+        fitted = np.polyfit(xgrid, rep.T, 0)
+        mask.append(bool((np.abs(rep - fitted.T).max(axis=1) < max_allowed_diff).all()))
+    return np.array(mask)
+
+
+def test_filter_exponents_power_law():
+    """Pure power laws have constant exponents and all pass"""
+    values = _power_law_values(ALPHAS)
+    assert _filter_exponents(values, XGRID, 0.3).all()
+    # The values can also have a flavour axis
+    mask = _filter_exponents(values[:, np.newaxis, :], XGRID, 0.3)
+    assert mask.shape == (len(ALPHAS),)
+    assert mask.all()
+
+
+def test_filter_exponents_edge_cases():
+    values = _power_law_values(ALPHAS)
+    # A replica which becomes negative has NaN exponents and always fails
+    values[1, 3] = -1.0
+    # A replica whose exponent changes along x fails only if the change is large enough
+    values[3] *= XGRID ** np.linspace(0, 1, len(XGRID))
+    mask = _filter_exponents(values, XGRID, 0.3)
+    np.testing.assert_array_equal(mask, [True, False, True, False, True])
+    mask = _filter_exponents(values, XGRID, 10)
+    np.testing.assert_array_equal(mask, [True, False, True, True, True])
+    # The difference with the fit is strictly smaller than the threshold
+    assert not _filter_exponents(_power_law_values([0.1]), XGRID, 0).any()
+    # A single replica
+    assert _filter_exponents(values[:1], XGRID, 0.3).tolist() == [True]
+    # Every replica fails
+    assert not _filter_exponents(-values, XGRID, 0.3).any()
+
+
+def test_filter_exponents_matches_polyfit():
+    """The fit of a constant is the mean, as with the previous ``np.polyfit`` implementation"""
+    rng = np.random.default_rng(3)
+    values = _power_law_values(rng.uniform(-0.3, 0.3, 50))[:, np.newaxis, :].repeat(2, axis=1)
+    values *= rng.lognormal(sigma=0.3, size=values.shape)
+    values[7, 1, 2] = -1
+    for max_allowed_diff in (0.05, 0.1, 0.3):
+        np.testing.assert_array_equal(
+            _filter_exponents(values, XGRID, max_allowed_diff),
+            _polyfit_filter_exponents(values, XGRID, max_allowed_diff),
+        )
+
+
+def test_gluon_values_from_grid():
+    """The gluon is taken from the plotting grid without replica 0"""
+    values = np.stack([_power_law_values(ALPHAS), -_power_law_values(ALPHAS)], axis=1)
+    grid = _xplotting_grid(values, flavours=("u", "g"))
+    # The PDF is not used at all
+    gv = gluon_values(None, Q, ("log", XGRID), grid)
+    np.testing.assert_array_equal(gv, -_power_law_values(ALPHAS))
+
+
+def test_gluon_values_fallback(monkeypatch):
+    """Without the gluon in the plotting grid, the PDF is evaluated and replica 0 removed"""
+    values = _power_law_values(ALPHAS)
+    grid = _xplotting_grid(values[:, np.newaxis, :], flavours=("u",))
+    calls = []
+
+    def grid_values(pdf, flavours, x, q):
+        calls.append((pdf, flavours, q))
+        data = np.concatenate([np.zeros((1, len(x))), values])
+        return data[:, np.newaxis, :]
+
+    monkeypatch.setattr(replica_selector.flavour, "grid_values", grid_values)
+    gv = gluon_values("pdf", Q, ("log", XGRID), grid)
+    np.testing.assert_array_equal(gv, values)
+    assert calls == [("pdf", ["g"], Q)]
+    # A plotting grid with another xgrid is not used either
+    grid = _xplotting_grid(values[:, np.newaxis, :], xgrid=XGRID * 2)
+    np.testing.assert_array_equal(gluon_values("pdf", Q, ("log", XGRID), grid), values)
+    assert len(calls) == 2
+    # Nor a plotting grid at another scale
+    grid = _xplotting_grid(-values[:, np.newaxis, :], q=2 * Q)
+    np.testing.assert_array_equal(gluon_values("pdf", Q, ("log", XGRID), grid), values)
+    assert len(calls) == 3
+
+
+def test_masks_have_one_entry_per_replica():
+    """All the masks refer to the replicas 1..N, so they can be combined"""
+    values = _power_law_values(ALPHAS)
+    # Replica 2 has a non frozen exponent. Only the replicas with a negative
+    # exponent grow towards small x
+    values[1] *= XGRID ** np.linspace(0, 1, len(XGRID))
+    grid = _xplotting_grid(values[:, np.newaxis, :])
+    gv = gluon_values(None, Q, ("log", XGRID), grid)
+    lim = len(XGRID)
+
+    frozen = frozen_exponents_mask(grid, lim)
+    growing = growing_gluon_mask(gv, lim)
+    outlier = not_outlier_mask(grid, 0)
+    for mask in (frozen, growing, outlier):
+        assert mask.shape == (len(ALPHAS),)
+    np.testing.assert_array_equal(frozen, [True, False, True, True, True])
+    np.testing.assert_array_equal(growing[[0, 2, 3, 4]], [True, False, False, False])
+    assert outlier.all()
+    np.testing.assert_array_equal(mcpdf_total_mask(outlier, growing, frozen), frozen & growing)
+
+
+@pytest.mark.parametrize("lim", [1, 0])
+def test_masks_empty_region(lim):
+    """With no points to compare, no replica is discarded"""
+    values = _power_law_values(ALPHAS)
+    grid = _xplotting_grid(values[:, np.newaxis, :])
+    assert growing_gluon_mask(values, lim).all()
+    if lim:
+        assert frozen_exponents_mask(grid, lim).all()
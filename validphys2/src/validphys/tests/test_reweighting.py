@@ -0,0 +1,87 @@
+"""
+test_reweighting.py
+
+Tests for the vectorised P(α) and unweighting in the reweighting module
+"""
+import numpy as np
+
+from validphys import reweighting
+from validphys.core import MCStats
+from validphys.results import Chi2Data
+
+
+def _p_alpha_reference(alpha, chi2s, ndata):
+    """P(α) for a single alpha, computed as in the NNPDF reweighting papers"""
+    scaled = chi2s / alpha**2
+    logw = ((ndata - 1) / 2) * np.log(scaled) - 0.5 * scaled
+    return np.sum(np.exp(logw - np.max(logw))) / alpha
+
+
+def test_p_alpha_values(monkeypatch):
+    rng = np.random.default_rng(seed=0)
+    ndata = 120
+    chi2s = rng.uniform(80, 200, size=500)
+    alphas = np.linspace(0.5, 3, 97)
+    expected = [_p_alpha_reference(alpha, chi2s, ndata) for alpha in alphas]
+    # Force several blocks of alphas
+    monkeypatch.setattr(reweighting, "_P_ALPHA_BLOCK_SIZE", 5000)
+    np.testing.assert_allclose(reweighting._p_alpha_values(alphas, chi2s, ndata), expected)
+    # Alpha = 1 reproduces the weights numerator
+    np.testing.assert_allclose(
+        reweighting._weights_numerator(chi2s, ndata),
+        reweighting._weights_numerator(chi2s, ndata, [1.0])[0],
+    )
+
+
+def _chi2_data(rng, nreplicas=100, ndatas=(40, 80)):
+    """Chi2 data of several experiments, where the first member is the central one"""
+    return [
+        Chi2Data(MCStats(rng.uniform(0.5, 2, size=(nreplicas + 1, 1)) * ndata), ndata, ndata)
+        for ndata in ndatas
+    ]
+
+
+def _old_p_alpha_vals(alphas, chi2_data):
+    """The per alpha loop used before the vectorisation, which rebuilt the
+    results with the error members rescaled by each alpha"""
+    vals = []
+    for alpha in alphas:
+        new_chi2 = [
+            (type(res)(res.error_members() / alpha**2), central, ndata)
+            for (res, central, ndata) in chi2_data
+        ]
+        total_ndata = sum(ndata for _, _, ndata in new_chi2)
+        chi2s = np.ravel(np.sum([res.data for res, _, _ in new_chi2], axis=0))
+        logw = ((total_ndata - 1) / 2) * np.log(chi2s) - 0.5 * chi2s
+        logw -= np.max(logw)
+        vals.append(np.sum(np.exp(logw) / alpha))
+    return vals
+
+
+def test_p_alpha_matches_loop():
+    """The vectorised P(α) uses the χ² of the replicas 1..N, like the previous loop"""
+    rng = np.random.default_rng(seed=1)
+    chi2_data = _chi2_data(rng)
+    alphas = np.linspace(0.5, 4, 50)
+    np.testing.assert_allclose(
+        reweighting._get_p_alpha_vals(alphas, chi2_data),
+        _old_p_alpha_vals(alphas, chi2_data),
+        rtol=1e-12,
+    )
+    np.testing.assert_allclose(
+        reweighting._get_p_alpha_val(1.3, chi2_data), _old_p_alpha_vals([1.3], chi2_data)[0]
+    )
+    # The weights have one entry per replica and match P(α) at α=1
+    numerator = reweighting.nnpdf_weights_numerator(chi2_data)
+    assert numerator.shape == (100,)
+    np.testing.assert_allclose(np.sum(numerator), _old_p_alpha_vals([1], chi2_data)[0])
+
+
+def test_sample_replicas():
+    weights = np.array([0.1, 0.0, 0.6, 0.3])
+    np.random.seed(42)
+    sample = reweighting._sample_replicas(weights, 20000)
+    assert sample.min() >= 0 and sample.max() < len(weights)
+    freqs = np.bincount(sample, minlength=len(weights)) / len(sample)
+    assert freqs[1] == 0
+    np.testing.assert_allclose(freqs, weights, atol=0.02)
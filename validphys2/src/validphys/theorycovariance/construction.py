@@ -20,7 +20,7 @@ from validphys.results import (
     procs_central_values_no_table,
 )
 from validphys.results import Chi2Data, results
-from validphys.calcutils import calc_chi2, all_chi2_theory, central_chi2_theory
+from validphys.calcutils import cached_cholesky, calc_chi2, results_chi2
 from validphys.theorycovariance.theorycovarianceutils import (
     process_lookup,
     check_correct_theory_combination,
@@ -751,7 +751,7 @@ def chi2_impact(theory_covmat_singleprocess, procs_covmat, procs_results):
     th_central = np.concatenate([x for x in th_central_list])
     central_diff = dat_central - th_central
     cov = theory_covmat_singleprocess.values + procs_covmat.values
-    return calc_chi2(la.cholesky(cov, lower=True), central_diff) / len(central_diff)
+    return calc_chi2(cached_cholesky(cov), central_diff) / len(central_diff)
 
 
 def data_theory_diff(procs_results):
@@ -803,8 +803,9 @@ def abs_chi2_data_theory_dataset(each_dataset_results, total_covmat_datasets):
     chi2data_array = []
     for datresults, covmat in zip(each_dataset_results, total_covmat_datasets):
         data_result, th_result = datresults
-        chi2s = all_chi2_theory(datresults, covmat)
-        central_result = central_chi2_theory(datresults, covmat)
+        chi2s, central_result = results_chi2(
+            data_result, th_result, sqrtcov=cached_cholesky(covmat)
+        )
         chi2data_array.append(
             Chi2Data(
                 th_result.stats_class(chi2s[:, np.newaxis]),
@@ -820,8 +821,9 @@ def abs_chi2_data_theory_proc(procs_results, total_covmat_procs):
     chi2data_array = []
     for expresults, covmat in zip(procs_results, total_covmat_procs):
         data_result, th_result = expresults
-        chi2s = all_chi2_theory(expresults, covmat)
-        central_result = central_chi2_theory(expresults, covmat)
+        chi2s, central_result = results_chi2(
+            data_result, th_result, sqrtcov=cached_cholesky(covmat)
+        )
         chi2data_array.append(
             Chi2Data(
                 th_result.stats_class(chi2s[:, np.newaxis]),